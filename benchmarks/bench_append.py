@@ -0,0 +1,59 @@
+"""
+Benchmark updating the statistics of a result from its state when samples are appended, against
+recomputing them over all the samples.
+
+A result of `--samples` samples gets `--new` more samples `--appends` times in a row, as labs
+adding a few samples to a study every week. Both compute Mean, Median and StdDev on log2 CPM.
+The state is stored with the result when it is processed, which is not timed. The statistics
+of the last append are checked against the full recompute.
+
+Usage:
+    python -m benchmarks.bench_append --genes 60000 --samples 500 --new 4 --appends 5
+"""
+import argparse
+import time
+
+import numpy as np
+import pandas as pd
+
+from benchmarks.synthetic import make_count_matrix
+from rnaseq_viz.backend.count_matrix import CountMatrix
+from rnaseq_viz.backend.incremental import StatisticsState
+from rnaseq_viz.backend.statistics import StatisticsSpec, compute_statistics
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--genes", type=int, default=60000)
+    parser.add_argument("--samples", type=int, default=500)
+    parser.add_argument("--new", type=int, default=4)
+    parser.add_argument("--appends", type=int, default=5)
+    args = parser.parse_args()
+
+    n_total = args.samples + args.new * args.appends
+    symbol, samples = make_count_matrix(args.genes, n_total)
+    counts = CountMatrix.from_frame(pd.Series(symbol), samples).counts
+    spec = StatisticsSpec("log2_cpm")
+    state = StatisticsState.from_counts(counts[:, :args.samples], spec)
+    print(f"{args.genes} genes x {args.samples} samples, {args.appends} appends of {args.new} samples")
+
+    full_seconds = incremental_seconds = 0.0
+    for n in range(args.samples + args.new, n_total + 1, args.new):
+        start = time.perf_counter()
+        expected = compute_statistics(counts[:, :n], spec)
+        full_seconds += time.perf_counter() - start
+        start = time.perf_counter()
+        state.append(counts[:, n - args.new:n], None, counts[:, :n])
+        updated = state.statistics()
+        incremental_seconds += time.perf_counter() - start
+
+    assert np.array_equal(updated["Median"], expected["Median"], equal_nan=True)
+    for column in ("Mean", "StdDev"):
+        np.testing.assert_allclose(updated[column], expected[column], rtol=1e-9, atol=1e-12)
+    for label, seconds in (("full recompute", full_seconds), ("update from the state", incremental_seconds)):
+        print(f"  {label:<22} {seconds / args.appends:8.3f} s per append")
+    print(f"  {'speedup':<22} {full_seconds / incremental_seconds:8.1f}x")
+
+
+if __name__ == "__main__":
+    main()
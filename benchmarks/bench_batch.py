@@ -0,0 +1,103 @@
+"""
+Benchmark the merge of the inputs of a batch against joining them with pandas, by time and peak memory.
+
+Each input has its own samples and a random 90% of the genes. The pandas baseline reads every
+input and outer-joins them one after another on SYMBOL, holding all of them and the growing
+join in memory. `merge_counts` holds only the inputs being parsed and the index of the genes, and
+writes the merged counts to a memory-mapped temp file, which batches are then processed from in chunks.
+Each run is a separate process, so that its peak resident memory is its own. The peak of
+`merge_counts` includes the pages of its memory-mapped merged matrix, which the OS can reclaim.
+
+Usage:
+    python -m benchmarks.bench_batch --files 4 16 --genes 20000 --samples 50
+"""
+import argparse
+import io
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+
+from benchmarks.synthetic import make_count_matrix
+
+BUCKET = "rnaseq-viz-benchmark"
+METHODS = ("pandas", "merge_counts")
+
+
+def write_inputs(root: str, n_files: int, n_genes: int, n_samples: int) -> list:
+    """Write the inputs of a batch to the local storage in `root`, returning their keys."""
+    from rnaseq_viz.common.local_storage import LocalStorage
+
+    storage = LocalStorage(root=root)
+    rng = np.random.default_rng(0)
+    keys = []
+    for i in range(n_files):
+        symbol, samples = make_count_matrix(n_genes, n_samples, seed=i)
+        samples.columns = [f"F{i:03d}_{name}" for name in samples.columns]
+        df = pd.concat([pd.Series(symbol, name="SYMBOL"), samples], axis=1)
+        df = df.iloc[np.sort(rng.permutation(n_genes)[:n_genes * 9 // 10])]
+        key = f"benchmark/uploads/input_{i:03d}.csv"
+        storage.upload_file_to_s3(io.BytesIO(df.to_csv(index=False).encode()), BUCKET, key)
+        keys.append(key)
+    return keys
+
+
+def run_method(method: str, root: str, keys: list) -> dict:
+    """Merge the inputs in this process, returning its time and peak resident memory."""
+    from rnaseq_viz.backend.cohort import merge_counts
+    from rnaseq_viz.common.local_storage import LocalStorage
+    from rnaseq_viz.common.metrics import StageTimings
+
+    storage = LocalStorage(root=root)
+    start = time.perf_counter()
+    if method == "pandas":
+        merged = None
+        for key in keys:
+            df = pd.read_csv(storage.path(BUCKET, key))
+            merged = df if merged is None else merged.merge(df, on="SYMBOL", how="outer")
+        merged.fillna(0)
+    else:
+        with merge_counts(storage, keys, StageTimings()):
+            pass
+    return {"seconds": time.perf_counter() - start,
+            "peak_rss_bytes": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--files", type=int, nargs="+", default=[4, 16])
+    parser.add_argument("--genes", type=int, default=20000)
+    parser.add_argument("--samples", type=int, default=50)
+    parser.add_argument("--method", choices=METHODS, help=argparse.SUPPRESS)
+    parser.add_argument("--root", help=argparse.SUPPRESS)
+    parser.add_argument("--keys", nargs="*", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.method:
+        print(json.dumps(run_method(args.method, args.root, args.keys)), flush=True)
+        return
+
+    env = {**os.environ, "S3_BUCKET": BUCKET, "STORAGE_BACKEND": "local", "LOG_LEVEL": "WARNING"}
+    os.environ.update(env)
+    for n_files in args.files:
+        with tempfile.TemporaryDirectory(prefix="rnaseq-viz-bench-batch-") as root:
+            keys = write_inputs(root, n_files, args.genes, args.samples)
+            print(f"{n_files} inputs of {args.genes * 9 // 10} of {args.genes} genes x {args.samples} samples")
+            for method in METHODS:
+                output = subprocess.run(
+                    [sys.executable, "-m", "benchmarks.bench_batch", "--method", method, "--root", root,
+                     "--keys", *keys], env=env, check=True, stdout=subprocess.PIPE, text=True,
+                ).stdout
+                result = json.loads(output.splitlines()[-1])
+                peak_mb = result['peak_rss_bytes'] / 2 ** 20
+                print(f"  {method:<13} {result['seconds']:8.2f} s  peak RSS {peak_mb:8.0f} MB")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,71 @@
+"""
+Benchmark the batched differential expression against a per-gene loop.
+
+The matrix is split in two halves of samples compared by Welch's t-test. The per-gene loop
+runs on the first `--loop-genes` genes only and is extrapolated to the whole matrix.
+
+Usage:
+    python -m benchmarks.bench_differential --genes 60000 --samples 500
+"""
+import argparse
+import time
+
+import numpy as np
+import pandas as pd
+
+from benchmarks.synthetic import make_count_matrix
+from rnaseq_viz.backend.count_matrix import CountMatrix
+from rnaseq_viz.backend.differential import (
+    Comparison, benjamini_hochberg, differential_expression, welch_t_test
+)
+
+
+def per_gene_differential(processed: pd.DataFrame, comparison: Comparison) -> np.ndarray:
+    """The test run one gene at a time, for comparison."""
+    test = processed[list(comparison.test)]
+    reference = processed[list(comparison.reference)]
+    pvalues = np.empty(len(processed))
+    for row in range(len(processed)):
+        values_test = np.log2(test.iloc[row].to_numpy(dtype=np.float64) + 1)[np.newaxis]
+        values_reference = np.log2(reference.iloc[row].to_numpy(dtype=np.float64) + 1)[np.newaxis]
+        pvalues[row] = welch_t_test(values_test, values_reference)[2][0]
+    return benjamini_hochberg(pvalues)
+
+
+def best_of(fn, repeat: int) -> float:
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        timings.append(time.perf_counter() - start)
+    return min(timings)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--genes", type=int, default=60000)
+    parser.add_argument("--samples", type=int, default=500)
+    parser.add_argument("--loop-genes", type=int, default=1000)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    symbol, samples = make_count_matrix(args.genes, args.samples)
+    matrix = CountMatrix.from_frame(pd.Series(symbol), samples)
+    processed = matrix.to_frame(matrix.statistics())
+    names = [str(name) for name in samples.columns]
+    comparison = Comparison(test=tuple(names[:len(names) // 2]), reference=tuple(names[len(names) // 2:]))
+    print(f"Matrix: {args.genes} genes x {args.samples} samples, "
+          f"{len(comparison.test)} test against {len(comparison.reference)} reference samples")
+
+    batched = best_of(lambda: differential_expression(processed, comparison), args.repeat)
+    loop_genes = min(args.loop_genes, args.genes)
+    loop = best_of(lambda: per_gene_differential(processed.iloc[:loop_genes], comparison), 1)
+    loop *= args.genes / loop_genes
+
+    print(f"per-gene loop: {loop:8.3f} s (extrapolated from {loop_genes} genes)")
+    print(f"batched:       {batched:8.3f} s")
+    print(f"speedup:       {loop / batched:8.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,58 @@
+"""
+Benchmark the Arrow CSV ingestion against the previous `pd.read_csv` parsing, on plain,
+gzip- and zstd-compressed synthetic count matrices.
+
+Usage:
+    python -m benchmarks.bench_ingestion --genes 60000 --samples 200
+"""
+import argparse
+import gzip
+import io
+
+import pandas as pd
+import pyarrow as pa
+
+from benchmarks.bench_validation import best_of
+from benchmarks.synthetic import count_csv_bytes
+from rnaseq_viz.backend.ingestion import decompressed_stream, read_counts_csv
+
+
+def compress(data: bytes, compression: str) -> bytes:
+    if compression == "gzip":
+        return gzip.compress(data, compresslevel=6)
+    sink = pa.BufferOutputStream()
+    with pa.CompressedOutputStream(sink, compression) as stream:
+        stream.write(data)
+    return sink.getvalue().to_pybytes()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--genes", type=int, default=20000)
+    parser.add_argument("--samples", type=int, default=100)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    csv_bytes = count_csv_bytes(args.genes, args.samples)
+    size_mb = len(csv_bytes) / 1024 / 1024
+    print(f"Matrix: {args.genes} genes x {args.samples} samples, {size_mb:.1f} MB of CSV")
+
+    for compression in (None, "gzip", "zstd"):
+        data = compress(csv_bytes, compression) if compression else csv_bytes
+        label = compression or "plain"
+
+        pandas_seconds = best_of(lambda: pd.read_csv(decompressed_stream(io.BytesIO(data), compression)),
+                                 args.repeat)
+        arrow_seconds = best_of(lambda: read_counts_csv(io.BytesIO(data), compression), args.repeat)
+        pandas_mb = pd.read_csv(decompressed_stream(io.BytesIO(data), compression)).memory_usage(deep=True).sum()
+        arrow_mb = read_counts_csv(io.BytesIO(data), compression).memory_usage(deep=True).sum()
+
+        print(f"{label:>5}: {len(data) / 1024 / 1024:8.1f} MB stored ({len(csv_bytes) / len(data):4.1f}x)")
+        print(f"       pd.read_csv     {pandas_seconds:7.3f} s  {size_mb / pandas_seconds:7.1f} MB/s  "
+              f"{pandas_mb / 1024 / 1024:8.1f} MB in memory")
+        print(f"       read_counts_csv {arrow_seconds:7.3f} s  {size_mb / arrow_seconds:7.1f} MB/s  "
+              f"{arrow_mb / 1024 / 1024:8.1f} MB in memory  ({pandas_seconds / arrow_seconds:.1f}x faster)")
+
+
+if __name__ == "__main__":
+    main()
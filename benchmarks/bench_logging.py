@@ -0,0 +1,128 @@
+"""
+Benchmark the latency of API requests with logging off, written synchronously by the request
+threads, and handed to the log writer thread of `setup_logging`, as text and as JSON.
+
+Each configuration runs in its own process, as logging is configured once per process. Requests
+poll `/check-status` of a finished task from several threads at once, which logs on every request
+like the task polling of the frontend. The logs go to a file, or with `--sink-kb-per-s` to a pipe
+drained at that rate, as by a log collector that falls behind.
+
+Usage:
+    python -m benchmarks.bench_logging --requests 2000 --threads 8
+    python -m benchmarks.bench_logging --requests 2000 --threads 8 --sink-kb-per-s 100
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+# Environment of each configuration, and whether the request threads write the logs themselves
+CONFIGURATIONS = {
+    "off": ({"LOG_LEVEL": "CRITICAL"}, False),
+    "synchronous": ({"LOG_LEVEL": "INFO"}, True),
+    "queue": ({"LOG_LEVEL": "INFO"}, False),
+    "queue_json": ({"LOG_LEVEL": "INFO", "LOG_JSON": "true"}, False),
+}
+
+
+def run_configuration(n_requests: int, n_threads: int, synchronous: bool) -> dict:
+    """Time the requests in this process, logging as configured by the environment."""
+    import logging
+    from fastapi.testclient import TestClient
+    from rnaseq_viz.backend.main import app, task_manager
+    from rnaseq_viz.config.log_config import LOG_FORMAT
+
+    if synchronous:
+        # The configuration before the log writer thread: every record is written by the thread that logs it
+        root = logging.getLogger()
+        root.handlers.clear()
+        handler = logging.StreamHandler()
+        handler.setFormatter(logging.Formatter(LOG_FORMAT))
+        root.addHandler(handler)
+
+    task_id = task_manager.tasks.create(status="completed", result="benchmark/processed/result.csv")
+    with TestClient(app) as client:
+        def request(_) -> float:
+            start = time.perf_counter()
+            client.get(f"/check-status/{task_id}")
+            return time.perf_counter() - start
+
+        for _ in range(100):
+            request(None)
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=n_threads) as pool:
+            latencies = np.array(list(pool.map(request, range(n_requests))))
+        elapsed = time.perf_counter() - start
+    return {"p50_ms": float(np.percentile(latencies, 50) * 1000), "p99_ms": float(np.percentile(latencies, 99) * 1000),
+            "requests_per_s": n_requests / elapsed}
+
+
+def drain(pipe, log_path: str, bytes_per_s: float, throttled: threading.Event) -> None:
+    """Copy the logs of a configuration from its stderr to a file, at `bytes_per_s` while `throttled` is set."""
+    with open(log_path, "wb") as log:
+        while True:
+            data = pipe.read1(4096)
+            if not data:
+                return
+            log.write(data)
+            if throttled.is_set():
+                time.sleep(len(data) / bytes_per_s)
+
+
+def run_in_process(name: str, args: argparse.Namespace, directory: str) -> dict:
+    environment, _ = CONFIGURATIONS[name]
+    env = {**os.environ, **environment, "STORAGE_BACKEND": "local", "TASK_STORE_BACKEND": "memory",
+           "LOCAL_STORAGE_ROOT": os.path.join(directory, "storage"), "PROCESSING_N_WORKERS": "0"}
+    log_path = os.path.join(directory, f"{name}.log")
+    process = subprocess.Popen(
+        [sys.executable, "-m", "benchmarks.bench_logging", "--configuration", name,
+         "--requests", str(args.requests), "--threads", str(args.threads)],
+        env=env, stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+    )
+    throttled = threading.Event()
+    if args.sink_kb_per_s:
+        throttled.set()
+    drainer = threading.Thread(target=drain, args=(process.stderr, log_path, args.sink_kb_per_s * 1024, throttled))
+    drainer.start()
+    output = process.stdout.readline()
+    # Logs still queued at exit are drained at full speed
+    throttled.clear()
+    process.wait()
+    drainer.join()
+    if process.returncode != 0 or not output:
+        raise RuntimeError(f"Configuration {name} failed, see {log_path}")
+    return {**json.loads(output), "log_bytes": os.path.getsize(log_path)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--threads", type=int, default=8)
+    parser.add_argument("--sink-kb-per-s", type=float, default=0,
+                        help="Write the logs to a pipe drained at this rate rather than to a file")
+    parser.add_argument("--configuration", choices=CONFIGURATIONS, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.configuration:
+        _, synchronous = CONFIGURATIONS[args.configuration]
+        print(json.dumps(run_configuration(args.requests, args.threads, synchronous)), flush=True)
+        return
+
+    sink = f"a pipe drained at {args.sink_kb_per_s:g} KB/s" if args.sink_kb_per_s else "a file"
+    print(f"{args.requests} requests from {args.threads} threads, logs written to {sink}")
+    with tempfile.TemporaryDirectory(prefix="rnaseq-viz-bench-logging-") as directory:
+        for name in CONFIGURATIONS:
+            result = run_in_process(name, args, directory)
+            print(f"  {name:<12} p50 {result['p50_ms']:7.3f} ms  p99 {result['p99_ms']:7.3f} ms  "
+                  f"{result['requests_per_s']:8.0f} req/s  {result['log_bytes']:>10} bytes of logs")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,252 @@
+"""
+Benchmark the backend hot paths on synthetic RNA-Seq count matrices.
+
+Times CSV parsing (Arrow ingestion), validation, `process_rnaseq_data`, serialization of the result in
+each format and the whole `TaskManager.process_file` path, the latter against an
+in-process S3 stand-in (moto), and against the local storage in a temporary directory.
+Results are written as JSON; given a baseline JSON, the run fails when a case got slower
+than the baseline by more than the threshold.
+
+Usage:
+    python -m benchmarks.bench_pipeline --preset quick --output bench.json
+    python -m benchmarks.bench_pipeline --size 60000x2000 --cases parse process
+    python -m benchmarks.bench_pipeline --preset quick --baseline bench.json --threshold 0.2
+"""
+import argparse
+import io
+import json
+import os
+import platform
+import statistics
+import sys
+import tempfile
+import time
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from typing import Callable, Dict, Iterator, List, Tuple
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+
+from benchmarks.synthetic import count_csv_bytes
+
+# S3 calls go to a bucket of the in-process stand-in, whatever the .env says;
+# set before the config is first imported
+os.environ["USE_LOCALSTACK"] = "false"
+os.environ["S3_BUCKET"] = "rnaseq-viz-benchmark"
+
+PRESETS = {
+    "quick": [(1000, 6), (20000, 100)],
+    "full": [(1000, 6), (20000, 100), (60000, 6), (60000, 500), (60000, 2000)],
+}
+CASES = ("parse", "validate", "process", "serialize_csv", "serialize_parquet", "task", "task_local")
+
+
+def time_runs(fn: Callable[[], object], repeat: int) -> List[float]:
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        timings.append(time.perf_counter() - start)
+    return timings
+
+
+@contextmanager
+def local_s3() -> Iterator:
+    """
+    Run the S3 calls of the backend against moto's in-process S3, with the bucket created.
+
+    Yields:
+        S3Manager: S3 access backed by the stand-in.
+    """
+    try:
+        from moto import mock_aws
+    except ImportError:
+        sys.exit("The task benchmark needs moto, install the dev dependencies or skip it with --cases")
+
+    for name in ("AWS_ACCESS_KEY_ID", "AWS_SECRET_ACCESS_KEY"):
+        os.environ.setdefault(name, "benchmark")
+    os.environ.setdefault("AWS_DEFAULT_REGION", "us-east-1")
+    from rnaseq_viz.common.s3_manager import S3Manager
+    from rnaseq_viz.config.config import S3_BUCKET
+
+    with mock_aws():
+        s3_manager = S3Manager()
+        s3_manager.s3_client.create_bucket(Bucket=S3_BUCKET)
+        yield s3_manager
+
+
+@contextmanager
+def local_storage() -> Iterator:
+    """
+    Run the storage calls of the backend against the local storage, in a temporary directory.
+
+    Yields:
+        LocalStorage: Storage removed on exit.
+    """
+    from rnaseq_viz.common.local_storage import LocalStorage
+
+    with tempfile.TemporaryDirectory(prefix="rnaseq-viz-storage-") as root:
+        yield LocalStorage(root=root)
+
+
+def bench_task(csv_bytes: bytes, repeat: int, storage: Callable = local_s3) -> List[float]:
+    from rnaseq_viz.backend.executor import ProcessingExecutor
+    from rnaseq_viz.backend.result_cache import InMemoryResultCache
+    from rnaseq_viz.backend.task_manager import TaskManager
+    from rnaseq_viz.backend.task_store import InMemoryTaskStore
+    from rnaseq_viz.config.config import S3_BUCKET
+
+    with storage() as s3_manager:
+        s3_manager.upload_file_to_s3(io.BytesIO(csv_bytes), S3_BUCKET, "benchmark/uploads/input.csv")
+        task_manager = TaskManager(s3_manager, executor=ProcessingExecutor(n_workers=0),
+                                   store=InMemoryTaskStore(), cache=InMemoryResultCache())
+
+        def run():
+            task_id = task_manager.tasks.create(status="processing")
+            task_manager.process_file(task_id, "benchmark/uploads/input.csv", "benchmark")
+            task = task_manager.tasks.get(task_id)
+            if task["status"] != "completed":
+                raise RuntimeError(f"Benchmark task failed: {task['result']}")
+
+        try:
+            return time_runs(run, repeat)
+        finally:
+            task_manager.shutdown()
+
+
+def bench_size(n_genes: int, n_samples: int, cases: List[str], repeat: int, seed: int) -> List[Dict]:
+    from rnaseq_viz.backend.data_processing import process_rnaseq_data
+    from rnaseq_viz.backend.ingestion import read_counts_csv
+    from rnaseq_viz.backend.result_writer import create_result_writer
+    from rnaseq_viz.backend.validation import validate_matrix
+
+    csv_bytes = count_csv_bytes(n_genes, n_samples, seed)
+    df = read_counts_csv(io.BytesIO(csv_bytes))
+    symbol = df["SYMBOL"].to_numpy(dtype=object)
+    samples = df.drop(columns=["SYMBOL"])
+    processed = process_rnaseq_data(df) if any(case.startswith("serialize") for case in cases) else None
+
+    def serialize(result_format: str):
+        writer = create_result_writer(io.BytesIO(), result_format)
+        writer.write_chunk(processed)
+        writer.close()
+
+    benches = {
+        "parse": lambda: time_runs(lambda: read_counts_csv(io.BytesIO(csv_bytes)), repeat),
+        "validate": lambda: time_runs(lambda: validate_matrix(symbol, samples), repeat),
+        "process": lambda: time_runs(lambda: process_rnaseq_data(df), repeat),
+        "serialize_csv": lambda: time_runs(lambda: serialize("csv"), repeat),
+        "serialize_parquet": lambda: time_runs(lambda: serialize("parquet"), repeat),
+        "task": lambda: bench_task(csv_bytes, repeat),
+        "task_local": lambda: bench_task(csv_bytes, repeat, storage=local_storage),
+    }
+
+    results = []
+    for case in cases:
+        runs = benches[case]()
+        results.append({
+            "case": case,
+            "genes": n_genes,
+            "samples": n_samples,
+            "input_bytes": len(csv_bytes),
+            "best_seconds": round(min(runs), 6),
+            "median_seconds": round(statistics.median(runs), 6),
+            "runs": [round(run, 6) for run in runs],
+        })
+        print(f"{case:<18} {n_genes:>6} x {n_samples:<5} best {min(runs):9.4f} s  "
+              f"median {statistics.median(runs):9.4f} s")
+    return results
+
+
+def environment() -> Dict:
+    return {
+        "timestamp": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "numpy": np.__version__,
+        "pandas": pd.__version__,
+        "pyarrow": pa.__version__,
+    }
+
+
+def compare(results: List[Dict], baseline: List[Dict], threshold: float, min_delta: float) -> List[str]:
+    """
+    Compare the best time of each case with the baseline.
+
+    Args:
+        results (List[Dict]): Results of this run.
+        baseline (List[Dict]): Results of the baseline run, cases missing from either side are skipped.
+        threshold (float): Allowed slowdown, as a fraction of the baseline time.
+        min_delta (float): Slowdowns of fewer seconds are ignored as noise.
+
+    Returns:
+        List[str]: Description of each regression.
+    """
+    def key(result: Dict) -> Tuple:
+        return result["case"], result["genes"], result["samples"]
+
+    reference = {key(result): result["best_seconds"] for result in baseline}
+    regressions = []
+    for result in results:
+        before = reference.get(key(result))
+        if before is None:
+            continue
+        after = result["best_seconds"]
+        if after > before * (1 + threshold) and after - before > min_delta:
+            regressions.append(f"{result['case']} {result['genes']}x{result['samples']}: "
+                               f"{before:.4f} s -> {after:.4f} s (+{(after / before - 1) * 100:.0f}%)")
+    return regressions
+
+
+def parse_size(value: str) -> Tuple[int, int]:
+    try:
+        genes, samples = value.lower().split("x")
+        return int(genes), int(samples)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"Expected GENESxSAMPLES, e.g. 20000x100, got {value}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--preset", choices=sorted(PRESETS), default="quick",
+                        help="Matrix sizes to run, ignored if --size is given")
+    parser.add_argument("--size", type=parse_size, action="append",
+                        help="Matrix size as GENESxSAMPLES, may be repeated")
+    parser.add_argument("--cases", nargs="+", choices=CASES, default=list(CASES))
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="Write the results to this JSON file")
+    parser.add_argument("--baseline", help="JSON results of a previous run to compare against")
+    parser.add_argument("--threshold", type=float, default=0.2,
+                        help="Fail when a case is slower than the baseline by more than this fraction")
+    parser.add_argument("--min-delta", type=float, default=0.005,
+                        help="Ignore slowdowns of fewer seconds than this")
+    args = parser.parse_args()
+
+    results = []
+    for n_genes, n_samples in args.size or PRESETS[args.preset]:
+        results.extend(bench_size(n_genes, n_samples, args.cases, args.repeat, args.seed))
+
+    report = {"environment": environment(), "seed": args.seed, "repeat": args.repeat, "results": results}
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"Results written to {args.output}")
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)["results"]
+        regressions = compare(results, baseline, args.threshold, args.min_delta)
+        if regressions:
+            print(f"{len(regressions)} regression(s) over {args.threshold:.0%} against {args.baseline}:")
+            for regression in regressions:
+                print(f"  - {regression}")
+            sys.exit(1)
+        print(f"No regression over {args.threshold:.0%} against {args.baseline}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,71 @@
+"""
+Benchmark the single-pass statistics engine against one pandas reduction per statistic.
+
+Both compute every statistic of the registry, on raw counts and on log2 CPM. The pandas
+baseline normalizes a float64 copy of the matrix, then makes one pass over it per statistic,
+as `process_rnaseq_data` did with Mean, Median and StdDev. The cost of the default
+statistics alone shows what the extra statistics add to a pass.
+
+Usage:
+    python -m benchmarks.bench_statistics --genes 60000 --samples 200
+"""
+import argparse
+import time
+
+import numpy as np
+import pandas as pd
+
+from benchmarks.synthetic import make_count_matrix
+from rnaseq_viz.backend.count_matrix import CountMatrix
+from rnaseq_viz.backend.statistics import STATISTICS, StatisticsSpec
+
+
+def per_statistic_pandas(samples: pd.DataFrame, normalization: str) -> dict:
+    """Every statistic of the registry as a separate pandas row reduction, for comparison."""
+    values = samples.astype(np.float64)
+    if normalization == "log2_cpm":
+        values = np.log2(values / values.sum(axis=0) * 1e6 + 1)
+    mean = values.mean(axis=1)
+    std = values.std(axis=1)
+    return {
+        "Mean": mean, "Median": values.median(axis=1), "StdDev": std, "CV": std / mean,
+        "Q25": values.quantile(0.25, axis=1), "Q75": values.quantile(0.75, axis=1),
+        "DetectionRate": (values > 0).mean(axis=1), "Min": values.min(axis=1), "Max": values.max(axis=1),
+    }
+
+
+def best_of(fn, repeat: int) -> float:
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        timings.append(time.perf_counter() - start)
+    return min(timings)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--genes", type=int, default=60000)
+    parser.add_argument("--samples", type=int, default=200)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    symbol, samples = make_count_matrix(args.genes, args.samples)
+    matrix = CountMatrix.from_frame(pd.Series(symbol), samples)
+    print(f"Matrix: {args.genes} genes x {args.samples} samples, {matrix.counts.dtype} ({matrix.nbytes} bytes)")
+
+    for normalization in ("none", "log2_cpm"):
+        every = StatisticsSpec(normalization, tuple(STATISTICS))
+        default = best_of(lambda: matrix.statistics(StatisticsSpec(normalization)), args.repeat)
+        single_pass = best_of(lambda: matrix.statistics(every), args.repeat)
+        pandas = best_of(lambda: per_statistic_pandas(samples, normalization), args.repeat)
+        print(f"{normalization}:")
+        for label, seconds in ((f"per-statistic pandas ({len(every.columns)} columns)", pandas),
+                               (f"single pass ({len(every.columns)} columns)", single_pass),
+                               ("single pass (Mean, Median, StdDev)", default)):
+            print(f"  {label:<36} {seconds:8.3f} s")
+        print(f"  {'speedup':<36} {pandas / single_pass:8.1f}x")
+
+
+if __name__ == "__main__":
+    main()
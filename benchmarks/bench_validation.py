@@ -0,0 +1,57 @@
+"""
+Benchmark the vectorized RNASeqData validation against the previous per-cell validator.
+
+Usage:
+    python -m benchmarks.bench_validation --genes 60000 --samples 200
+"""
+import argparse
+import time
+
+import pandas as pd
+
+from benchmarks.synthetic import make_count_matrix
+from rnaseq_viz.backend.validation import validate_matrix
+
+
+def legacy_validate(symbol: list, samples: pd.DataFrame) -> None:
+    """The validator as it was before the NumPy engine, kept here for comparison."""
+    if any(s is None or pd.isna(s) for s in symbol):
+        raise ValueError("SYMBOL column must not contain NA or None values.")
+    if len(symbol) != len(set(symbol)):
+        raise ValueError("SYMBOL column must contain unique values.")
+    if samples.isna().any().any():
+        raise ValueError("Sample columns must not contain NA or None values.")
+    for col in samples.columns:
+        if not samples[col].apply(lambda x: isinstance(x, (int, float)) and x >= 0).all():
+            raise ValueError("All sample columns must be of int or float type and contain no negative values.")
+
+
+def best_of(fn, repeat: int) -> float:
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        timings.append(time.perf_counter() - start)
+    return min(timings)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--genes", type=int, default=20000)
+    parser.add_argument("--samples", type=int, default=100)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    symbol, samples = make_count_matrix(args.genes, args.samples)
+    print(f"Matrix: {args.genes} genes x {args.samples} samples")
+
+    vectorized = best_of(lambda: validate_matrix(symbol, samples), args.repeat)
+    legacy = best_of(lambda: legacy_validate(symbol.tolist(), samples), args.repeat)
+
+    print(f"legacy validator:     {legacy:8.3f} s")
+    print(f"vectorized validator: {vectorized:8.3f} s")
+    print(f"speedup:              {legacy / vectorized:8.1f}x")
+
+
+if __name__ == "__main__":
+    main()
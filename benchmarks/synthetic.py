@@ -0,0 +1,79 @@
+"""
+Synthetic RNA-Seq count matrices for the benchmarks.
+
+Counts follow the usual model of bulk RNA-Seq: each gene has a mean expression drawn
+from a log-normal distribution and a dispersion that decreases with its mean, each
+sample has a size factor (sequencing depth), and counts are negative binomial.
+"""
+import io
+from typing import IO, Iterator, Tuple
+
+import numpy as np
+import pandas as pd
+
+# Number of genes generated at a time when writing a CSV, bounding the memory of large matrices
+CSV_BLOCK_GENES = 5000
+
+
+def _gene_parameters(n_genes: int, rng: np.random.Generator) -> Tuple[np.ndarray, np.ndarray]:
+    # Mean counts spanning lowly to highly expressed genes (median ~50, long right tail)
+    means = np.clip(rng.lognormal(mean=np.log(50), sigma=2.0, size=n_genes), 0.1, 1e6)
+    # Mean-dispersion trend: Poisson-like noise for highly expressed genes, overdispersed low counts
+    dispersions = 0.05 + 1.0 / means
+    return means, dispersions
+
+
+def count_blocks(n_genes: int, n_samples: int, seed: int = 0,
+                 block_genes: int = CSV_BLOCK_GENES) -> Iterator[Tuple[np.ndarray, np.ndarray]]:
+    """
+    Generate a count matrix block of genes at a time.
+
+    Args:
+        n_genes (int): Number of genes (rows).
+        n_samples (int): Number of samples (columns).
+        seed (int): Seed of the random generator, the same seed gives the same matrix.
+        block_genes (int): Number of genes per block.
+
+    Yields:
+        Tuple[np.ndarray, np.ndarray]: Gene symbols and the (genes, samples) int64 counts of a block.
+    """
+    rng = np.random.default_rng(seed)
+    means, dispersions = _gene_parameters(n_genes, rng)
+    size_factors = rng.lognormal(mean=0.0, sigma=0.25, size=n_samples)
+    for start in range(0, n_genes, block_genes):
+        stop = min(start + block_genes, n_genes)
+        mu = means[start:stop, None] * size_factors[None, :]
+        r = 1.0 / dispersions[start:stop, None]
+        counts = rng.negative_binomial(r, r / (r + mu))
+        symbol = np.array([f"GENE{i:05d}" for i in range(start, stop)], dtype=object)
+        yield symbol, counts
+
+
+def sample_names(n_samples: int):
+    return [f"S{j:04d}" for j in range(n_samples)]
+
+
+def make_count_matrix(n_genes: int, n_samples: int, seed: int = 0) -> Tuple[np.ndarray, pd.DataFrame]:
+    """
+    Returns:
+        Tuple[np.ndarray, pd.DataFrame]: Gene symbols and the sample counts.
+    """
+    blocks = list(count_blocks(n_genes, n_samples, seed))
+    symbol = np.concatenate([block[0] for block in blocks])
+    counts = np.concatenate([block[1] for block in blocks])
+    return symbol, pd.DataFrame(counts, columns=sample_names(n_samples))
+
+
+def write_count_csv(output: IO[bytes], n_genes: int, n_samples: int, seed: int = 0) -> None:
+    """Write a count matrix as an input CSV, with a SYMBOL column followed by the samples."""
+    output.write((",".join(["SYMBOL"] + sample_names(n_samples)) + "\n").encode("utf-8"))
+    for symbol, counts in count_blocks(n_genes, n_samples, seed):
+        block = pd.DataFrame(counts, columns=sample_names(n_samples))
+        block.insert(0, "SYMBOL", symbol)
+        output.write(block.to_csv(index=False, header=False).encode("utf-8"))
+
+
+def count_csv_bytes(n_genes: int, n_samples: int, seed: int = 0) -> bytes:
+    buffer = io.BytesIO()
+    write_count_csv(buffer, n_genes, n_samples, seed)
+    return buffer.getvalue()
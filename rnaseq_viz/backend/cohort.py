@@ -0,0 +1,286 @@
+import logging
+import os
+import tempfile
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from dataclasses import dataclass, field
+from typing import Dict, Iterator, List, Optional
+
+import numpy as np
+import pandas as pd
+
+from rnaseq_viz.backend.ingestion import compression_of, read_counts_csv
+from rnaseq_viz.backend.task_control import TaskControl
+from rnaseq_viz.common.metrics import StageTimings
+from rnaseq_viz.common.storage import ObjectStorage
+from rnaseq_viz.config.config import S3_BUCKET, TEMP_DIR, BATCH_FETCH_CONCURRENCY, STREAMING_CHUNK_ROWS
+
+# Configure logger
+from rnaseq_viz.config.log_config import setup_logging
+setup_logging()
+logger = logging.getLogger(__name__)
+
+# Handling of the genes missing from some inputs of a batch: counted as 0 in their samples, or left out
+MISSING_GENES_MODES = ("zero", "intersect")
+
+
+@dataclass
+class FetchedInput:
+    """
+    Input of a batch, parsed, checked and spilled to disk until the shape of the merged matrix is known.
+
+    Attributes:
+        s3_key (str): S3 key of the input.
+        samples (List[str]): Names of its sample columns.
+        symbols (Optional[np.ndarray]): Its genes, released once they are in the index of the merge.
+        values_path (str): `.npy` temp file of its counts, one row per gene.
+        dtype (np.dtype): Type of its counts, uint32 unless some do not fit.
+        positions (Optional[np.ndarray]): Entry of each of its genes in the index of the merge.
+    """
+    s3_key: str
+    samples: List[str]
+    symbols: Optional[np.ndarray]
+    values_path: str
+    dtype: np.dtype
+    positions: Optional[np.ndarray] = field(default=None, repr=False)
+
+
+@dataclass
+class MergedCounts:
+    """
+    Count matrix of a batch, merged in a memory-mapped temp file, which is removed on `close`.
+
+    Attributes:
+        symbols (np.ndarray): Genes of the merged matrix, one per row.
+        samples (List[str]): Sample columns of the merged matrix, those of the inputs in order.
+        matrix_path (str): `.npy` temp file of the merged counts.
+        files (Dict[str, Dict]): Status, rows, samples and genes missing of each input, by S3 key.
+    """
+    symbols: np.ndarray
+    samples: List[str]
+    matrix_path: str
+    files: Dict[str, Dict] = field(default_factory=dict)
+
+    def chunks(self, chunk_rows: int = STREAMING_CHUNK_ROWS,
+               timings: Optional[StageTimings] = None) -> Iterator[pd.DataFrame]:
+        """
+        Read the merged matrix one block of rows at a time, as the chunks of a parsed CSV would be,
+        for `process_rnaseq_chunks`. There is at least one chunk, possibly empty.
+        """
+        timings = timings or StageTimings()
+        matrix = np.load(self.matrix_path, mmap_mode="r")
+        for offset in range(0, max(len(self.symbols), 1), chunk_rows):
+            with timings.stage("merge_read") as stage:
+                chunk = pd.DataFrame(np.asarray(matrix[offset:offset + chunk_rows]), columns=self.samples)
+                chunk.insert(0, 'SYMBOL', self.symbols[offset:offset + chunk_rows])
+                stage["rows"] = stage.get("rows", 0) + len(chunk)
+            yield chunk
+
+    def close(self) -> None:
+        try:
+            os.remove(self.matrix_path)
+        except FileNotFoundError:
+            pass
+
+    def __enter__(self) -> "MergedCounts":
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+
+def _temp_path(suffix: str) -> str:
+    os.makedirs(TEMP_DIR, exist_ok=True)
+    fd, path = tempfile.mkstemp(dir=TEMP_DIR, prefix="cohort-", suffix=suffix)
+    os.close(fd)
+    return path
+
+
+def fetch_input(s3_manager: ObjectStorage, s3_key: str) -> FetchedInput:
+    """
+    Download and parse an input of a batch, and spill its counts to a temp file.
+
+    Raises:
+        ValueError: If the input is not a count matrix that can be joined on SYMBOL.
+    """
+    with s3_manager.download_to_buffer(bucket=S3_BUCKET, key=s3_key) as buffer:
+        df = read_counts_csv(buffer, compression_of(s3_key))
+    if 'SYMBOL' not in df.columns:
+        raise ValueError("No SYMBOL column")
+    symbols = df.pop('SYMBOL').astype(object).to_numpy()
+    if pd.isna(symbols).any():
+        raise ValueError(f"{int(pd.isna(symbols).sum())} rows have no SYMBOL")
+    duplicated = pd.Series(symbols).duplicated()
+    if duplicated.any():
+        raise ValueError(f"Duplicate SYMBOL values, e.g. {symbols[duplicated.to_numpy()][0]}")
+    non_numeric = [name for name in df.columns if not pd.api.types.is_numeric_dtype(df[name])]
+    if non_numeric:
+        raise ValueError(f"Non-numeric sample columns: {non_numeric[:5]}")
+
+    # Counts that do not fit in uint32 are merged as float64, for validation to report them
+    dtype = np.dtype(np.uint32) if all(df.dtypes == np.uint32) else np.dtype(np.float64)
+    values_path = _temp_path(".npy")
+    try:
+        np.save(values_path, df.to_numpy(dtype=dtype))
+    except BaseException:
+        os.remove(values_path)
+        raise
+    return FetchedInput(s3_key=s3_key, samples=[str(name) for name in df.columns], symbols=symbols,
+                        values_path=values_path, dtype=dtype)
+
+
+def merge_counts(s3_manager: ObjectStorage, s3_keys: List[str], timings: StageTimings,
+                 control: Optional[TaskControl] = None, missing_genes: str = "zero",
+                 concurrency: int = BATCH_FETCH_CONCURRENCY) -> MergedCounts:
+    """
+    Join count matrices on SYMBOL into one, processed afterwards as a single input.
+
+    Inputs are downloaded and parsed `concurrency` at a time, and spilled to temp files.
+    Their genes go into a hash index of the merged rows as they arrive, ordered at the end as
+    the inputs are in `s3_keys`. The merged matrix is then assembled, one input at a time, in a
+    memory-mapped temp file, read back in chunks of rows by its processing. Memory is thus
+    bounded by the inputs being parsed and the index, whatever the number of inputs.
+
+    Genes missing from some of the inputs have counts of 0 in their samples with `missing_genes`
+    "zero", an outer join, or are left out with "intersect", an inner join. The number of genes of
+    the merge missing from each input is reported in its status as `genes_missing`, and with
+    "intersect" the number of its genes left out as `genes_dropped`.
+
+    Args:
+        s3_keys (List[str]): S3 keys of the inputs, whose sample names must be distinct.
+        timings (StageTimings): Timings of the "fetch" and "merge" stages.
+        control (Optional[TaskControl]): Receives the status of each input, and may stop the merge
+            between two inputs.
+        missing_genes (str): "zero" or "intersect", see above.
+
+    Returns:
+        MergedCounts: The merged matrix, to be closed by the caller, and the status of each input.
+
+    Raises:
+        ValueError: If an input cannot be merged, whose status says why.
+    """
+    if missing_genes not in MISSING_GENES_MODES:
+        raise ValueError(f"Unknown missing_genes {missing_genes}, expected one of {MISSING_GENES_MODES}")
+    files: Dict[str, Dict] = {key: {"status": "queued"} for key in s3_keys}
+    fetched: Dict[str, FetchedInput] = {}
+    index: Dict[str, int] = {}
+    sample_inputs: Dict[str, str] = {}
+
+    def report(s3_key: str, **status) -> None:
+        files[s3_key] = status
+        if control is not None:
+            control.report_files(files)
+
+    futures = {}
+    try:
+        with timings.stage("fetch") as stage:
+            pool = ThreadPoolExecutor(max_workers=concurrency)
+            try:
+                futures = {pool.submit(fetch_input, s3_manager, key): key for key in s3_keys}
+                for key in s3_keys:
+                    files[key] = {"status": "fetching"}
+                if control is not None:
+                    control.report_files(files)
+                for future in as_completed(futures):
+                    key = futures[future]
+                    if control is not None:
+                        control.checkpoint("fetch")
+                    try:
+                        result = future.result()
+                    except Exception as e:
+                        error = "Not found" if ObjectStorage.is_not_found(e) else str(e)
+                        report(key, status="failed", error=error)
+                        raise ValueError(f"Input {key} cannot be merged: {error}")
+                    fetched[key] = result
+                    result.positions = np.fromiter((index.setdefault(symbol, len(index)) for symbol in result.symbols),
+                                                   dtype=np.int64, count=len(result.symbols))
+                    result.symbols = None
+                    report(key, status="fetched", rows=len(result.positions), samples=len(result.samples))
+                    duplicates = [name for name in result.samples if name in sample_inputs]
+                    if duplicates:
+                        # Reported on the later of the two inputs, whichever was fetched first
+                        first, second = sorted((key, sample_inputs[duplicates[0]]), key=s3_keys.index)
+                        error = f"Samples {duplicates[:5]} are also in {first}"
+                        report(second, status="failed", error=error)
+                        raise ValueError(f"Input {second} cannot be merged: {error}")
+                    sample_inputs.update(dict.fromkeys(result.samples, key))
+            finally:
+                # Inputs not started yet are skipped when the merge fails
+                pool.shutdown(wait=True, cancel_futures=True)
+            stage.update(rows=len(index), columns=len(sample_inputs))
+
+        merged = _merge_matrix([fetched[key] for key in s3_keys], index, timings, missing_genes)
+    finally:
+        # Including the inputs fetched after the merge failed
+        for future in futures:
+            if not future.cancelled() and future.exception() is None:
+                os.remove(future.result().values_path)
+    for key in s3_keys:
+        files[key].update(status="merged", **merged.files[key])
+    merged.files = files
+    if control is not None:
+        control.report_files(files)
+    logger.info("Merged %s inputs into %s of %s genes and %s samples", len(s3_keys), len(merged.symbols),
+                len(index), len(sample_inputs))
+    return merged
+
+
+def _merged_rows(inputs: List[FetchedInput], n_genes: int) -> np.ndarray:
+    """
+    Row of each entry of the index in the merged matrix, so that genes are in their order of
+    first appearance in the inputs taken in order, whatever order they were fetched in.
+    """
+    rows = np.full(n_genes, -1, dtype=np.int64)
+    n_rows = 0
+    for result in inputs:
+        new = result.positions[rows[result.positions] < 0]
+        rows[new] = np.arange(n_rows, n_rows + len(new))
+        n_rows += len(new)
+    return rows
+
+
+def _merge_matrix(inputs: List[FetchedInput], index: Dict[str, int], timings: StageTimings,
+                  missing_genes: str) -> MergedCounts:
+    rows = _merged_rows(inputs, len(index))
+    if missing_genes == "intersect":
+        presence = np.zeros(len(index), dtype=np.int64)
+        for result in inputs:
+            presence[result.positions] += 1
+        # Renumbered in the order of the outer join
+        kept = np.flatnonzero(presence == len(inputs))
+        kept = kept[np.argsort(rows[kept])]
+        rows = np.full(len(index), -1, dtype=np.int64)
+        rows[kept] = np.arange(len(kept))
+    n_rows = int((rows >= 0).sum())
+    if n_rows == 0 and index:
+        raise ValueError("The inputs have no gene in common")
+    symbols = np.empty(n_rows, dtype=object)
+    entries = np.flatnonzero(rows >= 0)
+    symbols[rows[entries]] = np.array(list(index), dtype=object)[entries]
+    samples = [name for result in inputs for name in result.samples]
+    dtype = np.dtype(np.uint32) if all(result.dtype == np.uint32 for result in inputs) else np.dtype(np.float64)
+
+    merged = MergedCounts(symbols=symbols, samples=samples, matrix_path=_temp_path(".npy"))
+    try:
+        # Zero-filled, so genes missing from an input have no counts in its samples
+        matrix = np.lib.format.open_memmap(merged.matrix_path, mode="w+", dtype=dtype, shape=(n_rows, len(samples)))
+        start = 0
+        for result in inputs:
+            with timings.stage("merge"):
+                values = np.load(result.values_path, mmap_mode="r")
+                targets = rows[result.positions]
+                present = targets >= 0
+                if present.all():
+                    matrix[targets, start:start + len(result.samples)] = values
+                else:
+                    matrix[targets[present], start:start + len(result.samples)] = values[present]
+                start += len(result.samples)
+                del values
+            merged.files[result.s3_key] = {"genes_missing": len(index) - len(result.positions)}
+            if missing_genes == "intersect":
+                merged.files[result.s3_key]["genes_dropped"] = int((~present).sum())
+        matrix.flush()
+        del matrix
+    except BaseException:
+        merged.close()
+        raise
+    return merged
@@ -0,0 +1,123 @@
+import logging
+from dataclasses import dataclass
+from typing import Dict, List, Optional
+
+import numpy as np
+import pandas as pd
+
+from rnaseq_viz.backend.ingestion import UINT32_MAX
+from rnaseq_viz.backend.statistics import StatisticsSpec, compute_statistics
+
+# Configure logger
+from rnaseq_viz.config.log_config import setup_logging
+setup_logging()
+logger = logging.getLogger(__name__)
+
+
+def _fits_uint32(values: np.ndarray) -> bool:
+    """Whether validated, non-negative sample values are whole numbers that fit in uint32."""
+    if values.dtype.kind == 'u' and values.dtype.itemsize <= 4:
+        return True
+    if len(values) == 0:
+        return True
+    if values.dtype.kind in 'iu':
+        return int(values.max()) <= UINT32_MAX
+    return bool(values.max() <= UINT32_MAX and np.all(np.mod(values, 1) == 0))
+
+
+def log2_block(columns: List[np.ndarray], rows: slice) -> np.ndarray:
+    """
+    log2(count + 1) of a block of rows of the given sample columns.
+
+    Returns:
+        np.ndarray: The values, as a (rows, columns) float64 array.
+    """
+    block = np.empty((len(columns[0][rows]), len(columns)))
+    for position, values in enumerate(columns):
+        block[:, position] = values[rows]
+    np.log1p(block, out=block)
+    block /= np.log(2)
+    return block
+
+
+@dataclass
+class CountMatrix:
+    """
+    Compact in-memory representation of a validated RNA-Seq count matrix.
+
+    Counts are held in a single C-contiguous genes x samples array, as uint32 when every
+    value is a whole number that fits, which is the case for raw counts, and as float32
+    otherwise. SYMBOL keeps the categorical dtype it was parsed with.
+
+    Attributes:
+        symbols (pd.Series): Gene identifiers, one per row.
+        sample_names (List[str]): Names of the sample columns.
+        counts (np.ndarray): Sample values, of shape (genes, samples).
+    """
+    symbols: pd.Series
+    sample_names: List[str]
+    counts: np.ndarray
+
+    @classmethod
+    def from_frame(cls, symbol: pd.Series, samples: pd.DataFrame) -> "CountMatrix":
+        """
+        Pack validated sample columns into a matrix, one column at a time so that no
+        intermediate copy of the whole matrix is made.
+
+        Args:
+            symbol (pd.Series): SYMBOL column.
+            samples (pd.DataFrame): Validated sample columns, numeric and non-negative.
+
+        Returns:
+            CountMatrix: The packed matrix. The input frame is left untouched.
+        """
+        columns = [samples.iloc[:, position].to_numpy() for position in range(samples.shape[1])]
+        dtype = np.uint32 if all(_fits_uint32(values) for values in columns) else np.float32
+        counts = np.empty((len(samples), len(columns)), dtype=dtype)
+        for position, values in enumerate(columns):
+            counts[:, position] = values
+        return cls(symbols=symbol.reset_index(drop=True), sample_names=[str(name) for name in samples.columns],
+                   counts=counts)
+
+    @property
+    def n_genes(self) -> int:
+        return self.counts.shape[0]
+
+    @property
+    def n_samples(self) -> int:
+        return self.counts.shape[1]
+
+    @property
+    def nbytes(self) -> int:
+        return self.counts.nbytes + int(self.symbols.memory_usage(deep=True, index=False))
+
+    def statistics(self, spec: StatisticsSpec = StatisticsSpec(), lengths: Optional[np.ndarray] = None,
+                   totals: Optional[np.ndarray] = None) -> Dict[str, np.ndarray]:
+        """
+        Per-gene statistics over the samples, in float64, by default Mean, Median and StdDev.
+
+        All the statistics are computed in a single pass over the matrix, see `compute_statistics`.
+
+        Args:
+            spec (StatisticsSpec): Normalization and statistics to compute.
+            lengths (Optional[np.ndarray]): Gene lengths, required by the TPM normalizations.
+            totals (Optional[np.ndarray]): Per-sample totals of the whole input when the matrix is a chunk of it.
+
+        Returns:
+            Dict[str, np.ndarray]: Arrays of `n_genes` values, by statistic column.
+        """
+        return compute_statistics(self.counts, spec, lengths, totals)
+
+    def to_frame(self, stats: Dict[str, np.ndarray]) -> pd.DataFrame:
+        """
+        Processed result with SYMBOL, the statistics and the sample columns, in this order.
+
+        The sample columns are a view of the matrix, not a copy.
+
+        Returns:
+            pd.DataFrame: The processed result.
+        """
+        frame = pd.DataFrame(self.counts, columns=self.sample_names, copy=False)
+        for position, (name, values) in enumerate([('SYMBOL', self.symbols), *stats.items()]):
+            frame.insert(position, name, values)
+        return frame
@@ -1,34 +1,42 @@
 import logging
+import numpy as np
 import pandas as pd
 from pydantic import BaseModel, ValidationError, field_validator, ConfigDict
-from typing import List
+from typing import List, Optional, Tuple
+
+from rnaseq_viz.backend.count_matrix import CountMatrix
+from rnaseq_viz.backend.incremental import StatisticsState, statistics_with_state
+from rnaseq_viz.backend.statistics import StatisticsSpec, gene_lengths
+from rnaseq_viz.backend.validation import ValidationReport, validate_sample_matrix, validate_symbol_array
+from rnaseq_viz.common.metrics import StageTimings
 
 # Configure logger
 from rnaseq_viz.config.log_config import setup_logging
 setup_logging()
 logger = logging.getLogger(__name__)
 
+# Version of the processing output, bump it whenever the processed result changes for the same input
+PROCESSING_VERSION = "5"
+
 
 class RNASeqData(BaseModel):
-    SYMBOL: List[str]
+    SYMBOL: np.ndarray
     samples: pd.DataFrame
 
     # Model configuration
     model_config = ConfigDict(arbitrary_types_allowed=True)
 
-    @field_validator('SYMBOL')
-    def validate_symbol(cls, symbol: List[str]) -> List[str]:
+    @field_validator('SYMBOL', mode='before')
+    def validate_symbol(cls, symbol) -> np.ndarray:
         logger.info("Validating SYMBOL column...")
+        symbol = np.asarray(symbol, dtype=object)
 
-        # Check for NA or None values
-        if any(s is None or pd.isna(s) for s in symbol):
-            logger.error("Validation Error: SYMBOL column contains NA or None values.")
-            raise ValueError("SYMBOL column must not contain NA or None values.")
-
-        # Check for uniqueness
-        if len(symbol) != len(set(symbol)):
-            logger.error("Validation Error: SYMBOL column contains duplicate values.")
-            raise ValueError("SYMBOL column must contain unique values.")
+        # Check for NA, non-string and duplicate values
+        report = ValidationReport()
+        validate_symbol_array(symbol, report)
+        if not report.ok:
+            logger.error("Validation Error: SYMBOL column is invalid.\n%s", report.summary())
+            raise ValueError(f"SYMBOL column must contain unique, non-NA strings. {report.summary()}")
 
         return symbol
 
@@ -36,60 +44,156 @@ class RNASeqData(BaseModel):
     def validate_samples(cls, samples: pd.DataFrame) -> pd.DataFrame:
         logger.info("Validating sample columns...")
 
-        # Check for NA or None values
-        if samples.isna().any().any():
-            logger.error("Validation Error: Sample columns contain NA or None values.")
-            raise ValueError("Sample columns must not contain NA or None values.")
-
-        # Check that all sample columns are of int or float type and contain no negative values
-        for col in samples.columns:
-            if not samples[col].apply(lambda x: isinstance(x, (int, float)) and x >= 0).all():
-                logger.error("Validation Error: All sample columns must be "
-                             "of int or float type and contain no negative values.")
-                raise ValueError("All sample columns must be of int or float type and contain no negative values.")
+        # Check that all sample values are numeric, not NA and not negative
+        report = ValidationReport()
+        validate_sample_matrix(samples, report)
+        if not report.ok:
+            logger.error("Validation Error: Sample columns are invalid.\n%s", report.summary())
+            raise ValueError("All sample columns must be of int or float type and contain no NA "
+                             f"or negative values. {report.summary()}")
 
         return samples
 
 
-def process_rnaseq_data(df: pd.DataFrame) -> pd.DataFrame:
+def process_rnaseq_data(df: pd.DataFrame, timings: Optional[StageTimings] = None,
+                        statistics: StatisticsSpec = StatisticsSpec(),
+                        states: Optional[List[StatisticsState]] = None) -> pd.DataFrame:
     """
-    Process the RNA-Seq DataFrame by calculating Mean, Median, and StdDev.
+    Process the RNA-Seq DataFrame by calculating Mean, Median, StdDev and the other selected statistics.
     Perform validation on input data.
 
     Args:
-        df (pd.DataFrame): Input DataFrame containing RNA-Seq data with SYMBOL and sample columns.
+        df (pd.DataFrame): Input DataFrame containing RNA-Seq data with SYMBOL and sample columns,
+            and a Length column of gene lengths for the TPM normalizations.
+        timings (StageTimings): Receives the timings of the validate and compute stages.
+        statistics (StatisticsSpec): Normalization the statistics are computed on, and statistics to compute.
+        states (Optional[List[StatisticsState]]): Receives the state the statistics are updated from when
+            samples are appended to the result, if they can be.
 
     Returns:
-        pd.DataFrame: Processed DataFrame with Mean, Median, and StdDev columns inserted before sample columns.
+        pd.DataFrame: Processed DataFrame with the statistic columns inserted before sample columns.
+        Sample columns are the raw values, uint32 for whole counts and float32 otherwise.
+        `df` is not modified.
     """
 
     logger.info("Starting RNA-Seq data processing...")
+    timings = timings or StageTimings()
 
     # Check that the 'SYMBOL' column exists
     if 'SYMBOL' not in df.columns:
         logger.error("SYMBOL column is missing from the DataFrame.")
         raise ValueError("SYMBOL column is required in the DataFrame.")
 
-    # Separate the SYMBOL column from the samples
+    # Separate the SYMBOL column, and the gene lengths if used, from the samples
     symbol: pd.Series = df['SYMBOL']
-    samples: pd.DataFrame = df.drop(columns=['SYMBOL'])
+    lengths = gene_lengths(df) if statistics.needs_lengths else None
+    # Built from the columns rather than with `drop`, which would copy every sample column
+    samples: pd.DataFrame = pd.DataFrame({column: df[column] for column in statistics.sample_columns(df.columns)},
+                                         copy=False)
 
     # Validate the data using RNASeqData model
-    try:
-        rnaseq_data = RNASeqData(SYMBOL=symbol.tolist(), samples=samples)
-    except ValidationError as e:
-        logger.error(f"Data validation failed: {e}")
-        raise
+    with timings.stage("validate") as stage:
+        stage.update(rows=len(samples), columns=samples.shape[1])
+        try:
+            rnaseq_data = RNASeqData(SYMBOL=symbol.to_numpy(), samples=samples)
+        except ValidationError as e:
+            logger.error("Data validation failed: %s", e)
+            raise
 
     # Calculate statistics
-    logger.info("Calculating Mean, Median, and StdDev for each row...")
-    df['Mean'] = rnaseq_data.samples.mean(axis=1)
-    df['Median'] = rnaseq_data.samples.median(axis=1)
-    df['StdDev'] = rnaseq_data.samples.std(axis=1)
+    logger.info("Calculating %s of the %s normalized values for each row...",
+                ', '.join(statistics.columns), statistics.normalization)
+    with timings.stage("compute") as stage:
+        matrix = CountMatrix.from_frame(symbol, rnaseq_data.samples)
+        stage.update(rows=matrix.n_genes, columns=matrix.n_samples, bytes=matrix.nbytes)
+        if states is None:
+            stats = matrix.statistics(statistics, lengths)
+        else:
+            stats, state = statistics_with_state(matrix.counts, statistics, lengths)
+            if state is not None:
+                states.append(state)
+
+    # Place SYMBOL and the statistics before the sample columns, which are a view of the matrix
+    processed_df: pd.DataFrame = matrix.to_frame(stats)
+
+    logger.info("RNA-Seq data processing completed successfully (%s matrix of %s bytes).",
+                matrix.counts.dtype, matrix.nbytes)
 
-    # Reorder the DataFrame to place SYMBOL, Mean, Median, StdDev before the sample columns
-    processed_df: pd.DataFrame = df[['SYMBOL', 'Mean', 'Median', 'StdDev'] + list(rnaseq_data.samples.columns)]
+    return processed_df
 
-    logger.info("RNA-Seq data processing completed successfully.")
 
-    return processed_df
+def append_rnaseq_samples(base_df: pd.DataFrame, df: pd.DataFrame, timings: Optional[StageTimings] = None,
+                          statistics: StatisticsSpec = StatisticsSpec(),
+                          state: Optional[StatisticsState] = None) -> Tuple[pd.DataFrame, Optional[StatisticsState]]:
+    """
+    Append the sample columns of a new input to a processed result, and update its statistics.
+
+    Only the new sample columns are validated, those of the result were when it was processed.
+    The new input must have the genes of the result, in any order. With the `state` of the
+    result, stored with every result, the statistics are updated from it and the new columns
+    only. Without it, e.g. for a result processed before states were stored, they are computed
+    over all the columns, and the state built for the next append.
+
+    Args:
+        base_df (pd.DataFrame): Processed result, with SYMBOL, the statistic columns of `statistics` and the samples.
+        df (pd.DataFrame): New input, with SYMBOL and the new sample columns, and a Length column for the TPM
+            normalizations.
+        timings (StageTimings): Receives the timings of the validate and compute stages.
+        statistics (StatisticsSpec): Normalization and statistics of the result.
+        state (Optional[StatisticsState]): Summaries of the samples of the result, from the previous append.
+
+    Returns:
+        Tuple[pd.DataFrame, Optional[StatisticsState]]: The processed result with the samples of both inputs,
+        and the state of its samples, None if a statistic of the result cannot be updated from one.
+    """
+    logger.info("Appending samples to a processed RNA-Seq result...")
+    timings = timings or StageTimings()
+    if 'SYMBOL' not in df.columns:
+        logger.error("SYMBOL column is missing from the DataFrame.")
+        raise ValueError("SYMBOL column is required in the DataFrame.")
+
+    base_samples: List[str] = [column for column in base_df.columns[1:] if column not in statistics.columns]
+    new_samples: List[str] = statistics.sample_columns(df.columns)
+    existing = sorted(set(new_samples) & set(base_samples), key=new_samples.index)
+    if existing:
+        raise ValueError(f"Samples {existing[:5]} are already in the result")
+
+    with timings.stage("validate") as stage:
+        stage.update(rows=len(df), columns=len(new_samples))
+        try:
+            rnaseq_data = RNASeqData(SYMBOL=df['SYMBOL'].to_numpy(),
+                                     samples=pd.DataFrame({column: df[column] for column in new_samples}, copy=False))
+        except ValidationError as e:
+            logger.error("Data validation failed: %s", e)
+            raise
+        # Rows of the new input in the gene order of the result
+        symbol: pd.Series = base_df['SYMBOL']
+        order = pd.Index(rnaseq_data.SYMBOL).get_indexer(symbol.astype(object))
+        if (order < 0).any() or len(df) != len(base_df):
+            missing = symbol[order < 0]
+            raise ValueError(f"The new samples must have the genes of the result, {len(missing)} are missing "
+                             f"(e.g. {missing.head(5).tolist()}) and {len(df) - len(base_df) + len(missing)} "
+                             f"are not in the result")
+    lengths = gene_lengths(df)[order] if statistics.needs_lengths else None
+
+    with timings.stage("compute") as stage:
+        columns = {column: base_df[column] for column in base_samples}
+        columns.update((column, rnaseq_data.samples[column].to_numpy()[order]) for column in new_samples)
+        matrix = CountMatrix.from_frame(symbol, pd.DataFrame(columns, copy=False))
+        stage.update(rows=matrix.n_genes, columns=len(new_samples), bytes=matrix.nbytes)
+        n_base = len(base_samples)
+        if state is not None and state.spec == statistics and state.n_samples == n_base \
+                and len(state.mean) == matrix.n_genes:
+            logger.info("Updating %s from the state of %s samples with %s new samples",
+                        ', '.join(statistics.columns), n_base, len(new_samples))
+            state.append(matrix.counts[:, n_base:], lengths, matrix.counts)
+            stats = state.statistics()
+        else:
+            # Results processed before states were stored, or with statistics that cannot be updated
+            logger.info("Calculating %s over %s samples, no state of the result to update",
+                        ', '.join(statistics.columns), matrix.n_samples)
+            stats, state = statistics_with_state(matrix.counts, statistics, lengths)
+
+    processed_df: pd.DataFrame = matrix.to_frame(stats)
+    logger.info("Appended %s samples to a result of %s samples", len(new_samples), n_base)
+    return processed_df, state
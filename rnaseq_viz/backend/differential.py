@@ -0,0 +1,232 @@
+import logging
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+import pandas as pd
+
+from rnaseq_viz.backend.count_matrix import log2_block
+
+# Configure logger
+from rnaseq_viz.config.log_config import setup_logging
+setup_logging()
+logger = logging.getLogger(__name__)
+
+DE_COLUMNS = ["log2FoldChange", "t", "pvalue", "FDR"]
+
+# Rows converted to float64 at a time, about 16 MB for 500 samples
+_DE_BLOCK_ROWS = 4096
+# Lanczos approximation of the gamma function, g = 7, accurate to about 1e-15 for x >= 0.5
+_LANCZOS_G = 7
+_LANCZOS_COEFFICIENTS = (
+    0.99999999999980993, 676.5203681218851, -1259.1392167224028, 771.32342877765313, -176.61502916214059,
+    12.507343278686905, -0.13857109526572012, 9.9843695780195716e-6, 1.5056327351493116e-7,
+)
+# Continued fraction of the incomplete beta function, see Numerical Recipes 6.4
+_BETA_CF_MAX_ITERATIONS = 300
+_BETA_CF_EPSILON = 1e-15
+_BETA_CF_TINY = 1e-300
+
+
+@dataclass(frozen=True)
+class Comparison:
+    """
+    Two groups of samples compared by differential expression, `test` against `reference`.
+
+    Attributes:
+        test (Tuple[str, ...]): Sample columns of the test group, e.g. the treated samples.
+        reference (Tuple[str, ...]): Sample columns of the reference group, e.g. the controls.
+    """
+    test: Tuple[str, ...]
+    reference: Tuple[str, ...]
+
+    def __post_init__(self):
+        for name, group in (("test", self.test), ("reference", self.reference)):
+            if len(group) < 2:
+                raise ValueError(f"The {name} group needs at least 2 samples, got {len(group)}")
+            if len(set(group)) != len(group):
+                raise ValueError(f"The {name} group lists a sample more than once")
+        overlap = set(self.test) & set(self.reference)
+        if overlap:
+            raise ValueError(f"Samples {sorted(overlap)} are in both groups")
+
+    @classmethod
+    def from_request(cls, test: Optional[Sequence[str]], reference: Optional[Sequence[str]]) -> Optional["Comparison"]:
+        """
+        Returns:
+            Optional[Comparison]: The comparison of the request, or None if it has no sample groups.
+
+        Raises:
+            ValueError: If only one group is given, or the groups are invalid.
+        """
+        if not test and not reference:
+            return None
+        if not (test and reference):
+            raise ValueError("Differential expression needs both test and reference samples")
+        return cls(test=tuple(str(s) for s in test), reference=tuple(str(s) for s in reference))
+
+    def as_params(self) -> Dict[str, List[str]]:
+        """Processing parameters of the comparison, as part of the result cache key."""
+        return {"test": list(self.test), "reference": list(self.reference)}
+
+    def check(self, sample_names: Sequence[str]) -> None:
+        """
+        Raises:
+            ValueError: If a sample of the comparison is not a sample column of the input.
+        """
+        available = {str(name) for name in sample_names}
+        missing = [s for s in self.test + self.reference if s not in available]
+        if missing:
+            raise ValueError(f"Samples {missing} of the comparison are not in the input")
+
+
+def _log_gamma(x: np.ndarray) -> np.ndarray:
+    """Natural logarithm of the gamma function, elementwise, for x >= 0.5."""
+    x = np.asarray(x, dtype=np.float64) - 1
+    series = np.full_like(x, _LANCZOS_COEFFICIENTS[0])
+    for i, coefficient in enumerate(_LANCZOS_COEFFICIENTS[1:], start=1):
+        series += coefficient / (x + i)
+    t = x + _LANCZOS_G + 0.5
+    return 0.5 * np.log(2 * np.pi) + (x + 0.5) * np.log(t) - t + np.log(series)
+
+
+def _beta_continued_fraction(a: np.ndarray, b: np.ndarray, x: np.ndarray) -> np.ndarray:
+    """Continued fraction of the incomplete beta function by the modified Lentz method, elementwise."""
+    def clamp(values):
+        return np.where(np.abs(values) < _BETA_CF_TINY, _BETA_CF_TINY, values)
+
+    c = np.ones_like(x)
+    d = 1 / clamp(1 - (a + b) * x / (a + 1))
+    h = d.copy()
+    for m in range(1, _BETA_CF_MAX_ITERATIONS + 1):
+        even = m * (b - m) * x / ((a - 1 + 2 * m) * (a + 2 * m))
+        d = 1 / clamp(1 + even * d)
+        c = clamp(1 + even / c)
+        h *= d * c
+        odd = -(a + m) * (a + b + m) * x / ((a + 2 * m) * (a + 1 + 2 * m))
+        d = 1 / clamp(1 + odd * d)
+        c = clamp(1 + odd / c)
+        delta = d * c
+        h *= delta
+        if np.all(np.abs(delta - 1) < _BETA_CF_EPSILON):
+            break
+    return h
+
+
+def regularized_incomplete_beta(a: np.ndarray, b: np.ndarray, x: np.ndarray) -> np.ndarray:
+    """
+    Regularized incomplete beta function I_x(a, b), elementwise, for a, b >= 0.5 and x in [0, 1].
+
+    Returns:
+        np.ndarray: The values, NaN where an argument is NaN.
+    """
+    a, b, x = np.broadcast_arrays(*(np.asarray(v, dtype=np.float64) for v in (a, b, x)))
+    result = np.full(x.shape, np.nan)
+    valid = ~(np.isnan(a) | np.isnan(b) | np.isnan(x))
+    a, b, x = a[valid], b[valid], x[valid]
+    with np.errstate(divide="ignore", invalid="ignore"):
+        log_front = _log_gamma(a + b) - _log_gamma(a) - _log_gamma(b) + a * np.log(x) + b * np.log1p(-x)
+        front = np.exp(log_front)
+        # The continued fraction converges quickly for x below (a + 1) / (a + b + 2), and
+        # I_x(a, b) = 1 - I_{1-x}(b, a) covers the values above
+        direct = x < (a + 1) / (a + b + 2)
+        values = np.empty_like(x)
+        values[direct] = front[direct] * _beta_continued_fraction(a[direct], b[direct], x[direct]) / a[direct]
+        swapped = ~direct
+        values[swapped] = 1 - front[swapped] * _beta_continued_fraction(
+            b[swapped], a[swapped], 1 - x[swapped]) / b[swapped]
+    result[valid] = np.clip(values, 0, 1)
+    return result
+
+
+def t_test_pvalues(t: np.ndarray, df: np.ndarray) -> np.ndarray:
+    """
+    Two-sided p-values of Student t statistics, P(|T| >= |t|) with `df` degrees of freedom.
+
+    Returns:
+        np.ndarray: The p-values, NaN where the statistic or the degrees of freedom are NaN.
+    """
+    t = np.asarray(t, dtype=np.float64)
+    df = np.asarray(df, dtype=np.float64)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        x = df / (df + t * t)
+    # An infinite statistic has a p-value of 0
+    x = np.where(np.isinf(t) & ~np.isnan(df), 0.0, x)
+    return regularized_incomplete_beta(df / 2, 0.5, x)
+
+
+def welch_t_test(test: np.ndarray, reference: np.ndarray) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Welch's unequal variances t-test of each row of `test` against the same row of `reference`.
+
+    Args:
+        test (np.ndarray): Values of the test group, of shape (genes, test samples).
+        reference (np.ndarray): Values of the reference group, of shape (genes, reference samples).
+
+    Returns:
+        Tuple[np.ndarray, np.ndarray, np.ndarray]: Difference of the group means, t statistic
+        and two-sided p-value of each row. Rows with no variance in either group get NaN
+        statistics and p-values.
+    """
+    n_test, n_reference = test.shape[1], reference.shape[1]
+    difference = test.mean(axis=1) - reference.mean(axis=1)
+    se_test = test.var(axis=1, ddof=1) / n_test
+    se_reference = reference.var(axis=1, ddof=1) / n_reference
+    se = se_test + se_reference
+    with np.errstate(divide="ignore", invalid="ignore"):
+        t = np.where(se > 0, difference / np.sqrt(se), np.nan)
+        # Welch-Satterthwaite degrees of freedom
+        df = se * se / (se_test * se_test / (n_test - 1) + se_reference * se_reference / (n_reference - 1))
+    return difference, t, t_test_pvalues(t, df)
+
+
+def benjamini_hochberg(pvalues: np.ndarray) -> np.ndarray:
+    """
+    Benjamini-Hochberg adjusted p-values, i.e. the false discovery rate at which each test is significant.
+
+    Returns:
+        np.ndarray: The adjusted p-values. NaN p-values stay NaN and do not count as tests.
+    """
+    pvalues = np.asarray(pvalues, dtype=np.float64)
+    adjusted = np.full(len(pvalues), np.nan)
+    tested = np.flatnonzero(~np.isnan(pvalues))
+    if len(tested) == 0:
+        return adjusted
+    order = tested[np.argsort(pvalues[tested], kind="stable")]
+    scaled = pvalues[order] * len(order) / np.arange(1, len(order) + 1)
+    # The adjusted p-value of a test is the smallest scaled p-value of the tests ranked at or after it
+    adjusted[order] = np.minimum(np.minimum.accumulate(scaled[::-1])[::-1], 1)
+    return adjusted
+
+
+def differential_expression(processed: pd.DataFrame, comparison: Comparison,
+                            block_rows: int = _DE_BLOCK_ROWS, adjust: bool = True) -> pd.DataFrame:
+    """
+    Compare the test and reference samples of every gene with Welch's t-test on log2(count + 1).
+
+    The log2 fold change is the difference of the group means on that scale. The test runs
+    on blocks of `block_rows` genes at a time, all the genes of a block at once.
+
+    Args:
+        processed (pd.DataFrame): SYMBOL and the validated sample columns, e.g. a processed result.
+        comparison (Comparison): The sample groups.
+        block_rows (int): Number of genes converted to float64 at a time.
+        adjust (bool): Whether to compute the FDR column. Chunks of a larger input are adjusted
+            together with `benjamini_hochberg` once all of them are tested.
+
+    Returns:
+        pd.DataFrame: SYMBOL, log2FoldChange, t, pvalue and FDR, with the rows of the input.
+    """
+    comparison.check(processed.columns)
+    test_columns = [processed[name].to_numpy() for name in comparison.test]
+    reference_columns = [processed[name].to_numpy() for name in comparison.reference]
+    n_genes = len(processed)
+    results = {column: np.empty(n_genes) for column in DE_COLUMNS[:3]}
+    for start in range(0, n_genes, block_rows):
+        rows = slice(start, start + block_rows)
+        fold_change, t, pvalue = welch_t_test(log2_block(test_columns, rows), log2_block(reference_columns, rows))
+        results["log2FoldChange"][rows], results["t"][rows], results["pvalue"][rows] = fold_change, t, pvalue
+
+    result = pd.DataFrame({"SYMBOL": processed["SYMBOL"].to_numpy(), **results})
+    result["FDR"] = benjamini_hochberg(results["pvalue"]) if adjust else np.nan
+    return result
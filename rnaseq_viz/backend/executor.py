@@ -0,0 +1,200 @@
+import logging
+import multiprocessing
+import threading
+from concurrent.futures import Executor, Future, ThreadPoolExecutor
+from multiprocessing.connection import Connection
+from typing import Callable, Dict, List, Optional, Tuple
+
+from rnaseq_viz.common.storage import ObjectStorage, create_storage
+from rnaseq_viz.backend import pipeline
+from rnaseq_viz.backend.differential import Comparison
+from rnaseq_viz.backend.statistics import StatisticsSpec
+from rnaseq_viz.backend.task_control import TaskControl
+from rnaseq_viz.config.config import PROCESSING_N_WORKERS, PROCESSING_MP_START_METHOD
+
+# Configure logger
+from rnaseq_viz.config.log_config import log_context, setup_logging
+setup_logging()
+logger = logging.getLogger(__name__)
+
+
+# Object storage of the worker process, created when the worker starts
+_worker_s3_manager: Optional[ObjectStorage] = None
+
+
+def _init_worker():
+    global _worker_s3_manager
+    logger.info("Initializing processing worker...")
+    _worker_s3_manager = create_storage()
+
+
+def _run_in_worker(connection: Connection, job: Callable, args: Tuple) -> None:
+    """Entry point of the worker process of a job, which sends back the outcome of the job, or its error."""
+    _init_worker()
+    try:
+        outcome = ("result", job(*args))
+    except BaseException as e:
+        outcome = ("error", e)
+    try:
+        connection.send(outcome)
+    except Exception:
+        # The error cannot be pickled, its message is enough
+        connection.send(("error", RuntimeError(str(outcome[1]))))
+    finally:
+        connection.close()
+
+
+def run_processing_job(task_id: str, s3_key: str, folder: str, result_format: str,
+                       comparison: Optional[Comparison] = None,
+                       statistics: StatisticsSpec = StatisticsSpec(),
+                       control: Optional[TaskControl] = None) -> pipeline.ProcessingOutcome:
+    """
+    Entry point of a processing job inside a worker.
+
+    Returns:
+        pipeline.ProcessingOutcome: S3 key of the processed result, per-stage timings, peak memory and hash
+        of the input. Failures propagate as exceptions through the future.
+    """
+    with log_context(task_id=task_id):
+        return pipeline.process_file(_worker_s3_manager, task_id, s3_key, folder, result_format, comparison,
+                                     statistics, control)
+
+
+def run_batch_job(task_id: str, s3_keys: List[str], folder: str, result_format: str,
+                  comparison: Optional[Comparison] = None,
+                  statistics: StatisticsSpec = StatisticsSpec(),
+                  control: Optional[TaskControl] = None, missing_genes: str = "zero") -> pipeline.ProcessingOutcome:
+    """Entry point of the processing job of a batch of inputs inside a worker, see `run_processing_job`."""
+    with log_context(task_id=task_id):
+        return pipeline.process_batch(_worker_s3_manager, task_id, s3_keys, folder, result_format, comparison,
+                                      statistics, control, missing_genes)
+
+
+def run_append_job(task_id: str, base_result_s3_key: str, s3_key: str, folder: str, result_format: str,
+                   control: Optional[TaskControl] = None,
+                   study_id: Optional[str] = None) -> pipeline.ProcessingOutcome:
+    """Entry point of the job appending samples to a processed result inside a worker, see `run_processing_job`."""
+    with log_context(task_id=task_id):
+        return pipeline.process_append(_worker_s3_manager, task_id, base_result_s3_key, s3_key, folder, result_format,
+                                       control, study_id)
+
+
+class ProcessingExecutor:
+    """
+    Runs processing jobs outside of the API request threadpool.
+
+    Each job runs in a process of its own, so that CPU-bound pandas work does not hold
+    the GIL of the API process, and so that the job of a single task can be killed, e.g.
+    when it is stuck past its deadline, without affecting the others. At most `n_workers`
+    jobs run at once, the others wait in the order they were submitted. With `n_workers=0`
+    jobs run in a single background thread instead, which is convenient for local dev.
+    """
+
+    def __init__(self, n_workers: int = PROCESSING_N_WORKERS, start_method: str = PROCESSING_MP_START_METHOD):
+        self.n_workers = n_workers
+        self.start_method = start_method
+        self._context = multiprocessing.get_context(start_method)
+        if start_method == "forkserver":
+            # Worker processes are forked with the processing modules already imported
+            self._context.set_forkserver_preload([__name__])
+        # Worker processes of the running jobs, by task ID
+        self._processes: Dict[str, multiprocessing.process.BaseProcess] = {}
+        self._processes_lock = threading.Lock()
+        self._pool = self._create_pool()
+
+    def _create_pool(self) -> Executor:
+        if self.n_workers == 0:
+            logger.info("Creating in-process processing thread")
+            return ThreadPoolExecutor(max_workers=1, initializer=_init_worker)
+        logger.info("Running up to %s processing jobs at once in %s worker processes", self.n_workers,
+                    self.start_method)
+        # Each thread waits for the worker process of one job
+        return ThreadPoolExecutor(max_workers=self.n_workers, thread_name_prefix="processing")
+
+    def submit(self, task_id: str, s3_key: str, folder: str, result_format: str,
+               comparison: Optional[Comparison] = None, statistics: StatisticsSpec = StatisticsSpec(),
+               control: Optional[TaskControl] = None) -> Future:
+        """
+        Queue a processing job.
+
+        Returns:
+            Future: Resolves to the `pipeline.ProcessingOutcome` of the job, or raises the job's exception.
+        """
+        return self._submit(run_processing_job, task_id, s3_key, folder, result_format, comparison, statistics,
+                            control)
+
+    def submit_batch(self, task_id: str, s3_keys: List[str], folder: str, result_format: str,
+                     comparison: Optional[Comparison] = None, statistics: StatisticsSpec = StatisticsSpec(),
+                     control: Optional[TaskControl] = None, missing_genes: str = "zero") -> Future:
+        """
+        Queue the processing job of a batch of inputs, merged first.
+
+        Returns:
+            Future: Resolves to the `pipeline.ProcessingOutcome` of the job, or raises the job's exception.
+        """
+        return self._submit(run_batch_job, task_id, s3_keys, folder, result_format, comparison, statistics,
+                            control, missing_genes)
+
+    def submit_append(self, task_id: str, base_result_s3_key: str, s3_key: str, folder: str, result_format: str,
+                      control: Optional[TaskControl] = None, study_id: Optional[str] = None) -> Future:
+        """
+        Queue the job appending the samples of an upload to a processed result.
+
+        Returns:
+            Future: Resolves to the `pipeline.ProcessingOutcome` of the job, or raises the job's exception.
+        """
+        return self._submit(run_append_job, task_id, base_result_s3_key, s3_key, folder, result_format, control,
+                            study_id)
+
+    def kill(self, task_id: str) -> bool:
+        """
+        Kill the worker process of the job of a task, e.g. one stuck in a stage past its deadline.
+
+        The job fails with a RuntimeError, the jobs of the other tasks are not affected.
+
+        Returns:
+            bool: False if the job of the task does not run in a worker process, e.g. it is not
+            started yet, it finished, or jobs run in a thread.
+        """
+        with self._processes_lock:
+            process = self._processes.get(task_id)
+        if process is None or process.pid is None:
+            return False
+        logger.warning("Killing processing worker %s of task %s", process.pid, task_id)
+        process.kill()
+        return True
+
+    def _run_in_process(self, job: Callable, task_id: str, *args):
+        """Run a job in a new worker process, and wait for its outcome."""
+        receiver, sender = self._context.Pipe(duplex=False)
+        process = self._context.Process(target=_run_in_worker, args=(sender, job, (task_id, *args)),
+                                        name=f"processing-{task_id}")
+        with self._processes_lock:
+            self._processes[task_id] = process
+        try:
+            process.start()
+            # Only the worker holds the sending end, so that its death ends the wait
+            sender.close()
+            try:
+                status, value = receiver.recv()
+            except EOFError:
+                process.join()
+                status, value = "error", RuntimeError(f"Processing worker of task {task_id} exited with code "
+                                                      f"{process.exitcode} before the end of its job")
+            process.join()
+        finally:
+            receiver.close()
+            with self._processes_lock:
+                self._processes.pop(task_id, None)
+        if status == "error":
+            raise value
+        return value
+
+    def _submit(self, job: Callable, task_id: str, *args) -> Future:
+        if self.n_workers == 0:
+            return self._pool.submit(job, task_id, *args)
+        return self._pool.submit(self._run_in_process, job, task_id, *args)
+
+    def shutdown(self, wait: bool = True) -> None:
+        logger.info("Shutting down processing workers...")
+        self._pool.shutdown(wait=wait, cancel_futures=True)
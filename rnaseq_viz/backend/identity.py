@@ -0,0 +1,92 @@
+import hashlib
+import logging
+import threading
+import time
+from collections import OrderedDict
+from typing import Optional, Tuple
+
+import boto3
+from botocore.exceptions import ClientError
+from fastapi import HTTPException, Request
+
+from rnaseq_viz.config.config import COGNITO_BYPASS_AUTH, COGNITO_REGION, AUTH_USER_CACHE_SECONDS
+
+# Configure logger
+from rnaseq_viz.config.log_config import setup_logging
+setup_logging()
+logger = logging.getLogger(__name__)
+
+# Most access tokens whose user is remembered at once
+_MAX_CACHED_TOKENS = 10000
+
+
+class UserResolver:
+    """
+    Identifies the user a request is made for, to whom the per-user limits of the scheduler apply.
+
+    A request with a Cognito access token in an `Authorization: Bearer` header is made for the user the
+    token was issued to, as told by Cognito. The user of a token is remembered for `ttl_seconds`, so that
+    Cognito is not called on every request. Any other request, or every request when Cognito authentication
+    is bypassed, is made for its client address.
+    """
+
+    def __init__(self, cognito_client=None, use_tokens: bool = not COGNITO_BYPASS_AUTH,
+                 ttl_seconds: float = AUTH_USER_CACHE_SECONDS):
+        self._cognito_client = cognito_client
+        self.use_tokens = use_tokens
+        self.ttl_seconds = ttl_seconds
+        self._users: "OrderedDict[str, Tuple[str, float]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _cognito(self):
+        if self._cognito_client is None:
+            self._cognito_client = boto3.client('cognito-idp', region_name=COGNITO_REGION)
+        return self._cognito_client
+
+    def user(self, request: Request) -> str:
+        """
+        Return the user of a request.
+
+        Args:
+            request (Request): The incoming request.
+
+        Returns:
+            str: The username of its access token, else its client address.
+
+        Raises:
+            HTTPException: 401 if the access token of the request is invalid or expired.
+        """
+        scheme, _, token = request.headers.get("Authorization", "").partition(" ")
+        if self.use_tokens and scheme.lower() == "bearer" and token.strip():
+            return self._token_user(token.strip())
+        # Behind a reverse proxy, run uvicorn with --proxy-headers to get the address of the client
+        return request.client.host if request.client else "anonymous"
+
+    def _cached_user(self, key: str) -> Optional[str]:
+        with self._lock:
+            entry = self._users.get(key)
+            if entry is None or time.monotonic() - entry[1] >= self.ttl_seconds:
+                return None
+            self._users.move_to_end(key)
+            return entry[0]
+
+    def _token_user(self, token: str) -> str:
+        # Tokens are remembered by their digest, not kept in memory as they are
+        key = hashlib.sha256(token.encode()).hexdigest()
+        username = self._cached_user(key)
+        if username is not None:
+            return username
+        try:
+            username = self._cognito().get_user(AccessToken=token)["Username"]
+        except ClientError as e:
+            if e.response["Error"]["Code"] in ("NotAuthorizedException", "UserNotFoundException"):
+                logger.warning("Rejected a request with an invalid access token: %s", e.response["Error"]["Code"])
+                raise HTTPException(status_code=401, detail="Invalid or expired access token",
+                                    headers={"WWW-Authenticate": "Bearer"})
+            raise
+        with self._lock:
+            self._users[key] = (username, time.monotonic())
+            self._users.move_to_end(key)
+            while len(self._users) > _MAX_CACHED_TOKENS:
+                self._users.popitem(last=False)
+        return username
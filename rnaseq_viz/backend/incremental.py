@@ -0,0 +1,317 @@
+import io
+import logging
+import zipfile
+from dataclasses import dataclass
+from typing import IO, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from rnaseq_viz.backend.statistics import (
+    _median_positions, StatisticsSpec, _STATS_BLOCK_ROWS, compute_statistics, library_scale, library_sizes,
+    normalized_block
+)
+from rnaseq_viz.config.config import APPEND_MEDIAN_SKETCH_SIZE
+
+# Configure logger
+from rnaseq_viz.config.log_config import setup_logging
+setup_logging()
+logger = logging.getLogger(__name__)
+
+# Statistics that can be updated from the summaries of `StatisticsState` when samples are appended
+MERGEABLE_STATISTICS = frozenset({"mean", "median", "stddev", "cv", "detection_rate", "min_max"})
+# Fields of `StatisticsState` with one value, or row of values, per gene
+_GENE_FIELDS = ("mean", "m2", "detected", "minimum", "maximum", "below", "size", "window")
+
+
+def _sorted_window(block: np.ndarray, sketch_size: int) -> Tuple[np.ndarray, int, int]:
+    """
+    The `sketch_size` values ranked around the median of each gene of a normalized block, partially
+    sorting the block in place.
+
+    Returns:
+        Tuple[np.ndarray, int, int]: The sorted values of each gene, padded with NaN, their number,
+        and the number of values of each gene ranked below them.
+    """
+    n = block.shape[1]
+    size = min(sketch_size, n)
+    first = min(max(_median_positions(n)[0] - (size - 1) // 2, 0), n - size)
+    if size < n:
+        block.partition([first, first + size - 1], axis=1)
+    window = np.full((len(block), sketch_size), np.nan)
+    window[:, :size] = np.sort(block[:, first:first + size], axis=1)
+    return window, size, first
+
+
+@dataclass
+class StatisticsState:
+    """
+    Mergeable per-gene summaries of the normalized sample values of a processed result, from
+    which its statistics are updated when sample columns are appended, without reading the
+    values of the samples already processed.
+
+    The mean and standard deviation come from running moments, merged as in Chan et al.
+    The median comes from a sorted sketch of each gene: the `window` values ranked around its
+    median, and the number of values ranked below them. Appended values fall below, within
+    or above the window, and the median is read from the window as long as it stays within.
+    Genes whose median moves out of their window are recomputed from all their values.
+
+    Attributes:
+        spec (StatisticsSpec): Normalization and statistics of the result.
+        n_samples (int): Number of samples summarized.
+        totals (np.ndarray): Per-sample totals of the library-size normalizations, one per sample.
+        mean (np.ndarray): Mean of each gene.
+        m2 (np.ndarray): Sum of the squared deviations from the mean of each gene.
+        detected (np.ndarray): Number of samples with a non-zero value, per gene.
+        minimum (np.ndarray): Smallest value of each gene.
+        maximum (np.ndarray): Largest value of each gene.
+        below (np.ndarray): Number of values of each gene ranked below its window.
+        size (np.ndarray): Number of values in the window of each gene.
+        window (np.ndarray): Sorted values around the median of each gene, of shape (genes,
+            sketch size), padded with NaN beyond `size`.
+    """
+    spec: StatisticsSpec
+    n_samples: int
+    totals: np.ndarray
+    mean: np.ndarray
+    m2: np.ndarray
+    detected: np.ndarray
+    minimum: np.ndarray
+    maximum: np.ndarray
+    below: np.ndarray
+    size: np.ndarray
+    window: np.ndarray
+
+    @classmethod
+    def from_counts(cls, counts: np.ndarray, spec: StatisticsSpec, lengths: Optional[np.ndarray] = None,
+                    totals: Optional[np.ndarray] = None, sketch_size: int = APPEND_MEDIAN_SKETCH_SIZE,
+                    block_rows: int = _STATS_BLOCK_ROWS) -> "StatisticsState":
+        """
+        Summarize the sample values of a genes x samples matrix, in a single pass over the matrix.
+
+        Args:
+            counts (np.ndarray): Sample values, of shape (genes, samples), at least one sample.
+            spec (StatisticsSpec): Normalization and statistics of the result.
+            lengths (Optional[np.ndarray]): Gene lengths, required by the TPM normalizations.
+            totals (Optional[np.ndarray]): Per-sample totals of the whole input, from `library_sizes`,
+                computed from `counts` if None. Required when `counts` is a chunk of the input.
+            sketch_size (int): Number of values kept around the median of each gene.
+
+        Returns:
+            StatisticsState: The summaries.
+        """
+        n_genes, n_samples = counts.shape
+        if spec.needs_lengths and lengths is None:
+            raise ValueError(f"{spec.normalization} normalization requires gene lengths")
+        scale = None
+        if spec.needs_library_sizes:
+            totals = library_sizes(counts, spec, lengths, block_rows) if totals is None else totals
+            scale = library_scale(totals)
+        state = cls(spec=spec, n_samples=n_samples, totals=totals if scale is not None else np.zeros(0),
+                    mean=np.empty(n_genes), m2=np.empty(n_genes), detected=np.empty(n_genes, dtype=np.int64),
+                    minimum=np.empty(n_genes), maximum=np.empty(n_genes), below=np.empty(n_genes, dtype=np.int64),
+                    size=np.empty(n_genes, dtype=np.int64), window=np.empty((n_genes, sketch_size)))
+        for start in range(0, n_genes, block_rows):
+            rows = slice(start, start + block_rows)
+            block = normalized_block(counts, rows, spec, lengths, scale)
+            # As `BlockReductions`, so that the statistics are those of `compute_statistics`
+            state.mean[rows] = block.mean(axis=1)
+            state.m2[rows] = np.square(block - state.mean[rows, np.newaxis]).sum(axis=1)
+            state.detected[rows] = np.count_nonzero(block > 0, axis=1)
+            state.minimum[rows] = block.min(axis=1)
+            state.maximum[rows] = block.max(axis=1)
+            # Last, as it partially sorts the block in place
+            state.window[rows], state.size[rows], state.below[rows] = _sorted_window(block, sketch_size)
+        return state
+
+    @classmethod
+    def concat(cls, states: List["StatisticsState"]) -> "StatisticsState":
+        """The summaries of an input from those of its chunks of rows, in order."""
+        first = states[0]
+        return cls(spec=first.spec, n_samples=first.n_samples, totals=first.totals,
+                   **{name: np.concatenate([getattr(state, name) for state in states]) for name in _GENE_FIELDS})
+
+    @property
+    def sketch_size(self) -> int:
+        return self.window.shape[1]
+
+    def append(self, counts: np.ndarray, lengths: Optional[np.ndarray], all_counts: np.ndarray,
+               block_rows: int = _STATS_BLOCK_ROWS) -> None:
+        """
+        Add sample columns to the summaries.
+
+        Args:
+            counts (np.ndarray): Values of the appended samples, of shape (genes, new samples).
+            lengths (Optional[np.ndarray]): Gene lengths, required by the TPM normalizations.
+            all_counts (np.ndarray): Values of the samples already summarized followed by the
+                appended ones, only read for the genes whose median moved out of their window.
+        """
+        n_before, k = self.n_samples, counts.shape[1]
+        n = n_before + k
+        scale = None
+        if self.spec.needs_library_sizes:
+            totals = library_sizes(counts, self.spec, lengths, block_rows)
+            self.totals = np.concatenate([self.totals, totals])
+            scale = library_scale(totals)
+        self.n_samples = n
+        if k == 0:
+            return
+
+        refresh = []
+        with np.errstate(invalid="ignore", divide="ignore"):
+            for start in range(0, len(counts), block_rows):
+                rows = slice(start, start + block_rows)
+                block = normalized_block(counts, rows, self.spec, lengths, scale)
+                # Running moments, merged with those of the block
+                block_mean = block.mean(axis=1)
+                block_m2 = np.square(block - block_mean[:, np.newaxis]).sum(axis=1)
+                delta = block_mean - self.mean[rows]
+                self.mean[rows] += delta * (k / n)
+                self.m2[rows] += block_m2 + np.square(delta) * (n_before * k / n)
+                self.detected[rows] += np.count_nonzero(block > 0, axis=1)
+                np.minimum(self.minimum[rows], block.min(axis=1), out=self.minimum[rows])
+                np.maximum(self.maximum[rows], block.max(axis=1), out=self.maximum[rows])
+                lost = self._merge_window(rows, block, n)
+                refresh.extend(start + np.flatnonzero(lost))
+
+        if refresh:
+            logger.info("Median of %s genes moved out of their sketch, recomputing it from all %s samples",
+                        len(refresh), n)
+            self._rebuild_windows(np.asarray(refresh), all_counts, lengths)
+
+    def _merge_window(self, rows: slice, block: np.ndarray, n: int) -> np.ndarray:
+        """
+        Insert the values of a block of genes into their windows, and center them on the new median.
+
+        Returns:
+            np.ndarray: Whether the median of each gene of the block moved out of its window.
+        """
+        window, size, below = self.window[rows], self.size[rows], self.below[rows]
+        genes = np.arange(len(window))
+        lowest = window[:, 0]
+        highest = window[genes, np.maximum(size - 1, 0)]
+        # An empty window takes every value, as NaN compares false
+        lower = block < lowest[:, np.newaxis]
+        upper = block > highest[:, np.newaxis]
+        inside = ~lower & ~upper
+        below = below + np.count_nonzero(lower, axis=1)
+        merged = np.concatenate([window, np.where(inside, block, np.nan)], axis=1)
+        # NaN sort last
+        merged.sort(axis=1)
+        size = size + np.count_nonzero(inside, axis=1)
+
+        low, high = (position - below for position in _median_positions(n))
+        lost = (low < 0) | (high >= size)
+        # Keep the values ranked around the median, or the middle of the window if it moved out
+        centre = np.where(lost, size // 2, (low + high) // 2)
+        first = np.clip(centre - (self.sketch_size - 1) // 2, 0, np.maximum(size - self.sketch_size, 0))
+        columns = first[:, np.newaxis] + np.arange(self.sketch_size)
+        kept = columns < size[:, np.newaxis]
+        self.window[rows] = np.where(kept, np.take_along_axis(merged, np.minimum(columns, merged.shape[1] - 1),
+                                                              axis=1), np.nan)
+        self.size[rows] = np.minimum(size - first, self.sketch_size)
+        self.below[rows] = below + first
+        return lost
+
+    def _rebuild_windows(self, genes: np.ndarray, all_counts: np.ndarray, lengths: Optional[np.ndarray]) -> None:
+        """Recompute the windows of some genes from all their values."""
+        scale = library_scale(self.totals) if self.spec.needs_library_sizes else None
+        block = normalized_block(all_counts[genes], slice(None), self.spec,
+                                 lengths[genes] if lengths is not None else None, scale)
+        self.window[genes], self.size[genes], self.below[genes] = _sorted_window(block, self.sketch_size)
+
+    def median(self) -> np.ndarray:
+        """Median of each gene, read from its window."""
+        genes = np.arange(len(self.window))
+        low, high = (position - self.below for position in _median_positions(self.n_samples))
+        return (self.window[genes, low] + self.window[genes, high]) / 2
+
+    def statistics(self) -> Dict[str, np.ndarray]:
+        """
+        Returns:
+            Dict[str, np.ndarray]: Values of each statistic column of the spec, as `compute_statistics`.
+        """
+        n = self.n_samples
+        std = np.sqrt(self.m2 / (n - 1)) if n > 1 else np.full(len(self.mean), np.nan)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            values = {
+                "Mean": self.mean, "Median": self.median(), "StdDev": std,
+                "CV": np.where(self.mean > 0, std / self.mean, np.nan),
+                "DetectionRate": self.detected / n, "Min": self.minimum, "Max": self.maximum,
+            }
+        return {column: values[column].astype(np.float64) for column in self.spec.columns}
+
+    def to_bytes(self) -> bytes:
+        """Serialize the summaries, as an uncompressed NumPy archive."""
+        buffer = io.BytesIO()
+        np.savez(buffer, normalization=np.array(self.spec.normalization),
+                 statistics=np.array(self.spec.statistics), n_samples=np.array(self.n_samples),
+                 totals=self.totals, mean=self.mean, m2=self.m2, detected=self.detected, minimum=self.minimum,
+                 maximum=self.maximum, below=self.below, size=self.size, window=self.window)
+        return buffer.getvalue()
+
+    @classmethod
+    def from_bytes(cls, body: bytes) -> "StatisticsState":
+        """Read summaries serialized by `to_bytes`, or written chunk by chunk by `StatisticsStateWriter`."""
+        with np.load(io.BytesIO(body)) as archive:
+            fields = {name: archive[name] for name in archive.files}
+        n_chunks = int(fields.pop("n_chunks", 0))
+        if n_chunks:
+            for name in _GENE_FIELDS:
+                fields[name] = np.concatenate([fields.pop(f"{name}_{index}") for index in range(n_chunks)])
+        spec = StatisticsSpec(str(fields.pop("normalization")),
+                              tuple(str(name) for name in fields.pop("statistics")))
+        return cls(spec=spec, n_samples=int(fields.pop("n_samples")), **fields)
+
+
+class StatisticsStateWriter:
+    """
+    Writes the state of a result processed as chunks of rows, one chunk at a time, so that
+    the states of the chunks are not held in memory until the end of the input.
+
+    The archive is a NumPy archive like that of `StatisticsState.to_bytes`, with the per-gene
+    fields of each chunk stored as `{field}_{index}` and the number of chunks as `n_chunks`,
+    and is read back by `StatisticsState.from_bytes`. It is written sequentially, so the
+    output only needs `write` and `tell`, e.g. a multipart upload.
+    """
+
+    def __init__(self, file_obj: IO[bytes]):
+        self._archive = zipfile.ZipFile(file_obj, mode="w", compression=zipfile.ZIP_STORED, allowZip64=True)
+        self.n_chunks = 0
+
+    def _write_array(self, name: str, array: np.ndarray) -> None:
+        with self._archive.open(f"{name}.npy", mode="w", force_zip64=True) as member:
+            np.lib.format.write_array(member, np.asanyarray(array), allow_pickle=False)
+
+    def append(self, state: StatisticsState) -> None:
+        """Write the state of the next chunk of rows."""
+        if self.n_chunks == 0:
+            self._write_array("normalization", np.array(state.spec.normalization))
+            self._write_array("statistics", np.array(state.spec.statistics))
+            self._write_array("n_samples", np.array(state.n_samples))
+            self._write_array("totals", state.totals)
+        for name in _GENE_FIELDS:
+            self._write_array(f"{name}_{self.n_chunks}", getattr(state, name))
+        self.n_chunks += 1
+
+    def close(self) -> None:
+        """Write the number of chunks and the index of the archive, the output itself is not closed."""
+        if self.n_chunks:
+            self._write_array("n_chunks", np.array(self.n_chunks))
+        self._archive.close()
+
+
+def statistics_with_state(
+        counts: np.ndarray, spec: StatisticsSpec, lengths: Optional[np.ndarray] = None,
+        totals: Optional[np.ndarray] = None) -> Tuple[Dict[str, np.ndarray], Optional[StatisticsState]]:
+    """
+    Per-gene statistics of a genes x samples matrix, as `compute_statistics`, along with the state
+    they are updated from when samples are appended, both from the same single pass.
+
+    Returns:
+        Tuple[Dict[str, np.ndarray], Optional[StatisticsState]]: Values of each statistic column, and the
+        state, None if a statistic cannot be updated from one or the matrix has no samples.
+    """
+    if counts.shape[1] == 0 or not MERGEABLE_STATISTICS.issuperset(spec.statistics):
+        return compute_statistics(counts, spec, lengths, totals), None
+    state = StatisticsState.from_counts(counts, spec, lengths, totals)
+    return state.statistics(), state
@@ -0,0 +1,171 @@
+import hashlib
+import io
+import logging
+from typing import IO, Optional
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.csv as pacsv
+
+from rnaseq_viz.config.config import CSV_READ_BLOCK_SIZE_MB, COMPRESSED_SIZE_RATIO
+
+# Configure logger
+from rnaseq_viz.config.log_config import setup_logging
+setup_logging()
+logger = logging.getLogger(__name__)
+
+# Compression of an input, from the extension of its file name
+COMPRESSED_EXTENSIONS = {".gz": "gzip", ".gzip": "gzip", ".zst": "zstd", ".zstd": "zstd"}
+
+UINT32_MAX = np.iinfo(np.uint32).max
+
+
+def compression_of(name: str) -> Optional[str]:
+    """
+    Returns:
+        Optional[str]: "gzip" or "zstd" if the file name has a compressed extension, else None.
+    """
+    for extension, compression in COMPRESSED_EXTENSIONS.items():
+        if name.lower().endswith(extension):
+            return compression
+    return None
+
+
+def estimated_csv_size(size: int, compression: Optional[str]) -> int:
+    """Estimate the size of the decompressed CSV from the size of the stored object."""
+    return size * COMPRESSED_SIZE_RATIO if compression else size
+
+
+def decompressed_stream(stream: IO, compression: Optional[str]) -> IO:
+    """
+    Wrap a binary stream so that it is decompressed as it is read, without buffering the whole input.
+
+    Args:
+        stream (IO): Readable binary stream, e.g. an S3 body or a download buffer.
+        compression (Optional[str]): "gzip", "zstd" or None for an uncompressed stream.
+
+    Returns:
+        IO: Readable binary stream of the CSV bytes.
+    """
+    if compression is None:
+        return stream
+    if isinstance(stream, pa.NativeFile):
+        # e.g. a memory-mapped file of the local storage
+        return pa.CompressedInputStream(stream, compression)
+    return pa.CompressedInputStream(pa.PythonFile(stream, mode='r'), compression)
+
+
+class HashingReader(io.RawIOBase):
+    """
+    Readable stream computing the SHA-256 digest of the bytes read from an underlying stream,
+    so that the content of an input is hashed as it is streamed rather than in a separate pass.
+
+    The underlying stream is left open, it is closed by its owner.
+    """
+
+    def __init__(self, stream: IO[bytes]):
+        super().__init__()
+        self._stream = stream
+        self._digest = hashlib.sha256()
+        self._position = 0
+
+    def readable(self) -> bool:
+        return True
+
+    def readinto(self, buffer) -> int:
+        data = self._stream.read(len(buffer))
+        n = len(data)
+        buffer[:n] = data
+        self._digest.update(data)
+        self._position += n
+        return n
+
+    def tell(self) -> int:
+        return self._position
+
+    def hexdigest(self, chunk_size: int = 1024 * 1024) -> str:
+        """
+        Returns:
+            str: Hex digest of the whole content, reading what the consumer of the stream left unread.
+        """
+        for chunk in iter(lambda: self._stream.read(chunk_size), b""):
+            self._digest.update(chunk)
+            self._position += len(chunk)
+        return self._digest.hexdigest()
+
+
+def _compact_counts(table: pa.Table) -> pa.Table:
+    """
+    Store the integer sample columns as uint32 when all their values fit, halving their size.
+
+    Columns that do not fit, floating point and non-numeric columns are left as parsed
+    so that validation reports their values as they are in the input.
+    """
+    for position, field in enumerate(table.schema):
+        if field.name == 'SYMBOL' or not pa.types.is_integer(field.type) or table.column(position).null_count:
+            continue
+        bounds = pc.min_max(table.column(position)).as_py()
+        if bounds["min"] is None or (bounds["min"] >= 0 and bounds["max"] <= UINT32_MAX):
+            table = table.set_column(position, field.name, table.column(position).cast(pa.uint32()))
+    return table
+
+
+def _sample_column_names(source: IO, read_options: pacsv.ReadOptions) -> list:
+    """Column names of an uncompressed input other than SYMBOL, read from its header. The source is rewound."""
+    reader = pacsv.open_csv(source, read_options=read_options)
+    names = [name for name in reader.schema.names if name != 'SYMBOL']
+    source.seek(0)
+    return names
+
+
+def read_counts_csv(source: IO, compression: Optional[str] = None,
+                    block_size_mb: int = CSV_READ_BLOCK_SIZE_MB) -> pd.DataFrame:
+    """
+    Parse an RNA-Seq count CSV with pyarrow's multithreaded CSV reader.
+
+    SYMBOL is read as a categorical column and sample counts as uint32, which takes a
+    third of the memory of the object and int64 columns inferred by `pd.read_csv`.
+    When the input is uncompressed and seekable, the sample columns are parsed as uint32
+    directly, so that no int64 copy of the matrix is ever built. Inputs with values that do not fit,
+    e.g. normalized or negative values, are parsed again with inferred column types.
+
+    Args:
+        source (IO): Readable binary stream of the input.
+        compression (Optional[str]): "gzip", "zstd" or None for an uncompressed input.
+        block_size_mb (int): Size of the blocks parsed in parallel.
+
+    Returns:
+        pd.DataFrame: The input, with a categorical SYMBOL column and compact count columns.
+    """
+    read_options = pacsv.ReadOptions(use_threads=True, block_size=block_size_mb * 1024 * 1024)
+    column_types = {'SYMBOL': pa.dictionary(pa.int32(), pa.string())}
+    table = None
+    try:
+        if compression is None and source.seekable():
+            counts_types = dict(column_types, **{name: pa.uint32()
+                                                 for name in _sample_column_names(source, read_options)})
+            try:
+                # Empty and NA-like strings are missing values, as with pd.read_csv
+                table = pacsv.read_csv(source, read_options=read_options,
+                                       convert_options=pacsv.ConvertOptions(column_types=counts_types,
+                                                                            strings_can_be_null=True))
+            except pa.ArrowInvalid:
+                logger.info("Sample values do not all fit in uint32, parsing with inferred column types")
+                source.seek(0)
+        if table is None:
+            table = pacsv.read_csv(decompressed_stream(source, compression), read_options=read_options,
+                                   convert_options=pacsv.ConvertOptions(column_types=column_types,
+                                                                        strings_can_be_null=True))
+            table = _compact_counts(table)
+    except pa.ArrowInvalid as e:
+        logger.error("Failed to parse the input CSV: %s", e)
+        raise ValueError(f"Input is not a valid CSV: {e}")
+
+    logger.info("Parsed %s rows and %s columns (%s bytes in memory)", table.num_rows, table.num_columns, table.nbytes)
+    # One block per column, released from the Arrow table as it is converted, so the matrix is never held twice
+    df = table.to_pandas(split_blocks=True, self_destruct=True)
+    # Hand the parser's scratch buffers cached by the Arrow allocator back to the OS
+    pa.default_memory_pool().release_unused()
+    return df
@@ -0,0 +1,184 @@
+import fcntl
+import logging
+import os
+import threading
+import time
+from typing import Dict, Optional
+
+from rnaseq_viz.common.storage import ObjectStorage
+from rnaseq_viz.common.temp_files import cleanup_stale_temp_files
+from rnaseq_viz.common.metrics import DISK_USAGE, LIFECYCLE_REMOVED, TASK_REGISTRY_ENTRIES, update_memory_gauge
+from rnaseq_viz.backend.pipeline import read_study, study_prefix
+from rnaseq_viz.backend.result_index import cleanup_stale_indexes
+from rnaseq_viz.backend.task_control import cleanup_stale_control_files
+from rnaseq_viz.backend.task_store import TaskStore
+from rnaseq_viz.config.config import (
+    S3_BUCKET, TEMP_DIR, TEMP_FILE_MAX_AGE_SECONDS, RESULT_INDEX_DIR, TASK_STORE_PATH, RESULT_CACHE_PATH,
+    LIFECYCLE_SWEEP_INTERVAL_SECONDS, LIFECYCLE_LOCK_PATH, S3_RETENTION_SECONDS, S3_SWEEP_INTERVAL_SECONDS
+)
+
+# Configure logger
+from rnaseq_viz.config.log_config import setup_logging
+setup_logging()
+logger = logging.getLogger(__name__)
+
+# Subfolders of an upload folder written by the frontend and the backend, see `generate_unique_s3_folder`
+S3_DATA_SUBFOLDERS = ("uploads", "processed")
+
+
+def sweep_s3_data(s3_manager: ObjectStorage, bucket: str = S3_BUCKET,
+                  max_age_seconds: int = S3_RETENTION_SECONDS) -> int:
+    """
+    Delete the uploads and processed results older than `max_age_seconds` from S3.
+
+    Only keys of the form `{folder}/uploads/...`, `{folder}/processed/...` and
+    `{folder}/studies/...` are considered. The latest result of a study, its state and
+    the record of the study are kept whatever their age, so that samples can still be
+    appended to it, only the results it superseded expire. Result cache entries pointing
+    at deleted results are invalidated on their next lookup.
+
+    Returns:
+        int: Number of objects deleted.
+    """
+    cutoff = time.time() - max_age_seconds
+    latest: Dict[str, Optional[str]] = {}
+    expired = []
+    for obj in s3_manager.list_objects(bucket):
+        parts = obj["Key"].split("/")
+        if len(parts) < 3 or obj["LastModified"].timestamp() >= cutoff:
+            continue
+        if parts[1] in S3_DATA_SUBFOLDERS:
+            expired.append(obj["Key"])
+        elif parts[1] == "studies" and len(parts) == 4 and parts[3] != "study.json":
+            folder, study_id = parts[0], parts[2]
+            prefix = study_prefix(folder, study_id)
+            if prefix not in latest:
+                study = read_study(s3_manager, folder, study_id)
+                latest[prefix] = study["result"].rsplit("_processed.", 1)[0] + "_" if study else None
+            # The result of the study and the files next to it share the name of its task
+            if latest[prefix] is None or not obj["Key"].startswith(latest[prefix]):
+                expired.append(obj["Key"])
+    return s3_manager.delete_objects(bucket, expired) if expired else 0
+
+
+def disk_usage(path: str) -> int:
+    """
+    Returns:
+        int: Bytes used by a file, or by all the files below a directory.
+    """
+    if os.path.isfile(path):
+        return os.path.getsize(path)
+    total = 0
+    for root, _, files in os.walk(path):
+        for name in files:
+            try:
+                total += os.path.getsize(os.path.join(root, name))
+            except FileNotFoundError:
+                continue
+    return total
+
+
+def _sqlite_usage(path: str) -> int:
+    """Bytes used by an SQLite database, including its write-ahead log."""
+    return sum(os.path.getsize(path + suffix) for suffix in ("", "-wal", "-shm") if os.path.exists(path + suffix))
+
+
+class LifecycleSweeper:
+    """
+    Background thread keeping the footprint of a backend worker flat over long uptimes.
+
+    Every `interval_seconds`, expired finished tasks are removed from the task registry,
+    and the memory, disk and registry gauges are updated. Host-wide sweeps, of stale
+    temp files, result indexes and old S3 uploads and results, are run by a single
+    worker of the host, the one holding the lock file at `lock_path`. S3 is only swept
+    when `s3_retention_seconds` is set, every `s3_sweep_interval_seconds`, as listing
+    the bucket grows with the data it holds.
+    """
+
+    def __init__(self, s3_manager: ObjectStorage, tasks: TaskStore,
+                 interval_seconds: float = LIFECYCLE_SWEEP_INTERVAL_SECONDS, lock_path: str = LIFECYCLE_LOCK_PATH,
+                 s3_retention_seconds: int = S3_RETENTION_SECONDS,
+                 s3_sweep_interval_seconds: float = S3_SWEEP_INTERVAL_SECONDS):
+        self.s3_manager = s3_manager
+        self.tasks = tasks
+        self.interval_seconds = interval_seconds
+        self.lock_path = lock_path
+        self.s3_retention_seconds = s3_retention_seconds
+        self.s3_sweep_interval_seconds = s3_sweep_interval_seconds
+        self._last_s3_sweep: Optional[float] = None
+        self._lock_file: Optional[int] = None
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def _holds_host_lock(self) -> bool:
+        """Take the host lock if no other worker holds it. It is held until the process exits."""
+        if self._lock_file is not None:
+            return True
+        os.makedirs(os.path.dirname(self.lock_path), exist_ok=True)
+        fd = os.open(self.lock_path, os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            os.close(fd)
+            return False
+        self._lock_file = fd
+        logger.info("Worker %s runs the host-wide lifecycle sweeps", os.getpid())
+        return True
+
+    def sweep(self) -> Dict[str, int]:
+        """
+        Run one sweep.
+
+        Returns:
+            Dict[str, int]: Number of items removed by kind.
+        """
+        removed = {"tasks": self.tasks.sweep()}
+        if self._holds_host_lock():
+            removed["temp_files"] = cleanup_stale_temp_files(TEMP_FILE_MAX_AGE_SECONDS)
+            removed["result_indexes"] = cleanup_stale_indexes()
+            removed["task_control_files"] = cleanup_stale_control_files()
+            if self.s3_retention_seconds > 0 and self._s3_sweep_due():
+                removed["s3_objects"] = sweep_s3_data(self.s3_manager, max_age_seconds=self.s3_retention_seconds)
+        for kind, count in removed.items():
+            LIFECYCLE_REMOVED.labels(kind=kind).inc(count)
+        self.update_gauges()
+        if any(removed.values()):
+            logger.info("Lifecycle sweep removed %s", removed)
+        return removed
+
+    def _s3_sweep_due(self) -> bool:
+        now = time.monotonic()
+        if self._last_s3_sweep is not None and now - self._last_s3_sweep < self.s3_sweep_interval_seconds:
+            return False
+        self._last_s3_sweep = now
+        return True
+
+    def update_gauges(self) -> None:
+        update_memory_gauge()
+        DISK_USAGE.labels(path="temp").set(disk_usage(TEMP_DIR))
+        DISK_USAGE.labels(path="result_index").set(disk_usage(RESULT_INDEX_DIR))
+        DISK_USAGE.labels(path="task_store").set(_sqlite_usage(TASK_STORE_PATH))
+        DISK_USAGE.labels(path="result_cache").set(_sqlite_usage(RESULT_CACHE_PATH))
+        counts = self.tasks.counts()
+        for status in set(counts) | {"queued", "processing", "completed", "failed", "cancelled", "timed_out"}:
+            TASK_REGISTRY_ENTRIES.labels(status=status).set(counts.get(status, 0))
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.interval_seconds):
+            try:
+                self.sweep()
+            except Exception as e:
+                # A failed sweep, e.g. S3 being unreachable, is retried at the next interval
+                logger.error("Lifecycle sweep failed: %s", e)
+
+    def start(self) -> None:
+        self._thread = threading.Thread(target=self._run, name="lifecycle-sweeper", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+        if self._lock_file is not None:
+            os.close(self._lock_file)
+            self._lock_file = None
@@ -1,45 +1,284 @@
-from fastapi import FastAPI, BackgroundTasks, Body
+from contextlib import asynccontextmanager
+from typing import List, Optional
+from fastapi import FastAPI, Body, HTTPException, Query, Request
+from fastapi.responses import FileResponse, Response, StreamingResponse
 import logging
+import os
+import shutil
+import time
 import uvicorn
 
-from rnaseq_viz.common.s3_manager import S3Manager
+from rnaseq_viz.common.storage import create_storage
+from rnaseq_viz.common.local_storage import LocalStorage
+from rnaseq_viz.common.temp_files import cleanup_stale_temp_files
+from rnaseq_viz.common.metrics import (
+    REQUEST_LATENCY, METRICS_CONTENT_TYPE, render_metrics, mark_process_dead, update_memory_gauge
+)
 from rnaseq_viz.config.config import (
     BACKEND_HOST, BACKEND_PORT, BACKEND_N_WORKERS, LOG_LEVEL
 )
 from rnaseq_viz.backend.task_manager import TaskManager
+from rnaseq_viz.backend.differential import Comparison
+from rnaseq_viz.backend.identity import UserResolver
+from rnaseq_viz.backend.statistics import NORMALIZATIONS, STATISTICS, StatisticsSpec
+from rnaseq_viz.backend.task_events import task_event_stream
+from rnaseq_viz.backend.results import ResultReader
+from rnaseq_viz.backend.result_index import cleanup_stale_indexes
+from rnaseq_viz.backend.lifecycle import LifecycleSweeper
+from rnaseq_viz.config.config import RESULTS_PAGE_MAX_ROWS
 
-from rnaseq_viz.config.log_config import setup_logging, LOG_FORMAT
+from rnaseq_viz.config.log_config import setup_logging
 
 setup_logging()
 logger = logging.getLogger(__name__)
 
-app = FastAPI()
-
-# Initialize S3Manager and TaskManager
-s3_manager = S3Manager()
+# Initialize the object storage and TaskManager
+s3_manager = create_storage()
 task_manager = TaskManager(s3_manager)
+result_reader = ResultReader(s3_manager)
+user_resolver = UserResolver()
+lifecycle_sweeper = LifecycleSweeper(s3_manager, task_manager.tasks)
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Remove temp files left behind by workers that were killed mid-task
+    cleanup_stale_temp_files()
+    cleanup_stale_indexes()
+    lifecycle_sweeper.start()
+    task_manager.start_watchdog()
+    yield
+    lifecycle_sweeper.stop()
+    # Stop the processing workers with the API process
+    task_manager.shutdown()
+    mark_process_dead()
+
+
+app = FastAPI(lifespan=lifespan)
+
+
+@app.middleware("http")
+async def observe_request_latency(request: Request, call_next):
+    start = time.perf_counter()
+    response = await call_next(request)
+    # Label by route template rather than by path, so that task IDs do not create new series
+    route = request.scope.get("route")
+    REQUEST_LATENCY.labels(method=request.method,
+                           route=route.path if route is not None else "unmatched",
+                           status=response.status_code).observe(time.perf_counter() - start)
+    return response
 
 
 @app.post("/start-processing/")
 def start_processing(
+    request: Request,
+    s3_key: Optional[str] = Body(None, embed=True),
+    folder: Optional[str] = Body(None, embed=True),
+    content_hash: Optional[str] = Body(None, embed=True),
+    result_format: Optional[str] = Body(None, embed=True),
+    test_samples: Optional[List[str]] = Body(None, embed=True),
+    reference_samples: Optional[List[str]] = Body(None, embed=True),
+    normalization: Optional[str] = Body(None, embed=True),
+    statistics: Optional[List[str]] = Body(None, embed=True),
+):
+    logger.info("Received processing request for S3 key %s in folder %s...", s3_key, folder)
+    # Concurrency is limited per user, i.e. per access token user, or per client address without a token
+    user = user_resolver.user(request)
+    try:
+        comparison = Comparison.from_request(test_samples, reference_samples)
+        statistics_spec = StatisticsSpec.from_request(normalization, statistics)
+    except ValueError as e:
+        raise HTTPException(status_code=422, detail=str(e))
+    task_id = task_manager.start_task(s3_key, folder, content_hash, result_format, user, comparison,
+                                      statistics_spec)
+    return {"task_id": task_id}
+
+
+@app.post("/start-batch/")
+def start_batch(
+    request: Request,
+    s3_keys: List[str] = Body(..., embed=True),
+    folder: str = Body(..., embed=True),
+    result_format: Optional[str] = Body(None, embed=True),
+    test_samples: Optional[List[str]] = Body(None, embed=True),
+    reference_samples: Optional[List[str]] = Body(None, embed=True),
+    normalization: Optional[str] = Body(None, embed=True),
+    statistics: Optional[List[str]] = Body(None, embed=True),
+    missing_genes: Optional[str] = Body(None, embed=True),
+):
+    logger.info("Received batch processing request for %s S3 keys in folder %s...", len(s3_keys), folder)
+    user = user_resolver.user(request)
+    try:
+        comparison = Comparison.from_request(test_samples, reference_samples)
+        statistics_spec = StatisticsSpec.from_request(normalization, statistics)
+    except ValueError as e:
+        raise HTTPException(status_code=422, detail=str(e))
+    return task_manager.start_batch(s3_keys, folder, result_format, user, comparison, statistics_spec, missing_genes)
+
+
+@app.post("/append-samples/")
+def append_samples(
+    request: Request,
     s3_key: str = Body(..., embed=True),
     folder: str = Body(..., embed=True),
-    background_tasks: BackgroundTasks = BackgroundTasks()
+    task_id: Optional[str] = Body(None, embed=True),
+    result_key: Optional[str] = Body(None, embed=True),
+    study_id: Optional[str] = Body(None, embed=True),
+    result_format: Optional[str] = Body(None, embed=True),
 ):
-    logger.info(f"Received processing request for S3 key {s3_key} in folder {folder}...")
-    task_id = task_manager.start_task(s3_key, folder, background_tasks)
-    return {"task_id": task_id}
+    logger.info("Received request to append the samples of %s to %s...", s3_key,
+                task_id or result_key or f"study {study_id}")
+    user = user_resolver.user(request)
+    return task_manager.start_append(s3_key, folder, task_id, result_key, study_id, result_format, user)
+
+
+@app.get("/studies/{study_id}")
+def get_study(study_id: str, folder: str):
+    return task_manager.get_study(folder, study_id)
+
+
+@app.get("/statistics")
+def available_statistics():
+    return {
+        "normalizations": list(NORMALIZATIONS),
+        "statistics": {name: list(statistic.columns) for name, statistic in STATISTICS.items()},
+    }
+
+
+@app.get("/cached-result/{content_hash}")
+def cached_result(content_hash: str, result_format: Optional[str] = None):
+    logger.info("Looking up cached result for content hash %s...", content_hash)
+    result = task_manager.lookup_cached_result(content_hash, result_format)
+    if result is None:
+        raise HTTPException(status_code=404, detail="No cached result")
+    return {"result": result}
+
+
+@app.get("/cache-stats")
+def cache_stats():
+    return task_manager.cache_stats()
 
 
 @app.get("/check-status/{task_id}")
 def check_status(task_id: str):
-    logger.info(f"Checking status for task ID {task_id}...")
+    logger.info("Checking status for task ID %s...", task_id)
     return task_manager.get_task_status(task_id)
 
 
+@app.delete("/tasks/{task_id}")
+def cancel_task(task_id: str):
+    logger.info("Cancelling task ID %s...", task_id)
+    return task_manager.cancel_task(task_id)
+
+
+@app.get("/task-events/{task_id}")
+def task_events(task_id: str):
+    logger.info("Opening event stream for task ID %s...", task_id)
+    # Fail with a plain 404 before the stream starts if the task is unknown
+    task_manager.get_task_status(task_id)
+    return StreamingResponse(task_event_stream(task_manager.get_task, task_id, task_manager.tasks),
+                             media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+
+@app.get("/results/{task_id}/summary")
+def result_summary(task_id: str):
+    result_s3_key = task_manager.get_result_key(task_id)
+    try:
+        return result_reader.summary(result_s3_key)
+    except Exception as e:
+        logger.error("Failed to read the summary of task %s: %s", task_id, e)
+        raise HTTPException(status_code=404, detail="No summary for this result")
+
+
+@app.get("/results/{task_id}/sample-qc")
+def result_sample_qc(task_id: str):
+    result_s3_key = task_manager.get_result_key(task_id)
+    try:
+        return result_reader.sample_qc(result_s3_key)
+    except Exception as e:
+        logger.error("Failed to read the sample QC of task %s: %s", task_id, e)
+        raise HTTPException(status_code=404, detail="No sample QC for this result")
+
+
+@app.get("/results/{task_id}/rows")
+def result_rows(task_id: str, offset: int = Query(0, ge=0), limit: int = Query(100, ge=1, le=RESULTS_PAGE_MAX_ROWS),
+                sort_by: Optional[str] = None, descending: bool = True):
+    result_s3_key = task_manager.get_result_key(task_id)
+    try:
+        return result_reader.page(result_s3_key, offset, limit, sort_by, descending)
+    except ValueError as e:
+        raise HTTPException(status_code=422, detail=str(e))
+
+
+@app.post("/results/{task_id}/query")
+def result_query(
+    task_id: str,
+    symbols: Optional[List[str]] = Body(None, embed=True),
+    prefix: Optional[str] = Body(None, embed=True),
+    mean_min: Optional[float] = Body(None, embed=True),
+    mean_max: Optional[float] = Body(None, embed=True),
+    median_min: Optional[float] = Body(None, embed=True),
+    median_max: Optional[float] = Body(None, embed=True),
+    stddev_min: Optional[float] = Body(None, embed=True),
+    stddev_max: Optional[float] = Body(None, embed=True),
+    top_k: Optional[int] = Body(None, embed=True, ge=1, le=RESULTS_PAGE_MAX_ROWS),
+    rank_by: str = Body("Mean", embed=True),
+    descending: bool = Body(True, embed=True),
+):
+    result_s3_key = task_manager.get_result_key(task_id)
+    ranges = {"Mean": (mean_min, mean_max), "Median": (median_min, median_max), "StdDev": (stddev_min, stddev_max)}
+    try:
+        return result_reader.query(result_s3_key, symbols, prefix, ranges, top_k, rank_by, descending)
+    except ValueError as e:
+        raise HTTPException(status_code=422, detail=str(e))
+
+
+@app.get("/results/{task_id}/differential")
+def result_differential(task_id: str, offset: int = Query(0, ge=0),
+                        limit: int = Query(100, ge=1, le=RESULTS_PAGE_MAX_ROWS),
+                        sort_by: str = "pvalue", descending: bool = False, max_fdr: Optional[float] = None):
+    result_s3_key = task_manager.get_result_key(task_id)
+    try:
+        return result_reader.differential_page(result_s3_key, offset, limit, sort_by, descending, max_fdr)
+    except ValueError as e:
+        raise HTTPException(status_code=422, detail=str(e))
+    except Exception as e:
+        logger.error("Failed to read the differential expression of task %s: %s", task_id, e)
+        raise HTTPException(status_code=404, detail="No differential expression for this result")
+
+
+@app.get("/storage/{bucket}/{key:path}")
+def storage_download(bucket: str, key: str, expires: int, signature: str):
+    # Download URLs of the local storage, S3 serves its own
+    if not isinstance(s3_manager, LocalStorage):
+        raise HTTPException(status_code=404, detail="Not found")
+    if not s3_manager.verify_signature(bucket, key, expires, signature):
+        raise HTTPException(status_code=403, detail="Invalid or expired download URL")
+    try:
+        path = s3_manager.path(bucket, key)
+    except ValueError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    if not os.path.isfile(path):
+        raise HTTPException(status_code=404, detail=f"Object {key} not found")
+    return FileResponse(path, filename=os.path.basename(key))
+
+
+@app.get("/metrics")
+def metrics():
+    task_manager.update_queue_depth()
+    update_memory_gauge()
+    return Response(render_metrics(), media_type=METRICS_CONTENT_TYPE)
+
+
 def run_backend():
     logger.info("Starting FastAPI server...")
-    logger.info(f"Spawning {BACKEND_N_WORKERS} uvicorn workers at log level {LOG_LEVEL}")
+    logger.info("Spawning %s uvicorn workers at log level %s", BACKEND_N_WORKERS, LOG_LEVEL)
+    # Metrics of a previous run must not be aggregated with the new ones
+    multiproc_dir = os.environ.get("PROMETHEUS_MULTIPROC_DIR")
+    if multiproc_dir:
+        shutil.rmtree(multiproc_dir, ignore_errors=True)
+        os.makedirs(multiproc_dir, exist_ok=True)
     uvicorn.run(
         "rnaseq_viz.backend.main:app",
         host=BACKEND_HOST,
@@ -48,16 +287,11 @@ def run_backend():
         log_config={
             "version": 1,
             "disable_existing_loggers": False,
-            "formatters": {
-                "default": {
-                    "format": LOG_FORMAT,
-                },
-            },
             "handlers": {
+                # The queue handler of the process, uvicorn's records are written by the log writer thread too
                 "default": {
+                    "()": "rnaseq_viz.config.log_config.queue_handler",
                     "level": logging.getLevelName(LOG_LEVEL),
-                    "formatter": "default",
-                    "class": "logging.StreamHandler",
                 },
             },
             "loggers": {
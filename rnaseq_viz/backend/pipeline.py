@@ -0,0 +1,519 @@
+import io
+import json
+import logging
+import time
+from contextlib import ExitStack
+from functools import partial
+from dataclasses import dataclass, field
+from typing import IO, Callable, Dict, Iterable, List, Optional
+
+import numpy as np
+import pandas as pd
+
+from rnaseq_viz.common.storage import ObjectStorage
+from rnaseq_viz.common.metrics import StageTimings, peak_memory_bytes, reset_peak_memory
+from rnaseq_viz.backend.data_processing import append_rnaseq_samples, process_rnaseq_data
+from rnaseq_viz.backend.differential import DE_COLUMNS, Comparison, benjamini_hochberg, differential_expression
+from rnaseq_viz.backend.ingestion import (
+    HashingReader, compression_of, decompressed_stream, estimated_csv_size, read_counts_csv
+)
+from rnaseq_viz.backend.cohort import merge_counts
+from rnaseq_viz.backend.incremental import StatisticsState, StatisticsStateWriter
+from rnaseq_viz.backend.streaming import (
+    chunk_library_sizes, process_rnaseq_chunks, read_csv_chunks, scan_library_sizes
+)
+from rnaseq_viz.backend.result_writer import ParquetResultWriter, create_result_writer
+from rnaseq_viz.backend.sample_qc import SampleQCAccumulator
+from rnaseq_viz.backend.statistics import StatisticsSpec
+from rnaseq_viz.backend.task_control import TaskControl
+from rnaseq_viz.backend.viz_summary import compute_viz_summary
+from rnaseq_viz.config.config import S3_BUCKET, STREAMING_MIN_SIZE_MB, RESULT_FORMAT
+from rnaseq_viz.common.temp_files import spooled_buffer
+from rnaseq_viz.common.utils import compute_content_hash
+
+# Configure logger
+from rnaseq_viz.config.log_config import setup_logging
+setup_logging()
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class ProcessingOutcome:
+    """
+    Outcome of a successful processing job.
+
+    Attributes:
+        result_s3_key (str): S3 key of the processed result.
+        stages (Dict[str, Dict]): Wall time, bytes, rows and columns of each stage.
+        peak_memory_bytes (Optional[int]): Peak resident memory of the process while running the job.
+        content_hash (Optional[str]): SHA-256 hex digest of the input bytes as downloaded, which the result
+            is cached under.
+    """
+    result_s3_key: str
+    stages: Dict[str, Dict] = field(default_factory=dict)
+    peak_memory_bytes: Optional[int] = None
+    content_hash: Optional[str] = None
+
+
+def summary_s3_key(result_s3_key: str) -> str:
+    """S3 key of the visualization summary stored next to a processed result."""
+    return result_s3_key.rsplit("_processed.", 1)[0] + "_summary.json"
+
+
+def differential_s3_key(result_s3_key: str) -> str:
+    """S3 key of the differential expression result stored next to a processed result."""
+    return result_s3_key.rsplit("_processed.", 1)[0] + "_differential.parquet"
+
+
+def statistics_state_s3_key(result_s3_key: str) -> str:
+    """S3 key of the state the statistics of a processed result are updated from when samples are appended."""
+    return result_s3_key.rsplit("_processed.", 1)[0] + "_statistics_state.npz"
+
+
+def study_prefix(folder: str, study_id: str) -> str:
+    """Prefix of the results of a study, which the retention sweep keeps as long as they are its latest."""
+    return f"{folder}/studies/{study_id}/"
+
+
+def study_s3_key(folder: str, study_id: str) -> str:
+    """S3 key of the record of a study, pointing at its latest result."""
+    return study_prefix(folder, study_id) + "study.json"
+
+
+def read_study(s3_manager: ObjectStorage, folder: str, study_id: str) -> Optional[Dict]:
+    """
+    Returns:
+        Optional[Dict]: The record of a study, with the S3 key of its latest `result`, or None if it has none yet.
+    """
+    try:
+        return json.loads(s3_manager.read_object(bucket=S3_BUCKET, key=study_s3_key(folder, study_id)))
+    except Exception as e:
+        if ObjectStorage.is_not_found(e):
+            return None
+        raise
+
+
+def upload_differential(s3_manager: ObjectStorage, differential: pd.DataFrame, result_s3_key: str) -> str:
+    """
+    Store a differential expression result next to the processed result, always as Parquet.
+
+    Returns:
+        str: S3 key of the differential expression result.
+    """
+    buffer = io.BytesIO()
+    # Small p-values underflow in float32
+    writer = ParquetResultWriter(buffer, float32=False)
+    writer.write_chunk(differential)
+    writer.close()
+    buffer.seek(0)
+    return s3_manager.upload_file_to_s3(file_obj=buffer, bucket=S3_BUCKET,
+                                        s3_file_name=differential_s3_key(result_s3_key))
+
+
+def sample_qc_s3_key(result_s3_key: str) -> str:
+    """S3 key of the sample QC stored next to a processed result."""
+    return result_s3_key.rsplit("_processed.", 1)[0] + "_sample_qc.json"
+
+
+def upload_sample_qc(s3_manager: ObjectStorage, sample_qc: SampleQCAccumulator, result_s3_key: str,
+                     timings: StageTimings) -> str:
+    """
+    Compute the sample correlation and PCA from the accumulated genes and store them next to the result.
+
+    Returns:
+        str: S3 key of the sample QC.
+    """
+    with timings.stage("sample_qc") as stage:
+        body = json.dumps(sample_qc.summary()).encode("utf-8")
+        stage.update(bytes=len(body), rows=sample_qc.n_genes, columns=len(sample_qc.sample_names))
+    return s3_manager.upload_file_to_s3(file_obj=io.BytesIO(body), bucket=S3_BUCKET,
+                                        s3_file_name=sample_qc_s3_key(result_s3_key))
+
+
+def upload_statistics_state(s3_manager: ObjectStorage, states: List[StatisticsState], result_s3_key: str,
+                            timings: StageTimings) -> Optional[str]:
+    """
+    Store the state of the statistics of a processed result next to it, from those of its chunks of rows,
+    so that samples can be appended to the result without recomputing its statistics.
+
+    Returns:
+        Optional[str]: S3 key of the state, None if the result has none.
+    """
+    if not states:
+        return None
+    with timings.stage("upload_state") as stage:
+        body = StatisticsState.concat(states).to_bytes()
+        stage["bytes"] = len(body)
+        return s3_manager.upload_file_to_s3(file_obj=io.BytesIO(body), bucket=S3_BUCKET,
+                                            s3_file_name=statistics_state_s3_key(result_s3_key))
+
+
+def upload_viz_summary(s3_manager: ObjectStorage, stats: pd.DataFrame, n_samples: int, result_s3_key: str,
+                       timings: StageTimings, normalization: str = "none") -> str:
+    """
+    Compute the visualization summary of a processed result and store it next to the result.
+
+    Returns:
+        str: S3 key of the summary.
+    """
+    with timings.stage("summarize") as stage:
+        body = json.dumps(compute_viz_summary(stats, n_samples, normalization=normalization)).encode("utf-8")
+        stage.update(bytes=len(body), rows=len(stats))
+    return s3_manager.upload_file_to_s3(file_obj=io.BytesIO(body), bucket=S3_BUCKET,
+                                        s3_file_name=summary_s3_key(result_s3_key))
+
+
+def _timings(control: Optional[TaskControl]) -> StageTimings:
+    """Stage timings checking for the cancellation and the deadline of the task before each stage."""
+    return StageTimings(checkpoint=control.checkpoint if control is not None else None)
+
+
+def _stream_progress(control: Optional[TaskControl], body: IO, size: Optional[int]) -> Optional[Callable[[int], None]]:
+    """
+    Progress reporter of a streamed input, estimating its number of rows from the share of its bytes read so far.
+    """
+    if control is None:
+        return None
+
+    def report(rows_processed: int) -> None:
+        bytes_read = body.tell() if hasattr(body, "tell") else 0
+        rows_total = round(rows_processed * size / bytes_read) if size and bytes_read else None
+        control.report_progress(rows_processed, max(rows_total, rows_processed) if rows_total else None)
+    return report
+
+
+def process_file(s3_manager: ObjectStorage, task_id: str, s3_key: str, folder: str,
+                 result_format: str = RESULT_FORMAT, comparison: Optional[Comparison] = None,
+                 statistics: StatisticsSpec = StatisticsSpec(),
+                 control: Optional[TaskControl] = None) -> ProcessingOutcome:
+    """
+    Download, validate and process an uploaded RNA-Seq CSV, and upload the processed result
+    along with its visualization summary, sample QC and the state of its statistics for
+    appending samples, and its differential expression if a comparison is given.
+
+    Inputs larger than STREAMING_MIN_SIZE_MB are processed in streaming mode. Inputs named
+    `.csv.gz` or `.csv.zst` are decompressed as they are read.
+
+    Args:
+        s3_manager (ObjectStorage): Object storage of the calling process.
+        task_id (str): ID of the task, used to name the result.
+        s3_key (str): S3 key of the uploaded input CSV.
+        folder (str): S3 folder of the upload, the result is stored under `{folder}/processed/`.
+        result_format (str): Format of the processed result, "csv" or "parquet".
+        comparison (Optional[Comparison]): Sample groups compared by differential expression.
+        statistics (StatisticsSpec): Normalization and per-gene statistics of the result.
+        control (Optional[TaskControl]): Cancellation, deadline and progress of the task. Processing stops
+            with TaskCancelled at the first stage or chunk started after a cancellation or the deadline.
+
+    Returns:
+        ProcessingOutcome: S3 key of the processed result, per-stage timings and peak memory.
+    """
+    logger.info("Starting processing for task %s with S3 key %s in folder %s...", task_id, s3_key, folder)
+    # The peak is of the whole process, so it is the task's own only where the process runs one task at a time
+    reset_peak_memory()
+    size = s3_manager.get_object_size(bucket=S3_BUCKET, key=s3_key)
+    compression = compression_of(s3_key)
+    if estimated_csv_size(size, compression) >= STREAMING_MIN_SIZE_MB * 1024 * 1024:
+        logger.info("Input of %s bytes (%s) exceeds %s MB, processing in streaming mode",
+                    size, compression or 'uncompressed', STREAMING_MIN_SIZE_MB)
+        outcome = process_file_streaming(s3_manager, task_id, s3_key, folder, result_format, comparison,
+                                         statistics, control, size)
+    else:
+        outcome = process_file_in_memory(s3_manager, task_id, s3_key, folder, size, compression, result_format,
+                                         comparison, statistics, control)
+    outcome.peak_memory_bytes = peak_memory_bytes()
+    logger.info("Task %s peak resident memory: %s bytes", task_id, outcome.peak_memory_bytes)
+    return outcome
+
+
+def process_batch(s3_manager: ObjectStorage, task_id: str, s3_keys: List[str], folder: str,
+                  result_format: str = RESULT_FORMAT, comparison: Optional[Comparison] = None,
+                  statistics: StatisticsSpec = StatisticsSpec(),
+                  control: Optional[TaskControl] = None, missing_genes: str = "zero") -> ProcessingOutcome:
+    """
+    Merge several uploaded RNA-Seq CSVs on SYMBOL into one cohort, and process it as a single input.
+
+    The merged matrix is processed straight from its memory-mapped temp file, in chunks of rows
+    going through the same validation, statistics, writer, sample QC and differential expression
+    as the streaming mode, so its memory is bounded by the chunk size as well.
+
+    Args:
+        missing_genes (str): Handling of the genes missing from some inputs, "zero" or "intersect",
+            see `merge_counts`.
+
+    Returns:
+        ProcessingOutcome: S3 key of the processed result, timings of the merge and of the processing, and peak memory.
+    """
+    reset_peak_memory()
+    timings = _timings(control)
+    with merge_counts(s3_manager, s3_keys, timings, control, missing_genes) as merged:
+        n_genes = len(merged.symbols)
+        totals = None
+        if statistics.needs_library_sizes:
+            totals = chunk_library_sizes(merged.chunks(timings=timings), statistics, timings)
+        progress = None
+        if control is not None:
+            control.report_progress(0, n_genes, force=True)
+            progress = partial(_report_rows, control, n_genes)
+        processed_s3_key = process_chunks(s3_manager, task_id, merged.chunks(timings=timings), folder,
+                                          result_format, comparison, statistics, timings, totals, progress, control)
+    logger.info("Task %s stage timings: %s", task_id, timings.as_dict())
+    return ProcessingOutcome(result_s3_key=processed_s3_key, stages=timings.as_dict(),
+                             peak_memory_bytes=peak_memory_bytes())
+
+
+def _report_rows(control: TaskControl, rows_total: int, rows_processed: int) -> None:
+    control.report_progress(rows_processed, rows_total)
+
+
+def process_file_in_memory(s3_manager: ObjectStorage, task_id: str, s3_key: str, folder: str, size: int,
+                           compression: Optional[str], result_format: str = RESULT_FORMAT,
+                           comparison: Optional[Comparison] = None,
+                           statistics: StatisticsSpec = StatisticsSpec(),
+                           control: Optional[TaskControl] = None) -> ProcessingOutcome:
+    """
+    Process the input as a whole, parsed into a single compact DataFrame.
+
+    Returns:
+        ProcessingOutcome: S3 key of the processed result and per-stage timings.
+    """
+    timings = _timings(control)
+
+    with ExitStack() as stack:
+        # Download into memory, spilling to a self-deleting temp file only for large inputs
+        with timings.stage("download") as stage:
+            input_buffer = stack.enter_context(s3_manager.download_to_buffer(bucket=S3_BUCKET, key=s3_key))
+            content_hash = compute_content_hash(input_buffer)
+            stage["bytes"] = size
+        with timings.stage("parse") as stage:
+            df = read_counts_csv(input_buffer, compression)
+            stage.update(bytes=size, rows=len(df), columns=df.shape[1])
+    if control is not None:
+        control.report_progress(0, len(df), force=True)
+    if comparison is not None:
+        # Fail before processing when the comparison names samples that are not in the input
+        comparison.check(statistics.sample_columns(df.columns))
+
+    # Process the DataFrame and validate the data
+    states: List[StatisticsState] = []
+    processed_df = process_rnaseq_data(df, timings, statistics, states)
+    del df
+    if control is not None:
+        control.report_progress(len(processed_df), len(processed_df), force=True)
+
+    processed_s3_key = f"{folder}/processed/{task_id}_processed.{result_format}"
+    result_s3_key = upload_processed_result(s3_manager, processed_df, processed_s3_key, result_format, timings,
+                                            statistics)
+    upload_statistics_state(s3_manager, states, result_s3_key, timings)
+    if comparison is not None:
+        with timings.stage("differential") as stage:
+            differential = differential_expression(processed_df, comparison)
+            stage.update(rows=len(differential), columns=len(comparison.test) + len(comparison.reference))
+        upload_differential(s3_manager, differential, result_s3_key)
+    logger.info("Task %s stage timings: %s", task_id, timings.as_dict())
+    return ProcessingOutcome(result_s3_key=result_s3_key, stages=timings.as_dict(), content_hash=content_hash)
+
+
+def upload_processed_result(s3_manager: ObjectStorage, processed_df: pd.DataFrame, processed_s3_key: str,
+                            result_format: str, timings: StageTimings,
+                            statistics: StatisticsSpec = StatisticsSpec()) -> str:
+    """
+    Serialize and upload a processed result held in memory, along with its visualization summary and sample QC.
+
+    Returns:
+        str: S3 key of the processed result.
+    """
+    with spooled_buffer() as output_buffer:
+        with timings.stage("serialize") as stage:
+            writer = create_result_writer(output_buffer, result_format)
+            writer.write_chunk(processed_df)
+            writer.close()
+            stage.update(bytes=output_buffer.tell(), rows=len(processed_df), columns=processed_df.shape[1])
+        output_buffer.seek(0)
+        with timings.stage("upload") as stage:
+            result_s3_key = s3_manager.upload_file_to_s3(file_obj=output_buffer,
+                                                         bucket=S3_BUCKET,
+                                                         s3_file_name=processed_s3_key)
+            stage["bytes"] = timings.stages["serialize"]["bytes"]
+
+    upload_viz_summary(s3_manager, processed_df[['SYMBOL'] + statistics.columns],
+                       processed_df.shape[1] - 1 - len(statistics.columns), result_s3_key, timings,
+                       statistics.normalization)
+    sample_qc = SampleQCAccumulator()
+    with timings.stage("sample_qc"):
+        sample_qc.add_frame(processed_df, statistics.columns)
+    upload_sample_qc(s3_manager, sample_qc, result_s3_key, timings)
+    return result_s3_key
+
+
+def process_append(s3_manager: ObjectStorage, task_id: str, base_result_s3_key: str, s3_key: str, folder: str,
+                   result_format: str = RESULT_FORMAT, control: Optional[TaskControl] = None,
+                   study_id: Optional[str] = None) -> ProcessingOutcome:
+    """
+    Append the samples of an uploaded RNA-Seq CSV to a processed result, as a new result with the
+    normalization and statistics of the earlier one, see `append_rnaseq_samples`.
+
+    The statistics are updated from the state stored next to the earlier result when it was
+    produced, and a state is stored next to the new result for the next append. Differential
+    expression is not carried over, the sample groups of the earlier comparison are incomplete.
+
+    The results of a study are stored under `{folder}/studies/{study_id}/`, out of reach of the
+    retention sweep as long as they are its latest, and its record is pointed at the new result.
+
+    Args:
+        base_result_s3_key (str): S3 key of the processed result the samples are appended to.
+        s3_key (str): S3 key of the uploaded input CSV with the new samples.
+        folder (str): S3 folder of the upload, the result is stored under `{folder}/processed/`.
+        study_id (Optional[str]): Study the result becomes the latest result of.
+
+    Raises:
+        ValueError: If another append to the study completed in the meantime.
+
+    Returns:
+        ProcessingOutcome: S3 key of the processed result, per-stage timings and peak memory.
+    """
+    logger.info("Appending the samples of %s to %s for task %s...", s3_key, base_result_s3_key, task_id)
+    reset_peak_memory()
+    timings = _timings(control)
+    study = read_study(s3_manager, folder, study_id) if study_id is not None else None
+    with timings.stage("download") as stage:
+        summary = json.loads(s3_manager.read_object(bucket=S3_BUCKET, key=summary_s3_key(base_result_s3_key)))
+        statistics = StatisticsSpec.from_columns(summary.get("normalization", "none"),
+                                                 summary.get("statistics", ()))
+        try:
+            state = StatisticsState.from_bytes(
+                s3_manager.read_object(bucket=S3_BUCKET, key=statistics_state_s3_key(base_result_s3_key)))
+        except Exception as e:
+            if not ObjectStorage.is_not_found(e):
+                raise
+            # Processed before states were stored, or with the quantiles statistic
+            state = None
+        base_df = s3_manager.read_result_from_s3(bucket=S3_BUCKET, key=base_result_s3_key)
+        size = s3_manager.get_object_size(bucket=S3_BUCKET, key=s3_key)
+        stage["bytes"] = size
+    with timings.stage("parse") as stage:
+        with s3_manager.download_to_buffer(bucket=S3_BUCKET, key=s3_key) as input_buffer:
+            df = read_counts_csv(input_buffer, compression_of(s3_key))
+        stage.update(bytes=size, rows=len(df), columns=df.shape[1])
+    if control is not None:
+        control.report_progress(0, len(df), force=True)
+
+    processed_df, state = append_rnaseq_samples(base_df, df, timings, statistics, state)
+    del base_df, df
+    if control is not None:
+        control.report_progress(len(processed_df), len(processed_df), force=True)
+
+    prefix = study_prefix(folder, study_id) if study_id is not None else f"{folder}/processed/"
+    processed_s3_key = f"{prefix}{task_id}_processed.{result_format}"
+    result_s3_key = upload_processed_result(s3_manager, processed_df, processed_s3_key, result_format, timings,
+                                            statistics)
+    upload_statistics_state(s3_manager, [state] if state is not None else [], result_s3_key, timings)
+    if study_id is not None:
+        # Samples appended by an append that completed in the meantime would be lost
+        latest = read_study(s3_manager, folder, study_id)
+        if (latest or {}).get("result") != (study or {}).get("result"):
+            raise ValueError(f"Study {study_id} was appended to by another task in the meantime, "
+                             "append the samples again")
+        record = {"study_id": study_id, "result": result_s3_key, "task_id": task_id,
+                  "n_samples": processed_df.shape[1] - 1 - len(statistics.columns), "updated_at": time.time()}
+        s3_manager.upload_file_to_s3(file_obj=io.BytesIO(json.dumps(record).encode("utf-8")), bucket=S3_BUCKET,
+                                     s3_file_name=study_s3_key(folder, study_id))
+        logger.info("Result %s is the latest of study %s", result_s3_key, study_id)
+    logger.info("Task %s stage timings: %s", task_id, timings.as_dict())
+    return ProcessingOutcome(result_s3_key=result_s3_key, stages=timings.as_dict(),
+                             peak_memory_bytes=peak_memory_bytes())
+
+
+def process_file_streaming(s3_manager: ObjectStorage, task_id: str, s3_key: str, folder: str,
+                           result_format: str = RESULT_FORMAT,
+                           comparison: Optional[Comparison] = None,
+                           statistics: StatisticsSpec = StatisticsSpec(),
+                           control: Optional[TaskControl] = None, size: Optional[int] = None) -> ProcessingOutcome:
+    """
+    Process the input in row chunks read straight from S3, uploading the result as a multipart upload.
+    Peak memory is bounded by the chunk size rather than by the file size.
+
+    Downloading overlaps with parsing and uploading with serializing in this mode,
+    so the parse and serialize stages include the S3 transfers. Differential expression
+    is tested chunk by chunk, and the p-values of all chunks are adjusted together. The
+    library-size normalizations read the input twice, first for the per-sample totals.
+
+    Returns:
+        ProcessingOutcome: S3 key of the processed result and per-stage timings.
+    """
+    logger.info("Starting streaming processing for task %s with S3 key %s...", task_id, s3_key)
+    timings = _timings(control)
+    totals = None
+    if statistics.needs_library_sizes:
+        body = s3_manager.open_object_stream(bucket=S3_BUCKET, key=s3_key)
+        try:
+            totals = scan_library_sizes(decompressed_stream(body, compression_of(s3_key)), statistics,
+                                        timings=timings)
+        finally:
+            body.close()
+    body = s3_manager.open_object_stream(bucket=S3_BUCKET, key=s3_key)
+    try:
+        # The input is hashed as it is read, rather than downloaded once more
+        hashed_body = HashingReader(body)
+        chunks = read_csv_chunks(decompressed_stream(hashed_body, compression_of(s3_key)), timings=timings)
+        processed_s3_key = process_chunks(s3_manager, task_id, chunks, folder, result_format, comparison, statistics,
+                                          timings, totals, _stream_progress(control, hashed_body, size), control)
+        content_hash = hashed_body.hexdigest()
+    finally:
+        body.close()
+    logger.info("Task %s stage timings: %s", task_id, timings.as_dict())
+    return ProcessingOutcome(result_s3_key=processed_s3_key, stages=timings.as_dict(), content_hash=content_hash)
+
+
+def process_chunks(s3_manager: ObjectStorage, task_id: str, chunks: Iterable[pd.DataFrame], folder: str,
+                   result_format: str, comparison: Optional[Comparison], statistics: StatisticsSpec,
+                   timings: StageTimings, totals: Optional[np.ndarray] = None,
+                   progress: Optional[Callable[[int], None]] = None, control: Optional[TaskControl] = None) -> str:
+    """
+    Process an input given as chunks of rows with `process_rnaseq_chunks`, uploading the result and its
+    statistics state as multipart uploads, then its visualization summary, sample QC and differential expression.
+
+    Returns:
+        str: S3 key of the processed result.
+    """
+    processed_s3_key = f"{folder}/processed/{task_id}_processed.{result_format}"
+    stats_chunks: List[pd.DataFrame] = []
+    differential_chunks: List[pd.DataFrame] = []
+    sample_qc = SampleQCAccumulator()
+    with s3_manager.open_multipart_upload(bucket=S3_BUCKET, key=processed_s3_key) as upload, \
+            s3_manager.open_multipart_upload(bucket=S3_BUCKET,
+                                             key=statistics_state_s3_key(processed_s3_key)) as state_upload:
+        writer = create_result_writer(upload, result_format)
+        # The state of each chunk is written out as it comes, rather than held until the end of the input
+        states = StatisticsStateWriter(state_upload)
+        n_rows, n_samples = process_rnaseq_chunks(chunks, writer, timings=timings, stats_chunks=stats_chunks,
+                                                  comparison=comparison, differential_chunks=differential_chunks,
+                                                  sample_qc=sample_qc, statistics=statistics, totals=totals,
+                                                  progress=progress, states=states)
+        if control is not None:
+            control.report_progress(n_rows, n_rows, force=True)
+        with timings.stage("upload") as stage:
+            writer.close()
+            upload.close()
+            stage["bytes"] = upload.bytes_written
+        with timings.stage("upload_state") as stage:
+            states.close()
+            if states.n_chunks:
+                state_upload.close()
+                stage["bytes"] = state_upload.bytes_written
+            else:
+                # The statistics of the result cannot be updated from a state
+                state_upload.abort()
+
+    stats = (pd.concat(stats_chunks, ignore_index=True) if stats_chunks
+             else pd.DataFrame(columns=['SYMBOL'] + statistics.columns))
+    upload_viz_summary(s3_manager, stats, n_samples, processed_s3_key, timings, statistics.normalization)
+    upload_sample_qc(s3_manager, sample_qc, processed_s3_key, timings)
+    if comparison is not None:
+        with timings.stage("differential") as stage:
+            differential = (pd.concat(differential_chunks, ignore_index=True) if differential_chunks
+                            else pd.DataFrame(columns=['SYMBOL'] + DE_COLUMNS))
+            differential['FDR'] = benjamini_hochberg(differential['pvalue'].to_numpy(dtype=float))
+            stage.update(rows=len(differential))
+        upload_differential(s3_manager, differential, processed_s3_key)
+    return processed_s3_key
@@ -0,0 +1,207 @@
+import hashlib
+import json
+import logging
+import threading
+import time
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from typing import Dict, Optional, Tuple
+
+from rnaseq_viz.backend.data_processing import PROCESSING_VERSION
+from rnaseq_viz.backend.sqlite_db import SQLiteDatabase
+from rnaseq_viz.config.config import (
+    TASK_STORE_BACKEND, RESULT_CACHE_PATH, RESULT_CACHE_MAX_ENTRIES, RESULT_CACHE_TTL_SECONDS
+)
+
+# Configure logger
+from rnaseq_viz.config.log_config import setup_logging
+setup_logging()
+logger = logging.getLogger(__name__)
+
+
+def make_cache_key(content_hash: str, params: Optional[Dict] = None) -> str:
+    """
+    Build the cache key of a processing result.
+
+    The key covers the input bytes, the processing parameters and the version of
+    the processing code, so that a change to any of them is a cache miss.
+
+    Args:
+        content_hash (str): SHA-256 hex digest of the input bytes.
+        params (Dict): Processing parameters of the request.
+
+    Returns:
+        str: The cache key.
+    """
+    payload = json.dumps({"content": content_hash, "params": params or {}, "version": PROCESSING_VERSION},
+                         sort_keys=True)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class ResultCache(ABC):
+    """
+    Content-addressed cache mapping a cache key to the S3 key of a processed result.
+
+    Entries expire `ttl_seconds` after they were stored, and the least recently
+    used entries are evicted once more than `max_entries` are held.
+    """
+
+    def __init__(self, max_entries: int = RESULT_CACHE_MAX_ENTRIES, ttl_seconds: int = RESULT_CACHE_TTL_SECONDS):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+
+    @abstractmethod
+    def get(self, key: str) -> Optional[str]:
+        """
+        Returns:
+            Optional[str]: The cached result S3 key, or None on a miss.
+        """
+
+    @abstractmethod
+    def put(self, key: str, result_s3_key: str) -> None:
+        """Store a result, evicting expired and least recently used entries as needed."""
+
+    @abstractmethod
+    def invalidate(self, key: str) -> None:
+        """Remove an entry, e.g. when its result no longer exists."""
+
+    @abstractmethod
+    def stats(self) -> Dict[str, int]:
+        """
+        Returns:
+            Dict[str, int]: Number of entries and hit, miss and eviction counters.
+        """
+
+
+class InMemoryResultCache(ResultCache):
+    """Result cache held in the memory of a single process."""
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self._entries: "OrderedDict[str, Tuple[str, float]]" = OrderedDict()
+        self._counters = {"hits": 0, "misses": 0, "evictions": 0}
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[str]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and time.time() - entry[1] > self.ttl_seconds:
+                del self._entries[key]
+                self._counters["evictions"] += 1
+                entry = None
+            if entry is None:
+                self._counters["misses"] += 1
+                return None
+            self._entries.move_to_end(key)
+            self._counters["hits"] += 1
+            return entry[0]
+
+    def put(self, key: str, result_s3_key: str) -> None:
+        with self._lock:
+            self._entries[key] = (result_s3_key, time.time())
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self._counters["evictions"] += 1
+
+    def invalidate(self, key: str) -> None:
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {"entries": len(self._entries), **self._counters}
+
+
+class SQLiteResultCache(ResultCache):
+    """Result cache in an SQLite database on local disk, shared by every backend worker of the host."""
+
+    _SCHEMA = """
+        CREATE TABLE IF NOT EXISTS results (
+            cache_key TEXT PRIMARY KEY,
+            result_s3_key TEXT NOT NULL,
+            created_at REAL NOT NULL,
+            accessed_at REAL NOT NULL
+        );
+        CREATE INDEX IF NOT EXISTS idx_results_accessed_at ON results (accessed_at);
+        CREATE INDEX IF NOT EXISTS idx_results_created_at ON results (created_at);
+        CREATE TABLE IF NOT EXISTS counters (
+            name TEXT PRIMARY KEY,
+            value INTEGER NOT NULL
+        );
+    """
+
+    def __init__(self, path: str = RESULT_CACHE_PATH, **kwargs):
+        super().__init__(**kwargs)
+        logger.info("Using SQLite result cache at %s", path)
+        self._db = SQLiteDatabase(path, self._SCHEMA)
+
+    def _count(self, conn, name: str, n: int = 1) -> None:
+        if n:
+            conn.execute("INSERT INTO counters (name, value) VALUES (?, ?) "
+                         "ON CONFLICT (name) DO UPDATE SET value = value + excluded.value", (name, n))
+
+    def get(self, key: str) -> Optional[str]:
+        conn = self._db.connection()
+        now = time.time()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            expired = conn.execute("DELETE FROM results WHERE cache_key = ? AND created_at < ?",
+                                   (key, now - self.ttl_seconds)).rowcount
+            self._count(conn, "evictions", expired)
+            row = conn.execute("SELECT result_s3_key FROM results WHERE cache_key = ?", (key,)).fetchone()
+            if row is None:
+                self._count(conn, "misses")
+            else:
+                conn.execute("UPDATE results SET accessed_at = ? WHERE cache_key = ?", (now, key))
+                self._count(conn, "hits")
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        return row["result_s3_key"] if row is not None else None
+
+    def put(self, key: str, result_s3_key: str) -> None:
+        conn = self._db.connection()
+        now = time.time()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            conn.execute("INSERT OR REPLACE INTO results (cache_key, result_s3_key, created_at, accessed_at) "
+                         "VALUES (?, ?, ?, ?)", (key, result_s3_key, now, now))
+            evicted = conn.execute("DELETE FROM results WHERE created_at < ?", (now - self.ttl_seconds,)).rowcount
+            evicted += conn.execute(
+                "DELETE FROM results WHERE cache_key IN "
+                "(SELECT cache_key FROM results ORDER BY accessed_at DESC LIMIT -1 OFFSET ?)",
+                (self.max_entries,)).rowcount
+            self._count(conn, "evictions", evicted)
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+
+    def invalidate(self, key: str) -> None:
+        self._db.connection().execute("DELETE FROM results WHERE cache_key = ?", (key,))
+
+    def stats(self) -> Dict[str, int]:
+        conn = self._db.connection()
+        stats = {"entries": conn.execute("SELECT COUNT(*) FROM results").fetchone()[0],
+                 "hits": 0, "misses": 0, "evictions": 0}
+        stats.update({row["name"]: row["value"] for row in conn.execute("SELECT name, value FROM counters")})
+        return stats
+
+
+def create_result_cache(backend: str = TASK_STORE_BACKEND) -> ResultCache:
+    """
+    Create the result cache, shared between workers whenever the task store is.
+
+    Args:
+        backend (str): "memory" or "sqlite".
+
+    Returns:
+        ResultCache: The result cache.
+    """
+    if backend == "sqlite":
+        return SQLiteResultCache()
+    if backend == "memory":
+        return InMemoryResultCache()
+    raise ValueError(f"Unknown result cache backend: {backend}")
@@ -0,0 +1,192 @@
+import hashlib
+import logging
+import os
+import shutil
+import tempfile
+import time
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+
+from rnaseq_viz.config.config import RESULT_INDEX_DIR, RESULT_INDEX_MAX_AGE_SECONDS
+
+# Configure logger
+from rnaseq_viz.config.log_config import setup_logging
+setup_logging()
+logger = logging.getLogger(__name__)
+
+_COLUMNS_FILE = "columns.arrow"
+_SYMBOLS_FILE = "symbols.arrow"
+
+
+def _order_file(column: str) -> str:
+    return f"{column}.order.npy"
+
+
+def index_path(result_s3_key: str, index_dir: str = RESULT_INDEX_DIR) -> str:
+    """Directory of the index of a result. Results are immutable, so the index of a key never goes stale."""
+    return os.path.join(index_dir, hashlib.sha256(result_s3_key.encode("utf-8")).hexdigest())
+
+
+def _symbol_key(symbols: Sequence) -> np.ndarray:
+    """Symbols are matched case-insensitively, e.g. Gapdh, GAPDH and gapdh."""
+    return np.array([str(s).casefold() if s is not None else "" for s in symbols], dtype=object)
+
+
+def build_index(df: pd.DataFrame, path: str) -> None:
+    """
+    Write the index of a processed result to `path`.
+
+    The index holds an uncompressed Arrow copy of the result columns, which is memory-mapped
+    rather than read, the sorted SYMBOL keys with their rows, and the ascending row order of
+    each statistic. It is written to a temporary directory first and renamed into place, so
+    that concurrent builds by several workers are harmless.
+
+    Args:
+        df (pd.DataFrame): SYMBOL and the statistic columns of the result, sample columns are not indexed.
+        path (str): Directory of the index.
+    """
+    parent = os.path.dirname(path)
+    os.makedirs(parent, exist_ok=True)
+    staging = tempfile.mkdtemp(dir=parent, prefix=".building-")
+    try:
+        table = pa.Table.from_pandas(df.astype({'SYMBOL': object}), preserve_index=False)
+        with pa.OSFile(os.path.join(staging, _COLUMNS_FILE), "wb") as sink:
+            with pa.ipc.new_file(sink, table.schema) as writer:
+                writer.write_table(table, max_chunksize=max(len(table), 1))
+
+        keys = _symbol_key(df['SYMBOL'].to_numpy(dtype=object))
+        symbol_order = np.argsort(keys, kind="stable").astype(np.uint32)
+        symbols = pa.table({"key": pa.array(keys[symbol_order], type=pa.string()), "row": symbol_order})
+        with pa.OSFile(os.path.join(staging, _SYMBOLS_FILE), "wb") as sink:
+            with pa.ipc.new_file(sink, symbols.schema) as writer:
+                writer.write_table(symbols, max_chunksize=max(len(symbols), 1))
+
+        for column in df.columns[1:]:
+            order = np.argsort(df[column].to_numpy(dtype=np.float64), kind="stable").astype(np.uint32)
+            np.save(os.path.join(staging, _order_file(column)), order)
+
+        try:
+            os.rename(staging, path)
+        except OSError:
+            # Another worker built the same index in the meantime
+            if not os.path.isdir(path):
+                raise
+    finally:
+        shutil.rmtree(staging, ignore_errors=True)
+    logger.info("Built index of %s rows at %s", len(df), path)
+
+
+class ResultIndex:
+    """
+    Memory-mapped columns of a processed result with a SYMBOL index and sorted statistics.
+
+    Opening an index maps its files without reading them, so lookups only touch the pages
+    of the rows they return.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.table = pa.ipc.open_file(pa.memory_map(os.path.join(path, _COLUMNS_FILE))).read_all()
+        symbols = pa.ipc.open_file(pa.memory_map(os.path.join(path, _SYMBOLS_FILE))).read_all()
+        self._keys = symbols.column("key").to_numpy(zero_copy_only=False)
+        self._key_rows = symbols.column("row").to_numpy()
+        # SYMBOL, then the statistic columns of the result
+        self.columns: List[str] = self.table.column_names
+        self.statistics: List[str] = self.columns[1:]
+        self._orders = {column: np.load(os.path.join(path, _order_file(column)), mmap_mode="r")
+                        for column in self.statistics}
+        self._values = {column: self.table.column(column).to_numpy() for column in self.statistics}
+        self._sorted_values: Dict[str, np.ndarray] = {}
+        self._descending: Dict[str, np.ndarray] = {}
+        # Opening an index counts as a use when sweeping old indexes
+        os.utime(path)
+
+    def __len__(self) -> int:
+        return self.table.num_rows
+
+    def values(self, column: str) -> np.ndarray:
+        return self._values[column]
+
+    def order(self, column: str, descending: bool = False) -> np.ndarray:
+        """Rows sorted by a statistic column, or by SYMBOL. Missing values come last in both directions."""
+        order = self._key_rows if column == "SYMBOL" else self._orders[column]
+        if not descending:
+            return order
+        if column not in self._descending:
+            missing = 0 if column == "SYMBOL" else int(np.isnan(self._values[column]).sum())
+            present = len(order) - missing
+            self._descending[column] = np.concatenate([order[:present][::-1], order[present:]])
+        return self._descending[column]
+
+    def symbol_keys(self, rows: np.ndarray) -> List[str]:
+        """Case-folded symbols of the given rows."""
+        return _symbol_key(self.table.column("SYMBOL").take(pa.array(rows, type=pa.int64())).to_pylist()).tolist()
+
+    def lookup(self, symbols: Sequence[str]) -> Tuple[np.ndarray, List[str]]:
+        """
+        Find the rows of the given symbols, matched case-insensitively.
+
+        Returns:
+            Tuple[np.ndarray, List[str]]: Rows of the symbols found, in the order of the
+            request, and the symbols that were not found.
+        """
+        keys = _symbol_key(symbols)
+        starts = np.searchsorted(self._keys, keys, side="left")
+        stops = np.searchsorted(self._keys, keys, side="right")
+        rows, missing = [], []
+        for symbol, start, stop in zip(symbols, starts, stops):
+            if start == stop:
+                missing.append(symbol)
+            rows.extend(self._key_rows[start:stop])
+        return np.asarray(rows, dtype=np.int64), missing
+
+    def prefix_rows(self, prefix: str) -> np.ndarray:
+        """Rows whose SYMBOL starts with the prefix, matched case-insensitively, in SYMBOL order."""
+        key = prefix.casefold()
+        start = np.searchsorted(self._keys, key, side="left")
+        # Every key starting with the prefix sorts before the prefix followed by the last code point
+        stop = np.searchsorted(self._keys, key + chr(0x10FFFF), side="left")
+        return self._key_rows[start:stop].astype(np.int64)
+
+    def range_rows(self, column: str, low: Optional[float], high: Optional[float]) -> np.ndarray:
+        """Rows with a value of the column within [low, high], in ascending order of the column."""
+        order = self._orders[column]
+        if column not in self._sorted_values:
+            self._sorted_values[column] = self._values[column][order]
+        sorted_values = self._sorted_values[column]
+        start = 0 if low is None else np.searchsorted(sorted_values, low, side="left")
+        stop = len(order) if high is None else np.searchsorted(sorted_values, high, side="right")
+        return np.asarray(order[start:stop], dtype=np.int64)
+
+    def rows(self, rows: np.ndarray) -> List[List]:
+        """Values of the given rows, as JSON-serializable lists."""
+        taken = self.table.take(pa.array(rows, type=pa.int64()))
+        columns = [taken.column(column).to_pylist() for column in self.columns]
+        return [list(row) for row in zip(*columns)]
+
+
+def cleanup_stale_indexes(index_dir: str = RESULT_INDEX_DIR,
+                          max_age_seconds: int = RESULT_INDEX_MAX_AGE_SECONDS) -> int:
+    """
+    Remove the indexes that were not opened for `max_age_seconds`, and abandoned partial builds.
+
+    Returns:
+        int: Number of indexes removed.
+    """
+    if not os.path.isdir(index_dir):
+        return 0
+    removed = 0
+    cutoff = time.time() - max_age_seconds
+    for entry in os.scandir(index_dir):
+        try:
+            if entry.is_dir() and entry.stat().st_mtime < cutoff:
+                shutil.rmtree(entry.path, ignore_errors=True)
+                removed += 1
+        except FileNotFoundError:
+            continue
+    if removed:
+        logger.info("Removed %s stale result indexes from %s", removed, index_dir)
+    return removed
@@ -0,0 +1,130 @@
+import logging
+from abc import ABC, abstractmethod
+from typing import IO, Optional
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from rnaseq_viz.config.config import RESULT_FORMAT, RESULT_FLOAT32, RESULT_PARQUET_COMPRESSION
+
+# Configure logger
+from rnaseq_viz.config.log_config import setup_logging
+setup_logging()
+logger = logging.getLogger(__name__)
+
+RESULT_FORMATS = ("csv", "parquet")
+
+# Rows serialized at a time, so that the text or float64 copy of a chunk stays small whatever its size
+_WRITE_BLOCK_ROWS = 16384
+
+
+def downcast_floats(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Downcast float64 columns to float32, halving their size.
+
+    Args:
+        df (pd.DataFrame): The DataFrame to downcast.
+
+    Returns:
+        pd.DataFrame: DataFrame with float32 instead of float64 columns.
+    """
+    float_columns = [col for col, dtype in df.dtypes.items() if dtype == np.float64]
+    if not float_columns:
+        return df
+    return df.astype({col: np.float32 for col in float_columns})
+
+
+class ResultWriter(ABC):
+    """
+    Serializes a processed result, written as one or more row chunks, to a binary file object.
+    """
+
+    extension: str = ""
+
+    def __init__(self, output: IO, float32: bool = RESULT_FLOAT32):
+        self.output = output
+        self.float32 = float32
+
+    @abstractmethod
+    def write_chunk(self, df: pd.DataFrame) -> None:
+        """Append a chunk of rows to the result."""
+
+    def close(self) -> None:
+        """Finalize the result. The output file object itself is not closed."""
+
+
+class CSVResultWriter(ResultWriter):
+    extension = "csv"
+
+    def __init__(self, output: IO, float32: bool = RESULT_FLOAT32):
+        super().__init__(output, float32)
+        self._header_written = False
+
+    def write_chunk(self, df: pd.DataFrame) -> None:
+        for start in range(0, max(len(df), 1), _WRITE_BLOCK_ROWS):
+            block = df.iloc[start:start + _WRITE_BLOCK_ROWS]
+            if self.float32:
+                block = downcast_floats(block)
+            self.output.write(block.to_csv(index=False, header=not self._header_written).encode('utf-8'))
+            self._header_written = True
+
+
+class ParquetResultWriter(ResultWriter):
+    """
+    Writes each chunk as one or more Parquet row groups, so that readers can fetch single columns.
+
+    Sample columns are stored as floating point and SYMBOL as plain strings so that every
+    chunk shares the schema of the first one, whatever the dtypes of the individual chunks.
+    Parquet dictionary-encodes the strings in any case.
+    """
+
+    extension = "parquet"
+
+    def __init__(self, output: IO, float32: bool = RESULT_FLOAT32, compression: str = RESULT_PARQUET_COMPRESSION):
+        super().__init__(output, float32)
+        self.compression = compression
+        self._writer: Optional[pq.ParquetWriter] = None
+
+    def write_chunk(self, df: pd.DataFrame) -> None:
+        for start in range(0, max(len(df), 1), _WRITE_BLOCK_ROWS):
+            table = self._to_table(df.iloc[start:start + _WRITE_BLOCK_ROWS])
+            if self._writer is None:
+                self._writer = pq.ParquetWriter(pa.PythonFile(self.output, mode='w'), table.schema,
+                                                compression=self.compression)
+            self._writer.write_table(table)
+
+    def _to_table(self, df: pd.DataFrame) -> pa.Table:
+        float_type = np.float32 if self.float32 else np.float64
+        # Convert column by column rather than with `astype` on the whole frame, which would copy the matrix
+        arrays = []
+        for col in df.columns:
+            if col == 'SYMBOL':
+                symbol = pa.array(df[col], from_pandas=True)
+                arrays.append(symbol.cast(pa.string()) if pa.types.is_dictionary(symbol.type) else symbol)
+            else:
+                arrays.append(pa.array(df[col].to_numpy(dtype=float_type), from_pandas=True))
+        return pa.Table.from_arrays(arrays, names=[str(col) for col in df.columns])
+
+    def close(self) -> None:
+        if self._writer is not None:
+            self._writer.close()
+
+
+def create_result_writer(output: IO, result_format: str = RESULT_FORMAT) -> ResultWriter:
+    """
+    Create the writer of the requested result format.
+
+    Args:
+        output (IO): Binary file object receiving the result.
+        result_format (str): "csv" or "parquet".
+
+    Returns:
+        ResultWriter: The writer.
+    """
+    if result_format == "csv":
+        return CSVResultWriter(output)
+    if result_format == "parquet":
+        return ParquetResultWriter(output)
+    raise ValueError(f"Unknown result format: {result_format}. Expected one of {RESULT_FORMATS}.")
@@ -0,0 +1,260 @@
+import json
+import logging
+import os
+import threading
+from collections import OrderedDict
+from typing import Dict, List, Optional, Sequence
+
+import numpy as np
+import pandas as pd
+
+from rnaseq_viz.common.storage import ObjectStorage
+from rnaseq_viz.backend.differential import DE_COLUMNS
+from rnaseq_viz.backend.pipeline import differential_s3_key, sample_qc_s3_key, summary_s3_key
+from rnaseq_viz.backend.result_index import ResultIndex, build_index, index_path
+from rnaseq_viz.backend.viz_summary import STAT_COLUMNS
+from rnaseq_viz.config.config import (
+    S3_BUCKET, RESULTS_PAGE_MAX_ROWS, RESULTS_READER_MAX_ENTRIES, RESULT_INDEX_DIR
+)
+
+# Configure logger
+from rnaseq_viz.config.log_config import setup_logging
+setup_logging()
+logger = logging.getLogger(__name__)
+
+DIFFERENTIAL_COLUMNS = ["SYMBOL"] + DE_COLUMNS
+
+
+class ResultReader:
+    """
+    Serves visualization summaries, sample QC, pages and queries of processed results, and
+    their differential expression.
+
+    Each result is read from S3 once per host and kept as a memory-mapped index on local
+    disk, see `result_index`. The indexes and summaries of the most recently used results
+    are kept open, so that paging through or querying a result does not read S3 again.
+    """
+
+    def __init__(self, s3_manager: ObjectStorage, max_entries: int = RESULTS_READER_MAX_ENTRIES,
+                 index_dir: str = RESULT_INDEX_DIR):
+        self.s3_manager = s3_manager
+        self.max_entries = max_entries
+        self.index_dir = index_dir
+        self._indexes: "OrderedDict[str, ResultIndex]" = OrderedDict()
+        self._summaries: "OrderedDict[str, Dict]" = OrderedDict()
+        self._sample_qcs: "OrderedDict[str, Dict]" = OrderedDict()
+        self._differentials: "OrderedDict[str, pd.DataFrame]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _cached(self, cache: OrderedDict, key: str, load):
+        with self._lock:
+            if key in cache:
+                cache.move_to_end(key)
+                return cache[key]
+        # Load outside of the lock, concurrent loads of the same result are harmless
+        value = load()
+        with self._lock:
+            cache[key] = value
+            cache.move_to_end(key)
+            while len(cache) > self.max_entries:
+                cache.popitem(last=False)
+        return value
+
+    def index(self, result_s3_key: str) -> ResultIndex:
+        """
+        Returns:
+            ResultIndex: The index of a processed result, built from its S3 object on first use.
+            It holds SYMBOL and the statistic columns, sample columns are not served.
+        """
+        def load():
+            path = index_path(result_s3_key, self.index_dir)
+            if not os.path.isdir(path):
+                # Summaries written before the statistics were selectable do not list them
+                columns = ["SYMBOL"] + self.summary(result_s3_key).get("statistics", STAT_COLUMNS)
+                df = self.s3_manager.read_result_from_s3(bucket=S3_BUCKET, key=result_s3_key, columns=columns)
+                build_index(df, path)
+            return ResultIndex(path)
+        return self._cached(self._indexes, result_s3_key, load)
+
+    def summary(self, result_s3_key: str) -> Dict:
+        """
+        Returns:
+            Dict: The visualization summary computed at the end of processing.
+        """
+        def load():
+            return json.loads(self.s3_manager.read_object(bucket=S3_BUCKET, key=summary_s3_key(result_s3_key)))
+        return self._cached(self._summaries, result_s3_key, load)
+
+    def sample_qc(self, result_s3_key: str) -> Dict:
+        """
+        Returns:
+            Dict: The sample correlation heatmap and PCA computed at the end of processing.
+        """
+        def load():
+            return json.loads(self.s3_manager.read_object(bucket=S3_BUCKET, key=sample_qc_s3_key(result_s3_key)))
+        return self._cached(self._sample_qcs, result_s3_key, load)
+
+    def differential(self, result_s3_key: str) -> pd.DataFrame:
+        """
+        Returns:
+            pd.DataFrame: The differential expression computed with a processed result. It is
+            a few columns per gene, small enough to be held in memory rather than indexed.
+        """
+        def load():
+            return self.s3_manager.read_result_from_s3(bucket=S3_BUCKET, key=differential_s3_key(result_s3_key))
+        return self._cached(self._differentials, result_s3_key, load)
+
+    def differential_page(self, result_s3_key: str, offset: int = 0, limit: int = 100, sort_by: str = "pvalue",
+                          descending: bool = False, max_fdr: Optional[float] = None) -> Dict:
+        """
+        Read a page of genes of the differential expression of a processed result.
+
+        Args:
+            result_s3_key (str): S3 key of the processed result.
+            offset (int): Index of the first gene of the page.
+            limit (int): Number of genes of the page, at most RESULTS_PAGE_MAX_ROWS.
+            sort_by (str): Column to sort the genes by. Untested genes, with NaN statistics, come last.
+            descending (bool): Sort in descending order.
+            max_fdr (Optional[float]): Keep the genes significant at this false discovery rate only.
+
+        Returns:
+            Dict: Total number of genes, offset and limit of the page, column names, and the rows.
+        """
+        if sort_by not in DIFFERENTIAL_COLUMNS:
+            raise ValueError(f"Cannot sort by {sort_by}, expected one of {DIFFERENTIAL_COLUMNS}")
+        limit = max(0, min(limit, RESULTS_PAGE_MAX_ROWS))
+        offset = max(0, offset)
+
+        genes = self.differential(result_s3_key)
+        if max_fdr is not None:
+            genes = genes[genes["FDR"] <= max_fdr]
+        page = genes.sort_values(sort_by, ascending=not descending, na_position="last", kind="stable")
+        page = page.iloc[offset:offset + limit][DIFFERENTIAL_COLUMNS]
+
+        return {
+            "total": len(genes),
+            "offset": offset,
+            "limit": limit,
+            "columns": DIFFERENTIAL_COLUMNS,
+            # NaN is not valid JSON
+            "rows": page.astype(object).where(page.notna(), None).values.tolist(),
+        }
+
+    def page(self, result_s3_key: str, offset: int = 0, limit: int = 100, sort_by: Optional[str] = None,
+             descending: bool = True) -> Dict:
+        """
+        Read a page of rows of a processed result.
+
+        Args:
+            result_s3_key (str): S3 key of the processed result.
+            offset (int): Index of the first row of the page.
+            limit (int): Number of rows of the page, at most RESULTS_PAGE_MAX_ROWS.
+            sort_by (Optional[str]): Column to sort the rows by, the input order if None.
+            descending (bool): Sort in descending order.
+
+        Returns:
+            Dict: Total number of rows, offset and limit of the page, column names, and the rows.
+        """
+        limit = max(0, min(limit, RESULTS_PAGE_MAX_ROWS))
+        offset = max(0, offset)
+
+        index = self.index(result_s3_key)
+        if sort_by is not None and sort_by not in index.columns:
+            raise ValueError(f"Cannot sort by {sort_by}, expected one of {index.columns}")
+        total = len(index)
+        if sort_by is None:
+            rows = np.arange(min(offset, total), min(offset + limit, total))
+        else:
+            rows = index.order(sort_by, descending)[offset:offset + limit]
+
+        return {
+            "total": total,
+            "offset": offset,
+            "limit": limit,
+            "columns": index.columns,
+            "rows": index.rows(rows),
+        }
+
+    def query(self, result_s3_key: str, symbols: Optional[Sequence[str]] = None, prefix: Optional[str] = None,
+              ranges: Optional[Dict[str, Sequence[Optional[float]]]] = None, top_k: Optional[int] = None,
+              rank_by: str = "Mean", descending: bool = True) -> Dict:
+        """
+        Find the genes of a processed result matching all the given filters.
+
+        The most selective filter is answered from the index, exact symbols first, then the
+        symbol prefix, then the narrowest range, and the other filters are applied to its rows only.
+
+        Args:
+            result_s3_key (str): S3 key of the processed result.
+            symbols (Optional[Sequence[str]]): Exact gene symbols, matched case-insensitively.
+            prefix (Optional[str]): Prefix of the gene symbols, matched case-insensitively.
+            ranges (Optional[Dict[str, Sequence[Optional[float]]]]): Inclusive [low, high] bounds
+                by statistic column, None for an open bound.
+            top_k (Optional[int]): Keep the `top_k` matches ranked by `rank_by`, at most
+                RESULTS_PAGE_MAX_ROWS. All matches up to RESULTS_PAGE_MAX_ROWS if None.
+            rank_by (str): Statistic column the matches are ranked by.
+            descending (bool): Rank in descending order.
+
+        Returns:
+            Dict: Total number of matches, column names, the matching rows ranked by `rank_by`,
+            and the requested symbols that are not in the result.
+        """
+        ranges = {column: bounds for column, bounds in (ranges or {}).items()
+                  if any(bound is not None for bound in bounds)}
+        limit = RESULTS_PAGE_MAX_ROWS if top_k is None else max(0, min(top_k, RESULTS_PAGE_MAX_ROWS))
+
+        index = self.index(result_s3_key)
+        for column in [rank_by, *ranges]:
+            if column not in index.statistics:
+                raise ValueError(f"Cannot filter or rank by {column}, expected one of {index.statistics}")
+        missing: List[str] = []
+        if symbols is not None:
+            rows, missing = index.lookup(symbols)
+            if prefix:
+                keys = index.symbol_keys(rows)
+                rows = rows[np.array([key.startswith(prefix.casefold()) for key in keys], dtype=bool)]
+        elif prefix:
+            rows = index.prefix_rows(prefix)
+        elif ranges:
+            # Range sizes are known from the sorted values, start from the narrowest
+            candidates = {column: index.range_rows(column, *bounds) for column, bounds in ranges.items()}
+            column = min(candidates, key=lambda c: len(candidates[c]))
+            rows = candidates[column]
+            ranges.pop(column)
+        else:
+            rows = None
+
+        for column, (low, high) in ranges.items():
+            values = index.values(column)[rows] if rows is not None else index.values(column)
+            mask = np.ones(len(values), dtype=bool)
+            if low is not None:
+                mask &= values >= low
+            if high is not None:
+                mask &= values <= high
+            rows = rows[mask] if rows is not None else np.flatnonzero(mask)
+
+        if rows is None:
+            # No filter, the top genes of the whole result come straight from the sorted order
+            total = len(index)
+            ranked = index.order(rank_by, descending)[:limit]
+        else:
+            total = int(len(rows))
+            ranked = _rank(rows, index.values(rank_by)[rows], limit, descending)
+
+        return {
+            "total_matches": total,
+            "columns": index.columns,
+            "rows": index.rows(ranked),
+            "missing": missing,
+        }
+
+
+def _rank(rows: np.ndarray, values: np.ndarray, limit: int, descending: bool) -> np.ndarray:
+    """The `limit` first rows by value, partitioning before sorting so large matches are not fully sorted."""
+    if descending:
+        # Missing values rank last in both directions
+        values = np.where(np.isnan(values), np.inf, -values)
+    if limit < len(rows):
+        selected = np.argpartition(values, limit)[:limit]
+        rows, values = rows[selected], values[selected]
+    return rows[np.argsort(values, kind="stable")]
@@ -0,0 +1,177 @@
+import logging
+import math
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+import pandas as pd
+
+from rnaseq_viz.backend.count_matrix import log2_block
+from rnaseq_viz.backend.viz_summary import STAT_COLUMNS
+from rnaseq_viz.config.config import (
+    SAMPLE_QC_COMPONENTS, SAMPLE_QC_POWER_ITERATIONS, SAMPLE_QC_MAX_HEATMAP_SAMPLES
+)
+
+# Configure logger
+from rnaseq_viz.config.log_config import setup_logging
+setup_logging()
+logger = logging.getLogger(__name__)
+
+# Genes converted to float64 at a time, about 16 MB for 500 samples
+_QC_BLOCK_ROWS = 4096
+# Extra dimensions of the randomized subspace, beyond the components kept
+_OVERSAMPLING = 10
+
+
+def randomized_eigh(matrix: np.ndarray, k: int, power_iterations: int = SAMPLE_QC_POWER_ITERATIONS,
+                    seed: int = 0) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Top `k` eigenvalues and eigenvectors of a symmetric positive semi-definite matrix, by
+    randomized subspace iteration (Halko, Martinsson and Tropp, 2011).
+
+    The matrix is only multiplied with thin (n, k + 10) blocks, so the cost is O(n^2 k) rather
+    than the O(n^3) of a dense decomposition. Small matrices are decomposed exactly.
+
+    Returns:
+        Tuple[np.ndarray, np.ndarray]: The eigenvalues in decreasing order, and the eigenvectors
+        as columns. The sign of each eigenvector makes its largest entry positive.
+    """
+    n = len(matrix)
+    width = min(n, k + _OVERSAMPLING)
+    if width >= n:
+        eigenvalues, vectors = np.linalg.eigh(matrix)
+    else:
+        rng = np.random.default_rng(seed)
+        basis, _ = np.linalg.qr(matrix @ rng.standard_normal((n, width)))
+        for _ in range(power_iterations):
+            basis, _ = np.linalg.qr(matrix @ basis)
+        eigenvalues, small_vectors = np.linalg.eigh(basis.T @ matrix @ basis)
+        vectors = basis @ small_vectors
+    order = np.argsort(eigenvalues)[::-1][:k]
+    eigenvalues, vectors = eigenvalues[order], vectors[:, order]
+    signs = np.sign(vectors[np.argmax(np.abs(vectors), axis=0), np.arange(vectors.shape[1])])
+    return eigenvalues, vectors * np.where(signs == 0, 1, signs)
+
+
+def _rounded(values: np.ndarray, decimals: int = 4) -> List:
+    """Rounded values as nested lists, NaN as None since it is not valid JSON."""
+    rounded = np.round(values, decimals).astype(object)
+    rounded[np.isnan(values)] = None
+    return rounded.tolist()
+
+
+def heatmap(correlation: np.ndarray, labels: List[str], max_samples: int = SAMPLE_QC_MAX_HEATMAP_SAMPLES) -> Dict:
+    """
+    The correlation matrix as plotted, averaged over blocks of consecutive samples for large cohorts.
+
+    Returns:
+        Dict: `labels` of the rows and columns, `values` of the cells, and `block_size`, the
+        number of samples averaged in each row and column.
+    """
+    n = len(labels)
+    if n <= max_samples:
+        return {"labels": labels, "values": _rounded(correlation), "block_size": 1}
+    size = math.ceil(n / max_samples)
+    starts = np.arange(0, n, size)
+    present = ~np.isnan(correlation)
+    sums = np.add.reduceat(np.add.reduceat(np.where(present, correlation, 0), starts, axis=0), starts, axis=1)
+    counts = np.add.reduceat(np.add.reduceat(present.astype(np.int64), starts, axis=0), starts, axis=1)
+    with np.errstate(invalid="ignore"):
+        values = sums / counts
+    block_labels = [f"{labels[start]}..{labels[min(start + size, n) - 1]}" for start in starts]
+    return {"labels": block_labels, "values": _rounded(values), "block_size": size}
+
+
+class SampleQCAccumulator:
+    """
+    Sample-level QC of a count matrix, the sample-sample correlation and the PCA of the samples,
+    computed in a single pass over the genes.
+
+    Genes are added a block at a time, e.g. the chunks of a streamed input, as log2(count + 1).
+    Each block adds its (samples x samples) Gram matrix, a blocked matrix product, and its sums.
+    Both the Pearson correlation, centered per sample, and the PCA, centered per gene, derive
+    from these. The principal components are the top eigenvectors of the gene-centered Gram
+    matrix, found by randomized SVD. Memory is O(samples^2), whatever the number of genes.
+    """
+
+    def __init__(self):
+        self.sample_names: List[str] = []
+        self.n_genes = 0
+        self._gram: Optional[np.ndarray] = None
+        # Per-sample sums over the genes, the sum of gene means weighted by the values, and of squared gene means
+        self._sums: Optional[np.ndarray] = None
+        self._weighted_means: Optional[np.ndarray] = None
+        self._squared_means = 0.0
+
+    def add(self, block: np.ndarray) -> None:
+        """Add a (genes, samples) block of log2(count + 1) values."""
+        if self._gram is None:
+            n = block.shape[1]
+            self._gram, self._sums, self._weighted_means = np.zeros((n, n)), np.zeros(n), np.zeros(n)
+        self._gram += block.T @ block
+        self._sums += block.sum(axis=0)
+        means = block.mean(axis=1)
+        self._weighted_means += means @ block
+        self._squared_means += float(means @ means)
+        self.n_genes += len(block)
+
+    def add_frame(self, processed: pd.DataFrame, statistics: Sequence[str] = STAT_COLUMNS,
+                  block_rows: int = _QC_BLOCK_ROWS) -> None:
+        """
+        Add the genes of a processed result, or of a chunk of one: SYMBOL, the `statistics`
+        columns, then the samples.
+        """
+        first = 1 + len(statistics)
+        sample_names = [str(name) for name in processed.columns[first:]]
+        if not self.sample_names:
+            self.sample_names = sample_names
+        columns = [processed.iloc[:, position].to_numpy() for position in range(first, processed.shape[1])]
+        if not columns:
+            return
+        for start in range(0, len(processed), block_rows):
+            self.add(log2_block(columns, slice(start, start + block_rows)))
+
+    def correlation(self) -> np.ndarray:
+        """Pearson correlation of the samples over the genes, NaN for samples with no variance."""
+        covariance = self._gram - np.outer(self._sums, self._sums) / self.n_genes
+        std = np.sqrt(np.clip(np.diag(covariance), 0, None))
+        with np.errstate(invalid="ignore", divide="ignore"):
+            correlation = np.clip(covariance / np.outer(std, std), -1, 1)
+        correlation[np.diag_indices_from(correlation)] = np.where(std > 0, 1.0, np.nan)
+        return correlation
+
+    def pca(self, n_components: int = SAMPLE_QC_COMPONENTS,
+            power_iterations: int = SAMPLE_QC_POWER_ITERATIONS) -> Optional[Dict]:
+        """
+        Principal components of the samples, with the genes as variables centered on their mean.
+
+        Returns:
+            Optional[Dict]: `scores` of each sample on each component and `explained_variance_ratio`
+            of each component, or None with fewer than 2 samples.
+        """
+        k = min(n_components, len(self.sample_names) - 1)
+        if k < 1 or self.n_genes == 0:
+            return None
+        # Gram matrix of the gene-centered values, from the sums: G - v 1' - 1 v' + c 1 1'
+        gram = self._gram - np.add.outer(self._weighted_means, self._weighted_means) + self._squared_means
+        eigenvalues, vectors = randomized_eigh(gram, k, power_iterations)
+        eigenvalues = np.clip(eigenvalues, 0, None)
+        total = float(np.trace(gram))
+        return {
+            "scores": _rounded(vectors * np.sqrt(eigenvalues)),
+            "explained_variance_ratio": _rounded(eigenvalues / total if total > 0 else np.zeros_like(eigenvalues), 6),
+        }
+
+    def summary(self, n_components: int = SAMPLE_QC_COMPONENTS, power_iterations: int = SAMPLE_QC_POWER_ITERATIONS,
+                max_heatmap_samples: int = SAMPLE_QC_MAX_HEATMAP_SAMPLES) -> Dict:
+        """
+        Returns:
+            Dict: The QC artifact: sample names, number of genes, correlation heatmap and PCA.
+        """
+        if self._gram is None:
+            return {"samples": self.sample_names, "n_genes": 0, "correlation": None, "pca": None}
+        return {
+            "samples": self.sample_names,
+            "n_genes": self.n_genes,
+            "correlation": heatmap(self.correlation(), self.sample_names, max_heatmap_samples),
+            "pca": self.pca(n_components, power_iterations),
+        }
@@ -0,0 +1,337 @@
+import heapq
+import itertools
+import logging
+import math
+import os
+import pickle
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from rnaseq_viz.backend.sqlite_db import SQLiteDatabase
+from rnaseq_viz.config.config import (
+    SCHEDULER_MAX_RUNNING, SCHEDULER_MAX_QUEUED, SCHEDULER_MAX_RUNNING_PER_USER, SCHEDULER_AGING_SECONDS,
+    SCHEDULER_INITIAL_THROUGHPUT_MB_S, TASK_STORE_BACKEND, TASK_STORE_PATH
+)
+
+# Configure logger
+from rnaseq_viz.config.log_config import setup_logging
+setup_logging()
+logger = logging.getLogger(__name__)
+
+# Weight of the last finished job in the moving average of the processing throughput
+_THROUGHPUT_SMOOTHING = 0.3
+
+
+class QueueFullError(Exception):
+    """Raised when a job is submitted while the queue is full."""
+
+    def __init__(self, retry_after: int):
+        super().__init__(f"Processing queue is full, retry in {retry_after} s")
+        self.retry_after = retry_after
+
+
+@dataclass
+class Job:
+    """
+    A processing job waiting for, or holding, a processing slot.
+
+    Attributes:
+        task_id (str): ID of the task.
+        user (str): Owner of the job, concurrency is limited per owner.
+        size (int): Expected size of the input in bytes, once decompressed.
+        payload (Dict): Arguments of the job, opaque to the scheduler.
+        submitted_at (float): Time the job was queued at, as from `time.time()`.
+        started_at (float): Time the job was started at, 0 while it waits.
+        owner (str): Scheduler the job was submitted through, or started by once running.
+    """
+    task_id: str
+    user: str
+    size: int
+    payload: Dict = field(default_factory=dict)
+    submitted_at: float = field(default_factory=time.time)
+    started_at: float = 0.0
+    seq: int = 0
+    owner: str = ""
+
+
+class Scheduler:
+    """
+    Bounded, size-aware queue of processing jobs.
+
+    Jobs are started smallest input first, so that small uploads are not stuck behind
+    a large one. The priority of a waiting job grows with its wait, as if its input
+    shrank by half every `aging_seconds`, so large jobs are delayed but never starved.
+    At most `max_running` jobs run at once, and at most `max_running_per_user` of them
+    for a single user. Submissions beyond `max_queued` waiting jobs are rejected.
+
+    The scheduler only does the bookkeeping: callers start the jobs returned by
+    `next_jobs` and report them with `finish`. Its state is held in memory, for a
+    single backend worker; `SQLiteScheduler` shares it between the backend workers
+    of a host.
+    """
+
+    def __init__(self, max_running: int = SCHEDULER_MAX_RUNNING, max_queued: int = SCHEDULER_MAX_QUEUED,
+                 max_running_per_user: int = SCHEDULER_MAX_RUNNING_PER_USER,
+                 aging_seconds: float = SCHEDULER_AGING_SECONDS,
+                 initial_throughput_mb_s: float = SCHEDULER_INITIAL_THROUGHPUT_MB_S):
+        self.max_running = max(1, max_running)
+        self.max_queued = max_queued
+        self.max_running_per_user = max(1, max_running_per_user)
+        self.aging_seconds = aging_seconds
+        # Bytes of input processed per second by one job, learned from the finished jobs
+        self.throughput = initial_throughput_mb_s * 1024 * 1024
+        # Owner of the jobs submitted and started through this scheduler
+        self.owner = f"{os.getpid()}-{uuid.uuid4().hex[:8]}"
+        self._queued: Dict[str, Job] = {}
+        self._running: Dict[str, Job] = {}
+        self._seq = itertools.count()
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def _state(self) -> Iterator[Tuple[Dict[str, Job], Dict[str, Job]]]:
+        """The waiting and the running jobs by task ID, read and changed atomically within the context."""
+        with self._lock:
+            yield self._queued, self._running
+
+    def _priority(self, job: Job, now: float) -> Tuple[float, int]:
+        waited = now - job.submitted_at
+        return job.size * 0.5 ** (waited / self.aging_seconds), job.seq
+
+    def _duration(self, job: Job) -> float:
+        return job.size / self.throughput
+
+    def _slots(self, running: Dict[str, Job], now: float) -> List[float]:
+        """Seconds until each processing slot frees up, from the expected duration of the running jobs."""
+        slots = [max(0.0, job.started_at + self._duration(job) - now) for job in running.values()]
+        slots += [0.0] * (self.max_running - len(slots))
+        heapq.heapify(slots)
+        return slots
+
+    def _retry_after(self, running: Dict[str, Job], now: float) -> int:
+        """Seconds until the first queued job is expected to start, which frees a place in the queue."""
+        return max(1, math.ceil(min(self._slots(running, now))))
+
+    def check_capacity(self) -> None:
+        """Raise QueueFullError if a job submitted now would be rejected."""
+        with self._state() as (queued, running):
+            if len(queued) >= self.max_queued:
+                raise QueueFullError(self._retry_after(running, time.time()))
+
+    def submit(self, job: Job) -> None:
+        """
+        Queue a job.
+
+        Raises:
+            QueueFullError: If `max_queued` jobs are waiting already.
+        """
+        with self._state() as (queued, running):
+            if len(queued) >= self.max_queued:
+                raise QueueFullError(self._retry_after(running, time.time()))
+            job.seq = next(self._seq)
+            job.owner = self.owner
+            queued[job.task_id] = job
+        logger.info("Queued task %s of user %s with %s bytes of input", job.task_id, job.user, job.size)
+
+    def next_jobs(self, max_jobs: Optional[int] = None) -> List[Job]:
+        """
+        Take the jobs to start now, in priority order, and count them as running.
+
+        Args:
+            max_jobs (Optional[int]): Maximum number of jobs the caller can start, e.g. its free
+                processing workers.
+
+        Returns:
+            List[Job]: Jobs the caller must start.
+        """
+        started = []
+        with self._state() as (queued, running):
+            now = time.time()
+            running_per_user: Dict[str, int] = {}
+            for job in running.values():
+                running_per_user[job.user] = running_per_user.get(job.user, 0) + 1
+            for job in sorted(queued.values(), key=lambda job: self._priority(job, now)):
+                if len(running) >= self.max_running or (max_jobs is not None and len(started) >= max_jobs):
+                    break
+                if running_per_user.get(job.user, 0) >= self.max_running_per_user:
+                    continue
+                del queued[job.task_id]
+                job.started_at = now
+                job.owner = self.owner
+                running[job.task_id] = job
+                running_per_user[job.user] = running_per_user.get(job.user, 0) + 1
+                started.append(job)
+        return started
+
+    def finish(self, task_id: str) -> None:
+        """Release the slot of a finished job, and learn the processing throughput from it."""
+        with self._state() as (queued, running):
+            job = running.pop(task_id, None)
+            if job is None:
+                return
+            elapsed = time.time() - job.started_at
+            if job.size > 0 and elapsed > 0:
+                self.throughput += _THROUGHPUT_SMOOTHING * (job.size / elapsed - self.throughput)
+
+    def remove(self, task_id: str) -> bool:
+        """
+        Remove a waiting or running job without learning from it, e.g. when its task was cancelled.
+
+        Returns:
+            bool: Whether the job was known to this scheduler.
+        """
+        with self._state() as (queued, running):
+            return (queued.pop(task_id, None) or running.pop(task_id, None)) is not None
+
+    def cancel_queued(self) -> List[Job]:
+        """
+        Remove every waiting job submitted through this scheduler, e.g. on shutdown.
+
+        Returns:
+            List[Job]: The removed jobs.
+        """
+        with self._state() as (queued, running):
+            jobs = [job for job in queued.values() if job.owner == self.owner]
+            for job in jobs:
+                del queued[job.task_id]
+        return jobs
+
+    def queue_positions(self) -> Dict[str, Dict]:
+        """
+        Position and estimated wait of every waiting job.
+
+        The wait is estimated by replaying the queue in priority order on the processing
+        slots, ignoring the per-user limits, with durations from the learned throughput.
+
+        Returns:
+            Dict[str, Dict]: `queue_position` (1 for the next job to start) and
+            `estimated_wait_seconds` by task ID.
+        """
+        with self._state() as (queued, running):
+            now = time.time()
+            slots = self._slots(running, now)
+            positions = {}
+            for position, job in enumerate(sorted(queued.values(), key=lambda job: self._priority(job, now)),
+                                           start=1):
+                start = heapq.heappop(slots)
+                heapq.heappush(slots, start + self._duration(job))
+                positions[job.task_id] = {"queue_position": position, "estimated_wait_seconds": round(start, 1)}
+        return positions
+
+    @property
+    def n_queued(self) -> int:
+        """Number of waiting jobs submitted through this scheduler."""
+        with self._state() as (queued, running):
+            return sum(job.owner == self.owner for job in queued.values())
+
+    @property
+    def n_running(self) -> int:
+        with self._state() as (queued, running):
+            return len(running)
+
+
+def _process_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+class SQLiteScheduler(Scheduler):
+    """
+    Scheduler whose waiting and running jobs are kept in the SQLite task database, shared by
+    every backend worker of the host, so that its limits and queue positions hold for the host.
+
+    Each operation reads the jobs and writes its changes back in a single write transaction.
+    Any backend worker may start a waiting job, whichever one it was submitted through, so
+    the payload of the job is stored pickled. The slots of the jobs of a backend worker that
+    died are released. The processing throughput is learned by each backend worker from the
+    jobs it finished.
+    """
+
+    _SCHEMA = """
+        CREATE TABLE IF NOT EXISTS jobs (
+            task_id TEXT PRIMARY KEY,
+            user TEXT NOT NULL,
+            size INTEGER NOT NULL,
+            payload BLOB NOT NULL,
+            submitted_at REAL NOT NULL,
+            started_at REAL,
+            owner TEXT NOT NULL,
+            owner_pid INTEGER NOT NULL
+        );
+    """
+
+    def __init__(self, path: str = TASK_STORE_PATH, **kwargs):
+        super().__init__(**kwargs)
+        logger.info("Using SQLite scheduler at %s", path)
+        self._db = SQLiteDatabase(path, self._SCHEMA)
+
+    @contextmanager
+    def _state(self) -> Iterator[Tuple[Dict[str, Job], Dict[str, Job]]]:
+        conn = self._db.connection()
+        # BEGIN IMMEDIATE takes the write lock up front, serializing the decisions of the backend workers
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            queued: Dict[str, Job] = {}
+            running: Dict[str, Job] = {}
+            # Whether each job read was running
+            read: Dict[str, bool] = {}
+            for row in conn.execute("SELECT rowid AS seq, * FROM jobs"):
+                job = Job(task_id=row["task_id"], user=row["user"], size=row["size"],
+                          payload=pickle.loads(row["payload"]), submitted_at=row["submitted_at"],
+                          started_at=row["started_at"] or 0.0, seq=row["seq"], owner=row["owner"])
+                read[job.task_id] = row["started_at"] is not None
+                if row["started_at"] is None:
+                    queued[job.task_id] = job
+                elif _process_alive(row["owner_pid"]):
+                    running[job.task_id] = job
+                else:
+                    logger.warning("Releasing the slot of task %s, whose backend worker %s died",
+                                   job.task_id, row["owner_pid"])
+            yield queued, running
+            self._write(conn, read, queued, running)
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+
+    def _write(self, conn, read: Dict[str, bool], queued: Dict[str, Job], running: Dict[str, Job]) -> None:
+        """Write the changes made to the jobs read."""
+        for task_id in read.keys() - queued.keys() - running.keys():
+            conn.execute("DELETE FROM jobs WHERE task_id = ?", (task_id,))
+        for job in queued.values():
+            if job.task_id not in read:
+                conn.execute(
+                    "INSERT INTO jobs (task_id, user, size, payload, submitted_at, owner, owner_pid) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                    (job.task_id, job.user, job.size, pickle.dumps(job.payload), job.submitted_at, job.owner,
+                     os.getpid()),
+                )
+        for job in running.values():
+            if not read.get(job.task_id, False):
+                conn.execute("UPDATE jobs SET started_at = ?, owner = ?, owner_pid = ? WHERE task_id = ?",
+                             (job.started_at, job.owner, os.getpid(), job.task_id))
+
+
+def create_scheduler(backend: str = TASK_STORE_BACKEND) -> Scheduler:
+    """
+    Create the scheduler, shared between backend workers whenever the task store is.
+
+    Args:
+        backend (str): "memory" or "sqlite".
+
+    Returns:
+        Scheduler: The scheduler.
+    """
+    if backend == "sqlite":
+        return SQLiteScheduler()
+    if backend == "memory":
+        return Scheduler()
+    raise ValueError(f"Unknown scheduler backend: {backend}")
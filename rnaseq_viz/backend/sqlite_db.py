@@ -0,0 +1,35 @@
+import logging
+import os
+import sqlite3
+import threading
+
+# Configure logger
+from rnaseq_viz.config.log_config import setup_logging
+setup_logging()
+logger = logging.getLogger(__name__)
+
+
+class SQLiteDatabase:
+    """
+    SQLite database on local disk, shared by every process of the host.
+
+    The database runs in WAL mode so that readers in one process do not block the
+    writer of another. sqlite3 connections must not be shared between threads,
+    so one autocommit connection is kept per thread.
+    """
+
+    def __init__(self, path: str, schema: str):
+        self.path = path
+        self._local = threading.local()
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self.connection().executescript(schema)
+
+    def connection(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.row_factory = sqlite3.Row
+            self._local.conn = conn
+        return conn
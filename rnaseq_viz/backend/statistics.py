@@ -0,0 +1,333 @@
+import logging
+import math
+from dataclasses import dataclass
+from typing import Callable, Dict, FrozenSet, List, Optional, Sequence, Tuple
+
+import numpy as np
+import pandas as pd
+
+# Configure logger
+from rnaseq_viz.config.log_config import setup_logging
+setup_logging()
+logger = logging.getLogger(__name__)
+
+# Column of gene lengths, in bases, required by the length-normalized transforms and not a sample
+LENGTH_COLUMN = "Length"
+# Statistics of every result, the summary, the index and the frontend are built on them
+DEFAULT_STATISTICS = ("mean", "median", "stddev")
+
+# Rows converted to float64 at a time when computing statistics, about 16 MB for 500 samples
+_STATS_BLOCK_ROWS = 4096
+# Scale of the library-size normalizations, counts per million
+_PER_MILLION = 1e6
+
+
+@dataclass(frozen=True)
+class Normalization:
+    """
+    Transform of the sample values the statistics are computed on.
+
+    Attributes:
+        scale (Optional[str]): "library" to scale each sample to a million counts (CPM),
+            "length" to divide by the gene length first (TPM), None to keep the counts.
+        log (bool): Whether to take log2(value + 1) after scaling.
+    """
+    scale: Optional[str] = None
+    log: bool = False
+
+    @property
+    def needs_lengths(self) -> bool:
+        return self.scale == "length"
+
+
+NORMALIZATIONS: Dict[str, Normalization] = {
+    "none": Normalization(),
+    "log2": Normalization(log=True),
+    "cpm": Normalization(scale="library"),
+    "log2_cpm": Normalization(scale="library", log=True),
+    "tpm": Normalization(scale="length"),
+    "log2_tpm": Normalization(scale="length", log=True),
+}
+
+
+class BlockReductions:
+    """
+    Reductions of a block of genes over the samples, shared by all the statistics computed on the block.
+
+    Each one is computed at most once per block, and only if a selected statistic needs it:
+    "moments" for the mean and standard deviation, "detection" for the number of samples
+    with a non-zero value, and "order" for the order statistics the quantiles are read from,
+    all of them placed by a single partial sort of the block.
+    """
+
+    def __init__(self, block: np.ndarray, reductions: FrozenSet[str], positions: List[int]):
+        self.n_samples = block.shape[1]
+        if "moments" in reductions:
+            self.mean = block.mean(axis=1)
+            self.std = block.std(axis=1, ddof=1) if self.n_samples > 1 else np.full(len(block), np.nan)
+        if "detection" in reductions:
+            self.detected = np.count_nonzero(block > 0, axis=1)
+        if positions:
+            # Last, as it partially sorts the block in place
+            block.partition(positions, axis=1)
+            self._order = {position: block[:, position] for position in positions}
+
+    def median(self) -> np.ndarray:
+        """Median of each gene, the midpoint of the two middle values for an even number of samples."""
+        low, high = _median_positions(self.n_samples)
+        return (self._order[low] + self._order[high]) / 2
+
+    def quantile(self, q: float) -> np.ndarray:
+        """Quantile of each gene, linearly interpolated between order statistics as `np.quantile`."""
+        h = (self.n_samples - 1) * q
+        low, high = _quantile_positions(self.n_samples, q)
+        a, b = self._order[low], self._order[high]
+        t = h - low
+        return a + (b - a) * t if t < 0.5 else b - (b - a) * (1 - t)
+
+
+def _quantile_positions(n_samples: int, q: float) -> Tuple[int, int]:
+    h = (n_samples - 1) * q
+    return math.floor(h), min(math.floor(h) + 1, n_samples - 1)
+
+
+def _median_positions(n_samples: int) -> Tuple[int, int]:
+    return (n_samples - 1) // 2, n_samples // 2
+
+
+@dataclass(frozen=True)
+class GeneStatistic:
+    """
+    Per-gene statistic of the registry.
+
+    Attributes:
+        columns (Tuple[str, ...]): Result columns of the statistic.
+        reductions (FrozenSet[str]): Reductions of `BlockReductions` the statistic is derived from.
+        compute (Callable): Values of each column from the reductions of a block.
+        quantiles (Tuple[float, ...]): Quantiles whose order statistics are needed, besides the median.
+        median (bool): Whether the median order statistics are needed.
+    """
+    columns: Tuple[str, ...]
+    reductions: FrozenSet[str]
+    compute: Callable[[BlockReductions], Tuple[np.ndarray, ...]]
+    quantiles: Tuple[float, ...] = ()
+    median: bool = False
+
+    def positions(self, n_samples: int) -> List[int]:
+        """Order statistics of the samples needed by the statistic."""
+        positions = list(_median_positions(n_samples)) if self.median else []
+        for q in self.quantiles:
+            positions.extend(_quantile_positions(n_samples, q))
+        return positions
+
+
+def _coefficient_of_variation(reduced: BlockReductions) -> Tuple[np.ndarray]:
+    with np.errstate(invalid="ignore", divide="ignore"):
+        return (np.where(reduced.mean > 0, reduced.std / reduced.mean, np.nan),)
+
+
+# Adding a statistic derived from these reductions adds no pass over the data
+STATISTICS: Dict[str, GeneStatistic] = {
+    "mean": GeneStatistic(("Mean",), frozenset({"moments"}), lambda r: (r.mean,)),
+    "median": GeneStatistic(("Median",), frozenset({"order"}), lambda r: (r.median(),), median=True),
+    "stddev": GeneStatistic(("StdDev",), frozenset({"moments"}), lambda r: (r.std,)),
+    "cv": GeneStatistic(("CV",), frozenset({"moments"}), _coefficient_of_variation),
+    "quantiles": GeneStatistic(("Q25", "Q75"), frozenset({"order"}),
+                               lambda r: (r.quantile(0.25), r.quantile(0.75)), quantiles=(0.25, 0.75)),
+    "detection_rate": GeneStatistic(("DetectionRate",), frozenset({"detection"}),
+                                    lambda r: (r.detected / r.n_samples,)),
+    "min_max": GeneStatistic(("Min", "Max"), frozenset({"order"}),
+                             lambda r: (r.quantile(0.0), r.quantile(1.0)), quantiles=(0.0, 1.0)),
+}
+
+
+@dataclass(frozen=True)
+class StatisticsSpec:
+    """
+    Normalization and per-gene statistics of a processing request.
+
+    Attributes:
+        normalization (str): Name of the transform in NORMALIZATIONS.
+        statistics (Tuple[str, ...]): Names of the statistics in STATISTICS, the DEFAULT_STATISTICS
+            first and the others in the order of the registry, whatever the order requested.
+    """
+    normalization: str = "none"
+    statistics: Tuple[str, ...] = DEFAULT_STATISTICS
+
+    def __post_init__(self):
+        if self.normalization not in NORMALIZATIONS:
+            raise ValueError(f"Unknown normalization {self.normalization}, expected one of {list(NORMALIZATIONS)}")
+        unknown = [name for name in self.statistics if name not in STATISTICS]
+        if unknown:
+            raise ValueError(f"Unknown statistics {unknown}, expected some of {list(STATISTICS)}")
+        selected = set(self.statistics) | set(DEFAULT_STATISTICS)
+        object.__setattr__(self, "statistics", tuple(name for name in STATISTICS if name in selected))
+
+    @classmethod
+    def from_request(cls, normalization: Optional[str], statistics: Optional[Sequence[str]]) -> "StatisticsSpec":
+        """
+        Returns:
+            StatisticsSpec: The statistics of the request, the defaults if it selects none.
+
+        Raises:
+            ValueError: If the normalization or a statistic is unknown.
+        """
+        return cls(normalization=normalization or "none", statistics=tuple(statistics or ()))
+
+    @classmethod
+    def from_columns(cls, normalization: str, columns: Sequence[str]) -> "StatisticsSpec":
+        """
+        Returns:
+            StatisticsSpec: The statistics of a result with the given statistic columns, e.g. from its summary.
+        """
+        return cls(normalization=normalization,
+                   statistics=tuple(name for name, statistic in STATISTICS.items()
+                                    if set(statistic.columns) <= set(columns)))
+
+    @property
+    def is_default(self) -> bool:
+        return self == StatisticsSpec()
+
+    @property
+    def columns(self) -> List[str]:
+        """Statistic columns of the result, placed between SYMBOL and the samples."""
+        return [column for name in self.statistics for column in STATISTICS[name].columns]
+
+    @property
+    def needs_lengths(self) -> bool:
+        return NORMALIZATIONS[self.normalization].needs_lengths
+
+    @property
+    def needs_library_sizes(self) -> bool:
+        return NORMALIZATIONS[self.normalization].scale is not None
+
+    def as_params(self) -> Dict:
+        """Processing parameters of the statistics, as part of the result cache key."""
+        return {"normalization": self.normalization, "statistics": list(self.statistics)}
+
+    def sample_columns(self, columns: Sequence[str]) -> List[str]:
+        """The sample columns of an input with the given columns."""
+        other = {"SYMBOL", LENGTH_COLUMN} if self.needs_lengths else {"SYMBOL"}
+        return [column for column in columns if column not in other]
+
+
+def gene_lengths(df: pd.DataFrame) -> np.ndarray:
+    """
+    Returns:
+        np.ndarray: The gene lengths of the input, as float64.
+
+    Raises:
+        ValueError: If the input has no Length column, or a length is missing or not positive.
+    """
+    if LENGTH_COLUMN not in df.columns:
+        raise ValueError(f"TPM normalization requires a {LENGTH_COLUMN} column of gene lengths")
+    lengths = pd.to_numeric(df[LENGTH_COLUMN], errors="coerce").to_numpy(dtype=np.float64)
+    invalid = ~(lengths > 0) | ~np.isfinite(lengths)
+    if invalid.any():
+        raise ValueError(f"{LENGTH_COLUMN} column must contain positive numbers, "
+                         f"{int(invalid.sum())} invalid value(s) at rows {np.flatnonzero(invalid)[:10].tolist()}")
+    return lengths
+
+
+def _to_float64(counts: np.ndarray, rows: slice, lengths: Optional[np.ndarray]) -> np.ndarray:
+    block = counts[rows].astype(np.float64)
+    if lengths is not None:
+        block /= lengths[rows, np.newaxis]
+    return block
+
+
+def library_scale(totals: np.ndarray) -> np.ndarray:
+    """Factors scaling each sample to a million counts, from `library_sizes`. Samples without any count stay at 0."""
+    return np.divide(_PER_MILLION, totals, out=np.zeros(len(totals)), where=totals > 0)
+
+
+def normalized_block(counts: np.ndarray, rows: slice, spec: StatisticsSpec, lengths: Optional[np.ndarray] = None,
+                     scale: Optional[np.ndarray] = None) -> np.ndarray:
+    """
+    Rows of a genes x samples matrix as float64, normalized as selected by `spec`.
+
+    Args:
+        lengths (Optional[np.ndarray]): Gene lengths of the whole matrix, required by the TPM normalizations.
+        scale (Optional[np.ndarray]): Per-sample factors from `library_scale`, required by the
+            library-size normalizations.
+
+    Returns:
+        np.ndarray: The normalized values, a new array of shape (rows, samples).
+    """
+    normalization = NORMALIZATIONS[spec.normalization]
+    block = _to_float64(counts, rows, lengths if normalization.needs_lengths else None)
+    if scale is not None:
+        block *= scale
+    if normalization.log:
+        np.log1p(block, out=block)
+        block /= np.log(2)
+    return block
+
+
+def library_sizes(counts: np.ndarray, spec: StatisticsSpec, lengths: Optional[np.ndarray] = None,
+                  block_rows: int = _STATS_BLOCK_ROWS) -> np.ndarray:
+    """
+    Per-sample totals the library-size normalizations divide by, of the counts for CPM, of the
+    counts per base for TPM. Totals of chunks of a larger input add up.
+
+    Returns:
+        np.ndarray: The total of each sample column, as float64.
+    """
+    if not spec.needs_lengths:
+        return counts.sum(axis=0, dtype=np.float64)
+    totals = np.zeros(counts.shape[1])
+    for start in range(0, len(counts), block_rows):
+        totals += _to_float64(counts, slice(start, start + block_rows), lengths).sum(axis=0)
+    return totals
+
+
+def compute_statistics(counts: np.ndarray, spec: StatisticsSpec = StatisticsSpec(),
+                       lengths: Optional[np.ndarray] = None, totals: Optional[np.ndarray] = None,
+                       block_rows: int = _STATS_BLOCK_ROWS) -> Dict[str, np.ndarray]:
+    """
+    Per-gene statistics of a genes x samples matrix, all of them in a single pass over the matrix.
+
+    The selected statistics are compiled into the union of the reductions they need. Each block
+    of `block_rows` genes is converted to float64 and normalized once, then reduced once per
+    reduction, with a single partial sort for all the order statistics, e.g. the median, the
+    quartiles, the minimum and the maximum together. The defaults match pandas' `mean`, `median`
+    and `std` (ddof=1), NaN with too few samples.
+
+    Args:
+        counts (np.ndarray): Sample values, of shape (genes, samples).
+        spec (StatisticsSpec): Normalization and statistics to compute.
+        lengths (Optional[np.ndarray]): Gene lengths, required by the TPM normalizations.
+        totals (Optional[np.ndarray]): Per-sample totals of the whole input, from `library_sizes`,
+            computed from `counts` if None. Required when `counts` is a chunk of the input.
+        block_rows (int): Number of genes converted to float64 at a time.
+
+    Returns:
+        Dict[str, np.ndarray]: Values of each statistic column, `n_genes` of them each.
+    """
+    n_genes, n_samples = counts.shape
+    normalization = NORMALIZATIONS[spec.normalization]
+    if spec.needs_lengths and lengths is None:
+        raise ValueError(f"{spec.normalization} normalization requires gene lengths")
+    statistics = [STATISTICS[name] for name in spec.statistics]
+    results = {column: np.empty(n_genes) for column in spec.columns}
+    if n_samples == 0:
+        for values in results.values():
+            values.fill(np.nan)
+        return results
+
+    reductions = frozenset().union(*(statistic.reductions for statistic in statistics))
+    positions = sorted({position for statistic in statistics for position in statistic.positions(n_samples)})
+    scale = None
+    if normalization.scale is not None:
+        totals = library_sizes(counts, spec, lengths, block_rows) if totals is None else totals
+        scale = library_scale(totals)
+
+    with np.errstate(invalid="ignore", divide="ignore"):
+        for start in range(0, n_genes, block_rows):
+            rows = slice(start, start + block_rows)
+            block = normalized_block(counts, rows, spec, lengths, scale)
+            reduced = BlockReductions(block, reductions, positions)
+            for statistic in statistics:
+                for column, values in zip(statistic.columns, statistic.compute(reduced)):
+                    results[column][rows] = values
+    return results
@@ -0,0 +1,232 @@
+import logging
+from typing import IO, Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+from rnaseq_viz.backend.count_matrix import CountMatrix
+from rnaseq_viz.backend.differential import Comparison, differential_expression
+from rnaseq_viz.backend.incremental import StatisticsStateWriter, statistics_with_state
+from rnaseq_viz.backend.result_writer import ResultWriter
+from rnaseq_viz.backend.sample_qc import SampleQCAccumulator
+from rnaseq_viz.backend.statistics import StatisticsSpec, gene_lengths, library_sizes
+from rnaseq_viz.backend.validation import ValidationReport, validate_sample_matrix, validate_symbol_array
+from rnaseq_viz.common.metrics import StageTimings
+from rnaseq_viz.config.config import STREAMING_CHUNK_ROWS
+
+# Configure logger
+from rnaseq_viz.config.log_config import setup_logging
+setup_logging()
+logger = logging.getLogger(__name__)
+
+
+def _check_cross_chunk_duplicates(symbol: np.ndarray, seen: Dict[str, int], report: ValidationReport) -> None:
+    """
+    Report symbols of the current chunk that already appeared in a previous chunk, then remember them.
+
+    As `validate_symbol_array` does for the whole input, every occurrence of a duplicate is reported,
+    including the first, whose row is kept in `seen`: it maps each symbol to the row of its first
+    occurrence, or to -1 once that row has been reported. Duplicates within the chunk are left to
+    `validate_symbol_array`, and NA symbols are not duplicates.
+    """
+    series = pd.Series(symbol, copy=False)
+    na_mask = series.isna().to_numpy()
+    in_chunk = series.duplicated(keep=False).to_numpy() & ~na_mask
+    repeated = np.fromiter((s in seen for s in symbol), dtype=bool, count=len(symbol)) & ~na_mask
+    if repeated.any():
+        first: Dict[str, int] = {}
+        for s in symbol[repeated]:
+            if seen[s] >= 0:
+                first[s] = seen[s] - report.row_offset
+                seen[s] = -1
+        chunk_rows = np.flatnonzero(repeated & ~in_chunk)
+        rows = np.concatenate([np.fromiter(first.values(), dtype=np.intp, count=len(first)), chunk_rows])
+        values = np.concatenate([np.asarray(list(first), dtype=object), symbol[chunk_rows]])
+        order = np.argsort(rows, kind='stable')
+        report.add('duplicate', rows[order], ['SYMBOL'] * len(rows), values[order])
+    new = np.flatnonzero(~series.duplicated(keep='first').to_numpy() & ~repeated & ~na_mask)
+    seen.update(zip(symbol[new], np.where(in_chunk[new], -1, new + report.row_offset).tolist()))
+
+
+def read_csv_chunks(csv_stream: IO, chunk_rows: int = STREAMING_CHUNK_ROWS,
+                    timings: Optional[StageTimings] = None) -> Iterator[pd.DataFrame]:
+    """
+    Parse a CSV one block of rows at a time, for `process_rnaseq_chunks`.
+
+    Reading from the S3 body happens as the CSV is parsed, so the parse stage includes the download.
+    """
+    timings = timings or StageTimings()
+    reader = pd.read_csv(csv_stream, chunksize=chunk_rows)
+    while True:
+        with timings.stage("parse"):
+            chunk = next(reader, None)
+        if chunk is None:
+            return
+        yield chunk
+
+
+def scan_library_sizes(csv_stream: IO, statistics: StatisticsSpec, chunk_rows: int = STREAMING_CHUNK_ROWS,
+                       timings: Optional[StageTimings] = None) -> np.ndarray:
+    """
+    Sum the sample columns of an RNA-Seq CSV, one block of rows at a time, for the library-size
+    normalizations of `process_rnaseq_stream`, which need the totals of the whole input before
+    the first chunk. Invalid values count as 0 here, they are reported by the processing pass.
+
+    Returns:
+        np.ndarray: The total of each sample column, see `library_sizes`.
+    """
+    return chunk_library_sizes(pd.read_csv(csv_stream, chunksize=chunk_rows), statistics, timings)
+
+
+def chunk_library_sizes(chunks: Iterable[pd.DataFrame], statistics: StatisticsSpec,
+                        timings: Optional[StageTimings] = None) -> np.ndarray:
+    """
+    Sum the sample columns of the row chunks of an input, see `scan_library_sizes`.
+
+    Returns:
+        np.ndarray: The total of each sample column, see `library_sizes`.
+    """
+    timings = timings or StageTimings()
+    totals = None
+    n_rows = 0
+    for chunk in chunks:
+        with timings.stage("library_sizes") as stage:
+            lengths = gene_lengths(chunk) if statistics.needs_lengths else None
+            columns = statistics.sample_columns(chunk.columns)
+            samples = np.empty((len(chunk), len(columns)))
+            for position, column in enumerate(columns):
+                samples[:, position] = pd.to_numeric(chunk[column], errors="coerce").fillna(0)
+            chunk_totals = library_sizes(samples, statistics, lengths)
+            totals = chunk_totals if totals is None else totals + chunk_totals
+            n_rows += len(chunk)
+            stage.update(rows=n_rows, columns=samples.shape[1])
+    return totals if totals is not None else np.empty(0)
+
+
+def process_rnaseq_stream(csv_stream: IO, writer: ResultWriter, chunk_rows: int = STREAMING_CHUNK_ROWS,
+                          timings: Optional[StageTimings] = None,
+                          stats_chunks: Optional[List[pd.DataFrame]] = None,
+                          comparison: Optional[Comparison] = None,
+                          differential_chunks: Optional[List[pd.DataFrame]] = None,
+                          sample_qc: Optional[SampleQCAccumulator] = None,
+                          statistics: StatisticsSpec = StatisticsSpec(),
+                          totals: Optional[np.ndarray] = None,
+                          progress: Optional[Callable[[int], None]] = None,
+                          states: Optional[StatisticsStateWriter] = None) -> Tuple[int, int]:
+    """
+    Process an RNA-Seq CSV one block of rows at a time, writing the processed result as it goes,
+    see `process_rnaseq_chunks`.
+
+    Args:
+        csv_stream (IO): Readable binary or text stream of the input CSV.
+        chunk_rows (int): Number of rows per chunk.
+
+    Returns:
+        Tuple[int, int]: Number of data rows and of sample columns processed.
+    """
+    timings = timings or StageTimings()
+    logger.info("Starting streaming RNA-Seq data processing with %s rows per chunk...", chunk_rows)
+    return process_rnaseq_chunks(read_csv_chunks(csv_stream, chunk_rows, timings), writer, timings, stats_chunks,
+                                 comparison, differential_chunks, sample_qc, statistics, totals, progress, states)
+
+
+def process_rnaseq_chunks(chunks: Iterable[pd.DataFrame], writer: ResultWriter,
+                          timings: Optional[StageTimings] = None,
+                          stats_chunks: Optional[List[pd.DataFrame]] = None,
+                          comparison: Optional[Comparison] = None,
+                          differential_chunks: Optional[List[pd.DataFrame]] = None,
+                          sample_qc: Optional[SampleQCAccumulator] = None,
+                          statistics: StatisticsSpec = StatisticsSpec(),
+                          totals: Optional[np.ndarray] = None,
+                          progress: Optional[Callable[[int], None]] = None,
+                          states: Optional[StatisticsStateWriter] = None) -> Tuple[int, int]:
+    """
+    Process an RNA-Seq input given as successive chunks of rows, writing the processed result as it goes.
+
+    Produces the same output as `process_rnaseq_data`, but only one chunk of rows is held
+    in memory at a time, plus the rows of the SYMBOLs already seen for the uniqueness check.
+    Validation continues over the whole input after the first error so that every
+    violation is reported; nothing more is written once an error has been found.
+
+    Args:
+        chunks (Iterable[pd.DataFrame]): Chunks of rows with the SYMBOL column and the sample columns,
+            e.g. from `read_csv_chunks`.
+        writer (ResultWriter): Writer receiving the processed chunks, closed by the caller.
+        timings (StageTimings): Receives the timings of each stage, summed over all chunks.
+        stats_chunks (List[pd.DataFrame]): Receives the SYMBOL and statistic columns of each chunk.
+        comparison (Optional[Comparison]): Sample groups compared by differential expression.
+        differential_chunks (List[pd.DataFrame]): Receives the differential expression of each chunk,
+            without the FDR, which is adjusted over all the chunks by the caller.
+        sample_qc (Optional[SampleQCAccumulator]): Receives the genes of each chunk.
+        statistics (StatisticsSpec): Normalization the statistics are computed on, and statistics to compute.
+        totals (Optional[np.ndarray]): Per-sample totals of the whole input from `scan_library_sizes`,
+            required by the library-size normalizations.
+        progress (Optional[Callable[[int], None]]): Called with the number of rows processed after each chunk.
+        states (Optional[StatisticsStateWriter]): Receives the state of the statistics of each chunk, see
+            `process_rnaseq_data`, closed by the caller.
+
+    Returns:
+        Tuple[int, int]: Number of data rows and of sample columns processed.
+    """
+    if statistics.needs_library_sizes and totals is None:
+        raise ValueError(f"{statistics.normalization} normalization of a stream requires the per-sample totals "
+                         "of the whole input")
+    timings = timings or StageTimings()
+    report = ValidationReport()
+    seen: Dict[str, int] = {}
+    n_rows, n_columns = 0, 0
+
+    for chunk in chunks:
+        if 'SYMBOL' not in chunk.columns:
+            logger.error("SYMBOL column is missing from the input.")
+            raise ValueError("SYMBOL column is required in the DataFrame.")
+
+        symbol = chunk['SYMBOL'].to_numpy(dtype=object)
+        lengths = gene_lengths(chunk) if statistics.needs_lengths else None
+        samples = chunk[statistics.sample_columns(chunk.columns)]
+        if comparison is not None and n_rows == 0:
+            comparison.check(samples.columns)
+
+        with timings.stage("validate"):
+            report.row_offset = n_rows
+            validate_symbol_array(symbol, report)
+            _check_cross_chunk_duplicates(symbol, seen, report)
+            validate_sample_matrix(samples, report)
+
+        if report.ok:
+            with timings.stage("compute"):
+                matrix = CountMatrix.from_frame(chunk['SYMBOL'], samples)
+                if states is None:
+                    stats = matrix.statistics(statistics, lengths, totals)
+                else:
+                    stats, state = statistics_with_state(matrix.counts, statistics, lengths, totals)
+                    if state is not None:
+                        states.append(state)
+                processed = matrix.to_frame(stats)
+            with timings.stage("serialize"):
+                writer.write_chunk(processed)
+            if stats_chunks is not None:
+                stats_chunks.append(processed[['SYMBOL'] + statistics.columns])
+            if sample_qc is not None:
+                with timings.stage("sample_qc"):
+                    sample_qc.add_frame(processed, statistics.columns)
+            if comparison is not None and differential_chunks is not None:
+                with timings.stage("differential"):
+                    differential_chunks.append(differential_expression(processed, comparison, adjust=False))
+
+        n_rows += len(chunk)
+        n_columns = samples.shape[1]
+        logger.debug("Processed %s rows...", n_rows)
+        if progress is not None:
+            progress(n_rows)
+
+    for stage in ("parse", "validate", "compute", "serialize"):
+        if stage in timings.stages:
+            timings.stages[stage].update(rows=n_rows, columns=n_columns)
+
+    if not report.ok:
+        logger.error("Data validation failed:\n%s", report.summary())
+        raise ValueError(f"Data validation failed: {report.summary()}")
+
+    logger.info("Streaming RNA-Seq data processing completed successfully (%s rows).", n_rows)
+    return n_rows, n_columns
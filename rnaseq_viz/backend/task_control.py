@@ -0,0 +1,171 @@
+import json
+import logging
+import os
+import tempfile
+import time
+from dataclasses import dataclass, field
+from typing import Any, Dict, Optional
+
+from rnaseq_viz.config.config import (
+    TASK_CONTROL_DIR, TASK_PROGRESS_INTERVAL_SECONDS, TASK_TIMEOUT_SECONDS, TEMP_FILE_MAX_AGE_SECONDS
+)
+
+# Configure logger
+from rnaseq_viz.config.log_config import setup_logging
+setup_logging()
+logger = logging.getLogger(__name__)
+
+
+class TaskCancelled(Exception):
+    """Raised at a checkpoint of a task whose cancellation was requested."""
+
+
+class TaskTimedOut(TaskCancelled):
+    """Raised at a checkpoint of a task that ran past its deadline."""
+
+
+def _cancel_path(task_id: str, directory: str) -> str:
+    return os.path.join(directory, f"{task_id}.cancel")
+
+
+def _progress_path(task_id: str, directory: str) -> str:
+    return os.path.join(directory, f"{task_id}.progress")
+
+
+@dataclass
+class TaskControl:
+    """
+    Cooperative cancellation, deadline and progress of a running task.
+
+    The processing of a task runs in a worker process, which checks for a cancellation
+    request and for its deadline at each checkpoint, i.e. before each stage and each chunk,
+    and reports how many rows it processed. Both go through small files in `directory`,
+    so that any backend worker of the host can cancel a task or read its progress.
+
+    Attributes:
+        task_id (str): ID of the task.
+        started_at (float): Time the processing started at, as from `time.time()`.
+        timeout_seconds (int): Processing is stopped after this long, 0 for no limit.
+        directory (str): Directory of the cancellation requests and progress reports.
+    """
+    task_id: str
+    started_at: float = field(default_factory=time.time)
+    timeout_seconds: int = TASK_TIMEOUT_SECONDS
+    directory: str = TASK_CONTROL_DIR
+    _last_report: float = field(default=0.0, repr=False)
+    _progress: Dict[str, Any] = field(default_factory=dict, repr=False)
+
+    def checkpoint(self, stage: str) -> None:
+        """
+        Stop the task here if it was cancelled or ran past its deadline.
+
+        Args:
+            stage (str): Stage about to start, for the error message.
+
+        Raises:
+            TaskTimedOut: If the task ran for longer than `timeout_seconds`.
+            TaskCancelled: If its cancellation was requested.
+        """
+        if self.timeout_seconds > 0 and time.time() - self.started_at > self.timeout_seconds:
+            raise TaskTimedOut(f"Task timed out after {self.timeout_seconds} s, before the {stage} stage")
+        if os.path.exists(_cancel_path(self.task_id, self.directory)):
+            raise TaskCancelled(f"Task was cancelled before the {stage} stage")
+
+    def report_progress(self, rows_processed: int, rows_total: Optional[int] = None, force: bool = False) -> None:
+        """
+        Publish the number of rows processed so far, at most every TASK_PROGRESS_INTERVAL_SECONDS.
+
+        Args:
+            rows_processed (int): Rows processed so far.
+            rows_total (Optional[int]): Rows of the input, or an estimate, if known.
+            force (bool): Publish even if the previous report is recent, e.g. for the last one.
+        """
+        now = time.monotonic()
+        if not force and now - self._last_report < TASK_PROGRESS_INTERVAL_SECONDS:
+            return
+        self._last_report = now
+        self._progress.update(rows_processed=rows_processed, rows_total=rows_total)
+        self._write_progress()
+
+    def report_files(self, files: Dict[str, Dict]) -> None:
+        """
+        Publish the status of each input of a batch, along with the rows processed.
+
+        Args:
+            files (Dict[str, Dict]): Status of each input, by S3 key.
+        """
+        self._progress["files"] = files
+        self._write_progress()
+
+    def _write_progress(self) -> None:
+        self._write(_progress_path(self.task_id, self.directory), json.dumps(self._progress))
+
+    def _write(self, path: str, content: str) -> None:
+        os.makedirs(self.directory, exist_ok=True)
+        # Written to a temp file and renamed, so that readers never see a partial file
+        with tempfile.NamedTemporaryFile("w", dir=self.directory, suffix=".tmp", delete=False) as f:
+            f.write(content)
+        os.replace(f.name, path)
+
+
+def request_cancel(task_id: str, directory: str = TASK_CONTROL_DIR) -> None:
+    """Ask the worker processing a task to stop at its next checkpoint."""
+    os.makedirs(directory, exist_ok=True)
+    with open(_cancel_path(task_id, directory), "w"):
+        pass
+    logger.info("Requested the cancellation of task %s", task_id)
+
+
+def cancel_requested_at(task_id: str, directory: str = TASK_CONTROL_DIR) -> Optional[float]:
+    """
+    Returns:
+        Optional[float]: Time the cancellation of a task was requested at, as from `time.time()`, or None.
+    """
+    try:
+        return os.stat(_cancel_path(task_id, directory)).st_mtime
+    except FileNotFoundError:
+        return None
+
+
+def read_progress(task_id: str, directory: str = TASK_CONTROL_DIR) -> Optional[Dict]:
+    """
+    Returns:
+        Optional[Dict]: `rows_processed` and `rows_total` last reported by a running task, and `files`
+        for a batch, or None.
+    """
+    try:
+        with open(_progress_path(task_id, directory)) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+
+
+def clear(task_id: str, directory: str = TASK_CONTROL_DIR) -> None:
+    """Remove the cancellation request and progress of a finished task."""
+    for path in (_cancel_path(task_id, directory), _progress_path(task_id, directory)):
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+
+def cleanup_stale_control_files(max_age_seconds: int = TEMP_FILE_MAX_AGE_SECONDS,
+                                directory: str = TASK_CONTROL_DIR) -> int:
+    """
+    Remove the files of tasks whose worker was killed before it could clear them.
+
+    Returns:
+        int: Number of files removed.
+    """
+    if not os.path.isdir(directory):
+        return 0
+    removed = 0
+    cutoff = time.time() - max_age_seconds
+    for entry in os.scandir(directory):
+        try:
+            if entry.is_file() and entry.stat().st_mtime < cutoff:
+                os.remove(entry.path)
+                removed += 1
+        except FileNotFoundError:
+            continue
+    return removed
@@ -0,0 +1,91 @@
+import asyncio
+import json
+import logging
+import time
+from typing import AsyncIterator, Callable, Dict, Optional
+
+from starlette.concurrency import run_in_threadpool
+
+from rnaseq_viz.backend.task_store import TERMINAL_STATUSES, TaskStore
+from rnaseq_viz.config.config import TASK_EVENTS_POLL_SECONDS, TASK_EVENTS_KEEPALIVE_SECONDS
+
+# Configure logger
+from rnaseq_viz.config.log_config import setup_logging
+setup_logging()
+logger = logging.getLogger(__name__)
+
+
+def format_event(data: Dict, event: str = "status") -> str:
+    """
+    Format a server-sent event.
+
+    Args:
+        data (Dict): JSON payload of the event.
+        event (str): Event type.
+
+    Returns:
+        str: The event in text/event-stream format.
+    """
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+async def task_event_stream(get_task: Callable[[str], Optional[Dict]], task_id: str,
+                            tasks: Optional[TaskStore] = None,
+                            poll_seconds: float = TASK_EVENTS_POLL_SECONDS,
+                            keepalive_seconds: float = TASK_EVENTS_KEEPALIVE_SECONDS) -> AsyncIterator[str]:
+    """
+    Push the state of a task to one client every time it changes, until the task is finished.
+
+    The task is read again as soon as this backend worker changes it in `tasks`, e.g. when
+    it starts or finishes the processing of the task. Changes the stream is not notified of,
+    made by another backend worker of the host or progress reported by the processing, are
+    picked up by reading the task every `poll_seconds`, as often as clients used to poll.
+    A comment line is sent when nothing changed for `keepalive_seconds` so that proxies do
+    not close the idle connection.
+
+    Args:
+        get_task (Callable): Returns the task dict for an ID, or None if unknown.
+        task_id (str): ID of the watched task.
+        tasks (Optional[TaskStore]): Store notifying the changes of the task, polled only if None.
+        poll_seconds (float): Maximum interval between two reads of the task.
+        keepalive_seconds (float): Maximum interval between two messages.
+
+    Yields:
+        str: Server-sent events.
+    """
+    loop = asyncio.get_running_loop()
+    changed = asyncio.Event()
+
+    def on_change(changed_task_id: str) -> None:
+        # Called from the thread that changed the task
+        if changed_task_id == task_id:
+            loop.call_soon_threadsafe(changed.set)
+
+    if tasks is not None:
+        tasks.add_listener(on_change)
+    last_task: Optional[Dict] = None
+    last_sent = time.monotonic()
+    try:
+        while True:
+            # Cleared before the read, so that a change made during the read is not missed
+            changed.clear()
+            task = await run_in_threadpool(get_task, task_id)
+            if task is None:
+                yield format_event({"detail": "Invalid task ID"}, event="error")
+                return
+            if task != last_task:
+                yield format_event(task)
+                last_task, last_sent = task, time.monotonic()
+                if task["status"] in TERMINAL_STATUSES:
+                    logger.info("Task %s finished with status %s, closing event stream", task_id, task['status'])
+                    return
+            elif time.monotonic() - last_sent >= keepalive_seconds:
+                yield ": keep-alive\n\n"
+                last_sent = time.monotonic()
+            try:
+                await asyncio.wait_for(changed.wait(), timeout=poll_seconds)
+            except asyncio.TimeoutError:
+                pass
+    finally:
+        if tasks is not None:
+            tasks.remove_listener(on_change)
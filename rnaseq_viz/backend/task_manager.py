@@ -1,62 +1,568 @@
-from typing import Dict
+from concurrent.futures import Future
+from functools import partial
+from typing import Dict, List, Optional
 import logging
-import pandas as pd
+import re
+import threading
+import time
 from fastapi import HTTPException
 
-from rnaseq_viz.common.s3_manager import S3Manager
-from rnaseq_viz.backend.data_processing import process_rnaseq_data
-from rnaseq_viz.config.config import S3_BUCKET
-from rnaseq_viz.common.utils import generate_unique_temp_path
+from rnaseq_viz.common.storage import ObjectStorage
+from rnaseq_viz.backend import pipeline, task_control
+from rnaseq_viz.backend.executor import ProcessingExecutor
+from rnaseq_viz.backend.cohort import MISSING_GENES_MODES
+from rnaseq_viz.backend.ingestion import compression_of, estimated_csv_size
+from rnaseq_viz.backend.differential import Comparison
+from rnaseq_viz.backend.statistics import StatisticsSpec
+from rnaseq_viz.backend.scheduler import Job, QueueFullError, Scheduler, create_scheduler
+from rnaseq_viz.backend.task_control import TaskCancelled, TaskControl, TaskTimedOut
+from rnaseq_viz.backend.task_store import TaskStore, create_task_store
+from rnaseq_viz.backend.result_cache import ResultCache, create_result_cache, make_cache_key
+from rnaseq_viz.backend.result_writer import RESULT_FORMATS
+from rnaseq_viz.common.metrics import (
+    TASK_LATENCY, TASK_PEAK_MEMORY, TASK_QUEUE_DEPTH, TASK_WORKERS_KILLED, TASKS_IN_FLIGHT, TASKS_TOTAL, observe_stages
+)
+from rnaseq_viz.config.config import (
+    S3_BUCKET, RESULT_CACHE_ENABLED, RESULT_FORMAT, BATCH_MAX_FILES, TASK_KILL_GRACE_SECONDS,
+    TASK_WATCHDOG_INTERVAL_SECONDS
+)
 
 # Configure logger
 from rnaseq_viz.config.log_config import setup_logging
 setup_logging()
 logger = logging.getLogger(__name__)
 
+# IDs of studies, part of the S3 keys of their results
+_STUDY_ID = re.compile(r"[A-Za-z0-9_-]{1,64}")
+
 
 class TaskManager:
-    def __init__(self, s3_manager: S3Manager):
+    def __init__(self, s3_manager: ObjectStorage, executor: Optional[ProcessingExecutor] = None,
+                 store: Optional[TaskStore] = None, cache: Optional[ResultCache] = None,
+                 scheduler: Optional[Scheduler] = None):
         self.s3_manager = s3_manager
-        self.tasks: Dict[str, Dict] = {}
+        self.executor = executor or ProcessingExecutor()
+        self.tasks: TaskStore = store or create_task_store()
+        self.cache: Optional[ResultCache] = cache or (create_result_cache() if RESULT_CACHE_ENABLED else None)
+        self.scheduler = scheduler or create_scheduler()
+        # Jobs handed to the executor by this backend worker and not finished yet, and their controls
+        self._pending: Dict[str, Future] = {}
+        self._controls: Dict[str, TaskControl] = {}
+        # Final statuses recorded by the watchdog before the jobs finished
+        self._recorded: Dict[str, str] = {}
+        self._pending_lock = threading.Lock()
+        self._dispatch_lock = threading.RLock()
+        self._watchdog_stop = threading.Event()
+        self._watchdog: Optional[threading.Thread] = None
+
+    def start_task(self, s3_key: Optional[str], folder: Optional[str], content_hash: Optional[str] = None,
+                   result_format: Optional[str] = None, user: str = "anonymous",
+                   comparison: Optional[Comparison] = None,
+                   statistics: StatisticsSpec = StatisticsSpec()) -> str:
+        """
+        Queue the processing of an uploaded input, or reuse the result of an identical earlier input.
+
+        The upload may be omitted when the content hash has a cached result, in which case
+        a completed task referencing that result is created. The content hash given is only
+        used to look up the cache: results are cached under the hash of the input computed by
+        the worker from the bytes it downloaded, so a wrong hash cannot serve the result of an
+        input to another. Otherwise the task is queued
+        by the scheduler with the size of the upload, and stays "queued" until a processing
+        slot is free. When the queue is full, no task is created and a 429 response with a
+        Retry-After header is raised.
+
+        Args:
+            user (str): Owner of the task, the number of tasks processed at once is limited per user.
+            comparison (Optional[Comparison]): Sample groups compared by differential expression,
+                whose result is stored next to the processed result.
+            statistics (StatisticsSpec): Normalization and per-gene statistics of the result.
+
+        Returns:
+            str: ID of the task.
+        """
+        result_format = self._check_result_format(result_format)
+        params = {"result_format": result_format}
+        if comparison is not None:
+            params["comparison"] = comparison.as_params()
+        # Left out by default, so that the cache keys of earlier results stay valid
+        if not statistics.is_default:
+            params["statistics"] = statistics.as_params()
+        cached_result = self._cached_result(make_cache_key(content_hash, params) if content_hash else None)
+        if cached_result is not None:
+            task_id = self.tasks.create(status="completed", result=cached_result, cached=True)
+            logger.info("Task %s served from cache: %s", task_id, cached_result)
+            TASKS_TOTAL.labels(status="cached").inc()
+            return task_id
+        if not (s3_key and folder):
+            raise HTTPException(status_code=422, detail="s3_key and folder are required unless the content hash "
+                                                        "has a cached result")
+
+        try:
+            # Fail fast, before the S3 request and the creation of the task
+            self.scheduler.check_capacity()
+        except QueueFullError as e:
+            raise self._queue_full(e)
+        size = estimated_csv_size(self._upload_size(s3_key), compression_of(s3_key))
+        return self._queue_job(user, size, {"s3_key": s3_key, "folder": folder, "result_format": result_format,
+                                            "cache_params": params, "content_hash": content_hash,
+                                            "comparison": comparison,
+                                            "statistics": statistics})
+
+    def start_batch(self, s3_keys: List[str], folder: str, result_format: Optional[str] = None,
+                    user: str = "anonymous", comparison: Optional[Comparison] = None,
+                    statistics: StatisticsSpec = StatisticsSpec(), missing_genes: Optional[str] = None) -> Dict:
+        """
+        Queue the processing of several uploaded inputs, merged on SYMBOL into one cohort.
+
+        The batch is a single task, scheduled with the total size of its inputs, whose status
+        also lists the status of each input, by S3 key, with the number of genes of the cohort
+        it misses once merged. Batches are not cached, as they have no content hash.
+
+        Args:
+            missing_genes (Optional[str]): Genes missing from some inputs count 0 in their samples
+                with "zero", the default, or are left out with "intersect".
+
+        Returns:
+            Dict: `batch_id`, the ID of the task, the status of each input as `files`, and `missing_genes`.
+        """
+        result_format = self._check_result_format(result_format)
+        missing_genes = missing_genes or "zero"
+        if missing_genes not in MISSING_GENES_MODES:
+            raise HTTPException(status_code=422, detail=f"Unknown missing_genes {missing_genes}, "
+                                                        f"expected one of {MISSING_GENES_MODES}")
+        if not 2 <= len(s3_keys) <= BATCH_MAX_FILES:
+            raise HTTPException(status_code=422, detail=f"A batch has 2 to {BATCH_MAX_FILES} inputs, "
+                                                        f"got {len(s3_keys)}")
+        if len(set(s3_keys)) != len(s3_keys):
+            raise HTTPException(status_code=422, detail="The inputs of a batch must be distinct")
+        try:
+            self.scheduler.check_capacity()
+        except QueueFullError as e:
+            raise self._queue_full(e)
+        size = sum(estimated_csv_size(self._upload_size(s3_key), compression_of(s3_key)) for s3_key in s3_keys)
+        files = {s3_key: {"status": "queued"} for s3_key in s3_keys}
+        task_id = self._queue_job(user, size, {"s3_keys": s3_keys, "folder": folder, "result_format": result_format,
+                                               "cache_params": None, "comparison": comparison,
+                                               "statistics": statistics, "missing_genes": missing_genes},
+                                  files=files, missing_genes=missing_genes)
+        logger.info("Batch %s of %s inputs queued", task_id, len(s3_keys))
+        return {"batch_id": task_id, "files": files, "missing_genes": missing_genes}
+
+    def start_append(self, s3_key: str, folder: str, task_id: Optional[str] = None, result_key: Optional[str] = None,
+                     study_id: Optional[str] = None, result_format: Optional[str] = None,
+                     user: str = "anonymous") -> Dict:
+        """
+        Queue the appending of the samples of an upload to a processed result.
+
+        The result is given by the ID of its task, by its S3 key, or as the latest result of a
+        study. Task records expire after TASK_STORE_TTL_SECONDS, and results under `processed/`
+        may be swept after S3_RETENTION_SECONDS, so appends spread over weeks go through a
+        study: with `study_id`, the new result becomes the latest of the study, and is kept
+        until a later append supersedes it. A study starts at its first append, from a result
+        given by task ID or S3 key.
 
-    def start_task(self, s3_key: str, folder: str, background_tasks) -> str:
-        task_id = f"task_{len(self.tasks) + 1}"
-        self.tasks[task_id] = {"status": "processing"}
-        background_tasks.add_task(self.process_file, task_id, s3_key, folder)
-        logger.info(f"Processing started with task ID {task_id}")
+        The new task has the normalization and statistics of the earlier one, and its result is
+        stored as a new object, in the format of the earlier result by default. Appends are not
+        cached, and are scheduled with the size of the upload and of the earlier result.
+
+        Args:
+            s3_key (str): S3 key of the upload with the new samples.
+            folder (str): S3 folder of the upload, and of the result and the study.
+            task_id (Optional[str]): ID of the completed task whose result the samples are appended to.
+            result_key (Optional[str]): S3 key of the result the samples are appended to, in `folder`.
+            study_id (Optional[str]): Study whose latest result the samples are appended to, unless one is given.
+
+        Returns:
+            Dict: `task_id`, the ID of the new task, and `study_id`.
+        """
+        if task_id is not None and result_key is not None:
+            raise HTTPException(status_code=422, detail="Give task_id or result_key, not both")
+        if study_id is not None and not _STUDY_ID.fullmatch(study_id):
+            raise HTTPException(status_code=422, detail="A study ID has 1 to 64 letters, digits, '-' or '_'")
+        if task_id is not None:
+            base_result_s3_key = self.get_result_key(task_id)
+        elif result_key is not None:
+            if not (result_key.startswith(f"{folder}/") and "_processed." in result_key):
+                raise HTTPException(status_code=422, detail=f"{result_key} is not a processed result of {folder}")
+            if not self.s3_manager.object_exists(bucket=S3_BUCKET, key=result_key):
+                raise HTTPException(status_code=404, detail=f"Result {result_key} not found")
+            base_result_s3_key = result_key
+        elif study_id is not None:
+            study = pipeline.read_study(self.s3_manager, folder, study_id)
+            if study is None:
+                raise HTTPException(status_code=404, detail=f"Study {study_id} not found, its first append "
+                                                            "needs a task_id or result_key")
+            base_result_s3_key = study["result"]
+        else:
+            raise HTTPException(status_code=422, detail="task_id, result_key or study_id is required")
+
+        result_format = self._check_result_format(result_format or base_result_s3_key.rsplit(".", 1)[-1])
+        try:
+            self.scheduler.check_capacity()
+        except QueueFullError as e:
+            raise self._queue_full(e)
+        size = (estimated_csv_size(self._upload_size(s3_key), compression_of(s3_key))
+                + self.s3_manager.get_object_size(bucket=S3_BUCKET, key=base_result_s3_key))
+        new_task_id = self._queue_job(user, size, {"base_result": base_result_s3_key, "s3_key": s3_key,
+                                                   "folder": folder, "result_format": result_format,
+                                                   "study_id": study_id, "cache_params": None},
+                                      appended_to=base_result_s3_key, study_id=study_id)
+        logger.info("Task %s appends the samples of %s to %s", new_task_id, s3_key, base_result_s3_key)
+        return {"task_id": new_task_id, "study_id": study_id}
+
+    def get_study(self, folder: str, study_id: str) -> Dict:
+        """
+        Returns:
+            Dict: The record of a study, with the S3 key of its latest `result` and its number of samples.
+        """
+        study = pipeline.read_study(self.s3_manager, folder, study_id) if _STUDY_ID.fullmatch(study_id) else None
+        if study is None:
+            raise HTTPException(status_code=404, detail=f"Study {study_id} not found")
+        return study
+
+    def _queue_job(self, user: str, size: int, payload: Dict, **fields) -> str:
+        """Create a queued task and submit its job to the scheduler, with `fields` set on the task."""
+        task_id = self.tasks.create(status="queued", **fields)
+        job = Job(task_id=task_id, user=user, size=size, payload=payload)
+        try:
+            self.scheduler.submit(job)
+        except QueueFullError as e:
+            # Another request took the last place in the queue in the meantime
+            self.tasks.transition(task_id, 'queued', 'failed', result=str(e))
+            raise self._queue_full(e)
+        TASKS_IN_FLIGHT.inc()
+        self._dispatch()
         return task_id
 
-    def get_task_status(self, task_id: str) -> Dict:
+    def _upload_size(self, s3_key: str) -> int:
+        try:
+            return self.s3_manager.get_object_size(bucket=S3_BUCKET, key=s3_key)
+        except Exception as e:
+            if ObjectStorage.is_not_found(e):
+                raise HTTPException(status_code=404, detail=f"Upload {s3_key} not found")
+            raise
+
+    @staticmethod
+    def _queue_full(error: QueueFullError) -> HTTPException:
+        logger.warning(str(error))
+        return HTTPException(status_code=429, detail=str(error), headers={"Retry-After": str(error.retry_after)})
+
+    def _dispatch(self):
+        """Hand the jobs the scheduler lets start to the executor, and publish the queue positions."""
+        # Serialized, so that the jobs taken by concurrent calls do not exceed the free processing workers
+        with self._dispatch_lock:
+            # Start other jobs in the slots of the skipped ones
+            while self._start_jobs():
+                pass
+            for task_id, position in self.scheduler.queue_positions().items():
+                self.tasks.update(task_id, **position)
+        self.update_queue_depth()
+
+    def _start_jobs(self) -> bool:
+        """
+        Hand the jobs the scheduler lets start to the executor.
+
+        Returns:
+            bool: Whether jobs were skipped because their task is no longer queued.
+        """
+        skipped = False
+        with self._pending_lock:
+            # Jobs handed to the executor beyond its workers would wait in it, holding slots of the host
+            free_workers = max(1, self.executor.n_workers) - len(self._pending)
+        for job in self.scheduler.next_jobs(max(0, free_workers)):
+            if not self.tasks.transition(job.task_id, 'queued', 'processing',
+                                         queue_position=None, estimated_wait_seconds=None):
+                # Cancelled while queued, before its job was removed from the queue
+                logger.info("Task %s is no longer queued, not starting it", job.task_id)
+                self.scheduler.remove(job.task_id)
+                TASKS_IN_FLIGHT.dec()
+                skipped = True
+                continue
+            # The deadline of the task counts from now, the wait in the queue is not included
+            control = TaskControl(job.task_id)
+            if "s3_keys" in job.payload:
+                future = self.executor.submit_batch(job.task_id, job.payload["s3_keys"], job.payload["folder"],
+                                                    job.payload["result_format"], job.payload["comparison"],
+                                                    job.payload["statistics"], control, job.payload["missing_genes"])
+            elif "base_result" in job.payload:
+                future = self.executor.submit_append(job.task_id, job.payload["base_result"], job.payload["s3_key"],
+                                                     job.payload["folder"], job.payload["result_format"], control,
+                                                     job.payload["study_id"])
+            else:
+                future = self.executor.submit(job.task_id, job.payload["s3_key"], job.payload["folder"],
+                                              job.payload["result_format"], job.payload["comparison"],
+                                              job.payload["statistics"], control)
+            with self._pending_lock:
+                self._pending[job.task_id] = future
+                self._controls[job.task_id] = control
+            future.add_done_callback(partial(self._on_task_done, job))
+            logger.info("Processing started with task ID %s", job.task_id)
+        return skipped
+
+    def lookup_cached_result(self, content_hash: str, result_format: Optional[str] = None) -> Optional[str]:
+        """
+        Look up the processed result of an input by the hash of its content.
+
+        Returns:
+            Optional[str]: S3 key of the processed result, or None if it is not cached.
+        """
+        result_format = self._check_result_format(result_format)
+        return self._cached_result(make_cache_key(content_hash, {"result_format": result_format}))
+
+    @staticmethod
+    def _check_result_format(result_format: Optional[str]) -> str:
+        result_format = result_format or RESULT_FORMAT
+        if result_format not in RESULT_FORMATS:
+            raise HTTPException(status_code=422, detail=f"Unknown result format {result_format}, "
+                                                        f"expected one of {RESULT_FORMATS}")
+        return result_format
+
+    def _cached_result(self, cache_key: Optional[str]) -> Optional[str]:
+        if self.cache is None or cache_key is None:
+            return None
+        result_s3_key = self.cache.get(cache_key)
+        # The result object may have been deleted since it was cached
+        if result_s3_key is not None and not self.s3_manager.object_exists(bucket=S3_BUCKET, key=result_s3_key):
+            logger.info("Cached result %s no longer exists, invalidating it", result_s3_key)
+            self.cache.invalidate(cache_key)
+            return None
+        return result_s3_key
+
+    def update_queue_depth(self):
+        """Set the queue depth gauge to the number of submitted jobs not picked up by a worker yet."""
+        with self._pending_lock:
+            waiting = sum(not future.running() for future in self._pending.values())
+        TASK_QUEUE_DEPTH.set(self.scheduler.n_queued + waiting)
+
+    def cache_stats(self) -> Dict:
+        return self.cache.stats() if self.cache is not None else {}
+
+    def get_task(self, task_id: str) -> Optional[Dict]:
+        """
+        Returns:
+            Optional[Dict]: The task, with the `rows_processed` and `rows_total` last reported by its
+            processing while it runs, or None if the ID is unknown.
+        """
         task = self.tasks.get(task_id)
+        if task is not None and task["status"] == "processing":
+            progress = task_control.read_progress(task_id)
+            if progress is not None:
+                task = {**task, **progress}
+        return task
+
+    def get_task_status(self, task_id: str) -> Dict:
+        task = self.get_task(task_id)
         if not task:
-            logger.error(f"Task ID {task_id} not found")
+            logger.error("Task ID %s not found", task_id)
             raise HTTPException(status_code=404, detail="Invalid task ID")
-        logger.info(f"Task {task_id} status: {task['status']}")
+        logger.info("Task %s status: %s", task_id, task['status'])
         return task
 
-    def process_file(self, task_id: str, s3_key: str, folder: str):
-        logger.info(f"Starting processing for task {task_id} with S3 key {s3_key} in folder {folder}...")
-        try:
-            # Generate a unique path for the local temporary file
-            local_file = generate_unique_temp_path(prefix="/tmp", filename=f"{task_id}.csv")
-            self.s3_manager.download_file_from_s3(bucket=S3_BUCKET, key=s3_key, filename=local_file)
+    def cancel_task(self, task_id: str) -> Dict:
+        """
+        Cancel a task, to free its place in the queue or its processing worker.
+
+        A queued task is cancelled at once. A task being processed stops at its next checkpoint,
+        before the next stage or chunk, and stays "processing" with `cancel_requested` set until then.
 
-            df = pd.read_csv(local_file)
+        Returns:
+            Dict: The task.
+        """
+        task = self.get_task_status(task_id)
+        if task["status"] == "queued":
+            if self.tasks.transition(task_id, 'queued', 'cancelled', result="Task was cancelled",
+                                     queue_position=None, estimated_wait_seconds=None):
+                # Otherwise a backend worker took the job in the meantime, and skips it as it is no longer queued
+                if self.scheduler.remove(task_id):
+                    TASKS_IN_FLIGHT.dec()
+                TASKS_TOTAL.labels(status="cancelled").inc()
+                logger.info("Task %s cancelled while queued", task_id)
+                self._dispatch()
+                return self.get_task_status(task_id)
+            # Started in the meantime
+            task = self.get_task_status(task_id)
+        if task["status"] != "processing":
+            raise HTTPException(status_code=409, detail=f"Task is already {task['status']}")
 
-            # Process the DataFrame and validate the data
-            processed_df = process_rnaseq_data(df)
+        self.tasks.update(task_id, cancel_requested=True)
+        task_control.request_cancel(task_id)
+        with self._pending_lock:
+            future = self._pending.get(task_id)
+        # Succeeds if no processing worker picked the job up yet, `_on_task_done` then records the cancellation
+        if future is not None:
+            future.cancel()
+        return self.get_task_status(task_id)
 
-            processed_s3_key = f"{folder}/processed/{task_id}_processed.csv"
-            processed_file = generate_unique_temp_path(prefix="/tmp", filename=f"{task_id}_processed.csv")
-            processed_df.to_csv(processed_file, index=False)
-            result_s3_key = self.s3_manager.upload_file_to_s3(file_obj=open(processed_file, "rb"),
-                                                              bucket=S3_BUCKET,
-                                                              s3_file_name=processed_s3_key)
+    def get_result_key(self, task_id: str) -> str:
+        """
+        Returns:
+            str: S3 key of the processed result of a completed task.
+        """
+        task = self.get_task_status(task_id)
+        if task["status"] != "completed":
+            raise HTTPException(status_code=409, detail=f"Task is {task['status']}, not completed")
+        return task["result"]
 
-            self.tasks[task_id]['status'] = 'completed'
-            self.tasks[task_id]['result'] = result_s3_key
-            logger.info(f"Task {task_id} completed successfully. Result stored at {result_s3_key}")
+    def process_file(self, task_id: str, s3_key: str, folder: str, result_format: str = RESULT_FORMAT,
+                     comparison: Optional[Comparison] = None, statistics: StatisticsSpec = StatisticsSpec()):
+        """Run a task synchronously in the calling process and record its outcome."""
+        try:
+            outcome = pipeline.process_file(self.s3_manager, task_id, s3_key, folder, result_format, comparison,
+                                            statistics)
         except Exception as e:
-            self.tasks[task_id]['status'] = 'failed'
-            self.tasks[task_id]['result'] = str(e)
-            logger.error(f"Task {task_id} failed: {e}")
+            self._record_failure(task_id, e)
+        else:
+            self._record_success(task_id, outcome)
+
+    def _on_task_done(self, job: Job, future: Future):
+        """Report the outcome of a job run by the executor back to the task registry, and start the next jobs."""
+        task_id = job.task_id
+        with self._pending_lock:
+            self._pending.pop(task_id, None)
+            self._controls.pop(task_id, None)
+            recorded = self._recorded.pop(task_id, None)
+        self.scheduler.finish(task_id)
+        TASKS_IN_FLIGHT.dec()
+        progress = task_control.read_progress(task_id)
+        if progress is not None and "files" in progress:
+            # The final status of the inputs of a batch, only reported by the worker
+            self.tasks.update(task_id, files=progress["files"])
+        task_control.clear(task_id)
+
+        if future.cancelled():
+            # By `cancel_task`, or by the shutdown of the executor
+            cancelled = (self.tasks.get(task_id) or {}).get("cancel_requested", False)
+            error = TaskCancelled("Task was cancelled") if cancelled else RuntimeError("Task was cancelled")
+        else:
+            error = future.exception()
+        if recorded is not None:
+            # By the watchdog, while the job was still running
+            status = recorded
+        elif isinstance(error, TaskTimedOut):
+            status = self._record_timeout(task_id, error)
+        elif isinstance(error, TaskCancelled):
+            status = self._record_cancellation(task_id, error)
+        elif error is not None:
+            status = self._record_failure(task_id, error)
+        else:
+            status = self._record_success(task_id, future.result(), job.payload["cache_params"],
+                                          job.payload.get("content_hash"))
+        # Latency as seen by the user, including the wait in the queue
+        TASK_LATENCY.labels(status=status).observe(time.time() - job.submitted_at)
+        self._dispatch()
+
+    def _record_success(self, task_id: str, outcome: pipeline.ProcessingOutcome,
+                        cache_params: Optional[Dict] = None, content_hash: Optional[str] = None) -> str:
+        self.tasks.transition(task_id, 'processing', 'completed', result=outcome.result_s3_key, stages=outcome.stages,
+                              peak_memory_bytes=outcome.peak_memory_bytes)
+        if self.cache is not None and cache_params is not None and outcome.content_hash is not None:
+            if content_hash is not None and content_hash != outcome.content_hash:
+                logger.warning("Content hash %s given for task %s does not match its input, caching the result "
+                               "under the hash of the input %s", content_hash, task_id, outcome.content_hash)
+            self.cache.put(make_cache_key(outcome.content_hash, cache_params), outcome.result_s3_key)
+        observe_stages(outcome.stages)
+        if outcome.peak_memory_bytes is not None:
+            TASK_PEAK_MEMORY.observe(outcome.peak_memory_bytes)
+        TASKS_TOTAL.labels(status="completed").inc()
+        logger.info("Task %s completed successfully. Result stored at %s", task_id, outcome.result_s3_key)
+        return "completed"
+
+    def _record_failure(self, task_id: str, error: BaseException) -> str:
+        self.tasks.transition(task_id, 'processing', 'failed', result=str(error))
+        TASKS_TOTAL.labels(status="failed").inc()
+        logger.error("Task %s failed: %s", task_id, error)
+        return "failed"
+
+    def _record_cancellation(self, task_id: str, error: TaskCancelled) -> str:
+        self.tasks.transition(task_id, 'processing', 'cancelled', result=str(error))
+        TASKS_TOTAL.labels(status="cancelled").inc()
+        logger.info("Task %s cancelled: %s", task_id, error)
+        return "cancelled"
+
+    def _record_timeout(self, task_id: str, error: TaskTimedOut) -> str:
+        self.tasks.transition(task_id, 'processing', 'timed_out', result=str(error))
+        TASKS_TOTAL.labels(status="timed_out").inc()
+        logger.warning("Task %s timed out: %s", task_id, error)
+        return "timed_out"
+
+    def check_overdue(self) -> None:
+        """
+        Stop the running tasks of this backend worker that do not stop by themselves.
+
+        A task past its deadline is recorded as "timed_out" right away, even though its worker only
+        stops at its next checkpoint. When a task is still running TASK_KILL_GRACE_SECONDS after its
+        deadline or its cancellation, e.g. stuck in a long stage, its worker process is killed. Each job
+        runs in a process of its own, so the other running jobs carry on.
+        """
+        now = time.time()
+        with self._pending_lock:
+            running = [(task_id, self._controls[task_id]) for task_id, future in self._pending.items()
+                       if future.running() and task_id in self._controls]
+        for task_id, control in running:
+            overdue = None
+            if control.timeout_seconds > 0:
+                overdue = now - control.started_at - control.timeout_seconds
+                if overdue > 0:
+                    self._record_overdue(task_id, "timed_out",
+                                         TaskTimedOut(f"Task timed out after {control.timeout_seconds} s"))
+            cancelled_at = task_control.cancel_requested_at(task_id)
+            if cancelled_at is not None:
+                overdue = max(overdue or 0.0, now - cancelled_at)
+            # Jobs run in a thread cannot be killed
+            if overdue is not None and overdue > TASK_KILL_GRACE_SECONDS and self.executor.n_workers > 0:
+                self._kill_worker(task_id)
+
+    def _record_overdue(self, task_id: str, status: str, error: TaskCancelled) -> Optional[str]:
+        """
+        Record the final status of a job still running, which `_on_task_done` keeps when the job finishes.
+
+        Returns:
+            Optional[str]: The status recorded, now or earlier, or None if the job finished in the meantime.
+        """
+        with self._pending_lock:
+            if task_id in self._recorded:
+                return self._recorded[task_id]
+            if task_id not in self._pending or not self.tasks.transition(task_id, 'processing', status,
+                                                                         result=str(error)):
+                return None
+            self._recorded[task_id] = status
+        TASKS_TOTAL.labels(status=status).inc()
+        logger.warning("Task %s recorded as %s while running: %s", task_id, status, error)
+        return status
+
+    def _kill_worker(self, task_id: str) -> None:
+        if not self.executor.kill(task_id):
+            # Not started by its worker yet, or finished in the meantime
+            return
+        # Not to be killed again for a cancellation before the job is reported as finished
+        task_control.clear(task_id)
+        # The status of a task stuck since its cancellation is only recorded now
+        status = self._record_overdue(task_id, "cancelled", TaskCancelled("Task was cancelled"))
+        TASK_WORKERS_KILLED.labels(status=status or "finished").inc()
+        logger.warning("Killed the worker of overdue task %s (%s)", task_id, status)
+
+    def start_watchdog(self, interval_seconds: float = TASK_WATCHDOG_INTERVAL_SECONDS) -> None:
+        """
+        Check for overdue tasks every `interval_seconds` in a background thread, until `shutdown`.
+        The thread also starts the jobs that this backend worker has free processing workers for,
+        which were queued through another backend worker of the host, busy at the time.
+        """
+        def run():
+            while not self._watchdog_stop.wait(interval_seconds):
+                try:
+                    self.check_overdue()
+                    self._dispatch()
+                except Exception as e:
+                    logger.error("Task watchdog check failed: %s", e)
+        self._watchdog = threading.Thread(target=run, name="task-watchdog", daemon=True)
+        self._watchdog.start()
+
+    def shutdown(self):
+        self._watchdog_stop.set()
+        if self._watchdog is not None:
+            self._watchdog.join(timeout=5)
+        for job in self.scheduler.cancel_queued():
+            self.tasks.transition(job.task_id, 'queued', 'failed', result="Backend shut down before processing",
+                                  queue_position=None, estimated_wait_seconds=None)
+            TASKS_IN_FLIGHT.dec()
+        self.executor.shutdown()
@@ -0,0 +1,341 @@
+import json
+import logging
+import threading
+import time
+import uuid
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from typing import Callable, Dict, List, Optional
+
+from rnaseq_viz.backend.sqlite_db import SQLiteDatabase
+from rnaseq_viz.config.config import (
+    TASK_STORE_BACKEND, TASK_STORE_PATH, TASK_STORE_MAX_FINISHED, TASK_STORE_TTL_SECONDS
+)
+
+# Configure logger
+from rnaseq_viz.config.log_config import setup_logging
+setup_logging()
+logger = logging.getLogger(__name__)
+
+# Statuses after which a task never changes again
+TERMINAL_STATUSES = ("completed", "failed", "cancelled", "timed_out")
+
+
+def generate_task_id() -> str:
+    """
+    Generate a globally unique task ID, safe to create concurrently from several processes.
+
+    Returns:
+        str: The task ID.
+    """
+    return f"task_{uuid.uuid4().hex}"
+
+
+class TaskStore(ABC):
+    """
+    Registry of processing tasks.
+
+    A task is a dict with a `status`, an optional `result` and any number of
+    extra JSON-serializable fields.
+
+    Finished tasks, in a terminal status, expire `ttl_seconds` after they finished,
+    and the least recently read ones are evicted once more than `max_finished` are
+    held. Tasks still queued or processing are never evicted.
+
+    Listeners added with `add_listener` are called with the ID of every task changed
+    through this store, after the change, from the thread that made it. Changes made by
+    other processes sharing the same database are not notified.
+    """
+
+    def __init__(self, max_finished: int = TASK_STORE_MAX_FINISHED, ttl_seconds: int = TASK_STORE_TTL_SECONDS):
+        self.max_finished = max_finished
+        self.ttl_seconds = ttl_seconds
+        self._listeners: List[Callable[[str], None]] = []
+        self._listeners_lock = threading.Lock()
+
+    def add_listener(self, listener: Callable[[str], None]) -> None:
+        """Call `listener` with the ID of each task changed from now on."""
+        with self._listeners_lock:
+            self._listeners.append(listener)
+
+    def remove_listener(self, listener: Callable[[str], None]) -> None:
+        with self._listeners_lock:
+            if listener in self._listeners:
+                self._listeners.remove(listener)
+
+    def _notify(self, task_id: str) -> None:
+        with self._listeners_lock:
+            listeners = list(self._listeners)
+        for listener in listeners:
+            try:
+                listener(task_id)
+            except Exception as e:
+                logger.error("Task change listener failed: %s", e)
+
+    @abstractmethod
+    def create(self, status: str, **fields) -> str:
+        """
+        Register a new task.
+
+        Returns:
+            str: The new task ID.
+        """
+
+    @abstractmethod
+    def get(self, task_id: str) -> Optional[Dict]:
+        """
+        Returns:
+            Optional[Dict]: The task, or None if the ID is unknown.
+        """
+
+    @abstractmethod
+    def update(self, task_id: str, **fields) -> None:
+        """Set fields of a task without changing its status."""
+
+    @abstractmethod
+    def transition(self, task_id: str, from_status: str, to_status: str, **fields) -> bool:
+        """
+        Atomically move a task from `from_status` to `to_status`, setting `fields` on the way.
+
+        Returns:
+            bool: False if the task was not in `from_status`, in which case nothing is changed.
+        """
+
+    @abstractmethod
+    def sweep(self) -> int:
+        """
+        Remove the expired finished tasks.
+
+        Returns:
+            int: Number of tasks removed.
+        """
+
+    @abstractmethod
+    def counts(self) -> Dict[str, int]:
+        """
+        Returns:
+            Dict[str, int]: Number of tasks by status.
+        """
+
+
+class InMemoryTaskStore(TaskStore):
+    """Task store held in the memory of a single process."""
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self._tasks: Dict[str, Dict] = {}
+        # Finish time of the finished tasks, least recently read first
+        self._finished: "OrderedDict[str, float]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _finish(self, task_id: str) -> None:
+        """Start the lifetime of a task that reached a terminal status, evicting beyond capacity."""
+        self._finished[task_id] = time.time()
+        while len(self._finished) > self.max_finished:
+            evicted, _ = self._finished.popitem(last=False)
+            del self._tasks[evicted]
+
+    def create(self, status: str, **fields) -> str:
+        task_id = generate_task_id()
+        with self._lock:
+            self._tasks[task_id] = {"status": status, **fields}
+            if status in TERMINAL_STATUSES:
+                self._finish(task_id)
+        return task_id
+
+    def get(self, task_id: str) -> Optional[Dict]:
+        with self._lock:
+            task = self._tasks.get(task_id)
+            if task_id in self._finished:
+                if time.time() - self._finished[task_id] > self.ttl_seconds:
+                    del self._finished[task_id], self._tasks[task_id]
+                    return None
+                self._finished.move_to_end(task_id)
+            return dict(task) if task is not None else None
+
+    def update(self, task_id: str, **fields) -> None:
+        with self._lock:
+            if task_id not in self._tasks:
+                return
+            self._tasks[task_id].update(fields)
+        self._notify(task_id)
+
+    def transition(self, task_id: str, from_status: str, to_status: str, **fields) -> bool:
+        with self._lock:
+            task = self._tasks.get(task_id)
+            if task is None or task["status"] != from_status:
+                return False
+            task.update(fields, status=to_status)
+            if to_status in TERMINAL_STATUSES:
+                self._finish(task_id)
+        self._notify(task_id)
+        return True
+
+    def sweep(self) -> int:
+        cutoff = time.time() - self.ttl_seconds
+        with self._lock:
+            expired = [task_id for task_id, finished_at in self._finished.items() if finished_at < cutoff]
+            for task_id in expired:
+                del self._finished[task_id], self._tasks[task_id]
+        return len(expired)
+
+    def counts(self) -> Dict[str, int]:
+        counts: Dict[str, int] = {}
+        with self._lock:
+            for task in self._tasks.values():
+                counts[task["status"]] = counts.get(task["status"], 0) + 1
+        return counts
+
+
+class SQLiteTaskStore(TaskStore):
+    """
+    Task store in an SQLite database on local disk, shared by every process of the host.
+
+    The database runs in WAL mode so that status polls from any uvicorn worker do
+    not block the writes of the others. Status and result are real columns, indexed
+    for lookups; other fields are kept as a JSON document. Finished tasks have a
+    `finished_at` time, and an `accessed_at` time refreshed at most every
+    `_ACCESS_RESOLUTION_SECONDS` when read, to evict the least recently read first.
+    """
+
+    _SCHEMA = """
+        CREATE TABLE IF NOT EXISTS tasks (
+            task_id TEXT PRIMARY KEY,
+            status TEXT NOT NULL,
+            result TEXT,
+            extra TEXT NOT NULL DEFAULT '{}',
+            created_at REAL NOT NULL,
+            updated_at REAL NOT NULL,
+            finished_at REAL,
+            accessed_at REAL
+        );
+        CREATE INDEX IF NOT EXISTS idx_tasks_status ON tasks (status);
+        CREATE INDEX IF NOT EXISTS idx_tasks_updated_at ON tasks (updated_at);
+        CREATE INDEX IF NOT EXISTS idx_tasks_finished_at ON tasks (finished_at);
+        CREATE INDEX IF NOT EXISTS idx_tasks_accessed_at ON tasks (accessed_at);
+    """
+    _ACCESS_RESOLUTION_SECONDS = 60
+
+    def __init__(self, path: str = TASK_STORE_PATH, **kwargs):
+        super().__init__(**kwargs)
+        logger.info("Using SQLite task store at %s", path)
+        self._db = SQLiteDatabase(path, self._SCHEMA)
+
+    def _connection(self):
+        return self._db.connection()
+
+    @staticmethod
+    def _split(fields: Dict):
+        result = fields.pop("result", None)
+        return result, fields
+
+    def _evict_finished(self, conn) -> int:
+        """Delete the least recently read finished tasks beyond `max_finished`."""
+        return conn.execute(
+            "DELETE FROM tasks WHERE task_id IN (SELECT task_id FROM tasks WHERE finished_at IS NOT NULL "
+            "ORDER BY accessed_at DESC LIMIT -1 OFFSET ?)", (self.max_finished,)).rowcount
+
+    def create(self, status: str, **fields) -> str:
+        task_id = generate_task_id()
+        result, extra = self._split(dict(fields))
+        now = time.time()
+        finished_at = now if status in TERMINAL_STATUSES else None
+        conn = self._connection()
+        conn.execute(
+            "INSERT INTO tasks (task_id, status, result, extra, created_at, updated_at, finished_at, accessed_at) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+            (task_id, status, result, json.dumps(extra), now, now, finished_at, finished_at),
+        )
+        if finished_at is not None:
+            self._evict_finished(conn)
+        return task_id
+
+    def get(self, task_id: str) -> Optional[Dict]:
+        conn = self._connection()
+        row = conn.execute(
+            "SELECT status, result, extra, finished_at, accessed_at FROM tasks WHERE task_id = ?", (task_id,)
+        ).fetchone()
+        if row is None:
+            return None
+        if row["finished_at"] is not None:
+            now = time.time()
+            if now - row["finished_at"] > self.ttl_seconds:
+                # Expired, deleted by the next sweep
+                return None
+            if now - row["accessed_at"] > self._ACCESS_RESOLUTION_SECONDS:
+                conn.execute("UPDATE tasks SET accessed_at = ? WHERE task_id = ?", (now, task_id))
+        task = {"status": row["status"], **json.loads(row["extra"])}
+        if row["result"] is not None:
+            task["result"] = row["result"]
+        return task
+
+    def _write(self, task_id: str, from_status: Optional[str], to_status: Optional[str], fields: Dict) -> bool:
+        conn = self._connection()
+        # BEGIN IMMEDIATE takes the write lock up front, making the read-modify-write of `extra` atomic
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            row = conn.execute("SELECT status, result, extra FROM tasks WHERE task_id = ?", (task_id,)).fetchone()
+            if row is None or (from_status is not None and row["status"] != from_status):
+                conn.execute("ROLLBACK")
+                return False
+            result, extra = self._split(dict(fields))
+            merged = {**json.loads(row["extra"]), **extra}
+            now = time.time()
+            conn.execute(
+                "UPDATE tasks SET status = ?, result = ?, extra = ?, updated_at = ? WHERE task_id = ?",
+                (to_status or row["status"], result if "result" in fields else row["result"],
+                 json.dumps(merged), now, task_id),
+            )
+            if to_status in TERMINAL_STATUSES:
+                conn.execute("UPDATE tasks SET finished_at = ?, accessed_at = ? WHERE task_id = ?",
+                             (now, now, task_id))
+                self._evict_finished(conn)
+            conn.execute("COMMIT")
+            return True
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+
+    def update(self, task_id: str, **fields) -> None:
+        if self._write(task_id, None, None, fields):
+            self._notify(task_id)
+
+    def transition(self, task_id: str, from_status: str, to_status: str, **fields) -> bool:
+        if not self._write(task_id, from_status, to_status, fields):
+            return False
+        self._notify(task_id)
+        return True
+
+    def sweep(self) -> int:
+        conn = self._connection()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            removed = conn.execute("DELETE FROM tasks WHERE finished_at < ?",
+                                   (time.time() - self.ttl_seconds,)).rowcount
+            removed += self._evict_finished(conn)
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        return removed
+
+    def counts(self) -> Dict[str, int]:
+        rows = self._connection().execute("SELECT status, COUNT(*) AS n FROM tasks GROUP BY status")
+        return {row["status"]: row["n"] for row in rows}
+
+
+def create_task_store(backend: str = TASK_STORE_BACKEND) -> TaskStore:
+    """
+    Create the task store configured by TASK_STORE_BACKEND.
+
+    Args:
+        backend (str): "memory" or "sqlite".
+
+    Returns:
+        TaskStore: The task store.
+    """
+    if backend == "sqlite":
+        return SQLiteTaskStore()
+    if backend == "memory":
+        return InMemoryTaskStore()
+    raise ValueError(f"Unknown task store backend: {backend}")
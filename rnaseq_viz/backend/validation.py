@@ -0,0 +1,237 @@
+import logging
+from dataclasses import dataclass, field
+from typing import Any, List, Optional, Sequence
+
+import numpy as np
+import pandas as pd
+
+from rnaseq_viz.config.config import VALIDATION_MAX_VIOLATIONS
+
+# Configure logger
+from rnaseq_viz.config.log_config import setup_logging
+setup_logging()
+logger = logging.getLogger(__name__)
+
+
+@dataclass(frozen=True)
+class Violation:
+    """
+    A single validation failure located in the input matrix.
+
+    Attributes:
+        check (str): Name of the failed check, one of 'dtype', 'na', 'negative' or 'duplicate'.
+        row (int): 0-based row position in the input DataFrame.
+        column (str): Name of the offending column.
+        value (Any): The offending value.
+    """
+    check: str
+    row: int
+    column: str
+    value: Any
+
+    def __str__(self) -> str:
+        return f"{self.check} at row {self.row}, column '{self.column}': {self.value!r}"
+
+
+@dataclass
+class ValidationReport:
+    """
+    Collects violations found by the vectorized checks.
+
+    Every violation is counted, but only the first `max_violations` are stored
+    with their positions so that a badly broken matrix cannot blow up memory.
+    `row_offset` is added to every recorded row, which lets chunked readers
+    report positions relative to the whole file.
+    """
+    max_violations: int = VALIDATION_MAX_VIOLATIONS
+    row_offset: int = 0
+    violations: List[Violation] = field(default_factory=list)
+    counts: dict = field(default_factory=dict)
+
+    @property
+    def ok(self) -> bool:
+        return not self.counts
+
+    @property
+    def total(self) -> int:
+        return sum(self.counts.values())
+
+    @property
+    def truncated(self) -> bool:
+        return self.total > len(self.violations)
+
+    @property
+    def room(self) -> int:
+        return max(self.max_violations - len(self.violations), 0)
+
+    def add(self, check: str, rows: np.ndarray, columns: Sequence[str], values: Sequence[Any],
+            total: Optional[int] = None) -> None:
+        """
+        Record a batch of violations of the same check.
+
+        Args:
+            check (str): Name of the failed check.
+            rows (np.ndarray): Row positions of the violations.
+            columns (Sequence[str]): Column name of each violation.
+            values (Sequence[Any]): Offending value of each violation.
+            total (int): Number of violations to count, if more than the positions given.
+        """
+        n = len(rows) if total is None else total
+        if n == 0:
+            return
+        self.counts[check] = self.counts.get(check, 0) + n
+        room = self.room
+        for row, col, val in zip(rows[:room], columns[:room], values[:room]):
+            self.violations.append(Violation(check=check, row=int(row) + self.row_offset,
+                                             column=str(col), value=_to_python(val)))
+
+    def summary(self) -> str:
+        """
+        Returns:
+            str: Human readable description of all recorded violations.
+        """
+        counts = ", ".join(f"{n} {check}" for check, n in self.counts.items())
+        lines = [f"{self.total} validation error(s) found ({counts})"]
+        lines += [f"  - {v}" for v in self.violations]
+        if self.truncated:
+            lines.append(f"  ... {self.total - len(self.violations)} more not shown")
+        return "\n".join(lines)
+
+
+def _to_python(value: Any) -> Any:
+    return value.item() if isinstance(value, np.generic) else value
+
+
+def _add_mask(report: ValidationReport, check: str, mask: np.ndarray,
+              columns: np.ndarray, block: np.ndarray, chunk_rows: int = 4096) -> None:
+    """
+    Record the True cells of a 2-D mask, extracting positions only up to the report's room.
+    """
+    total = int(np.count_nonzero(mask))
+    if not total:
+        return
+    rows, cols = [], []
+    found, room = 0, report.room
+    for start in range(0, mask.shape[0], chunk_rows):
+        if found >= room:
+            break
+        r, c = np.nonzero(mask[start:start + chunk_rows])
+        rows.append(r + start)
+        cols.append(c)
+        found += len(r)
+    rows = np.concatenate(rows)[:room] if rows else np.empty(0, dtype=np.intp)
+    cols = np.concatenate(cols)[:room] if cols else np.empty(0, dtype=np.intp)
+    report.add(check, rows, columns[cols], block[rows, cols], total=total)
+
+
+def validate_symbol_array(symbol: np.ndarray, report: ValidationReport, column: str = 'SYMBOL') -> None:
+    """
+    Check the gene identifier column for NA, non-string and duplicate values.
+
+    Args:
+        symbol (np.ndarray): Gene identifiers, one per row.
+        report (ValidationReport): Report receiving the violations.
+        column (str): Column name used when reporting.
+    """
+    symbol = pd.Series(symbol, copy=False)
+
+    na_mask = symbol.isna().to_numpy()
+    if na_mask.any():
+        rows = np.flatnonzero(na_mask)
+        report.add('na', rows, [column] * len(rows), symbol.to_numpy()[rows])
+
+    # infer_dtype runs in C; only fall back to a per-element scan when something is off
+    if pd.api.types.infer_dtype(symbol, skipna=True) not in ('string', 'empty'):
+        not_str = ~na_mask & ~symbol.map(lambda s: isinstance(s, str)).to_numpy(dtype=bool)
+        rows = np.flatnonzero(not_str)
+        report.add('dtype', rows, [column] * len(rows), symbol.to_numpy()[rows])
+
+    dup_mask = symbol.duplicated(keep=False).to_numpy() & ~na_mask
+    if dup_mask.any():
+        rows = np.flatnonzero(dup_mask)
+        report.add('duplicate', rows, [column] * len(rows), symbol.to_numpy()[rows])
+
+
+def _numeric_block(samples: pd.DataFrame, report: ValidationReport) -> pd.DataFrame:
+    """
+    Coerce non-numeric sample columns to float, reporting every cell that cannot be parsed.
+
+    Unparseable cells are replaced by 0 so that they are not reported a second time as NA.
+    """
+    bad_columns = [col for col, dtype in samples.dtypes.items()
+                   if pd.api.types.is_bool_dtype(dtype) or not pd.api.types.is_numeric_dtype(dtype)]
+    if not bad_columns:
+        return samples
+
+    samples = samples.copy(deep=False)
+    for col in bad_columns:
+        original = samples[col]
+        if pd.api.types.is_bool_dtype(original.dtype):
+            rows = np.flatnonzero(original.notna().to_numpy())
+            report.add('dtype', rows, [col] * len(rows), original.to_numpy()[rows])
+            samples[col] = original.isna().map({True: np.nan, False: 0.0})
+            continue
+        numeric = pd.to_numeric(original, errors='coerce')
+        unparseable = (numeric.isna() & original.notna()).to_numpy()
+        rows = np.flatnonzero(unparseable)
+        report.add('dtype', rows, [col] * len(rows), original.to_numpy()[rows])
+        samples[col] = numeric.mask(unparseable, 0.0)
+    return samples
+
+
+def validate_sample_matrix(samples: pd.DataFrame, report: ValidationReport) -> None:
+    """
+    Check that every sample cell is numeric, not NA and not negative.
+
+    Columns are grouped by dtype and each group is checked as one 2-D NumPy
+    block, so the cost is a handful of whole-array comparisons rather than a
+    Python call per cell.
+
+    Args:
+        samples (pd.DataFrame): Sample columns of the input matrix.
+        report (ValidationReport): Report receiving the violations.
+    """
+    samples = _numeric_block(samples, report)
+    columns = np.asarray(samples.columns, dtype=object)
+
+    groups: dict = {}
+    for position, dtype in enumerate(samples.dtypes):
+        groups.setdefault(dtype, []).append(position)
+
+    for dtype, positions in groups.items():
+        # NumPy unsigned counts can be neither missing nor negative, so their block is not built
+        if isinstance(dtype, np.dtype) and dtype.kind == 'u':
+            continue
+        positions = np.asarray(positions)
+        if pd.api.types.is_extension_array_dtype(dtype):
+            block = samples.iloc[:, positions].to_numpy(dtype='float64', na_value=np.nan)
+        else:
+            block = samples.iloc[:, positions].to_numpy()
+
+        if block.dtype.kind == 'f':
+            _add_mask(report, 'na', np.isnan(block), columns[positions], block)
+
+        if block.dtype.kind != 'u':
+            _add_mask(report, 'negative', block < 0, columns[positions], block)
+
+
+def validate_matrix(symbol: np.ndarray, samples: pd.DataFrame,
+                    max_violations: Optional[int] = None) -> ValidationReport:
+    """
+    Run all checks over a full RNA-Seq matrix.
+
+    Args:
+        symbol (np.ndarray): Gene identifiers.
+        samples (pd.DataFrame): Sample columns.
+        max_violations (Optional[int]): Number of violations to keep with their positions,
+            VALIDATION_MAX_VIOLATIONS by default.
+
+    Returns:
+        ValidationReport: The report, empty if the matrix is valid.
+    """
+    if max_violations is None:
+        max_violations = VALIDATION_MAX_VIOLATIONS
+    report = ValidationReport(max_violations=max_violations)
+    validate_symbol_array(symbol, report)
+    validate_sample_matrix(samples, report)
+    return report
@@ -0,0 +1,122 @@
+import logging
+from typing import Dict, List, Optional
+
+import numpy as np
+import pandas as pd
+
+from rnaseq_viz.config.config import VIZ_HISTOGRAM_BINS, VIZ_KDE_POINTS, VIZ_TOP_N, VIZ_CUTOFF_PERCENTILE
+
+# Configure logger
+from rnaseq_viz.config.log_config import setup_logging
+setup_logging()
+logger = logging.getLogger(__name__)
+
+STAT_COLUMNS = ["Mean", "Median", "StdDev"]
+# Percentiles of each statistic reported in the summary
+SUMMARY_PERCENTILES = (5, 25, 50, 75, 90, 95, 99)
+# Resolution of the grid the KDE is binned on before smoothing
+_KDE_GRID_SIZE = 2048
+
+
+def _round(values: np.ndarray) -> List[float]:
+    """Round to 6 significant digits, enough for plotting and much more compact as JSON."""
+    return [float(f"{value:.6g}") for value in values]
+
+
+def _percentiles(values: np.ndarray) -> np.ndarray:
+    """SUMMARY_PERCENTILES of the values, leaving out NaN, e.g. the CV of genes with no counts."""
+    values = values[~np.isnan(values)]
+    return np.percentile(values, SUMMARY_PERCENTILES) if len(values) else np.full(len(SUMMARY_PERCENTILES), np.nan)
+
+
+def kde_curve(values: np.ndarray, low: float, high: float, n_points: int = VIZ_KDE_POINTS) -> Optional[Dict]:
+    """
+    Gaussian kernel density estimate of the values, evaluated on `n_points` between `low` and `high`.
+
+    The values are binned on a fine grid and the bin counts are convolved with the kernel,
+    which costs O(n) instead of O(n * n_points) for an exact KDE. The bandwidth follows
+    Scott's rule, as seaborn's default.
+
+    Returns:
+        Optional[Dict]: The `x` and density `y` coordinates of the curve, or None if the
+        values have no spread.
+    """
+    n = len(values)
+    std = values.std(ddof=1) if n > 1 else 0.0
+    if n < 2 or not std > 0 or not high > low:
+        return None
+    bandwidth = std * n ** (-1 / 5)
+
+    # Bin over the curve range extended by 4 bandwidths so the kernel tails are not cut off
+    grid_low, grid_high = low - 4 * bandwidth, high + 4 * bandwidth
+    counts, edges = np.histogram(values, bins=_KDE_GRID_SIZE, range=(grid_low, grid_high))
+    step = edges[1] - edges[0]
+    half_width = min(int(np.ceil(4 * bandwidth / step)), _KDE_GRID_SIZE)
+    offsets = np.arange(-half_width, half_width + 1) * step
+    kernel = np.exp(-0.5 * (offsets / bandwidth) ** 2) / (bandwidth * np.sqrt(2 * np.pi))
+    density = np.convolve(counts, kernel, mode="same") / n
+
+    x = np.linspace(low, high, n_points)
+    y = np.interp(x, (edges[:-1] + edges[1:]) / 2, density)
+    return {"x": _round(x), "y": _round(y)}
+
+
+def compute_viz_summary(stats: pd.DataFrame, n_samples: int, bins: int = VIZ_HISTOGRAM_BINS,
+                        kde_points: int = VIZ_KDE_POINTS, top_n: int = VIZ_TOP_N,
+                        cutoff_percentile: float = VIZ_CUTOFF_PERCENTILE, normalization: str = "none") -> Dict:
+    """
+    Compute the compact payload the frontend renders a processed result from.
+
+    The distribution of mean expression is summarized below the `cutoff_percentile`
+    percentile, cutting off the long right tail of highly expressed genes.
+
+    Args:
+        stats (pd.DataFrame): SYMBOL, Mean, Median, StdDev and the other statistic columns of every gene.
+        n_samples (int): Number of sample columns of the input.
+        bins (int): Number of histogram bins.
+        kde_points (int): Number of points of the KDE curve.
+        top_n (int): Number of most expressed genes listed.
+        cutoff_percentile (float): Percentile of the Mean above which genes are left out of the distribution.
+        normalization (str): Normalization the statistics were computed on.
+
+    Returns:
+        Dict: Gene and sample counts, the normalization and statistic columns, percentiles of each
+        statistic, the histogram and KDE of the Mean below the cutoff, and the `top_n` genes by Mean.
+    """
+    columns = [str(column) for column in stats.columns[1:]]
+    mean = stats["Mean"].to_numpy(dtype=np.float64)
+    cutoff = float(np.percentile(mean, cutoff_percentile)) if len(mean) else 0.0
+    kept = mean[mean <= cutoff]
+
+    counts, edges = np.histogram(kept, bins=bins) if len(kept) else (np.zeros(bins, dtype=int), np.zeros(bins + 1))
+    kde = kde_curve(kept, float(edges[0]), float(edges[-1]), kde_points)
+    if kde is not None:
+        # Scale the density to expected counts per histogram bin, so the curve overlays the bars
+        scale = len(kept) * (edges[1] - edges[0])
+        kde["y"] = _round(np.asarray(kde["y"]) * scale)
+
+    top = stats.nlargest(top_n, "Mean")[["SYMBOL"] + columns]
+    summary = {
+        "n_genes": int(len(stats)),
+        "n_samples": int(n_samples),
+        "normalization": normalization,
+        "statistics": columns,
+        "percentiles": {
+            column: dict(zip(map(str, SUMMARY_PERCENTILES),
+                             _round(_percentiles(stats[column].to_numpy(dtype=np.float64)))))
+            for column in columns
+        } if len(stats) else {},
+        "mean_distribution": {
+            "cutoff_percentile": cutoff_percentile,
+            "cutoff": cutoff,
+            "n_genes": int(len(kept)),
+            "histogram": {"counts": counts.tolist(), "edges": _round(edges)},
+            "kde": kde,
+        },
+        "top_genes": [
+            {"SYMBOL": str(row.SYMBOL), **dict(zip(columns, _round(np.array(row[1:], dtype=np.float64))))}
+            for row in top.itertuples(index=False)
+        ],
+    }
+    logger.info("Computed visualization summary of %s genes", len(stats))
+    return summary
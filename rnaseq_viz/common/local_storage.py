@@ -0,0 +1,263 @@
+import hashlib
+import hmac
+import logging
+import os
+import shutil
+import tempfile
+import time
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from io import BytesIO
+from typing import IO, Dict, Iterator, List, Optional
+from urllib.parse import quote, urlencode
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from rnaseq_viz.common.metrics import timed_transfer
+from rnaseq_viz.common.storage import ObjectStorage
+from rnaseq_viz.config.config import LOCAL_STORAGE_ROOT, LOCAL_STORAGE_URL, LOCAL_STORAGE_SIGNING_KEY
+
+# Configure logger
+from rnaseq_viz.config.log_config import setup_logging
+setup_logging()
+logger = logging.getLogger(__name__)
+
+# Prefix of the files being written, renamed to their key once complete
+PARTIAL_PREFIX = ".partial-"
+_SIGNING_KEY_FILE = ".signing_key"
+
+
+class LocalFileWriter:
+    """
+    File-like writer of an object of the local storage, the counterpart of `S3MultipartWriter`.
+
+    Bytes go to a partial file next to the object, which is renamed into place by `close()`,
+    so that readers never see a partially written object. `abort()` removes the partial file.
+    """
+
+    def __init__(self, path: str):
+        self._started = time.perf_counter()
+        self.path = path
+        self.bytes_written = 0
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._file = tempfile.NamedTemporaryFile(dir=os.path.dirname(path), prefix=PARTIAL_PREFIX, delete=False)
+
+    @property
+    def closed(self) -> bool:
+        return self._file.closed
+
+    def tell(self) -> int:
+        return self.bytes_written
+
+    def flush(self) -> None:
+        pass
+
+    def write(self, data: bytes) -> int:
+        self._file.write(data)
+        self.bytes_written += len(data)
+        return len(data)
+
+    def close(self) -> str:
+        if self.closed:
+            return self.path
+        self._file.close()
+        os.replace(self._file.name, self.path)
+        logger.info("Wrote %s (%s bytes in %.3f s)", self.path, self.bytes_written, time.perf_counter() - self._started)
+        return self.path
+
+    def abort(self) -> None:
+        if self.closed:
+            return
+        logger.warning("Aborting the write of %s", self.path)
+        self._file.close()
+        os.remove(self._file.name)
+
+    def __enter__(self) -> "LocalFileWriter":
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
+
+
+class LocalStorage(ObjectStorage):
+    """
+    Object storage in a directory of the host, for single-node installs and benchmarks,
+    where the HTTP round trips of S3 dominate small jobs.
+
+    The object `key` of `bucket` is the file `{root}/{bucket}/{key}`. Objects are written to a
+    partial file and renamed into place, so they appear atomically, and are read through
+    memory maps rather than copied. Download URLs point at the `/storage` route of the backend,
+    signed with a key shared by the processes of the host.
+    """
+
+    def __init__(self, root: str = LOCAL_STORAGE_ROOT, url: str = LOCAL_STORAGE_URL,
+                 signing_key: str = LOCAL_STORAGE_SIGNING_KEY):
+        logger.info("Initializing local storage in %s...", root)
+        self.root = os.path.abspath(root)
+        self.url = url.rstrip("/")
+        os.makedirs(self.root, exist_ok=True)
+        self._signing_key = signing_key.encode("utf-8") if signing_key else self._host_signing_key()
+
+    def _host_signing_key(self) -> bytes:
+        """Signing key of the host, created by the first process that needs it."""
+        path = os.path.join(self.root, _SIGNING_KEY_FILE)
+        try:
+            fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+        except FileExistsError:
+            # Another process may still be writing it
+            for _ in range(100):
+                with open(path, "rb") as f:
+                    key = f.read()
+                if key:
+                    return key
+                time.sleep(0.01)
+            raise RuntimeError(f"Signing key {path} is empty")
+        key = os.urandom(32).hex().encode("ascii")
+        with os.fdopen(fd, "wb") as f:
+            f.write(key)
+        return key
+
+    def path(self, bucket: str, key: str) -> str:
+        """
+        Returns:
+            str: Path of the file of an object.
+
+        Raises:
+            ValueError: If the bucket or key would address a file outside of the bucket directory.
+        """
+        bucket_dir = os.path.join(self.root, bucket)
+        path = os.path.normpath(os.path.join(bucket_dir, key))
+        if not bucket or "/" in bucket or bucket.startswith(".") or not path.startswith(bucket_dir + os.sep):
+            raise ValueError(f"Invalid object s3://{bucket}/{key}")
+        return path
+
+    def upload_file_to_s3(self, file_obj: BytesIO, bucket: str, s3_file_name: str) -> str:
+        logger.info("Storing file in bucket %s with key %s...", bucket, s3_file_name)
+        with timed_transfer("upload") as transfer:
+            with LocalFileWriter(self.path(bucket, s3_file_name)) as writer:
+                shutil.copyfileobj(file_obj, writer)
+            transfer["bytes"] = writer.bytes_written
+        logger.info("Stored %s/%s (%s bytes in %.3f s)", bucket, s3_file_name, transfer['bytes'], transfer['seconds'])
+        return s3_file_name
+
+    def read_csv_from_s3(self, bucket: str, key: str, columns: Optional[List[str]] = None) -> pd.DataFrame:
+        logger.info("Reading CSV file from bucket %s with key %s...", bucket, key)
+        with timed_transfer("download") as transfer:
+            path = self.path(bucket, key)
+            transfer["bytes"] = os.path.getsize(path)
+            return pd.read_csv(path, usecols=columns, memory_map=True)
+
+    def read_object(self, bucket: str, key: str) -> bytes:
+        with timed_transfer("download") as transfer:
+            with open(self.path(bucket, key), "rb") as f:
+                body = f.read()
+            transfer["bytes"] = len(body)
+        return body
+
+    def generate_presigned_url(self, bucket: str, key: str, expires_in: int = 3600) -> str:
+        expires = int(time.time()) + expires_in
+        query = urlencode({"expires": expires, "signature": self.signature(bucket, key, expires)})
+        return f"{self.url}/storage/{quote(bucket)}/{quote(key)}?{query}"
+
+    def signature(self, bucket: str, key: str, expires: int) -> str:
+        message = f"{bucket}\n{key}\n{expires}".encode("utf-8")
+        return hmac.new(self._signing_key, message, hashlib.sha256).hexdigest()
+
+    def verify_signature(self, bucket: str, key: str, expires: int, signature: str) -> bool:
+        """Whether a download URL made by `generate_presigned_url` is authentic and not expired."""
+        return expires >= time.time() and hmac.compare_digest(self.signature(bucket, key, expires), signature)
+
+    def read_parquet_from_s3(self, bucket: str, key: str, columns: Optional[List[str]] = None) -> pd.DataFrame:
+        logger.info("Reading Parquet file from bucket %s with key %s, columns %s...", bucket, key, columns)
+        with timed_transfer("ranged_download") as transfer:
+            # Only the pages of the footer and of the requested column chunks are read from the map
+            table = pq.read_table(self.path(bucket, key), columns=columns, memory_map=True)
+            transfer["bytes"] = table.nbytes
+        return table.to_pandas()
+
+    def download_file_from_s3(self, bucket: str, key: str, filename: str) -> bool:
+        with timed_transfer("download") as transfer:
+            shutil.copyfile(self.path(bucket, key), filename)
+            transfer["bytes"] = os.path.getsize(filename)
+        return True
+
+    def get_object_size(self, bucket: str, key: str) -> int:
+        return os.path.getsize(self.path(bucket, key))
+
+    def object_exists(self, bucket: str, key: str) -> bool:
+        return os.path.isfile(self.path(bucket, key))
+
+    def list_objects(self, bucket: str, prefix: str = "") -> Iterator[Dict]:
+        """
+        List the objects of a bucket whose key starts with `prefix`, in no particular order.
+
+        Partial files left behind by killed processes are listed too, so that the retention
+        sweep of `lifecycle` eventually deletes them.
+
+        Yields:
+            Dict: `Key`, `Size` and `LastModified` of each object.
+        """
+        bucket_dir = os.path.join(self.root, bucket)
+        for directory, _, files in os.walk(bucket_dir):
+            for name in files:
+                path = os.path.join(directory, name)
+                key = os.path.relpath(path, bucket_dir).replace(os.sep, "/")
+                if not key.startswith(prefix):
+                    continue
+                try:
+                    stat = os.stat(path)
+                except FileNotFoundError:
+                    continue
+                yield {"Key": key, "Size": stat.st_size,
+                       "LastModified": datetime.fromtimestamp(stat.st_mtime, tz=timezone.utc)}
+
+    def delete_objects(self, bucket: str, keys: List[str]) -> int:
+        deleted = 0
+        bucket_dir = os.path.join(self.root, bucket)
+        for key in keys:
+            path = self.path(bucket, key)
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                continue
+            deleted += 1
+            # Remove the directories left empty, e.g. of an upload folder, up to the bucket
+            directory = os.path.dirname(path)
+            while directory != bucket_dir:
+                try:
+                    os.rmdir(directory)
+                except OSError:
+                    break
+                directory = os.path.dirname(directory)
+        logger.info("Deleted %s objects from bucket %s", deleted, bucket)
+        return deleted
+
+    def open_object_stream(self, bucket: str, key: str) -> IO[bytes]:
+        logger.info("Opening stream on object %s/%s...", bucket, key)
+        return open(self.path(bucket, key), "rb")
+
+    def open_multipart_upload(self, bucket: str, key: str) -> LocalFileWriter:
+        return LocalFileWriter(self.path(bucket, key))
+
+    @contextmanager
+    def download_to_buffer(self, bucket: str, key: str) -> Iterator[IO[bytes]]:
+        """
+        Map an object into memory, nothing is copied.
+
+        Yields:
+            IO[bytes]: Read-only memory-mapped file of the object, positioned at the start.
+        """
+        path = self.path(bucket, key)
+        with timed_transfer("download") as transfer:
+            # Arrow maps empty files too, unlike mmap
+            mapped = pa.memory_map(path, "r")
+            transfer["bytes"] = mapped.size()
+        try:
+            yield mapped
+        finally:
+            mapped.close()
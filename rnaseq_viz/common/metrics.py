@@ -0,0 +1,195 @@
+import logging
+import os
+import sys
+import time
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterator, Optional
+
+from prometheus_client import CollectorRegistry, Counter, Gauge, Histogram, generate_latest, CONTENT_TYPE_LATEST
+from prometheus_client import multiprocess
+
+# Configure logger
+from rnaseq_viz.config.log_config import log_context, setup_logging
+setup_logging()
+logger = logging.getLogger(__name__)
+
+# Buckets from 5 ms to 10 min, covering both API requests and processing stages
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600)
+
+REQUEST_LATENCY = Histogram("rnaseq_request_latency_seconds", "Latency of backend API requests",
+                            ["method", "route", "status"], buckets=LATENCY_BUCKETS)
+STAGE_LATENCY = Histogram("rnaseq_task_stage_seconds", "Wall time of processing stages",
+                          ["stage"], buckets=LATENCY_BUCKETS)
+TASK_LATENCY = Histogram("rnaseq_task_seconds", "Wall time of processing tasks, from submission to completion",
+                         ["status"], buckets=LATENCY_BUCKETS)
+TASKS_TOTAL = Counter("rnaseq_tasks_total", "Processing tasks by final status", ["status"])
+TASK_WORKERS_KILLED = Counter("rnaseq_task_workers_killed_total",
+                              "Processing worker processes killed by the watchdog, by status of their task", ["status"])
+TASKS_IN_FLIGHT = Gauge("rnaseq_tasks_in_flight", "Processing tasks submitted and not finished yet",
+                        multiprocess_mode="livesum")
+TASK_QUEUE_DEPTH = Gauge("rnaseq_task_queue_depth", "Processing tasks waiting for a worker",
+                         multiprocess_mode="livesum")
+S3_TRANSFER_LATENCY = Histogram("rnaseq_s3_transfer_seconds", "Wall time of S3 transfers",
+                                ["operation"], buckets=LATENCY_BUCKETS)
+S3_TRANSFER_BYTES = Counter("rnaseq_s3_transfer_bytes", "Bytes transferred to and from S3", ["operation"])
+RESIDENT_MEMORY = Gauge("rnaseq_resident_memory_bytes", "Resident memory of the backend processes",
+                        multiprocess_mode="livesum")
+# Every worker of the host measures the same files and the same shared task store
+DISK_USAGE = Gauge("rnaseq_disk_usage_bytes", "Local disk used by the backend", ["path"],
+                   multiprocess_mode="max")
+TASK_REGISTRY_ENTRIES = Gauge("rnaseq_task_registry_entries", "Tasks held by the task registry", ["status"],
+                              multiprocess_mode="max")
+# Buckets from 64 MB to 64 GB
+MEMORY_BUCKETS = tuple(2 ** power * 1024 * 1024 for power in range(6, 17))
+
+TASK_PEAK_MEMORY = Histogram("rnaseq_task_peak_memory_bytes", "Peak resident memory of the process running a task",
+                             buckets=MEMORY_BUCKETS)
+LIFECYCLE_REMOVED = Counter("rnaseq_lifecycle_removed", "Expired items removed by the lifecycle sweeper", ["kind"])
+
+
+def render_metrics() -> bytes:
+    """
+    Render all metrics in the Prometheus text format.
+
+    When PROMETHEUS_MULTIPROC_DIR is set, the metrics of every backend worker and
+    processing worker process of the host are aggregated.
+
+    Returns:
+        bytes: The metrics exposition.
+    """
+    if "PROMETHEUS_MULTIPROC_DIR" in os.environ:
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        return generate_latest(registry)
+    return generate_latest()
+
+
+METRICS_CONTENT_TYPE = CONTENT_TYPE_LATEST
+
+
+def mark_process_dead(pid: Optional[int] = None) -> None:
+    """Drop the live gauges of an exiting process from the multiprocess aggregation."""
+    if "PROMETHEUS_MULTIPROC_DIR" in os.environ:
+        multiprocess.mark_process_dead(pid or os.getpid())
+
+
+def resident_memory_bytes() -> int:
+    """
+    Returns:
+        int: Current resident memory of the calling process, or its peak where the current one is unknown.
+    """
+    try:
+        with open("/proc/self/statm") as statm:
+            return int(statm.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError):
+        import resource
+        # ru_maxrss is in kB on Linux and in bytes on macOS
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak if sys.platform == "darwin" else peak * 1024
+
+
+def reset_peak_memory() -> bool:
+    """
+    Reset the peak resident memory of the calling process to its current resident memory.
+
+    Returns:
+        bool: Whether the peak could be reset, which needs Linux. Otherwise `peak_memory_bytes`
+        keeps reporting the peak since the process started.
+    """
+    try:
+        with open("/proc/self/clear_refs", "w") as clear_refs:
+            clear_refs.write("5")
+        return True
+    except OSError:
+        return False
+
+
+def peak_memory_bytes() -> int:
+    """
+    Returns:
+        int: Peak resident memory of the calling process since it started or since `reset_peak_memory`.
+    """
+    try:
+        with open("/proc/self/status") as status:
+            for line in status:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) * 1024
+    except (OSError, ValueError):
+        pass
+    import resource
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+def update_memory_gauge() -> None:
+    RESIDENT_MEMORY.set(resident_memory_bytes())
+
+
+class StageTimings:
+    """
+    Records the wall time and the volume of data handled by each stage of a task.
+
+    Stages entered several times, e.g. once per chunk in streaming mode, accumulate
+    their time and byte counts.
+
+    Args:
+        checkpoint (Optional[Callable[[str], None]]): Called with the name of each stage before it
+            starts, which may raise to stop the task there, see `TaskControl.checkpoint`.
+    """
+
+    def __init__(self, checkpoint: Optional[Callable[[str], None]] = None):
+        self.stages: Dict[str, Dict] = {}
+        self.checkpoint = checkpoint
+
+    @contextmanager
+    def stage(self, name: str) -> Iterator[Dict]:
+        """
+        Time a stage.
+
+        Args:
+            name (str): Name of the stage.
+
+        Yields:
+            Dict: The stage record, on which `bytes`, `rows` or `columns` can be set.
+        """
+        if self.checkpoint is not None:
+            self.checkpoint(name)
+        record = self.stages.setdefault(name, {"seconds": 0.0})
+        start = time.perf_counter()
+        try:
+            with log_context(stage=name):
+                yield record
+        finally:
+            record["seconds"] = round(record["seconds"] + time.perf_counter() - start, 6)
+
+    def add(self, name: str, key: str, value: int) -> None:
+        """Add to a counter of a stage, for stages entered repeatedly."""
+        record = self.stages.setdefault(name, {"seconds": 0.0})
+        record[key] = record.get(key, 0) + value
+
+    def as_dict(self) -> Dict[str, Dict]:
+        return {name: dict(record) for name, record in self.stages.items()}
+
+
+def observe_stages(stages: Optional[Dict[str, Dict]]) -> None:
+    """Feed the stage timings of a finished task into the stage latency histogram."""
+    for name, record in (stages or {}).items():
+        STAGE_LATENCY.labels(stage=name).observe(record["seconds"])
+
+
+@contextmanager
+def timed_transfer(operation: str) -> Iterator[Dict]:
+    """
+    Time an S3 transfer. The caller sets `bytes` on the yielded record.
+
+    Yields:
+        Dict: The transfer record.
+    """
+    record = {"bytes": 0}
+    start = time.perf_counter()
+    try:
+        yield record
+    finally:
+        record["seconds"] = time.perf_counter() - start
+        S3_TRANSFER_LATENCY.labels(operation=operation).observe(record["seconds"])
+        S3_TRANSFER_BYTES.labels(operation=operation).inc(record["bytes"])
@@ -1,12 +1,26 @@
 import boto3
+import io
 import logging
+import time
+from contextlib import contextmanager
 import pandas as pd
+import pyarrow.parquet as pq
 from io import BytesIO
+from typing import IO, Dict, Iterator, List, Optional
+from boto3.s3.transfer import TransferConfig
 from botocore.client import BaseClient
-from botocore.exceptions import NoCredentialsError, PartialCredentialsError
+from botocore.config import Config
+from botocore.exceptions import ClientError, NoCredentialsError, PartialCredentialsError
+from botocore.response import StreamingBody
 
 
-from rnaseq_viz.config.config import USE_LOCALSTACK
+from rnaseq_viz.common.metrics import timed_transfer, S3_TRANSFER_BYTES, S3_TRANSFER_LATENCY
+from rnaseq_viz.common.storage import ObjectStorage
+from rnaseq_viz.common.temp_files import spooled_buffer
+from rnaseq_viz.config.config import (
+    USE_LOCALSTACK, S3_MULTIPART_CHUNKSIZE_MB, S3_MULTIPART_THRESHOLD_MB, S3_MAX_CONCURRENCY,
+    S3_MAX_POOL_CONNECTIONS
+)
 
 
 # Configure logger
@@ -15,9 +29,140 @@ setup_logging()
 logger = logging.getLogger(__name__)
 
 
-class S3Manager:
+class S3MultipartWriter:
+    """
+    File-like writer that streams bytes to S3 as a multipart upload.
+
+    Data is buffered until a full part is available, so memory use is bounded
+    by the part size regardless of the total object size. The upload is only
+    committed by `close()`; `abort()` discards every part already sent.
+    """
+
+    def __init__(self, s3_client: BaseClient, bucket: str, key: str,
+                 part_size: int = S3_MULTIPART_CHUNKSIZE_MB * 1024 * 1024):
+        self._started = time.perf_counter()
+        self.s3_client = s3_client
+        self.bucket = bucket
+        self.key = key
+        self.part_size = part_size
+        self.bytes_written = 0
+        self.closed = False
+        self._buffer = bytearray()
+        self._parts: List[Dict] = []
+        self._upload_id = self.s3_client.create_multipart_upload(Bucket=bucket, Key=key)['UploadId']
+        logger.info("Started multipart upload to s3://%s/%s", bucket, key)
+
+    def tell(self) -> int:
+        return self.bytes_written
+
+    def flush(self) -> None:
+        pass
+
+    def write(self, data: bytes) -> int:
+        self._buffer += data
+        self.bytes_written += len(data)
+        while len(self._buffer) >= self.part_size:
+            self._upload_part(bytes(self._buffer[:self.part_size]))
+            del self._buffer[:self.part_size]
+        return len(data)
+
+    def _upload_part(self, body: bytes) -> None:
+        part_number = len(self._parts) + 1
+        response = self.s3_client.upload_part(Bucket=self.bucket, Key=self.key, UploadId=self._upload_id,
+                                              PartNumber=part_number, Body=body)
+        self._parts.append({'ETag': response['ETag'], 'PartNumber': part_number})
+
+    def close(self) -> str:
+        if self.closed:
+            return self.key
+        self.closed = True
+        # The last part may be smaller than the minimum part size, and S3 requires at least one part
+        if self._buffer or not self._parts:
+            self._upload_part(bytes(self._buffer))
+            self._buffer.clear()
+        self.s3_client.complete_multipart_upload(Bucket=self.bucket, Key=self.key, UploadId=self._upload_id,
+                                                 MultipartUpload={'Parts': self._parts})
+        S3_TRANSFER_LATENCY.labels(operation="multipart_upload").observe(time.perf_counter() - self._started)
+        S3_TRANSFER_BYTES.labels(operation="multipart_upload").inc(self.bytes_written)
+        logger.info("Multipart upload successful: s3://%s/%s (%s bytes in %s parts)",
+                    self.bucket, self.key, self.bytes_written, len(self._parts))
+        return self.key
+
+    def abort(self) -> None:
+        if self.closed:
+            return
+        self.closed = True
+        logger.warning("Aborting multipart upload to s3://%s/%s", self.bucket, self.key)
+        self._buffer.clear()
+        self.s3_client.abort_multipart_upload(Bucket=self.bucket, Key=self.key, UploadId=self._upload_id)
+
+    def __enter__(self) -> "S3MultipartWriter":
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
+
+
+class S3RangeReader(io.RawIOBase):
+    """
+    Seekable read-only file over an S3 object, fetching bytes with ranged GETs.
+
+    Columnar readers only read the footer and the column chunks they need, so
+    reading a few columns of a Parquet object transfers only those columns.
+    """
+
+    def __init__(self, s3_client: BaseClient, bucket: str, key: str):
+        self.s3_client = s3_client
+        self.bucket = bucket
+        self.key = key
+        self.size = s3_client.head_object(Bucket=bucket, Key=key)['ContentLength']
+        self.bytes_read = 0
+        self._position = 0
+
+    def readable(self) -> bool:
+        return True
+
+    def seekable(self) -> bool:
+        return True
+
+    def tell(self) -> int:
+        return self._position
+
+    def seek(self, offset: int, whence: int = io.SEEK_SET) -> int:
+        if whence == io.SEEK_SET:
+            self._position = offset
+        elif whence == io.SEEK_CUR:
+            self._position += offset
+        elif whence == io.SEEK_END:
+            self._position = self.size + offset
+        return self._position
+
+    def readinto(self, buffer) -> int:
+        end = min(self._position + len(buffer), self.size)
+        if end <= self._position:
+            return 0
+        response = self.s3_client.get_object(Bucket=self.bucket, Key=self.key,
+                                             Range=f"bytes={self._position}-{end - 1}")
+        data = response['Body'].read()
+        buffer[:len(data)] = data
+        self._position += len(data)
+        self.bytes_read += len(data)
+        return len(data)
+
+
+class S3Manager(ObjectStorage):
+    """Object storage in S3, or in LocalStack with USE_LOCALSTACK."""
+
     def __init__(self):
         logger.info("Initializing S3Manager...")
+        client_config = Config(max_pool_connections=max(S3_MAX_POOL_CONNECTIONS, S3_MAX_CONCURRENCY),
+                               retries={"max_attempts": 5, "mode": "adaptive"})
+        self.transfer_config = TransferConfig(multipart_threshold=S3_MULTIPART_THRESHOLD_MB * 1024 * 1024,
+                                              multipart_chunksize=S3_MULTIPART_CHUNKSIZE_MB * 1024 * 1024,
+                                              max_concurrency=S3_MAX_CONCURRENCY)
         if USE_LOCALSTACK:
             logger.info("Using localstack S3 client")
             self._s3_client = boto3.client(
@@ -25,48 +170,194 @@ class S3Manager:
                 endpoint_url="http://localhost:4566",
                 aws_access_key_id="test",
                 aws_secret_access_key="test",
-                region_name="us-east-1"
+                region_name="us-east-1",
+                config=client_config
             )
         else:
             logger.info("Not using localstack")
             boto3.setup_default_session()
-            self._s3_client = boto3.client("s3")
+            self._s3_client = boto3.client("s3", config=client_config)
 
     @property
     def s3_client(self) -> BaseClient:
-        logger.debug("Getting S3 client...")
         return self._s3_client
 
     def upload_file_to_s3(self, file_obj: BytesIO, bucket: str, s3_file_name: str) -> str:
-        logger.info(f"Uploading file to S3 bucket {bucket} with S3 key {s3_file_name}...")
+        logger.info("Uploading file to S3 bucket %s with S3 key %s...", bucket, s3_file_name)
         try:
-            self.s3_client.upload_fileobj(file_obj, bucket, s3_file_name)
-            logger.info(f"Upload Successful: s3://{bucket}/{s3_file_name}")
+            with timed_transfer("upload") as transfer:
+                def count_bytes(n: int):
+                    transfer["bytes"] += n
+                self.s3_client.upload_fileobj(file_obj, bucket, s3_file_name, Config=self.transfer_config,
+                                              Callback=count_bytes)
+            logger.info("Upload Successful: s3://%s/%s (%s bytes in %.3f s)",
+                        bucket, s3_file_name, transfer['bytes'], transfer['seconds'])
             return s3_file_name
         except (NoCredentialsError, PartialCredentialsError) as e:
-            logger.error(f"Credentials error: {e}")
+            logger.error("Credentials error: %s", e)
             raise
         except Exception as e:
-            logger.error(f"An error occurred during file upload: {e}")
+            logger.error("An error occurred during file upload: %s", e)
             raise
 
-    def read_csv_from_s3(self, bucket: str, key: str) -> pd.DataFrame:
-        logger.info(f"Reading CSV file from S3 bucket {bucket} with key {key}...")
+    def read_csv_from_s3(self, bucket: str, key: str, columns: Optional[List[str]] = None) -> pd.DataFrame:
+        logger.info("Reading CSV file from S3 bucket %s with key %s...", bucket, key)
         try:
-            response = self.s3_client.get_object(Bucket=bucket, Key=key)
-            df = pd.read_csv(BytesIO(response['Body'].read()))
+            with timed_transfer("download") as transfer:
+                response = self.s3_client.get_object(Bucket=bucket, Key=key)
+                body = response['Body'].read()
+                transfer["bytes"] = len(body)
+            df = pd.read_csv(BytesIO(body), usecols=columns)
             logger.info("CSV file read successfully")
             return df
         except Exception as e:
-            logger.error(f"An error occurred while reading the CSV file: {e}")
+            logger.error("An error occurred while reading the CSV file: %s", e)
+            raise
+
+    def read_object(self, bucket: str, key: str) -> bytes:
+        """Read a small object, e.g. a JSON document, into memory."""
+        logger.info("Reading object from S3 bucket %s with key %s...", bucket, key)
+        try:
+            with timed_transfer("download") as transfer:
+                body = self.s3_client.get_object(Bucket=bucket, Key=key)['Body'].read()
+                transfer["bytes"] = len(body)
+            return body
+        except Exception as e:
+            logger.error("An error occurred while reading the object: %s", e)
+            raise
+
+    def generate_presigned_url(self, bucket: str, key: str, expires_in: int = 3600) -> str:
+        """
+        Returns:
+            str: URL from which the object can be downloaded without credentials for `expires_in` seconds.
+        """
+        return self.s3_client.generate_presigned_url("get_object", Params={"Bucket": bucket, "Key": key},
+                                                     ExpiresIn=expires_in)
+
+    def read_parquet_from_s3(self, bucket: str, key: str, columns: Optional[List[str]] = None) -> pd.DataFrame:
+        """
+        Read a Parquet object, fetching only the byte ranges of the requested columns.
+
+        Args:
+            bucket (str): S3 bucket.
+            key (str): S3 key of the Parquet object.
+            columns (List[str]): Columns to read, all columns if None.
+
+        Returns:
+            pd.DataFrame: The requested columns.
+        """
+        logger.info("Reading Parquet file from S3 bucket %s with key %s, columns %s...", bucket, key, columns)
+        try:
+            with timed_transfer("ranged_download") as transfer:
+                reader = S3RangeReader(self.s3_client, bucket, key)
+                table = pq.read_table(reader, columns=columns)
+                transfer["bytes"] = reader.bytes_read
+            df = table.to_pandas()
+            logger.info("Parquet file read successfully (%s of %s bytes fetched)", reader.bytes_read, reader.size)
+            return df
+        except Exception as e:
+            logger.error("An error occurred while reading the Parquet file: %s", e)
             raise
 
     def download_file_from_s3(self, bucket: str, key: str, filename: str) -> bool:
-        logger.info(f"Downloading file from S3 bucket {bucket} with key {key} to local file {filename}...")
+        logger.info("Downloading file from S3 bucket %s with key %s to local file %s...", bucket, key, filename)
+        try:
+            with timed_transfer("download"):
+                self.s3_client.download_file(bucket, key, filename, Config=self.transfer_config)
+            logger.info("Downloaded file from S3: %s", filename)
+            return True
+        except Exception as e:
+            logger.error("An error occurred while downloading the file: %s", e)
+            raise
+
+    def get_object_size(self, bucket: str, key: str) -> int:
+        logger.info("Getting size of S3 object s3://%s/%s...", bucket, key)
+        try:
+            return self.s3_client.head_object(Bucket=bucket, Key=key)['ContentLength']
+        except Exception as e:
+            logger.error("An error occurred while getting the object size: %s", e)
+            raise
+
+    def object_exists(self, bucket: str, key: str) -> bool:
         try:
-            self.s3_client.download_file(bucket, key, filename)
-            logger.info(f"Downloaded file from S3: {filename}")
+            self.s3_client.head_object(Bucket=bucket, Key=key)
             return True
+        except ClientError as e:
+            if e.response['Error']['Code'] in ('404', 'NoSuchKey', 'NotFound'):
+                return False
+            logger.error("An error occurred while checking the object exists: %s", e)
+            raise
+
+    def list_objects(self, bucket: str, prefix: str = "") -> Iterator[Dict]:
+        """
+        List the objects of a bucket, page by page.
+
+        Yields:
+            Dict: `Key`, `Size` and `LastModified` of each object.
+        """
+        paginator = self.s3_client.get_paginator("list_objects_v2")
+        for page in paginator.paginate(Bucket=bucket, Prefix=prefix):
+            yield from page.get("Contents", [])
+
+    def delete_objects(self, bucket: str, keys: List[str]) -> int:
+        """
+        Delete objects, in batches of 1000 as allowed by S3.
+
+        Returns:
+            int: Number of objects deleted.
+        """
+        deleted = 0
+        for start in range(0, len(keys), 1000):
+            batch = [{"Key": key} for key in keys[start:start + 1000]]
+            response = self.s3_client.delete_objects(Bucket=bucket, Delete={"Objects": batch, "Quiet": True})
+            for error in response.get("Errors", []):
+                logger.error("Failed to delete s3://%s/%s: %s", bucket, error['Key'], error['Message'])
+            deleted += len(batch) - len(response.get("Errors", []))
+        logger.info("Deleted %s objects from S3 bucket %s", deleted, bucket)
+        return deleted
+
+    def open_object_stream(self, bucket: str, key: str) -> StreamingBody:
+        """
+        Open an S3 object for sequential reading without downloading it first.
+
+        Returns:
+            StreamingBody: File-like body of the object, to be closed by the caller.
+        """
+        logger.info("Opening stream on S3 object s3://%s/%s...", bucket, key)
+        try:
+            return self.s3_client.get_object(Bucket=bucket, Key=key)['Body']
         except Exception as e:
-            logger.error(f"An error occurred while downloading the file: {e}")
+            logger.error("An error occurred while opening the object stream: %s", e)
             raise
+
+    def open_multipart_upload(self, bucket: str, key: str) -> S3MultipartWriter:
+        """
+        Start a multipart upload that can be written to incrementally.
+
+        Returns:
+            S3MultipartWriter: Writer committing the object on close, or discarding it on abort.
+        """
+        return S3MultipartWriter(self.s3_client, bucket, key)
+
+    @contextmanager
+    def download_to_buffer(self, bucket: str, key: str) -> Iterator[IO[bytes]]:
+        """
+        Download an S3 object into memory, spilling to disk only above SPILL_THRESHOLD_MB.
+        The buffer, and its spill file if any, is released on leaving the context.
+
+        Yields:
+            IO[bytes]: The object content, positioned at the start.
+        """
+        logger.info("Downloading file from S3 bucket %s with key %s to a buffer...", bucket, key)
+        with spooled_buffer() as buffer:
+            try:
+                with timed_transfer("download") as transfer:
+                    self.s3_client.download_fileobj(bucket, key, buffer, Config=self.transfer_config)
+                    transfer["bytes"] = buffer.tell()
+            except Exception as e:
+                logger.error("An error occurred while downloading the file: %s", e)
+                raise
+            logger.info("Downloaded s3://%s/%s (%s bytes in %.3f s)",
+                        bucket, key, transfer['bytes'], transfer['seconds'])
+            buffer.seek(0)
+            yield buffer
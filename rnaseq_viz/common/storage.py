@@ -0,0 +1,147 @@
+import logging
+from abc import ABC, abstractmethod
+from contextlib import contextmanager
+from io import BytesIO
+from typing import IO, Dict, Iterator, List, Optional
+
+import pandas as pd
+
+from rnaseq_viz.config.config import STORAGE_BACKEND
+
+# Configure logger
+from rnaseq_viz.config.log_config import setup_logging
+setup_logging()
+logger = logging.getLogger(__name__)
+
+
+class ObjectStorage(ABC):
+    """
+    Object storage the frontend and the backend exchange uploads and results through.
+
+    Objects are addressed by bucket and key as in S3, whatever the backend. The method
+    names are those of the S3 backend, `S3Manager`, which every caller was written against.
+    A missing object raises the backend's own not-found error, see `is_not_found`.
+    """
+
+    @abstractmethod
+    def upload_file_to_s3(self, file_obj: BytesIO, bucket: str, s3_file_name: str) -> str:
+        """
+        Store the content of a file object, replacing any object with the same key.
+
+        Returns:
+            str: The key of the stored object.
+        """
+
+    @abstractmethod
+    def read_csv_from_s3(self, bucket: str, key: str, columns: Optional[List[str]] = None) -> pd.DataFrame:
+        """Read a CSV object into a DataFrame, only the given columns if any."""
+
+    @abstractmethod
+    def read_object(self, bucket: str, key: str) -> bytes:
+        """Read a small object, e.g. a JSON document, into memory."""
+
+    @abstractmethod
+    def generate_presigned_url(self, bucket: str, key: str, expires_in: int = 3600) -> str:
+        """
+        Returns:
+            str: URL from which the object can be downloaded without credentials for `expires_in` seconds.
+        """
+
+    @abstractmethod
+    def read_parquet_from_s3(self, bucket: str, key: str, columns: Optional[List[str]] = None) -> pd.DataFrame:
+        """Read a Parquet object, only the given columns if any."""
+
+    def read_result_from_s3(self, bucket: str, key: str, columns: Optional[List[str]] = None) -> pd.DataFrame:
+        """
+        Read a processed result stored as CSV or Parquet, depending on its extension.
+        """
+        if key.endswith(".parquet"):
+            return self.read_parquet_from_s3(bucket=bucket, key=key, columns=columns)
+        return self.read_csv_from_s3(bucket=bucket, key=key, columns=columns)
+
+    @abstractmethod
+    def download_file_from_s3(self, bucket: str, key: str, filename: str) -> bool:
+        """Copy an object to a local file."""
+
+    @abstractmethod
+    def get_object_size(self, bucket: str, key: str) -> int:
+        """Size of an object in bytes."""
+
+    @abstractmethod
+    def object_exists(self, bucket: str, key: str) -> bool:
+        pass
+
+    @abstractmethod
+    def list_objects(self, bucket: str, prefix: str = "") -> Iterator[Dict]:
+        """
+        List the objects of a bucket whose key starts with `prefix`.
+
+        Yields:
+            Dict: `Key`, `Size` and `LastModified` of each object.
+        """
+
+    @abstractmethod
+    def delete_objects(self, bucket: str, keys: List[str]) -> int:
+        """
+        Delete objects, missing ones are ignored.
+
+        Returns:
+            int: Number of objects deleted.
+        """
+
+    @abstractmethod
+    def open_object_stream(self, bucket: str, key: str) -> IO[bytes]:
+        """
+        Open an object for sequential reading without downloading it first.
+
+        Returns:
+            IO[bytes]: File-like body of the object, to be closed by the caller.
+        """
+
+    @abstractmethod
+    def open_multipart_upload(self, bucket: str, key: str):
+        """
+        Start an upload that can be written to incrementally.
+
+        Returns:
+            File-like writer with `write`, `tell` and `bytes_written`, committing the object
+            on `close()` or discarding it on `abort()`, and usable as a context manager.
+        """
+
+    @abstractmethod
+    @contextmanager
+    def download_to_buffer(self, bucket: str, key: str) -> Iterator[IO[bytes]]:
+        """
+        Give access to the content of an object as a seekable file, for the lifetime of the context.
+
+        Yields:
+            IO[bytes]: The object content, positioned at the start.
+        """
+
+    @staticmethod
+    def is_not_found(error: BaseException) -> bool:
+        """Whether an error raised by a storage method means that the object does not exist."""
+        if isinstance(error, FileNotFoundError):
+            return True
+        response = getattr(error, "response", None)
+        return isinstance(response, dict) and response.get("Error", {}).get("Code") in ('404', 'NoSuchKey', 'NotFound')
+
+
+def create_storage(backend: str = STORAGE_BACKEND) -> ObjectStorage:
+    """
+    Create the object storage configured by STORAGE_BACKEND.
+
+    Args:
+        backend (str): "s3", for S3 or LocalStack, or "local" for a directory of the host.
+
+    Returns:
+        ObjectStorage: The object storage.
+    """
+    # Imported here, as both backends subclass ObjectStorage
+    if backend == "s3":
+        from rnaseq_viz.common.s3_manager import S3Manager
+        return S3Manager()
+    if backend == "local":
+        from rnaseq_viz.common.local_storage import LocalStorage
+        return LocalStorage()
+    raise ValueError(f"Unknown storage backend: {backend}")
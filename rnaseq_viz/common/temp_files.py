@@ -0,0 +1,64 @@
+import logging
+import os
+import tempfile
+import time
+from contextlib import contextmanager
+from typing import Iterator, IO
+
+from rnaseq_viz.config.config import TEMP_DIR, SPILL_THRESHOLD_MB, TEMP_FILE_MAX_AGE_SECONDS
+
+# Configure logger
+from rnaseq_viz.config.log_config import setup_logging
+setup_logging()
+logger = logging.getLogger(__name__)
+
+
+@contextmanager
+def spooled_buffer(max_size_mb: int = SPILL_THRESHOLD_MB) -> Iterator[IO[bytes]]:
+    """
+    Binary buffer held in memory that spills to a file in TEMP_DIR once it grows past `max_size_mb`.
+
+    The spill file is anonymous and removed as soon as the buffer is closed on leaving
+    the context, including when the processing fails, so temp files cannot pile up.
+
+    Args:
+        max_size_mb (int): Size above which the buffer is moved to disk.
+
+    Yields:
+        IO[bytes]: The buffer.
+    """
+    os.makedirs(TEMP_DIR, exist_ok=True)
+    # max_size=0 would disable spilling altogether, so 0 MB means spill right away
+    max_size = max(max_size_mb * 1024 * 1024, 1)
+    buffer = tempfile.SpooledTemporaryFile(max_size=max_size, mode="w+b", dir=TEMP_DIR)
+    try:
+        yield buffer
+    finally:
+        buffer.close()
+
+
+def cleanup_stale_temp_files(max_age_seconds: int = TEMP_FILE_MAX_AGE_SECONDS) -> int:
+    """
+    Remove files left in TEMP_DIR by processes that were killed before cleaning up after themselves.
+
+    Args:
+        max_age_seconds (int): Files last modified longer ago than this are removed.
+
+    Returns:
+        int: Number of files removed.
+    """
+    if not os.path.isdir(TEMP_DIR):
+        return 0
+    removed = 0
+    cutoff = time.time() - max_age_seconds
+    for entry in os.scandir(TEMP_DIR):
+        try:
+            if entry.is_file() and entry.stat().st_mtime < cutoff:
+                os.remove(entry.path)
+                removed += 1
+        except FileNotFoundError:
+            # Removed concurrently by another worker
+            continue
+    if removed:
+        logger.info("Removed %s stale temp files from %s", removed, TEMP_DIR)
+    return removed
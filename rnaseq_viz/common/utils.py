@@ -1,6 +1,8 @@
+import hashlib
 import os
 import time
 import uuid
+from typing import BinaryIO
 
 
 def generate_unique_s3_folder() -> str:
@@ -42,3 +44,24 @@ def generate_unique_temp_path(prefix: str = "/tmp", filename: str = "") -> str:
 
     # Return the complete temporary file path
     return os.path.join(prefix, unique_filename)
+
+
+def compute_content_hash(file_obj: BinaryIO, chunk_size: int = 1024 * 1024) -> str:
+    """
+    Compute the SHA-256 digest of a file object's content, reading it in chunks.
+    The file position is restored afterwards so the file can still be uploaded.
+
+    Args:
+        file_obj (BinaryIO): The file object to hash.
+        chunk_size (int): Number of bytes read at a time.
+
+    Returns:
+        str: The hex digest of the content.
+    """
+    position = file_obj.tell()
+    file_obj.seek(0)
+    digest = hashlib.sha256()
+    for chunk in iter(lambda: file_obj.read(chunk_size), b""):
+        digest.update(chunk)
+    file_obj.seek(position)
+    return digest.hexdigest()
@@ -5,16 +5,185 @@ from dotenv import load_dotenv
 load_dotenv()
 
 # Logging level
-LOG_LEVEL = os.getenv('LOG_LEVEL', 'DEBUG')
+LOG_LEVEL = os.getenv('LOG_LEVEL', 'INFO')
+# Write the logs as JSON lines, with the task ID and stage of the records logged by tasks
+LOG_JSON = os.getenv('LOG_JSON', 'false').lower() == 'true'
+# Keep 1 in LOG_DEBUG_SAMPLE_RATE occurrences of each DEBUG message, 1 keeps them all
+LOG_DEBUG_SAMPLE_RATE = int(os.getenv('LOG_DEBUG_SAMPLE_RATE', '1'))
+# Records waiting to be written by the log writer thread, further records are dropped
+LOG_QUEUE_SIZE = int(os.getenv('LOG_QUEUE_SIZE', '10000'))
+# The log writer thread writes the records queued over this interval in seconds at once
+LOG_FLUSH_INTERVAL_SECONDS = float(os.getenv('LOG_FLUSH_INTERVAL_SECONDS', '0.05'))
 
 # S3 Configuration
 S3_BUCKET = os.getenv('S3_BUCKET', 'scratch')
+# Part size of multipart uploads in MB (S3 requires at least 5 MB except for the last part)
+S3_MULTIPART_CHUNKSIZE_MB = int(os.getenv('S3_MULTIPART_CHUNKSIZE_MB', '8'))
+# Size above which transfers are split into concurrent multipart transfers, in MB
+S3_MULTIPART_THRESHOLD_MB = int(os.getenv('S3_MULTIPART_THRESHOLD_MB', '16'))
+# Number of threads transferring parts of a single object concurrently
+S3_MAX_CONCURRENCY = int(os.getenv('S3_MAX_CONCURRENCY', '10'))
+# Size of the HTTP connection pool of the S3 client, at least S3_MAX_CONCURRENCY
+S3_MAX_POOL_CONNECTIONS = int(os.getenv('S3_MAX_POOL_CONNECTIONS', '32'))
+
+# Temporary files
+# Directory of the temp files spilled to disk
+TEMP_DIR = os.getenv('TEMP_DIR', '/tmp/rnaseq_viz/tmp')
+# In-memory buffers spill to TEMP_DIR above this size in MB
+SPILL_THRESHOLD_MB = int(os.getenv('SPILL_THRESHOLD_MB', '256'))
+# Temp files older than this in seconds were left behind by killed processes and are removed
+TEMP_FILE_MAX_AGE_SECONDS = int(os.getenv('TEMP_FILE_MAX_AGE_SECONDS', str(24 * 3600)))
+
+# Lifecycle of tasks, files and S3 data
+# Interval in seconds between two sweeps of expired tasks, temp files, result indexes and S3 data
+LIFECYCLE_SWEEP_INTERVAL_SECONDS = float(os.getenv('LIFECYCLE_SWEEP_INTERVAL_SECONDS', '600'))
+# Lock file electing the backend worker of the host that sweeps files and S3
+LIFECYCLE_LOCK_PATH = os.getenv('LIFECYCLE_LOCK_PATH', '/tmp/rnaseq_viz/lifecycle.lock')
+# Uploads and processed results are deleted from S3 by the backend this long in seconds after they were
+# written (0 to keep them, e.g. when they are expired by an S3 lifecycle rule on the bucket)
+S3_RETENTION_SECONDS = int(os.getenv('S3_RETENTION_SECONDS', '0'))
+# Interval in seconds between two sweeps of S3 data, each of which lists the whole bucket
+S3_SWEEP_INTERVAL_SECONDS = float(os.getenv('S3_SWEEP_INTERVAL_SECONDS', str(24 * 3600)))
 
 # Backend Configuration
 BACKEND_HOST = os.getenv('BACKEND_HOST', '0.0.0.0')
 BACKEND_PORT = int(os.getenv('BACKEND_PORT', '8001'))
 BACKEND_N_WORKERS = int(os.getenv('BACKEND_N_WORKERS', '1'))
 
+# Task registry
+# "memory" keeps tasks in the backend process, "sqlite" shares them between all backend workers of the host
+TASK_STORE_BACKEND = os.getenv('TASK_STORE_BACKEND', 'sqlite' if BACKEND_N_WORKERS > 1 else 'memory')
+# Path of the SQLite task database
+TASK_STORE_PATH = os.getenv('TASK_STORE_PATH', '/tmp/rnaseq_viz/tasks.sqlite3')
+# Finished tasks are forgotten this long in seconds after they finished
+TASK_STORE_TTL_SECONDS = int(os.getenv('TASK_STORE_TTL_SECONDS', str(24 * 3600)))
+# Maximum number of finished tasks kept, the least recently read are forgotten first
+TASK_STORE_MAX_FINISHED = int(os.getenv('TASK_STORE_MAX_FINISHED', '10000'))
+
+# Processed results
+# Format of processed results, "parquet" or "csv"
+RESULT_FORMAT = os.getenv('RESULT_FORMAT', 'parquet')
+# Store floating point columns as float32 instead of float64
+RESULT_FLOAT32 = os.getenv('RESULT_FLOAT32', 'true').lower() == 'true'
+# Compression codec of Parquet results
+RESULT_PARQUET_COMPRESSION = os.getenv('RESULT_PARQUET_COMPRESSION', 'zstd')
+
+# Content-addressed result cache
+RESULT_CACHE_ENABLED = os.getenv('RESULT_CACHE_ENABLED', 'true').lower() == 'true'
+# Path of the SQLite result cache database, used with the "sqlite" task store backend
+RESULT_CACHE_PATH = os.getenv('RESULT_CACHE_PATH', '/tmp/rnaseq_viz/result_cache.sqlite3')
+# Maximum number of cached results, least recently used results are evicted first
+RESULT_CACHE_MAX_ENTRIES = int(os.getenv('RESULT_CACHE_MAX_ENTRIES', '1000'))
+# Time to live of cached results in seconds
+RESULT_CACHE_TTL_SECONDS = int(os.getenv('RESULT_CACHE_TTL_SECONDS', str(7 * 24 * 3600)))
+
+# Task status events
+# Maximum interval in seconds between two reads of a watched task. Changes made by the backend worker serving
+# the event stream are pushed at once, those of other backend workers and progress reports within this interval
+TASK_EVENTS_POLL_SECONDS = float(os.getenv('TASK_EVENTS_POLL_SECONDS', '2'))
+# Maximum interval in seconds between two messages on an idle event stream
+TASK_EVENTS_KEEPALIVE_SECONDS = float(os.getenv('TASK_EVENTS_KEEPALIVE_SECONDS', '15'))
+
+# Processing execution
+# Number of processing jobs run at once, each in a worker process of its own, per backend worker (0 to run
+# jobs one at a time in a thread instead)
+PROCESSING_N_WORKERS = int(os.getenv('PROCESSING_N_WORKERS', '2'))
+# multiprocessing start method of the processing workers, "forkserver" starts them faster than "spawn"
+PROCESSING_MP_START_METHOD = os.getenv('PROCESSING_MP_START_METHOD', 'spawn')
+# Wall-clock limit in seconds of the processing of a task, checked between stages and chunks (0 for no limit)
+TASK_TIMEOUT_SECONDS = int(os.getenv('TASK_TIMEOUT_SECONDS', '3600'))
+# Worker processes of tasks still running this long in seconds after their deadline or their cancellation,
+# i.e. stuck in a stage, are killed by the watchdog of the backend worker that started them
+TASK_KILL_GRACE_SECONDS = float(os.getenv('TASK_KILL_GRACE_SECONDS', '60'))
+# Interval in seconds between two checks of the watchdog for overdue tasks
+TASK_WATCHDOG_INTERVAL_SECONDS = float(os.getenv('TASK_WATCHDOG_INTERVAL_SECONDS', '5'))
+# Directory of the cancellation requests and progress of running tasks, shared by the processes of the host
+TASK_CONTROL_DIR = os.getenv('TASK_CONTROL_DIR', '/tmp/rnaseq_viz/task_control')
+# Minimum interval in seconds between two progress reports of a running task
+TASK_PROGRESS_INTERVAL_SECONDS = float(os.getenv('TASK_PROGRESS_INTERVAL_SECONDS', '0.5'))
+
+# Scheduling of processing jobs. With the sqlite task store, the queue and the limits are kept in its database
+# and shared by the backend workers of the host
+# Maximum number of jobs processed at once, by default one per processing worker of the host
+SCHEDULER_MAX_RUNNING = int(os.getenv(
+    'SCHEDULER_MAX_RUNNING',
+    str(max(1, PROCESSING_N_WORKERS) * (BACKEND_N_WORKERS if TASK_STORE_BACKEND == 'sqlite' else 1))
+))
+# Maximum number of jobs processed at once for a single user, i.e. access token user or client address
+SCHEDULER_MAX_RUNNING_PER_USER = int(os.getenv('SCHEDULER_MAX_RUNNING_PER_USER', '1'))
+# Maximum number of jobs waiting to be processed, further submissions are rejected with 429
+SCHEDULER_MAX_QUEUED = int(os.getenv('SCHEDULER_MAX_QUEUED', '32'))
+# Smallest inputs run first, the priority of a waiting job doubles every SCHEDULER_AGING_SECONDS
+SCHEDULER_AGING_SECONDS = float(os.getenv('SCHEDULER_AGING_SECONDS', '120'))
+# Processing throughput in MB of CSV per second assumed for wait estimates until jobs have finished
+SCHEDULER_INITIAL_THROUGHPUT_MB_S = float(os.getenv('SCHEDULER_INITIAL_THROUGHPUT_MB_S', '20'))
+
+# Input validation
+# Maximum number of violations reported with their row/column positions
+VALIDATION_MAX_VIOLATIONS = int(os.getenv('VALIDATION_MAX_VIOLATIONS', '100'))
+
+# Input ingestion
+# Block size in MB of the multithreaded CSV reader, each block is parsed by one thread
+CSV_READ_BLOCK_SIZE_MB = int(os.getenv('CSV_READ_BLOCK_SIZE_MB', '4'))
+# Expected expansion of compressed inputs, used to estimate their CSV size when choosing streaming mode
+COMPRESSED_SIZE_RATIO = int(os.getenv('COMPRESSED_SIZE_RATIO', '5'))
+
+# Streaming processing
+# Inputs larger than this size in MB are processed in row chunks straight from S3 (0 to always stream)
+STREAMING_MIN_SIZE_MB = int(os.getenv('STREAMING_MIN_SIZE_MB', '256'))
+# Number of rows per chunk in streaming mode
+STREAMING_CHUNK_ROWS = int(os.getenv('STREAMING_CHUNK_ROWS', '5000'))
+
+# Batches of inputs merged into one cohort before processing
+# Maximum number of inputs of a batch
+BATCH_MAX_FILES = int(os.getenv('BATCH_MAX_FILES', '100'))
+# Number of inputs of a batch downloaded and parsed at once, which bounds the memory used by the merge
+BATCH_FETCH_CONCURRENCY = int(os.getenv('BATCH_FETCH_CONCURRENCY', '4'))
+
+# Samples appended to a processed result
+# Values kept around the median of each gene in the state stored with every result, to update the median when
+# samples are appended, genes whose median moves further are recomputed. At least 2, the median of an even
+# number of samples is the mean of the two middle values
+APPEND_MEDIAN_SKETCH_SIZE = int(os.getenv('APPEND_MEDIAN_SKETCH_SIZE', '64'))
+if APPEND_MEDIAN_SKETCH_SIZE < 2:
+    raise ValueError(f"APPEND_MEDIAN_SKETCH_SIZE must be at least 2, got {APPEND_MEDIAN_SKETCH_SIZE}")
+
+# Visualization summaries, computed by the backend at the end of processing
+VIZ_HISTOGRAM_BINS = int(os.getenv('VIZ_HISTOGRAM_BINS', '30'))
+VIZ_KDE_POINTS = int(os.getenv('VIZ_KDE_POINTS', '200'))
+# Number of most expressed genes listed in the summary
+VIZ_TOP_N = int(os.getenv('VIZ_TOP_N', '50'))
+# Genes with a Mean above this percentile are left out of the plotted distribution
+VIZ_CUTOFF_PERCENTILE = float(os.getenv('VIZ_CUTOFF_PERCENTILE', '95'))
+
+# Sample QC, correlation heatmap and PCA of the samples computed at the end of processing
+# Number of principal components kept
+SAMPLE_QC_COMPONENTS = int(os.getenv('SAMPLE_QC_COMPONENTS', '10'))
+# Power iterations of the randomized SVD, more are more accurate when the spectrum decays slowly
+SAMPLE_QC_POWER_ITERATIONS = int(os.getenv('SAMPLE_QC_POWER_ITERATIONS', '4'))
+# Larger cohorts get a heatmap averaged over blocks of consecutive samples
+SAMPLE_QC_MAX_HEATMAP_SAMPLES = int(os.getenv('SAMPLE_QC_MAX_HEATMAP_SAMPLES', '200'))
+
+# Paginated results
+# Maximum number of rows of a results page
+RESULTS_PAGE_MAX_ROWS = int(os.getenv('RESULTS_PAGE_MAX_ROWS', '1000'))
+# Number of processed results kept open by each backend worker to serve pages and queries
+RESULTS_READER_MAX_ENTRIES = int(os.getenv('RESULTS_READER_MAX_ENTRIES', '8'))
+# Directory of the memory-mapped, indexed copies of processed results, shared by the workers of the host
+RESULT_INDEX_DIR = os.getenv('RESULT_INDEX_DIR', '/tmp/rnaseq_viz/result_index')
+# Indexes not used for this long in seconds are removed when the backend starts
+RESULT_INDEX_MAX_AGE_SECONDS = int(os.getenv('RESULT_INDEX_MAX_AGE_SECONDS', str(7 * 24 * 3600)))
+
+# Object storage of uploads and results
+# "s3" for S3, or LocalStack with USE_LOCALSTACK, "local" for a directory of the host on single-node installs
+STORAGE_BACKEND = os.getenv('STORAGE_BACKEND', 's3')
+# Directory of the local storage, buckets are its subdirectories
+LOCAL_STORAGE_ROOT = os.getenv('LOCAL_STORAGE_ROOT', '/tmp/rnaseq_viz/storage')
+# Backend URL the browser downloads results of the local storage from
+LOCAL_STORAGE_URL = os.getenv('LOCAL_STORAGE_URL', f'http://localhost:{BACKEND_PORT}')
+# Key signing the download URLs of the local storage, generated once per host under LOCAL_STORAGE_ROOT if empty
+LOCAL_STORAGE_SIGNING_KEY = os.getenv('LOCAL_STORAGE_SIGNING_KEY', '')
+
 # Frontend Configuration
 # URL for frontend to access backend
 BACKEND_ACCESS_URL = os.getenv('BACKEND_ACCCESS_URL', f'http://localhost:{BACKEND_PORT}')
@@ -24,6 +193,13 @@ BACKEND_ACCESS_URL = os.getenv('BACKEND_ACCCESS_URL', f'http://localhost:{BACKEN
 FRONTEND_RETRY_COUNT = int(os.getenv('FRONTEND_RETRY_COUNT', 5))
 # Delay between retries in seconds
 FRONTEND_RETRY_DELAY_SECONDS = int(os.getenv('FRONTEND_RETRY_DELAY_SECONDS', 2))
+# Maximum number of pooled HTTP connections to the backend
+FRONTEND_HTTP_POOL_SIZE = int(os.getenv('FRONTEND_HTTP_POOL_SIZE', 20))
+# Read timeout of task event streams in seconds, must exceed TASK_EVENTS_KEEPALIVE_SECONDS
+FRONTEND_EVENTS_READ_TIMEOUT_SECONDS = int(os.getenv('FRONTEND_EVENTS_READ_TIMEOUT_SECONDS', 60))
+# Number of uploads, results and figures kept by each frontend cache, and for how long in seconds
+FRONTEND_CACHE_MAX_ENTRIES = int(os.getenv('FRONTEND_CACHE_MAX_ENTRIES', 32))
+FRONTEND_CACHE_TTL_SECONDS = int(os.getenv('FRONTEND_CACHE_TTL_SECONDS', 3600))
 
 
 # LocalStack Configuration
@@ -34,3 +210,5 @@ COGNITO_USER_POOL_ID = os.getenv('COGNITO_USER_POOL_ID')
 COGNITO_CLIENT_ID = os.getenv('COGNITO_CLIENT_ID')
 COGNITO_REGION = os.getenv('COGNITO_REGION', 'us-east-1')
 COGNITO_BYPASS_AUTH = os.getenv('COGNITO_BYPASS_AUTH', 'false').lower() == 'true'
+# The backend asks Cognito for the user of an access token at most once per this many seconds
+AUTH_USER_CACHE_SECONDS = float(os.getenv('AUTH_USER_CACHE_SECONDS', '300'))
@@ -1,12 +1,203 @@
+import atexit
+import json
 import logging
-from rnaseq_viz.config.config import LOG_LEVEL
+import os
+import queue
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from logging.handlers import QueueHandler, QueueListener
+from collections import OrderedDict
+from typing import Dict, Iterator, Optional
+
+from rnaseq_viz.config.config import (
+    LOG_LEVEL, LOG_JSON, LOG_DEBUG_SAMPLE_RATE, LOG_QUEUE_SIZE, LOG_FLUSH_INTERVAL_SECONDS
+)
 
 LOG_FORMAT = '%(asctime)s %(levelname)s: %(message)s'
+# Fields set by `log_context`, added to every record
+CONTEXT_FIELDS = ("task_id", "stage")
+# DEBUG messages whose occurrences are counted by `DebugSampler`, the least recently logged are forgotten
+SAMPLER_MAX_MESSAGES = 1024
+
+_context: ContextVar[Dict[str, str]] = ContextVar("log_context", default={})
+_lock = threading.Lock()
+_queue_handler: Optional["DroppingQueueHandler"] = None
+_listener: Optional[QueueListener] = None
+
+
+@contextmanager
+def log_context(**fields: str) -> Iterator[None]:
+    """
+    Attach fields, e.g. `task_id` or `stage`, to the records logged by the current thread or
+    coroutine within the context. They are written out by the JSON format.
+    """
+    token = _context.set({**_context.get(), **fields})
+    try:
+        yield
+    finally:
+        _context.reset(token)
+
+
+class ContextFilter(logging.Filter):
+    """Copy the fields of `log_context` onto the records, in the thread that logs them."""
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        context = _context.get()
+        for field in CONTEXT_FIELDS:
+            setattr(record, field, context.get(field))
+        return True
+
+
+class DebugSampler(logging.Filter):
+    """
+    Keep the first and then 1 in `rate` occurrences of each DEBUG message, for messages logged
+    per chunk or per call. Occurrences are counted by logger and message template, so the
+    messages must be logged with arguments rather than pre-formatted.
+
+    The counts of at most `max_messages` messages are kept, those of the least recently logged
+    are dropped, and their next occurrence is kept as a first one. Records are filtered in the
+    threads that log them, so the counts are updated under a lock.
+    """
+
+    def __init__(self, rate: int, max_messages: int = SAMPLER_MAX_MESSAGES):
+        super().__init__()
+        self.rate = rate
+        self.max_messages = max_messages
+        self._counts: "OrderedDict[tuple, int]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno > logging.DEBUG:
+            return True
+        key = (record.name, record.msg)
+        with self._lock:
+            count = self._counts.pop(key, 0)
+            self._counts[key] = count + 1
+            if len(self._counts) > self.max_messages:
+                self._counts.popitem(last=False)
+        return count % self.rate == 0
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per record, with the fields of `log_context` when set."""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {"time": self.formatTime(record), "level": record.levelname, "logger": record.name,
+                 "message": record.getMessage()}
+        for field in CONTEXT_FIELDS:
+            value = getattr(record, field, None)
+            if value is not None:
+                entry[field] = value
+        if record.exc_info:
+            entry["exception"] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
+
+
+class DroppingQueueHandler(QueueHandler):
+    """
+    Hand the records to the writer thread without blocking. When the writer falls behind by
+    more than the queue size, records are dropped and counted rather than piling up in memory.
+    """
+
+    def __init__(self, log_queue: queue.Queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # The message is merged now, in case its arguments change before it is written. As the writer
+        # is in this process, the record is not copied, and its exception is kept for the formatter.
+        record.msg = record.getMessage()
+        record.args = None
+        return record
+
+    def enqueue(self, record: logging.LogRecord) -> None:
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+class BatchingQueueListener(QueueListener):
+    """
+    Writer thread that waits `interval` seconds after the first record of a burst, and then
+    writes the records queued in the meantime at once, rather than waking up for every record
+    and contending with the threads that log for the GIL.
+    """
+
+    def __init__(self, log_queue: queue.Queue, *handlers: logging.Handler,
+                 interval: float = LOG_FLUSH_INTERVAL_SECONDS):
+        super().__init__(log_queue, *handlers, respect_handler_level=True)
+        self.interval = interval
+
+    def dequeue(self, block: bool) -> logging.LogRecord:
+        if block and self.interval > 0 and self.queue.empty():
+            record = self.queue.get()
+            time.sleep(self.interval)
+            return record
+        return self.queue.get(block)
+
+
+def _start_listener(handler: logging.Handler) -> QueueListener:
+    listener = BatchingQueueListener(_queue_handler.queue, handler)
+    listener.start()
+    return listener
+
+
+def _stop_listener() -> None:
+    """Write out the records still queued, at exit."""
+    global _listener
+    if _queue_handler.dropped:
+        logging.getLogger(__name__).warning("%s log records were dropped", _queue_handler.dropped)
+    with _lock:
+        if _listener is not None:
+            _listener.stop()
+            _listener = None
+
+
+def _restart_after_fork() -> None:
+    # The writer thread does not survive a fork, and the queue may have been locked by it
+    global _listener
+    if _listener is not None:
+        _queue_handler.queue = queue.Queue(LOG_QUEUE_SIZE)
+        _listener = _start_listener(*_listener.handlers)
+
+
+def queue_handler() -> DroppingQueueHandler:
+    """
+    Returns:
+        DroppingQueueHandler: The handler of the process, through which every record goes, for
+        logging configurations made elsewhere, e.g. uvicorn's.
+    """
+    global _queue_handler, _listener
+    with _lock:
+        if _queue_handler is None:
+            writer = logging.StreamHandler()
+            writer.setFormatter(JsonFormatter() if LOG_JSON else logging.Formatter(LOG_FORMAT))
+            _queue_handler = DroppingQueueHandler(queue.Queue(LOG_QUEUE_SIZE))
+            _queue_handler.addFilter(ContextFilter())
+            if LOG_DEBUG_SAMPLE_RATE > 1:
+                _queue_handler.addFilter(DebugSampler(LOG_DEBUG_SAMPLE_RATE))
+            _listener = _start_listener(writer)
+            atexit.register(_stop_listener)
+            os.register_at_fork(after_in_child=_restart_after_fork)
+        return _queue_handler
 
 
 def setup_logging():
-    logging.basicConfig(
-        level=logging.getLevelName(LOG_LEVEL),
-        format=LOG_FORMAT,
-        handlers=[logging.StreamHandler()]
-    )
+    """
+    Configure the logging of the process, on the first call only.
+
+    Records are formatted and written by a background thread, so that logging never blocks the
+    caller on I/O. Log calls should pass their arguments rather than an f-string, so that
+    records filtered out by level are never formatted.
+    """
+    if _queue_handler is not None:
+        return
+    handler = queue_handler()
+    root = logging.getLogger()
+    # As `logging.basicConfig`, leave alone a root logger configured by the host, e.g. uvicorn
+    if not root.handlers:
+        root.addHandler(handler)
+        root.setLevel(logging.getLevelName(LOG_LEVEL))
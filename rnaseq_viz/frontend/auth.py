@@ -16,7 +16,7 @@ logger = logging.getLogger(__name__)
 # Authentication logic
 def authenticate_user(username, password):
     logger.info("Running authenticate_user()")
-    logger.info(f"COGNITO_BYPASS_AUTH set to {COGNITO_BYPASS_AUTH}")
+    logger.info("COGNITO_BYPASS_AUTH set to %s", COGNITO_BYPASS_AUTH)
     if COGNITO_BYPASS_AUTH:
         st.info("Bypassing Cognito authentication")
         return True
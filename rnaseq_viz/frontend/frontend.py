@@ -1,17 +1,23 @@
+import json
 import requests
 import logging
 import time
 
 import streamlit as st
+from requests.adapters import HTTPAdapter
 
-from rnaseq_viz.frontend.viz_utils import display_results
-from rnaseq_viz.common.s3_manager import S3Manager
-from rnaseq_viz.common.utils import generate_unique_s3_folder
+from rnaseq_viz.frontend.viz_utils import display_page, display_summary, render_mean_distribution, render_sample_qc
+from rnaseq_viz.common.storage import create_storage
+from rnaseq_viz.common.utils import generate_unique_s3_folder, compute_content_hash
 from rnaseq_viz.config.config import (
     BACKEND_ACCESS_URL,
     S3_BUCKET,
     FRONTEND_RETRY_COUNT,
-    FRONTEND_RETRY_DELAY_SECONDS
+    FRONTEND_RETRY_DELAY_SECONDS,
+    FRONTEND_HTTP_POOL_SIZE,
+    FRONTEND_EVENTS_READ_TIMEOUT_SECONDS,
+    FRONTEND_CACHE_MAX_ENTRIES,
+    FRONTEND_CACHE_TTL_SECONDS
 )
 
 from rnaseq_viz.config.log_config import setup_logging
@@ -20,40 +26,103 @@ from rnaseq_viz.config.log_config import setup_logging
 setup_logging()
 logger = logging.getLogger(__name__)
 
-# Initialize S3Manager
-s3_manager = S3Manager()
+# Number of rows of each page of the results table
+RESULTS_PAGE_ROWS = 100
 
+# Frontend caches are bounded in size and lifetime, and cleared from the sidebar
+CACHE_OPTIONS = {"max_entries": FRONTEND_CACHE_MAX_ENTRIES, "ttl": FRONTEND_CACHE_TTL_SECONDS, "show_spinner": False}
 
-def upload_file_to_s3(uploaded_file):
-    """Uploads the file to S3 and returns the unique S3 key and folder."""
+
+@st.cache_resource
+def get_s3_manager():
+    """Returns the object storage shared by every session and rerun, boto3 clients are thread-safe."""
+    return create_storage()
+
+
+@st.cache_resource
+def get_http_session():
+    """Returns the HTTP session shared by every call to the backend."""
+    return create_http_session()
+
+
+def create_http_session():
+    """Creates an HTTP session reusing pooled keep-alive connections to the backend."""
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=FRONTEND_HTTP_POOL_SIZE, pool_maxsize=FRONTEND_HTTP_POOL_SIZE)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+
+def get_content_hash(uploaded_file):
+    """Returns the content hash of an uploaded file, hashed once per upload of the session."""
+    hashes = st.session_state.setdefault("content_hashes", {})
+    if uploaded_file.file_id not in hashes:
+        hashes[uploaded_file.file_id] = compute_content_hash(uploaded_file)
+    return hashes[uploaded_file.file_id]
+
+
+@st.cache_data(**CACHE_OPTIONS)
+def upload_input(content_hash, file_name, _uploaded_file):
+    """
+    Uploads an input once per content and file name, reruns get the S3 key of the first upload.
+    Failed uploads raise and are therefore not cached.
+    """
+    unique_s3_folder = generate_unique_s3_folder()
+    s3_key = f"{unique_s3_folder}/uploads/{file_name}"
+    _uploaded_file.seek(0)
+    get_s3_manager().upload_file_to_s3(file_obj=_uploaded_file, bucket=S3_BUCKET, s3_file_name=s3_key)
+    logger.info("File uploaded successfully: %s", s3_key)
+    return s3_key, unique_s3_folder
+
+
+def upload_file_to_s3(uploaded_file, content_hash):
+    """Uploads the file to S3 unless it was already uploaded, and returns the unique S3 key and folder."""
     try:
-        unique_s3_folder = generate_unique_s3_folder()
-        s3_key = f"{unique_s3_folder}/uploads/{uploaded_file.name}"
-        s3_manager.upload_file_to_s3(file_obj=uploaded_file, bucket=S3_BUCKET, s3_file_name=s3_key)
-        logger.info(f"File uploaded successfully: {s3_key}")
+        s3_key, unique_s3_folder = upload_input(content_hash, uploaded_file.name, uploaded_file)
         st.success("File uploaded successfully!")
         return s3_key, unique_s3_folder
     except Exception as e:
         st.error(f"An error occurred: {str(e)}")
-        logger.error(f"An error occurred during upload: {str(e)}")
+        logger.error("An error occurred during upload: %s", str(e))
         return None, None
 
 
-def start_processing_task(s3_key, folder):
+def get_cached_result(content_hash):
+    """Returns the S3 key of the processed result of an identical earlier upload, or None."""
+    response = get_http_session().get(f"{BACKEND_ACCESS_URL}/cached-result/{content_hash}")
+    if response.status_code == 200:
+        logger.info("Found cached result for content hash %s", content_hash)
+        return response.json()["result"]
+    if response.status_code != 404:
+        logger.error("Failed to look up cached result. Status code: %s, Response: %s",
+                     response.status_code, response.text)
+    return None
+
+
+def start_processing_task(s3_key, folder, content_hash=None):
     """Starts the processing task by sending a request to the FastAPI backend."""
-    logger.info(f"Starting processing task with s3_key: {s3_key} and folder: {folder}")
+    logger.info("Starting processing task with s3_key: %s and folder: %s", s3_key, folder)
     payload = {
         "s3_key": s3_key,
-        "folder": folder
+        "folder": folder,
+        "content_hash": content_hash,
     }
-    response = requests.post(f"{BACKEND_ACCESS_URL}/start-processing", json=payload)
+    # The backend limits the tasks of each user, whom it finds from the access token
+    token = st.session_state.get("token")
+    headers = {"Authorization": f"Bearer {token}"} if isinstance(token, str) else None
+    response = get_http_session().post(f"{BACKEND_ACCESS_URL}/start-processing", json=payload, headers=headers)
     if response.status_code == 200:
         task_id = response.json()["task_id"]
         st.write(f"Processing started with task ID: {task_id}")
         return task_id
+    elif response.status_code == 429:
+        st.warning(f"The backend is busy, please try again in {response.headers.get('Retry-After', 'a few')} seconds.")
+        logger.warning("Processing queue is full: %s", response.text)
+        return None
     else:
         st.error("Failed to start processing.")
-        logger.error(f"Failed to start processing. Status code: {response.status_code}, Response: {response.text}")
+        logger.error("Failed to start processing. Status code: %s, Response: %s", response.status_code, response.text)
         return None
 
 
@@ -61,7 +130,7 @@ def check_task_status(task_id):
     """Checks the status of the processing task with retry logic for specific errors."""
     retries = 0
     while True:
-        response = requests.get(f"{BACKEND_ACCESS_URL}/check-status/{task_id}")
+        response = get_http_session().get(f"{BACKEND_ACCESS_URL}/check-status/{task_id}")
         if response.status_code == 200:
             return response.json()
         elif response.status_code == 404 and "Invalid task ID" in response.text:
@@ -70,25 +139,187 @@ def check_task_status(task_id):
                 st.error("Failed to check processing status after multiple attempts.")
                 logger.error("Failed to check processing status after multiple attempts.")
                 return None
-            logger.info(f"Retrying to check task status... Attempt {retries}/{FRONTEND_RETRY_COUNT}")
+            logger.info("Retrying to check task status... Attempt %s/%s", retries, FRONTEND_RETRY_COUNT)
             time.sleep(FRONTEND_RETRY_DELAY_SECONDS)
         else:
             st.error(f"Failed to check processing status. Status code: {response.status_code}")
-            logger.error(f"Failed to check processing status. Status code: {response.status_code}, "
-                         f"Response: {response.text}")
+            logger.error("Failed to check processing status. Status code: %s, Response: %s",
+                         response.status_code, response.text)
             return None
 
 
-def download_and_display_results(result_key):
-    """Downloads the processed file from S3 and displays the results."""
-    df = s3_manager.read_csv_from_s3(bucket=S3_BUCKET, key=result_key)
-    if df is not None:
-        logger.info("Processed DataFrame is not None. Displaying results.")
-        logger.info(f"{df.head(2)}")
-        display_results(df)
+def watch_task_status(task_id):
+    """Yields the task status each time it changes, as pushed by the backend with server-sent events."""
+    with get_http_session().get(f"{BACKEND_ACCESS_URL}/task-events/{task_id}", stream=True,
+                                timeout=(5, FRONTEND_EVENTS_READ_TIMEOUT_SECONDS)) as response:
+        if response.status_code != 200:
+            st.error(f"Failed to watch processing status. Status code: {response.status_code}")
+            logger.error("Failed to watch processing status. Status code: %s, Response: %s",
+                         response.status_code, response.text)
+            return
+        event = "message"
+        for line in response.iter_lines(decode_unicode=True):
+            if line.startswith("event:"):
+                event = line[len("event:"):].strip()
+            elif line.startswith("data:"):
+                data = json.loads(line[len("data:"):])
+                if event == "error":
+                    st.error(f"Failed to watch processing status: {data['detail']}")
+                    logger.error("Failed to watch processing status: %s", data['detail'])
+                    return
+                yield data
+            elif not line:
+                event = "message"
+
+
+@st.cache_data(**CACHE_OPTIONS)
+def fetch_summary(task_id):
+    """Fetches the visualization summary of a completed task, computed by the backend."""
+    response = get_http_session().get(f"{BACKEND_ACCESS_URL}/results/{task_id}/summary")
+    response.raise_for_status()
+    return response.json()
+
+
+@st.cache_data(**CACHE_OPTIONS)
+def fetch_sample_qc(task_id):
+    """Fetches the sample correlation and PCA of a completed task, or None for results processed without them."""
+    response = get_http_session().get(f"{BACKEND_ACCESS_URL}/results/{task_id}/sample-qc")
+    if response.status_code == 404:
+        return None
+    response.raise_for_status()
+    return response.json()
+
+
+@st.cache_data(**CACHE_OPTIONS)
+def fetch_page(task_id, offset, limit, sort_by=None, descending=True):
+    """Fetches a page of rows of the result of a completed task."""
+    params = {"offset": offset, "limit": limit, "descending": descending}
+    if sort_by:
+        params["sort_by"] = sort_by
+    response = get_http_session().get(f"{BACKEND_ACCESS_URL}/results/{task_id}/rows", params=params)
+    response.raise_for_status()
+    return response.json()
+
+
+@st.cache_data(**CACHE_OPTIONS)
+def render_result_figure(task_id):
+    """Renders the distribution plot of a processed result as a PNG image."""
+    return render_mean_distribution(fetch_summary(task_id))
+
+
+@st.cache_data(**CACHE_OPTIONS)
+def render_sample_qc_figure(task_id):
+    """Renders the sample correlation heatmap and PCA of a processed result as a PNG image."""
+    return render_sample_qc(fetch_sample_qc(task_id))
+
+
+def clear_frontend_caches():
+    """Drops cached uploads, summaries, pages and figures, and the results remembered by the session."""
+    for cached in (upload_input, fetch_summary, fetch_sample_qc, fetch_page, render_result_figure,
+                   render_sample_qc_figure):
+        cached.clear()
+    st.session_state.pop("content_hashes", None)
+    st.session_state.pop("results", None)
+    logger.info("Frontend caches cleared")
+
+
+def display_result(result):
+    """Displays the summary, the sample QC and one page of rows of a processed result, fetched from the backend."""
+    task_id = result["task_id"]
+    try:
+        summary = fetch_summary(task_id)
+        display_summary(summary, render_result_figure(task_id))
+
+        sample_qc = fetch_sample_qc(task_id)
+        if sample_qc is not None and sample_qc["correlation"] is not None:
+            st.subheader("Sample QC")
+            st.image(render_sample_qc_figure(task_id))
+
+        st.subheader("Results")
+        sort_column, order_column, page_column = st.columns(3)
+        statistics = summary.get("statistics", ["Mean", "Median", "StdDev"])
+        sort_by = sort_column.selectbox("Sort by", [*statistics, "SYMBOL", "Input order"])
+        descending = order_column.selectbox("Order", ["Descending", "Ascending"]) == "Descending"
+        n_pages = max(1, -(-summary["n_genes"] // RESULTS_PAGE_ROWS))
+        page_number = page_column.number_input(f"Page (of {n_pages})", min_value=1, max_value=n_pages, value=1)
+        page = fetch_page(task_id, (page_number - 1) * RESULTS_PAGE_ROWS, RESULTS_PAGE_ROWS,
+                          None if sort_by == "Input order" else sort_by, descending)
+    except requests.RequestException as e:
+        st.error("Failed to fetch the processed result.")
+        logger.error("Failed to fetch the result of task %s: %s", task_id, e)
+        return False
+
+    display_page(page)
+    st.link_button("Download the full result",
+                   get_s3_manager().generate_presigned_url(bucket=S3_BUCKET, key=result["result"]))
+    return True
+
+
+def cancel_task(task_id):
+    """Asks the backend to cancel a task, which stops at its next stage or chunk."""
+    response = get_http_session().delete(f"{BACKEND_ACCESS_URL}/tasks/{task_id}")
+    if response.status_code == 200:
+        logger.info("Cancellation of task %s requested", task_id)
     else:
-        st.error("Failed to download the processed file from S3.")
-        logger.error("Failed to download the processed file from S3.")
+        logger.warning("Failed to cancel task %s. Status code: %s, Response: %s",
+                       task_id, response.status_code, response.text)
+
+
+def wait_for_task(task_id):
+    """Waits for a processing task to finish and returns its final status, or None."""
+    status = None
+    progress = st.empty()
+    # Clicking reruns the script, which stops waiting, after the callback sent the cancellation
+    st.button("Cancel processing", key=f"cancel_{task_id}", on_click=cancel_task, args=(task_id,))
+    try:
+        for status in watch_task_status(task_id):
+            if status['status'] == 'queued' and status.get('queue_position'):
+                progress.write(f"Queued at position {status['queue_position']}, "
+                               f"starting in about {status['estimated_wait_seconds']:.0f} s...")
+            elif status['status'] == 'processing' and status.get('rows_processed') is not None:
+                total = f" of about {status['rows_total']}" if status.get('rows_total') else ""
+                progress.write(f"Processing... {status['rows_processed']}{total} rows")
+            elif status['status'] in ('queued', 'processing'):
+                progress.write("Processing...")
+    except requests.RequestException as e:
+        # Fall back to a single status check if the event stream dropped
+        logger.warning("Task event stream interrupted: %s", e)
+        status = check_task_status(task_id)
+
+    if status:
+        if status['status'] == 'completed':
+            st.success("Processing completed!")
+        elif status['status'] == 'failed':
+            st.error(f"Processing failed: {status['result']}")
+            logger.error("Processing failed: %s", status['result'])
+        elif status['status'] == 'cancelled':
+            st.warning("Processing was cancelled.")
+        elif status['status'] == 'timed_out':
+            st.error(f"Processing timed out: {status['result']}")
+            logger.error("Processing timed out: %s", status['result'])
+    return status
+
+
+def process_upload(uploaded_file, content_hash, cached_result=None):
+    """
+    Runs the processing task of the file, uploading it unless a cached result can be reused.
+
+    Returns the task ID and the S3 key of its result, or None.
+    """
+    if cached_result:
+        # The backend records a completed task for the cached result without any upload
+        s3_key, folder = None, None
+    else:
+        s3_key, folder = upload_file_to_s3(uploaded_file, content_hash)
+        if not (s3_key and folder):
+            return None
+    task_id = start_processing_task(s3_key, folder, content_hash)
+    if not task_id:
+        return None
+    status = wait_for_task(task_id)
+    if status and status['status'] == 'completed':
+        return {"task_id": task_id, "result": status['result']}
+    return None
 
 
 def run_frontend():
@@ -96,27 +327,28 @@ def run_frontend():
     logger.info("Running run_frontend()")
     st.title("RNA-Seq Analysis")
 
-    uploaded_file = st.file_uploader("Upload your CSV file", type=["csv"])
+    if st.sidebar.button("Clear cached data"):
+        clear_frontend_caches()
+
+    # Count matrices compress 5-10x, gzip- and zstd-compressed CSVs are decompressed by the backend
+    uploaded_file = st.file_uploader("Upload your CSV file (optionally .csv.gz or .csv.zst)", type=["csv", "gz", "zst"])
 
     if uploaded_file is not None:
-        s3_key, folder = upload_file_to_s3(uploaded_file)
-        if s3_key and folder and st.button("Start Processing"):
-            task_id = start_processing_task(s3_key, folder)
-            if task_id:
-                while True:
-                    status = check_task_status(task_id)
-                    if status:
-                        if status['status'] == 'completed':
-                            st.success("Processing completed!")
-                            st.write("Downloading processed file...")
-                            download_and_display_results(status['result'])
-                            break
-                        elif status['status'] == 'failed':
-                            st.error(f"Processing failed: {status['result']}")
-                            logger.error(f"Processing failed: {status['result']}")
-                            break
-                        else:
-                            st.write("Processing...")
-                            time.sleep(2)  # Poll every 2 seconds
-                    else:
-                        break
+        content_hash = get_content_hash(uploaded_file)
+        # Results obtained earlier in the session stay displayed across reruns
+        results = st.session_state.setdefault("results", {})
+        result = results.get(content_hash)
+
+        if result is None:
+            # Identical inputs skip both the upload and the processing
+            cached_result = get_cached_result(content_hash)
+            if cached_result:
+                st.success("This file was already processed, the existing result will be used.")
+            if st.button("Start Processing"):
+                result = process_upload(uploaded_file, content_hash, cached_result)
+                if result:
+                    results[content_hash] = result
+
+        if result and not display_result(result):
+            # The task may have expired, forget it so that the file can be processed again
+            results.pop(content_hash, None)
@@ -19,6 +19,8 @@ def login():
         token = authenticate_user(username, password)
         if token:
             st.success("Login successful")
+            # Identifies the user to the backend, which limits the tasks processed at once per user
+            st.session_state.username = username
             return token
         else:
             st.error("Login failed")
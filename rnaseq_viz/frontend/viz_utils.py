@@ -1,27 +1,112 @@
+import io
+
 import streamlit as st
 import matplotlib.pyplot as plt
-import seaborn as sns
 import numpy as np
+import pandas as pd
 
 
-def display_results(df):
+def render_mean_distribution(summary) -> bytes:
     """
-    Display the processed data in a table and plot the distribution of mean expression.
+    Plot the distribution of mean expression from the histogram and KDE precomputed by the backend.
 
     Args:
-        df (pandas.DataFrame): The processed DataFrame containing RNA-Seq analysis results.
-    """
-    # Display the processed data in a table
-    st.dataframe(df)
-
-    # Determine cutoff for the right tail
-    cutoff = np.percentile(df['Mean'], 95)
-
-    # Plot distribution of mean expression with cutoff
-    st.write("Distribution of Mean Expression (Cutoff applied)")
-    plt.figure(figsize=(10, 6))
-    sns.histplot(df[df['Mean'] <= cutoff]['Mean'], kde=True, bins=30)  # Apply cutoff
-    plt.title("Distribution of Mean Expression")
-    plt.xlabel("Mean Expression")
-    plt.ylabel("Frequency")
-    st.pyplot(plt)  # Streamlit function to display the plot
+        summary (dict): The visualization summary of a processed result.
+
+    Returns:
+        bytes: The plot as a PNG image.
+    """
+    distribution = summary["mean_distribution"]
+    counts = np.asarray(distribution["histogram"]["counts"])
+    edges = np.asarray(distribution["histogram"]["edges"])
+
+    fig, ax = plt.subplots(figsize=(10, 6))
+    ax.bar(edges[:-1], counts, width=np.diff(edges), align="edge", alpha=0.6, edgecolor="white")
+    if distribution["kde"] is not None:
+        ax.plot(distribution["kde"]["x"], distribution["kde"]["y"])
+    ax.set_title("Distribution of Mean Expression")
+    ax.set_xlabel("Mean Expression")
+    ax.set_ylabel("Frequency")
+
+    buffer = io.BytesIO()
+    fig.savefig(buffer, format="png", bbox_inches="tight")
+    plt.close(fig)
+    return buffer.getvalue()
+
+
+def render_sample_qc(sample_qc) -> bytes:
+    """
+    Plot the sample-sample correlation heatmap and the PCA of the samples precomputed by the backend.
+
+    Args:
+        sample_qc (dict): The sample QC of a processed result.
+
+    Returns:
+        bytes: The plots as a PNG image.
+    """
+    correlation, pca = sample_qc["correlation"], sample_qc["pca"]
+    fig, (heatmap_ax, pca_ax) = plt.subplots(1, 2, figsize=(14, 6))
+
+    values = np.array(correlation["values"], dtype=float)
+    image = heatmap_ax.imshow(values, cmap="viridis", interpolation="nearest")
+    fig.colorbar(image, ax=heatmap_ax, fraction=0.046, pad=0.04)
+    if len(correlation["labels"]) <= 30:
+        ticks = np.arange(len(correlation["labels"]))
+        heatmap_ax.set_xticks(ticks, correlation["labels"], rotation=90, fontsize=7)
+        heatmap_ax.set_yticks(ticks, correlation["labels"], fontsize=7)
+    title = "Sample Correlation (log2 counts)"
+    if correlation["block_size"] > 1:
+        title += f", averaged over blocks of {correlation['block_size']} samples"
+    heatmap_ax.set_title(title)
+
+    if pca is not None:
+        scores = np.array(pca["scores"], dtype=float)
+        ratio = pca["explained_variance_ratio"]
+        y = scores[:, 1] if scores.shape[1] > 1 else np.zeros(len(scores))
+        pca_ax.scatter(scores[:, 0], y, alpha=0.7)
+        if len(scores) <= 30:
+            for name, x_value, y_value in zip(sample_qc["samples"], scores[:, 0], y):
+                pca_ax.annotate(name, (x_value, y_value), fontsize=7)
+        pca_ax.set_xlabel(f"PC1 ({ratio[0]:.1%})")
+        pca_ax.set_ylabel(f"PC2 ({ratio[1]:.1%})" if len(ratio) > 1 else "PC2")
+    pca_ax.set_title("PCA of the Samples")
+
+    buffer = io.BytesIO()
+    fig.savefig(buffer, format="png", bbox_inches="tight")
+    plt.close(fig)
+    return buffer.getvalue()
+
+
+def display_summary(summary, distribution_png):
+    """
+    Display the overview of a processed result: its size, the distribution of mean expression and the top genes.
+
+    Args:
+        summary (dict): The visualization summary of a processed result.
+        distribution_png (bytes): The distribution plot rendered by `render_mean_distribution`.
+    """
+    distribution = summary["mean_distribution"]
+    genes, samples = st.columns(2)
+    genes.metric("Genes", f"{summary['n_genes']:,}")
+    samples.metric("Samples", f"{summary['n_samples']:,}")
+    if summary.get("normalization", "none") != "none":
+        st.caption(f"Statistics computed on {summary['normalization']} normalized values")
+
+    st.write(f"Distribution of Mean Expression (Cutoff applied at the {distribution['cutoff_percentile']:g}th "
+             f"percentile, {distribution['cutoff']:.1f})")
+    st.image(distribution_png)
+
+    st.write(f"Top {len(summary['top_genes'])} genes by Mean Expression")
+    st.dataframe(pd.DataFrame(summary["top_genes"]), hide_index=True)
+
+
+def display_page(page):
+    """
+    Display a page of rows of a processed result.
+
+    Args:
+        page (dict): A page as returned by the paginated results endpoint.
+    """
+    st.dataframe(pd.DataFrame(page["rows"], columns=page["columns"]), hide_index=True)
+    last = min(page["offset"] + page["limit"], page["total"])
+    st.caption(f"Rows {page['offset'] + 1 if page['total'] else 0}-{last} of {page['total']:,}")
@@ -0,0 +1,25 @@
+import pytest
+
+from rnaseq_viz.backend import executor
+from rnaseq_viz.backend.executor import ProcessingExecutor
+from rnaseq_viz.backend.result_cache import InMemoryResultCache
+from rnaseq_viz.backend.scheduler import Scheduler
+from rnaseq_viz.backend.task_manager import TaskManager
+from rnaseq_viz.backend.task_store import InMemoryTaskStore
+from rnaseq_viz.common.local_storage import LocalStorage
+
+
+@pytest.fixture
+def storage(tmp_path) -> LocalStorage:
+    """Object storage in a temp directory, in place of S3."""
+    return LocalStorage(root=str(tmp_path / "storage"))
+
+
+@pytest.fixture
+def manager(storage, monkeypatch):
+    """Task manager running one job at a time in a thread, on the temp storage."""
+    monkeypatch.setattr(executor, "create_storage", lambda: storage)
+    manager = TaskManager(storage, executor=ProcessingExecutor(n_workers=0), store=InMemoryTaskStore(),
+                          cache=InMemoryResultCache(), scheduler=Scheduler(max_running=1))
+    yield manager
+    manager.shutdown()
@@ -0,0 +1,87 @@
+"""
+Small count matrices and uploads shared by the tests.
+"""
+import io
+import time
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+import pandas as pd
+
+from rnaseq_viz.backend import pipeline
+from rnaseq_viz.backend.pipeline import ProcessingOutcome
+from rnaseq_viz.backend.task_manager import TaskManager
+from rnaseq_viz.backend.task_store import TERMINAL_STATUSES
+from rnaseq_viz.common.storage import ObjectStorage
+from rnaseq_viz.config.config import S3_BUCKET
+
+
+def count_frame(samples: Sequence[str], n_genes: int = 60, genes: Optional[List[str]] = None,
+                seed: int = 0) -> pd.DataFrame:
+    """
+    Returns:
+        pd.DataFrame: SYMBOL and negative binomial counts of the samples, for `genes` or GENE00000 onwards.
+    """
+    rng = np.random.default_rng(seed)
+    genes = genes if genes is not None else [f"GENE{i:05d}" for i in range(n_genes)]
+    counts = rng.negative_binomial(2, 0.02, size=(len(genes), len(samples)))
+    return pd.concat([pd.Series(genes, name="SYMBOL"), pd.DataFrame(counts, columns=list(samples))], axis=1)
+
+
+def invalid_count_frame() -> pd.DataFrame:
+    """
+    Returns:
+        pd.DataFrame: Counts of 12 genes and 3 samples with a duplicate gene at rows 1, 9 and 10, an NA gene
+        at row 4, a negative count at row 3 of S1 and an NA count at row 7 of S2.
+    """
+    df = count_frame(["S0", "S1", "S2"], n_genes=12)
+    df.loc[[1, 10], "SYMBOL"] = "GENE00009"
+    df.loc[4, "SYMBOL"] = np.nan
+    df.loc[3, "S1"] = -5
+    df.loc[7, "S2"] = np.nan
+    return df
+
+
+def csv_bytes(df: pd.DataFrame) -> bytes:
+    return df.to_csv(index=False).encode("utf-8")
+
+
+def upload_csv(storage: ObjectStorage, df: pd.DataFrame, key: str) -> str:
+    storage.upload_file_to_s3(io.BytesIO(csv_bytes(df)), S3_BUCKET, key)
+    return key
+
+
+def read_result(storage: ObjectStorage, key: str) -> pd.DataFrame:
+    return storage.read_result_from_s3(bucket=S3_BUCKET, key=key)
+
+
+def process_in_both_modes(storage: ObjectStorage, monkeypatch, key: str, folder: str, *args,
+                          **kwargs) -> Tuple[ProcessingOutcome, ProcessingOutcome]:
+    """
+    Process an upload in memory then in streaming mode, see `pipeline.process_file`. Uploads of more
+    genes than the rows of a chunk are streamed in several chunks.
+
+    Returns:
+        Tuple[ProcessingOutcome, ProcessingOutcome]: The outcomes in memory and in streaming mode.
+    """
+    outcomes = []
+    for mode, min_size_mb in (("in_memory", 1024), ("streaming", 0)):
+        monkeypatch.setattr(pipeline, "STREAMING_MIN_SIZE_MB", min_size_mb)
+        outcomes.append(pipeline.process_file(storage, f"task_{mode}", key, folder, *args, **kwargs))
+    return outcomes[0], outcomes[1]
+
+
+def finished_task(manager: TaskManager, task_id: str) -> Dict:
+    """Wait for a task to reach a final status, and return it."""
+    return wait_for(lambda: (task := manager.get_task(task_id))["status"] in TERMINAL_STATUSES and task)
+
+
+def wait_for(predicate, timeout_seconds: float = 60.0):
+    """Poll `predicate` until it returns a truthy value, which is returned."""
+    deadline = time.monotonic() + timeout_seconds
+    while time.monotonic() < deadline:
+        value = predicate()
+        if value:
+            return value
+        time.sleep(0.02)
+    raise TimeoutError(f"Condition not met within {timeout_seconds} s")
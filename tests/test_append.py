@@ -0,0 +1,109 @@
+import importlib
+import io
+from functools import partial
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from rnaseq_viz.backend import pipeline, streaming
+from rnaseq_viz.backend.incremental import StatisticsState, StatisticsStateWriter
+from rnaseq_viz.backend.statistics import StatisticsSpec
+from rnaseq_viz.config import config
+from rnaseq_viz.config.config import S3_BUCKET
+from tests.helpers import count_frame, read_result, upload_csv
+
+GENES = [f"GENE{i:05d}" for i in range(80)]
+
+
+def _assert_same_result(result: pd.DataFrame, expected: pd.DataFrame):
+    assert list(result.columns) == list(expected.columns)
+    assert result["SYMBOL"].tolist() == expected["SYMBOL"].tolist()
+    for column in expected.columns[1:]:
+        np.testing.assert_allclose(result[column], expected[column], rtol=1e-5, err_msg=column)
+
+
+@pytest.mark.parametrize("statistics", [StatisticsSpec(), StatisticsSpec("log2_cpm", ("mean", "median", "cv"))],
+                         ids=["default", "log2_cpm"])
+def test_appended_samples_match_a_full_recompute(storage, statistics):
+    full = count_frame([f"S{i}" for i in range(10)], genes=GENES, seed=1)
+    upload_csv(storage, full.iloc[:, :7], "f1/uploads/base.csv")
+    # The genes of the new samples come in another order
+    shuffled = full.sample(frac=1, random_state=0)
+    upload_csv(storage, shuffled[["SYMBOL", "S6", "S7"]], "f1/uploads/new1.csv")
+    upload_csv(storage, shuffled[["SYMBOL", "S8", "S9"]], "f1/uploads/new2.csv")
+    upload_csv(storage, full, "f1/uploads/full.csv")
+
+    base = pipeline.process_file(storage, "task_base", "f1/uploads/base.csv", "f1", "csv", statistics=statistics)
+    first = pipeline.process_append(storage, "task_new1", base.result_s3_key, "f1/uploads/new1.csv", "f1", "csv",
+                                    study_id="study1")
+    second = pipeline.process_append(storage, "task_new2", first.result_s3_key, "f1/uploads/new2.csv", "f1", "csv",
+                                     study_id="study1")
+    expected = pipeline.process_file(storage, "task_full", "f1/uploads/full.csv", "f1", "csv", statistics=statistics)
+
+    _assert_same_result(read_result(storage, second.result_s3_key), read_result(storage, expected.result_s3_key))
+    assert storage.object_exists(S3_BUCKET, pipeline.statistics_state_s3_key(second.result_s3_key))
+    study = pipeline.read_study(storage, "f1", "study1")
+    assert study["result"] == second.result_s3_key and study["n_samples"] == 10
+
+
+def test_state_written_chunk_by_chunk_reads_back_as_the_state_of_the_whole_matrix():
+    counts = count_frame([f"S{i}" for i in range(6)], genes=GENES, seed=2).iloc[:, 1:].to_numpy(dtype=float)
+    statistics = StatisticsSpec("log2_cpm", ("mean", "median", "cv"))
+    totals = counts.sum(axis=0)
+    buffer = io.BytesIO()
+    writer = StatisticsStateWriter(buffer)
+    for start in range(0, len(counts), 30):
+        writer.append(StatisticsState.from_counts(counts[start:start + 30], statistics, totals=totals))
+    writer.close()
+
+    state = StatisticsState.from_bytes(buffer.getvalue())
+    expected = StatisticsState.from_counts(counts, statistics, totals=totals)
+    assert writer.n_chunks == 3 and state.spec == expected.spec and state.n_samples == expected.n_samples
+    for name, values in state.statistics().items():
+        np.testing.assert_allclose(values, expected.statistics()[name], err_msg=name)
+
+
+def test_samples_appended_to_a_streamed_result_match_a_full_recompute(storage, monkeypatch):
+    full = count_frame([f"S{i}" for i in range(8)], genes=GENES, seed=3)
+    upload_csv(storage, full.iloc[:, :6], "f1/uploads/base.csv")
+    upload_csv(storage, full[["SYMBOL", "S5", "S6", "S7"]], "f1/uploads/new.csv")
+    upload_csv(storage, full, "f1/uploads/full.csv")
+    # The base is streamed in several chunks, each of which writes its part of the state
+    monkeypatch.setattr(pipeline, "read_csv_chunks", partial(streaming.read_csv_chunks, chunk_rows=7))
+    monkeypatch.setattr(pipeline, "STREAMING_MIN_SIZE_MB", 0)
+    base = pipeline.process_file(storage, "task_base", "f1/uploads/base.csv", "f1", "csv")
+    monkeypatch.setattr(pipeline, "STREAMING_MIN_SIZE_MB", 1024)
+
+    appended = pipeline.process_append(storage, "task_new", base.result_s3_key, "f1/uploads/new.csv", "f1", "csv")
+    expected = pipeline.process_file(storage, "task_full", "f1/uploads/full.csv", "f1", "csv")
+
+    _assert_same_result(read_result(storage, appended.result_s3_key), read_result(storage, expected.result_s3_key))
+
+
+def test_append_rejects_samples_already_in_the_result(storage):
+    upload_csv(storage, count_frame(["S0", "S1"], genes=GENES), "f1/uploads/base.csv")
+    upload_csv(storage, count_frame(["S1", "S2"], genes=GENES), "f1/uploads/new.csv")
+    base = pipeline.process_file(storage, "task_base", "f1/uploads/base.csv", "f1", "csv")
+
+    with pytest.raises(ValueError, match="already in the result"):
+        pipeline.process_append(storage, "task_new", base.result_s3_key, "f1/uploads/new.csv", "f1", "csv")
+
+
+def test_append_rejects_samples_missing_genes_of_the_result(storage):
+    upload_csv(storage, count_frame(["S0", "S1"], genes=GENES), "f1/uploads/base.csv")
+    upload_csv(storage, count_frame(["S2"], genes=GENES[:-3]), "f1/uploads/new.csv")
+    base = pipeline.process_file(storage, "task_base", "f1/uploads/base.csv", "f1", "csv")
+
+    with pytest.raises(ValueError, match="3 are missing"):
+        pipeline.process_append(storage, "task_new", base.result_s3_key, "f1/uploads/new.csv", "f1", "csv")
+
+
+def test_median_sketch_smaller_than_two_values_is_rejected(monkeypatch):
+    monkeypatch.setenv("APPEND_MEDIAN_SKETCH_SIZE", "1")
+    try:
+        with pytest.raises(ValueError, match="APPEND_MEDIAN_SKETCH_SIZE must be at least 2"):
+            importlib.reload(config)
+    finally:
+        monkeypatch.undo()
+        importlib.reload(config)
@@ -0,0 +1,84 @@
+import os
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from rnaseq_viz.backend import pipeline
+from rnaseq_viz.backend.cohort import merge_counts
+from rnaseq_viz.common.metrics import StageTimings
+from tests.helpers import count_frame, read_result, upload_csv
+
+GENES = [f"GENE{i:05d}" for i in range(100)]
+
+
+@pytest.fixture
+def inputs(storage):
+    """Three inputs with their own samples and a part of the genes each, in another order for the last one."""
+    frames = [
+        count_frame(["A0", "A1"], genes=GENES[:90], seed=0),
+        count_frame(["B0", "B1", "B2"], genes=GENES[20:], seed=1),
+        count_frame(["C0"], genes=GENES[10:70][::-1], seed=2),
+    ]
+    keys = [upload_csv(storage, df, f"b1/uploads/input{i}.csv") for i, df in enumerate(frames)]
+    return keys, frames
+
+
+def _read_merged(merged) -> pd.DataFrame:
+    return pd.concat(merged.chunks(chunk_rows=7), ignore_index=True)
+
+
+def test_merge_sums_the_counts_of_the_inputs(storage, inputs):
+    keys, frames = inputs
+    with merge_counts(storage, keys, StageTimings()) as merged:
+        df = _read_merged(merged)
+        matrix_path = merged.matrix_path
+
+    assert not os.path.exists(matrix_path)
+    assert df["SYMBOL"].tolist() == GENES
+    assert list(df.columns[1:]) == ["A0", "A1", "B0", "B1", "B2", "C0"]
+    for frame in frames:
+        samples = list(frame.columns[1:])
+        # Samples sum to the counts of their input, the genes it does not have count 0
+        assert df[samples].sum().tolist() == frame[samples].sum().tolist()
+        pd.testing.assert_frame_equal(df.set_index("SYMBOL").loc[frame["SYMBOL"], samples].reset_index(drop=True),
+                                      frame[samples].reset_index(drop=True), check_dtype=False)
+    per_gene = pd.concat([frame.set_index("SYMBOL").sum(axis=1) for frame in frames], axis=1).sum(axis=1)
+    np.testing.assert_array_equal(df.set_index("SYMBOL").sum(axis=1), per_gene.loc[GENES])
+    assert [merged.files[key]["genes_missing"] for key in keys] == [10, 20, 40]
+
+
+def test_merge_intersect_keeps_the_genes_of_every_input(storage, inputs):
+    keys, frames = inputs
+    with merge_counts(storage, keys, StageTimings(), missing_genes="intersect") as merged:
+        df = _read_merged(merged)
+
+    assert df["SYMBOL"].tolist() == GENES[20:70]
+    assert [merged.files[key]["genes_dropped"] for key in keys] == [40, 30, 10]
+    expected = frames[1].set_index("SYMBOL").loc[GENES[20:70]]
+    np.testing.assert_array_equal(df[["B0", "B1", "B2"]], expected)
+
+
+def test_merge_rejects_samples_of_two_inputs(storage, inputs):
+    keys, frames = inputs
+    key = upload_csv(storage, frames[0], "b1/uploads/copy.csv")
+
+    with pytest.raises(ValueError, match="are also in"):
+        merge_counts(storage, keys + [key], StageTimings())
+
+
+def test_merge_rejects_an_unknown_missing_genes_mode(storage, inputs):
+    with pytest.raises(ValueError, match="Unknown missing_genes"):
+        merge_counts(storage, inputs[0], StageTimings(), missing_genes="drop")
+
+
+def test_batch_result_equals_the_result_of_the_merged_input(storage, inputs):
+    keys, frames = inputs
+    with merge_counts(storage, keys, StageTimings()) as merged:
+        upload_csv(storage, _read_merged(merged), "b1/uploads/merged.csv")
+
+    batch = pipeline.process_batch(storage, "task_batch", keys, "b1", "csv")
+    single = pipeline.process_file(storage, "task_single", "b1/uploads/merged.csv", "b1", "csv")
+
+    pd.testing.assert_frame_equal(read_result(storage, batch.result_s3_key), read_result(storage, single.result_s3_key))
+    assert "merge" in batch.stages and "merge_read" in batch.stages
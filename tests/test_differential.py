@@ -0,0 +1,74 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from rnaseq_viz.backend import pipeline
+from rnaseq_viz.backend.differential import (Comparison, benjamini_hochberg, differential_expression,
+                                             t_test_pvalues, welch_t_test)
+from rnaseq_viz.config.config import S3_BUCKET
+from tests.helpers import count_frame, process_in_both_modes, upload_csv
+
+SAMPLES = [f"S{i}" for i in range(6)]
+COMPARISON = Comparison(test=("S0", "S1", "S2"), reference=("S3", "S4", "S5"))
+
+
+def test_t_test_pvalues_match_the_closed_forms():
+    t = np.array([0.0, 0.5, 1.0, 3.0, -3.0])
+    # Cauchy distribution with 1 degree of freedom, and 1 - |t| / sqrt(2 + t^2) with 2
+    np.testing.assert_allclose(t_test_pvalues(t, np.ones_like(t)), 1 - 2 / np.pi * np.arctan(np.abs(t)), atol=1e-12)
+    np.testing.assert_allclose(t_test_pvalues(t, np.full_like(t, 2.0)), 1 - np.abs(t) / np.sqrt(2 + t * t),
+                               atol=1e-12)
+    # Critical value of the two-sided 5% test with 10 degrees of freedom
+    assert t_test_pvalues(np.array([2.2281388519649385]), np.array([10.0]))[0] == pytest.approx(0.05, abs=1e-10)
+    np.testing.assert_array_equal(t_test_pvalues(np.array([np.inf, np.nan]), np.array([3.0, 3.0])), [0.0, np.nan])
+
+
+def test_welch_t_test_of_each_row():
+    test = np.array([[1.0, 2.0, 3.0], [5.0, 5.0, 5.0]])
+    reference = np.array([[4.0, 6.0, 8.0], [5.0, 5.0, 5.0]])
+
+    difference, t, pvalues = welch_t_test(test, reference)
+
+    # Variances 1 and 4 over 3 samples: t = -4 / sqrt(1 / 3 + 4 / 3), df = (5 / 3)^2 / ((1 / 9 + 16 / 9) / 2)
+    np.testing.assert_allclose(difference, [-4.0, 0.0])
+    assert t[0] == pytest.approx(-4 / np.sqrt(5 / 3))
+    assert pvalues[0] == pytest.approx(t_test_pvalues(t[:1], np.array([50 / 17]))[0])
+    # No variance in either group
+    assert np.isnan(t[1]) and np.isnan(pvalues[1])
+
+
+def test_benjamini_hochberg():
+    adjusted = benjamini_hochberg(np.array([0.01, 0.04, np.nan, 0.03, 0.005]))
+
+    np.testing.assert_allclose(adjusted, [0.02, 0.04, np.nan, 0.04, 0.02])
+
+
+def test_differential_expression_on_log2_counts():
+    processed = count_frame(SAMPLES, n_genes=30, seed=3)
+
+    result = differential_expression(processed, COMPARISON, block_rows=7)
+
+    log2 = np.log2(processed[SAMPLES].to_numpy(dtype=float) + 1)
+    difference, t, pvalues = welch_t_test(log2[:, :3], log2[:, 3:])
+    assert result["SYMBOL"].tolist() == processed["SYMBOL"].tolist()
+    np.testing.assert_allclose(result["log2FoldChange"], difference)
+    np.testing.assert_allclose(result["t"], t)
+    np.testing.assert_allclose(result["FDR"], benjamini_hochberg(pvalues))
+
+
+def test_comparison_rejects_invalid_groups():
+    with pytest.raises(ValueError, match="at least 2 samples"):
+        Comparison(test=("S0",), reference=("S1", "S2"))
+    with pytest.raises(ValueError, match="in both groups"):
+        Comparison(test=("S0", "S1"), reference=("S1", "S2"))
+
+
+def test_streaming_differential_equals_in_memory_differential(storage, monkeypatch):
+    key = upload_csv(storage, count_frame(SAMPLES, n_genes=12000), "f1/uploads/in.csv")
+
+    in_memory, streaming = process_in_both_modes(storage, monkeypatch, key, "f1", "csv", COMPARISON)
+
+    # The p-values of the chunks are adjusted together
+    pd.testing.assert_frame_equal(
+        storage.read_parquet_from_s3(S3_BUCKET, pipeline.differential_s3_key(streaming.result_s3_key)),
+        storage.read_parquet_from_s3(S3_BUCKET, pipeline.differential_s3_key(in_memory.result_s3_key)))
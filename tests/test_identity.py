@@ -0,0 +1,46 @@
+import boto3
+import pytest
+from botocore.stub import Stubber
+from fastapi import HTTPException, Request
+
+from rnaseq_viz.backend.identity import UserResolver
+
+
+def _request(authorization=None) -> Request:
+    headers = [(b"authorization", authorization.encode())] if authorization else []
+    return Request({"type": "http", "headers": headers, "client": ("10.0.0.7", 50000)})
+
+
+@pytest.fixture
+def cognito():
+    client = boto3.client("cognito-idp", region_name="us-east-1", aws_access_key_id="test",
+                          aws_secret_access_key="test")
+    with Stubber(client) as stubber:
+        yield client, stubber
+
+
+def test_requests_without_a_token_are_made_for_their_client_address(cognito):
+    client, _ = cognito
+    assert UserResolver(client, use_tokens=True).user(_request()) == "10.0.0.7"
+    # Tokens are ignored, i.e. not trusted, while Cognito authentication is bypassed
+    assert UserResolver(client, use_tokens=False).user(_request("Bearer token")) == "10.0.0.7"
+
+
+def test_the_user_of_a_token_is_asked_once_to_cognito(cognito):
+    client, stubber = cognito
+    stubber.add_response("get_user", {"Username": "alice", "UserAttributes": []}, {"AccessToken": "token"})
+    resolver = UserResolver(client, use_tokens=True)
+
+    assert resolver.user(_request("Bearer token")) == "alice"
+    # A second call to Cognito would fail, as it is not stubbed
+    assert resolver.user(_request("bearer token")) == "alice"
+    stubber.assert_no_pending_responses()
+
+
+def test_an_invalid_token_is_rejected(cognito):
+    client, stubber = cognito
+    stubber.add_client_error("get_user", "NotAuthorizedException", "Access Token has expired")
+
+    with pytest.raises(HTTPException) as e:
+        UserResolver(client, use_tokens=True).user(_request("Bearer expired"))
+    assert e.value.status_code == 401
@@ -0,0 +1,45 @@
+import logging
+import threading
+
+from rnaseq_viz.config.log_config import DebugSampler
+
+
+def _record(msg: str, level: int = logging.DEBUG) -> logging.LogRecord:
+    return logging.LogRecord("rnaseq_viz.test", level, __file__, 1, msg, None, None)
+
+
+def test_debug_sampler_keeps_one_in_rate_occurrences_of_each_message():
+    sampler = DebugSampler(rate=3)
+
+    kept = [sampler.filter(_record("chunk %s")) for _ in range(7)]
+
+    assert kept == [True, False, False, True, False, False, True]
+    assert sampler.filter(_record("other %s"))
+    assert all(sampler.filter(_record("chunk %s", logging.INFO)) for _ in range(3))
+
+
+def test_debug_sampler_forgets_the_least_recently_logged_messages():
+    sampler = DebugSampler(rate=3, max_messages=2)
+    for msg in ("a %s", "b %s", "a %s", "c %s"):
+        sampler.filter(_record(msg))
+
+    # "b" was dropped when "c" came, "a" was logged more recently and is still counted
+    assert len(sampler._counts) == 2
+    assert not sampler.filter(_record("a %s"))
+    assert sampler.filter(_record("b %s"))
+
+
+def test_debug_sampler_counts_every_occurrence_across_threads():
+    sampler = DebugSampler(rate=10)
+    kept = []
+
+    def log():
+        kept.extend(sampler.filter(_record("chunk %s")) for _ in range(1000))
+
+    threads = [threading.Thread(target=log) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert sum(kept) == 800
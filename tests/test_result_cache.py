@@ -0,0 +1,39 @@
+import pytest
+from fastapi import HTTPException
+
+from rnaseq_viz.common.utils import compute_content_hash
+from rnaseq_viz.config.config import S3_BUCKET
+from tests.helpers import count_frame, finished_task, upload_csv
+
+
+def _content_hash(storage, key: str) -> str:
+    with open(storage.path(S3_BUCKET, key), "rb") as f:
+        return compute_content_hash(f)
+
+
+def test_result_is_served_from_cache_by_the_hash_of_the_input(storage, manager):
+    key = upload_csv(storage, count_frame(["S0", "S1", "S2"]), "f1/uploads/in.csv")
+
+    task = finished_task(manager, manager.start_task(key, "f1", result_format="parquet"))
+    assert task["status"] == "completed"
+
+    content_hash = _content_hash(storage, key)
+    cached = manager.get_task(manager.start_task(None, None, content_hash=content_hash, result_format="parquet"))
+    assert cached["status"] == "completed" and cached["cached"]
+    assert cached["result"] == task["result"] == manager.lookup_cached_result(content_hash, "parquet")
+    # Other processing parameters make another result
+    assert manager.lookup_cached_result(content_hash, "csv") is None
+
+
+def test_a_wrong_content_hash_does_not_cache_the_result_under_it(storage, manager):
+    key = upload_csv(storage, count_frame(["S0", "S1"], seed=1), "f1/uploads/in.csv")
+    wrong_hash = "0" * 64
+
+    task = finished_task(manager, manager.start_task(key, "f1", content_hash=wrong_hash))
+
+    assert task["status"] == "completed"
+    assert manager.lookup_cached_result(wrong_hash) is None
+    assert manager.lookup_cached_result(_content_hash(storage, key)) == task["result"]
+    with pytest.raises(HTTPException) as e:
+        manager.start_task(None, None, content_hash=wrong_hash)
+    assert e.value.status_code == 422
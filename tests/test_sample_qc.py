@@ -0,0 +1,57 @@
+import json
+
+import numpy as np
+
+from rnaseq_viz.backend import pipeline
+from rnaseq_viz.backend.sample_qc import SampleQCAccumulator, randomized_eigh
+from rnaseq_viz.config.config import S3_BUCKET
+from tests.helpers import count_frame, process_in_both_modes, upload_csv
+
+SAMPLES = [f"S{i}" for i in range(8)]
+
+
+def _log2(df) -> np.ndarray:
+    return np.log2(df[SAMPLES].to_numpy(dtype=float) + 1)
+
+
+def test_accumulated_correlation_and_pca_match_numpy():
+    df = count_frame(SAMPLES, n_genes=500, seed=4)
+    accumulator = SampleQCAccumulator()
+    accumulator.add_frame(df, statistics=(), block_rows=64)
+
+    values = _log2(df)
+    np.testing.assert_allclose(accumulator.correlation(), np.corrcoef(values, rowvar=False), atol=1e-10)
+    centered = values - values.mean(axis=1, keepdims=True)
+    singular_values = np.linalg.svd(centered, compute_uv=False)
+    pca = accumulator.pca(n_components=3)
+    np.testing.assert_allclose(pca["explained_variance_ratio"],
+                               (singular_values ** 2 / (singular_values ** 2).sum())[:3], atol=1e-6)
+    assert np.array(pca["scores"]).shape == (len(SAMPLES), 3)
+
+
+def test_randomized_eigh_finds_the_top_eigenvalues():
+    rng = np.random.default_rng(0)
+    vectors, _ = np.linalg.qr(rng.standard_normal((60, 60)))
+    eigenvalues = np.concatenate([[100.0, 50.0, 20.0], rng.uniform(0, 1, 57)])
+    matrix = (vectors * eigenvalues) @ vectors.T
+
+    found, found_vectors = randomized_eigh(matrix, 3, power_iterations=4)
+
+    np.testing.assert_allclose(found, [100.0, 50.0, 20.0], rtol=1e-6)
+    np.testing.assert_allclose(np.abs(found_vectors.T @ vectors[:, :3]), np.eye(3), atol=1e-4)
+
+
+def test_pca_needs_two_samples():
+    accumulator = SampleQCAccumulator()
+    accumulator.add_frame(count_frame(["S0"]), statistics=())
+
+    assert accumulator.pca() is None
+
+
+def test_streaming_sample_qc_equals_in_memory_sample_qc(storage, monkeypatch):
+    key = upload_csv(storage, count_frame(SAMPLES, n_genes=12000), "f1/uploads/in.csv")
+
+    in_memory, streaming = process_in_both_modes(storage, monkeypatch, key, "f1", "csv")
+
+    assert (json.loads(storage.read_object(S3_BUCKET, pipeline.sample_qc_s3_key(streaming.result_s3_key)))
+            == json.loads(storage.read_object(S3_BUCKET, pipeline.sample_qc_s3_key(in_memory.result_s3_key))))
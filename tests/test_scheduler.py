@@ -0,0 +1,53 @@
+import pytest
+
+from rnaseq_viz.backend.scheduler import Job, QueueFullError, SQLiteScheduler
+
+
+def _schedulers(tmp_path, **limits):
+    # Two backend workers of a host, sharing the task database
+    path = str(tmp_path / "tasks.sqlite3")
+    return SQLiteScheduler(path, **limits), SQLiteScheduler(path, **limits)
+
+
+def test_limits_hold_for_the_jobs_of_every_backend_worker(tmp_path):
+    first, second = _schedulers(tmp_path, max_running=2, max_running_per_user=1, max_queued=3)
+    first.submit(Job("a1", "alice", size=10, payload={"s3_key": "a1.csv"}))
+    second.submit(Job("a2", "alice", size=20))
+    second.submit(Job("b1", "bob", size=30))
+    with pytest.raises(QueueFullError):
+        first.submit(Job("c1", "carol", size=1))
+
+    # Either worker may start a job submitted through the other, a single one per user
+    assert [(job.task_id, job.payload) for job in second.next_jobs(max_jobs=1)] == [("a1", {"s3_key": "a1.csv"})]
+    assert [job.task_id for job in first.next_jobs()] == ["b1"]
+    assert second.next_jobs() == [] and second.n_running == 2
+    assert first.queue_positions().keys() == second.queue_positions().keys() == {"a2"}
+
+    # A job finished by the worker that started it frees its slot for both
+    second.finish("a1")
+    assert [job.task_id for job in first.next_jobs()] == ["a2"]
+
+
+def test_a_worker_cancels_only_the_waiting_jobs_submitted_through_it(tmp_path):
+    first, second = _schedulers(tmp_path, max_running=1)
+    first.submit(Job("t1", "alice", size=10))
+    second.submit(Job("t2", "bob", size=10))
+    second.submit(Job("t3", "carol", size=10))
+
+    assert [job.task_id for job in first.cancel_queued()] == ["t1"]
+    assert first.n_queued == 0 and second.n_queued == 2
+    # A job is removed by whichever worker its task was cancelled through
+    assert first.remove("t2") and not second.remove("t2")
+    assert list(second.queue_positions()) == ["t3"]
+
+
+def test_the_slots_of_a_dead_backend_worker_are_released(tmp_path):
+    first, second = _schedulers(tmp_path, max_running=1)
+    first.submit(Job("t1", "alice", size=10))
+    second.submit(Job("t2", "bob", size=10))
+    assert [job.task_id for job in first.next_jobs()] == ["t1"]
+    assert second.next_jobs() == []
+
+    with first._db.connection() as conn:
+        conn.execute("UPDATE jobs SET owner_pid = ? WHERE task_id = 't1'", (2 ** 22 + 1,))
+    assert [job.task_id for job in second.next_jobs()] == ["t2"]
@@ -0,0 +1,70 @@
+import io
+import re
+
+import pandas as pd
+import pytest
+
+from rnaseq_viz.backend.data_processing import process_rnaseq_data
+from rnaseq_viz.backend.result_writer import create_result_writer
+from rnaseq_viz.backend.statistics import StatisticsSpec
+from rnaseq_viz.backend.streaming import process_rnaseq_stream, scan_library_sizes
+from tests.helpers import count_frame, csv_bytes, invalid_count_frame, process_in_both_modes, read_result, upload_csv
+
+SAMPLES = [f"S{i}" for i in range(6)]
+SPECS = [StatisticsSpec(), StatisticsSpec("log2_cpm"),
+         StatisticsSpec("log2", ("mean", "cv", "quantiles", "detection_rate", "min_max"))]
+
+
+def _write(df: pd.DataFrame, result_format: str) -> bytes:
+    output = io.BytesIO()
+    writer = create_result_writer(output, result_format)
+    writer.write_chunk(df)
+    writer.close()
+    return output.getvalue()
+
+
+def _violations(message: str) -> set:
+    # Without the details pydantic appends to the last line of the summary of a field
+    return set(re.findall(r"^\s+- (.+?)(?: \[type=.*)?$", message, flags=re.MULTILINE))
+
+
+@pytest.mark.parametrize("statistics", SPECS, ids=lambda spec: spec.normalization + "-" + "-".join(spec.statistics))
+@pytest.mark.parametrize("chunk_rows", [1, 7, 1000])
+def test_stream_output_equals_in_memory_output(statistics, chunk_rows):
+    data = csv_bytes(count_frame(SAMPLES, n_genes=50))
+    expected = _write(process_rnaseq_data(pd.read_csv(io.BytesIO(data)), statistics=statistics), "csv")
+
+    totals = scan_library_sizes(io.BytesIO(data), statistics) if statistics.needs_library_sizes else None
+    output = io.BytesIO()
+    writer = create_result_writer(output, "csv")
+    assert process_rnaseq_stream(io.BytesIO(data), writer, chunk_rows=chunk_rows, statistics=statistics,
+                                 totals=totals) == (50, len(SAMPLES))
+    writer.close()
+
+    assert output.getvalue() == expected
+
+
+@pytest.mark.parametrize("chunk_rows", [1, 4, 100])
+def test_streaming_reports_the_violations_of_the_in_memory_validation(chunk_rows):
+    data = csv_bytes(invalid_count_frame())
+    with pytest.raises(ValueError) as in_memory:
+        process_rnaseq_data(pd.read_csv(io.BytesIO(data)))
+    with pytest.raises(ValueError) as streaming:
+        process_rnaseq_stream(io.BytesIO(data), create_result_writer(io.BytesIO(), "csv"), chunk_rows=chunk_rows)
+
+    expected = _violations(str(in_memory.value))
+    # The duplicate across chunks is reported at its first occurrence as well
+    assert "duplicate at row 1, column 'SYMBOL': 'GENE00009'" in expected
+    assert _violations(str(streaming.value)) == expected
+
+
+@pytest.mark.parametrize("result_format", ["csv", "parquet"])
+def test_streaming_task_equals_in_memory_task(storage, monkeypatch, result_format):
+    key = upload_csv(storage, count_frame(SAMPLES, n_genes=12000), "f1/uploads/in.csv")
+
+    in_memory, streaming = process_in_both_modes(storage, monkeypatch, key, "f1", result_format)
+
+    assert "download" in in_memory.stages and "download" not in streaming.stages
+    assert streaming.content_hash == in_memory.content_hash
+    pd.testing.assert_frame_equal(read_result(storage, streaming.result_s3_key),
+                                  read_result(storage, in_memory.result_s3_key))
@@ -0,0 +1,43 @@
+import asyncio
+import json
+import threading
+
+from rnaseq_viz.backend.task_events import task_event_stream
+from rnaseq_viz.backend.task_store import InMemoryTaskStore
+
+
+def _status(event: str) -> str:
+    return json.loads(event.split("data: ", 1)[1])["status"]
+
+
+def test_changes_of_the_task_are_pushed_without_waiting_for_the_next_poll():
+    tasks = InMemoryTaskStore()
+    task_id = tasks.create(status="queued")
+
+    async def watch():
+        # Any change found by polling would take a minute
+        stream = task_event_stream(tasks.get, task_id, tasks, poll_seconds=60, keepalive_seconds=60)
+        statuses = [_status(await stream.__anext__())]
+        threading.Timer(0.1, tasks.transition, (task_id, "queued", "processing")).start()
+        statuses.append(_status(await asyncio.wait_for(stream.__anext__(), timeout=5)))
+        tasks.transition(task_id, "processing", "completed", result="key")
+        statuses.append(_status(await asyncio.wait_for(stream.__anext__(), timeout=5)))
+        return statuses
+
+    assert asyncio.run(watch()) == ["queued", "processing", "completed"]
+    # The stream stopped listening once the task finished
+    assert tasks._listeners == []
+
+
+def test_changes_made_elsewhere_are_picked_up_by_polling():
+    tasks = InMemoryTaskStore()
+    task_id = tasks.create(status="queued")
+
+    async def watch():
+        # Not notified of the changes of the task
+        stream = task_event_stream(tasks.get, task_id, poll_seconds=0.05, keepalive_seconds=60)
+        first = _status(await stream.__anext__())
+        tasks.transition(task_id, "queued", "failed", result="error")
+        return first, _status(await asyncio.wait_for(stream.__anext__(), timeout=5))
+
+    assert asyncio.run(watch()) == ("queued", "failed")
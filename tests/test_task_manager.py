@@ -0,0 +1,81 @@
+import threading
+import time
+
+import pytest
+from fastapi import HTTPException
+
+from rnaseq_viz.backend import executor, pipeline, task_manager
+from rnaseq_viz.backend.executor import ProcessingExecutor
+from rnaseq_viz.backend.result_cache import InMemoryResultCache
+from rnaseq_viz.backend.scheduler import Scheduler
+from rnaseq_viz.backend.task_manager import TaskManager
+from rnaseq_viz.backend.task_store import InMemoryTaskStore
+from tests.helpers import count_frame, finished_task, upload_csv, wait_for
+
+
+def test_cancel_queued_and_running_tasks(storage, manager, monkeypatch):
+    key = upload_csv(storage, count_frame(["S0", "S1"]), "f1/uploads/in.csv")
+    started, release = threading.Event(), threading.Event()
+    process_file = pipeline.process_file
+
+    def held_process_file(*args, **kwargs):
+        started.set()
+        release.wait(timeout=60)
+        return process_file(*args, **kwargs)
+
+    monkeypatch.setattr(pipeline, "process_file", held_process_file)
+    running = manager.start_task(key, "f1")
+    queued = manager.start_task(key, "f1")
+    assert started.wait(timeout=60)
+    assert manager.get_task(running)["status"] == "processing"
+    assert manager.get_task(queued)["status"] == "queued"
+
+    assert manager.cancel_task(queued)["status"] == "cancelled"
+    task = manager.cancel_task(running)
+    assert task["status"] == "processing" and task["cancel_requested"]
+    release.set()
+
+    task = finished_task(manager, running)
+    assert task["status"] == "cancelled"
+    assert "cancelled" in task["result"]
+    with pytest.raises(HTTPException) as e:
+        manager.cancel_task(running)
+    assert e.value.status_code == 409
+    # The slot of the cancelled task is free again
+    assert finished_task(manager, manager.start_task(key, "f1"))["status"] == "completed"
+
+
+def test_watchdog_kills_only_the_worker_of_the_overdue_task(storage, monkeypatch, tmp_path):
+    key = upload_csv(storage, count_frame(["S0", "S1"]), "f1/uploads/in.csv")
+    stuck_key = upload_csv(storage, count_frame(["S0", "S1"]), "f1/uploads/stuck.csv")
+    release = tmp_path / "release"
+    process_file = pipeline.process_file
+
+    def held_process_file(s3_manager, task_id, s3_key, *args, **kwargs):
+        # Stuck in a stage, without reaching a checkpoint, or held until released
+        while s3_key == stuck_key or not release.exists():
+            time.sleep(0.05)
+        return process_file(s3_manager, task_id, s3_key, *args, **kwargs)
+
+    # Forked worker processes inherit the patches
+    monkeypatch.setattr(pipeline, "process_file", held_process_file)
+    monkeypatch.setattr(executor, "create_storage", lambda: storage)
+    monkeypatch.setattr(task_manager, "TASK_KILL_GRACE_SECONDS", 0)
+    manager = TaskManager(storage, executor=ProcessingExecutor(n_workers=2, start_method="fork"),
+                          store=InMemoryTaskStore(), cache=InMemoryResultCache(),
+                          scheduler=Scheduler(max_running=2, max_running_per_user=2))
+    try:
+        stuck = manager.start_task(stuck_key, "f1")
+        other = manager.start_task(key, "f1")
+        assert manager.get_task(other)["status"] == "processing"
+        manager.cancel_task(stuck)
+
+        wait_for(lambda: manager.check_overdue() or manager.get_task(stuck)["status"] == "cancelled")
+        assert finished_task(manager, stuck)["status"] == "cancelled"
+        # The job of the other task carries on in its own worker process
+        assert manager.get_task(other)["status"] == "processing"
+        release.touch()
+        assert finished_task(manager, other)["status"] == "completed"
+    finally:
+        release.touch()
+        manager.shutdown()
@@ -0,0 +1,59 @@
+import pytest
+
+from rnaseq_viz.backend.data_processing import process_rnaseq_data
+from rnaseq_viz.backend.validation import validate_matrix
+from tests.helpers import count_frame, invalid_count_frame
+
+
+def test_validate_matrix_reports_positions():
+    invalid_frame = invalid_count_frame()
+    report = validate_matrix(invalid_frame["SYMBOL"].to_numpy(dtype=object), invalid_frame[["S0", "S1", "S2"]])
+
+    located = {(v.check, v.row, v.column) for v in report.violations}
+    assert located == {
+        ("duplicate", 1, "SYMBOL"), ("duplicate", 9, "SYMBOL"), ("duplicate", 10, "SYMBOL"),
+        ("na", 4, "SYMBOL"), ("negative", 3, "S1"), ("na", 7, "S2"),
+    }
+    assert report.counts == {"duplicate": 3, "na": 2, "negative": 1}
+
+
+def test_validate_matrix_reports_unparseable_cells():
+    df = count_frame(["S0", "S1"], n_genes=5).astype({"S0": object})
+    df.loc[2, "S0"] = "12a"
+
+    report = validate_matrix(df["SYMBOL"].to_numpy(dtype=object), df[["S0", "S1"]])
+
+    assert [(v.check, v.row, v.column, v.value) for v in report.violations] == [("dtype", 2, "S0", "12a")]
+
+
+def test_validation_keeps_the_positions_of_the_first_violations():
+    df = count_frame(["S0"], n_genes=20)
+    df["S0"] = -1
+
+    report = validate_matrix(df["SYMBOL"].to_numpy(dtype=object), df[["S0"]], max_violations=5)
+
+    assert report.total == 20 and report.truncated
+    assert [v.row for v in report.violations] == [0, 1, 2, 3, 4]
+
+
+def test_validation_with_no_room_for_positions_still_counts_the_violations():
+    df = count_frame(["S0"], n_genes=20)
+    df["S0"] = -1
+
+    report = validate_matrix(df["SYMBOL"].to_numpy(dtype=object), df[["S0"]], max_violations=0)
+
+    assert not report.ok and report.total == 20
+    assert report.violations == []
+
+
+def test_boolean_sample_columns_are_rejected():
+    # Unlike the per-cell isinstance check this engine replaced, to which True was the int 1
+    df = count_frame(["S0", "S1"], n_genes=4)
+    df["S1"] = [True, False, False, True]
+
+    report = validate_matrix(df["SYMBOL"].to_numpy(dtype=object), df[["S0", "S1"]])
+
+    assert [(v.check, v.row, v.column, v.value) for v in report.violations] == [
+        ("dtype", row, "S1", value) for row, value in enumerate([True, False, False, True])]
+    with pytest.raises(ValueError, match="dtype at row 0, column 'S1': True"):
+        process_rnaseq_data(df)